@@ -0,0 +1 @@
+"""Offline benchmarks for the volleyball analysis pipeline (see benchmarks/run.py)."""
@@ -0,0 +1,79 @@
+"""
+Compare two benchmark result files.
+
+Cases are matched by benchmark, name and video, and compared on their median
+time. Exits with status 1 when a case got slower than the threshold, so the
+comparison can gate CI.
+
+Usage:
+    python -m benchmarks.compare baseline.json current.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+
+def load_cases(path):
+    with open(path) as file:
+        report = json.load(file)
+    cases = {}
+    for entry in report.get("results", []):
+        if "stats" in entry:
+            cases[(entry["benchmark"], entry["name"], entry.get("video"))] = entry["stats"]
+    return report, cases
+
+
+def compare(baseline_path, current_path, threshold=10.0):
+    """
+    Print the change of every case present in both files.
+
+    Args:
+        baseline_path: Earlier result file
+        current_path: Newer result file
+        threshold: Slowdown in percent that counts as a regression
+
+    Returns:
+        List of (case, baseline_ms, current_ms, change_percent) regressions
+    """
+    baseline, baseline_cases = load_cases(baseline_path)
+    current, current_cases = load_cases(current_path)
+
+    print(f"Baseline: {(baseline.get('commit') or 'unknown')[:10]}  Current: {(current.get('commit') or 'unknown')[:10]}")
+    if baseline.get("environment") != current.get("environment"):
+        print("Warning: the runs were made in different environments")
+
+    regressions = []
+    for case in sorted(set(baseline_cases) & set(current_cases), key=lambda case: tuple(str(part) for part in case)):
+        before = baseline_cases[case]["median_ms"]
+        after = current_cases[case]["median_ms"]
+        change = (after - before) / before * 100 if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append((case, before, after, change))
+        benchmark, name, video = case
+        label = f"{benchmark}/{name}" + (f" [{video}]" if video else "")
+        print(f"{label:<90} {before:>10.1f} ms -> {after:>10.1f} ms  {change:+6.1f}%{flag}")
+
+    for case in sorted(set(baseline_cases) ^ set(current_cases), key=lambda case: tuple(str(part) for part in case)):
+        print(f"Only in {'baseline' if case in baseline_cases else 'current'}: {'/'.join(str(part) for part in case if part)}")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", help="Earlier result file")
+    parser.add_argument("current", help="Newer result file")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Slowdown in percent reported as a regression")
+    args = parser.parse_args(argv)
+
+    regressions = compare(args.baseline, args.current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than the {args.threshold:.0f}% threshold")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
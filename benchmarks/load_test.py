@@ -0,0 +1,395 @@
+"""
+Load test of the Flask and ASGI API servers.
+
+Starts the stub Gemini/OpenAI server, then each API server in its own
+process, and keeps a fixed number of requests in flight against it with an
+asyncio client:
+
+    flask   server/app.py on the threaded Werkzeug server, or gunicorn
+            gthread workers with --flask-server gunicorn
+    asgi    server/asgi_app.py on uvicorn (needs the server's "asgi" extra)
+
+Every server, endpoint and concurrency level is reported with throughput,
+latency percentiles, errors, and the server's peak thread count and RSS
+(children included, Linux only). With a stub latency of L ms an ideal
+server answers `concurrency` requests every L ms; the gap to that is the
+server's own queueing.
+
+Usage (from the repository root; server/app.py needs the .env file):
+    python -m benchmarks.load_test [--servers flask,asgi] [--concurrency 10,100,300] [--requests 600]
+                                   [--endpoint analyze-frame] [--analysis-type positioning] [--videos 4]
+                                   [--latency-ms 500] [--output load.json]
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import cv2
+import httpx
+import numpy as np
+
+from benchmarks.run import CACHE_DIR, REPO_ROOT, RESULTS_DIR, SERVER_DIR, benchmark_environment, git_revision
+from benchmarks.stub_api import StubAPIServer
+from benchmarks.synthetic_videos import QUICK_SPECS, encode_jpeg, generate_videos
+
+SERVERS = ["flask", "asgi"]
+SCHEMA_VERSION = 1
+
+ENDPOINTS = {
+    "analyze-frame": "/api/volleyball/analyze-frame",
+    "analyze-image": "/api/volleyball-agent/analyze-image",
+    "analyze-video": "/api/volleyball/analyze-video",
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request_factory(endpoint, video_paths, analysis_type="positioning", max_frames=3):
+    """
+    Build the request arguments for an endpoint.
+
+    Consecutive requests cycle through the videos, so concurrent requests
+    carry different payloads (a server mixing up requests' files shows up
+    in the results rather than going unnoticed).
+
+    Args:
+        endpoint: Key of ENDPOINTS
+        video_paths: Synthetic videos the payloads are made from
+        analysis_type: Analysis type of every request
+        max_frames: Frames analyzed per analyze-video request
+
+    Returns:
+        Function returning keyword arguments for httpx.AsyncClient.post
+    """
+    payloads = []
+    for video_path in video_paths:
+        if endpoint == "analyze-video":
+            with open(video_path, "rb") as file:
+                payloads.append((os.path.basename(video_path), file.read()))
+            continue
+        capture = cv2.VideoCapture(video_path)
+        success, frame = capture.read()
+        capture.release()
+        if not success:
+            raise RuntimeError(f"Could not read a frame from {video_path}")
+        payloads.append(encode_jpeg(frame))
+    payloads = itertools.cycle(payloads)
+
+    if endpoint == "analyze-frame":
+        return lambda: {"files": {"frame": ("frame.jpg", next(payloads), "image/jpeg")},
+                        "data": {"analysis_type": analysis_type}}
+    if endpoint == "analyze-image":
+        return lambda: {"json": {"image_data": "data:image/jpeg;base64," + base64.b64encode(next(payloads)).decode(),
+                                 "analysis_type": analysis_type}}
+
+    def video_request():
+        name, video = next(payloads)
+        return {"files": {"video": (name, video, "video/mp4")},
+                "data": {"analysis_type": analysis_type, "interval_seconds": "0.5",
+                         "max_frames": str(max_frames)}}
+    return video_request
+
+
+def server_command(server, port, workers, threads, flask_server):
+    """Command line starting a server on 127.0.0.1:port (run from server/)."""
+    if server == "asgi":
+        return [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(workers), "--log-level", "warning", "--no-access-log", "--backlog", "2048"]
+    if flask_server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "-k", "gthread", "-w", str(workers), "--threads", str(threads),
+                "-b", f"127.0.0.1:{port}", "--backlog", "2048", "--log-level", "warning", "app:app"]
+    return [sys.executable, "-c", f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+
+
+class ProcessMonitor:
+    """Samples the thread count and RSS of a process tree from /proc."""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss_kb = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _tree(self, pid):
+        pids = [pid]
+        try:
+            with open(f"/proc/{pid}/task/{pid}/children") as file:
+                for child in file.read().split():
+                    pids.extend(self._tree(int(child)))
+        except OSError:
+            pass
+        return pids
+
+    def sample(self):
+        threads = rss = 0
+        for pid in self._tree(self.pid):
+            try:
+                with open(f"/proc/{pid}/status") as file:
+                    for line in file:
+                        if line.startswith("Threads:"):
+                            threads += int(line.split()[1])
+                        elif line.startswith("VmRSS:"):
+                            rss += int(line.split()[1])
+            except OSError:
+                pass
+        self.peak_threads = max(self.peak_threads, threads)
+        self.peak_rss_kb = max(self.peak_rss_kb, rss)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.peak_threads = self.peak_rss_kb = 0
+        self.stopped.clear()
+        if os.path.exists(f"/proc/{self.pid}/status"):
+            self.thread = threading.Thread(target=self._run, name="load-monitor", daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def results(self):
+        return {"peak_threads": self.peak_threads or None,
+                "peak_rss_mb": round(self.peak_rss_kb / 1024, 1) if self.peak_rss_kb else None}
+
+
+async def run_load(base_url, path, make_request, concurrency, total, timeout):
+    """
+    Send `total` requests, `concurrency` at a time.
+
+    Returns:
+        Dictionary of throughput, latency percentiles and errors
+    """
+    latencies = []
+    errors = Counter()
+    remaining = iter(range(total))
+
+    # Every worker has its own connection; small clients, since one httpx
+    # pool slows down with hundreds of connections (see AsyncGeminiModel)
+    shards = -(-concurrency // 20)
+    limits = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+    clients = [httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) for _ in range(shards)]
+    try:
+        async def worker(client):
+            for _ in remaining:
+                start_time = time.perf_counter()
+                try:
+                    response = await client.post(path, **make_request())
+                except httpx.HTTPError as e:
+                    errors[type(e).__name__] += 1
+                    continue
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start_time)
+                else:
+                    errors[f"HTTP {response.status_code}"] += 1
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(worker(clients[number % shards]) for number in range(concurrency)))
+        duration = time.perf_counter() - start_time
+    finally:
+        for client in clients:
+            await client.aclose()
+
+    values = np.array(latencies, dtype=np.float64) * 1000
+    latency = {}
+    if len(values):
+        latency = {
+            "p50_ms": round(float(np.percentile(values, 50)), 1),
+            "p90_ms": round(float(np.percentile(values, 90)), 1),
+            "p99_ms": round(float(np.percentile(values, 99)), 1),
+            "max_ms": round(float(values.max()), 1),
+            "mean_ms": round(float(values.mean()), 1),
+        }
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": dict(errors),
+        "duration_seconds": round(duration, 3),
+        "requests_per_second": round(len(latencies) / duration, 2) if duration > 0 else None,
+        "latency": latency,
+    }
+
+
+class ServerProcess:
+    """An API server running in a subprocess, logging to a file."""
+
+    def __init__(self, command, environment, log_path):
+        self.command = command
+        self.environment = environment
+        self.log_path = log_path
+        self.process = None
+        self.log = None
+
+    def start(self, url, timeout=180):
+        self.log = open(self.log_path, "wb")
+        self.process = subprocess.Popen(self.command, cwd=SERVER_DIR, env=self.environment,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if httpx.get(f"{url}/api/health", timeout=2).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        self.stop()
+        with open(self.log_path, errors="replace") as file:
+            tail = file.read()[-2000:]
+        raise RuntimeError(f"Server did not start: {' '.join(self.command)}\n{tail}")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def print_table(results):
+    print(f"{'server':8} {'endpoint':14} {'conc':>5} {'ok':>6} {'err':>5} {'req/s':>8} {'p50':>8} {'p99':>8} "
+          f"{'threads':>7} {'rss MB':>7}")
+    for result in results:
+        latency = result["latency"]
+        print(f"{result['server']:8} {result['endpoint']:14} {result['concurrency']:>5} {result['ok']:>6} "
+              f"{sum(result['errors'].values()):>5} {result['requests_per_second'] or 0:>8} "
+              f"{latency.get('p50_ms', '-'):>8} {latency.get('p99_ms', '-'):>8} "
+              f"{result['peak_threads'] or '-':>7} {result['peak_rss_mb'] or '-':>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the Flask and ASGI API servers")
+    parser.add_argument("--servers", default=",".join(SERVERS), help=f"Comma-separated servers ({', '.join(SERVERS)})")
+    parser.add_argument("--endpoint", default="analyze-frame", choices=sorted(ENDPOINTS), help="Endpoint to load")
+    parser.add_argument("--analysis-type", default="positioning", choices=["technique", "positioning", "tactics"],
+                        help="Analysis type (technique adds player detection, about 100 ms of CPU per frame)")
+    parser.add_argument("--concurrency", default="10,100,300", help="Comma-separated requests in flight")
+    parser.add_argument("--requests", type=int, default=600, help="Requests per concurrency level")
+    parser.add_argument("--videos", type=int, default=4, help="Different videos the requests cycle through")
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="Stub API response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Maximum extra stub API latency")
+    parser.add_argument("--workers", type=int, default=1, help="Server processes (uvicorn/gunicorn workers)")
+    parser.add_argument("--threads", type=int, default=32, help="Threads per gunicorn worker")
+    parser.add_argument("--flask-server", default="werkzeug", choices=["werkzeug", "gunicorn"],
+                        help="Server running the Flask app")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request in seconds")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/load-<timestamp>-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    servers = [name.strip() for name in args.servers.split(",")]
+    unknown = set(servers) - set(SERVERS)
+    if unknown:
+        parser.error(f"Unknown servers: {', '.join(sorted(unknown))}")
+    if not os.path.exists(os.path.join(REPO_ROOT, ".env")):
+        parser.error("server/app.py needs a .env file at the repository root")
+    levels = [int(value) for value in args.concurrency.split(",")]
+
+    # Same specification, different scenes (one directory per seed, since
+    # the file name only depends on the specification)
+    video_paths = [path for seed in range(args.videos)
+                   for _, path in generate_videos(QUICK_SPECS, os.path.join(CACHE_DIR, "videos", f"seed{seed}"), seed)]
+    make_request = request_factory(args.endpoint, video_paths, args.analysis_type)
+    path = ENDPOINTS[args.endpoint]
+
+    workdir = tempfile.mkdtemp(prefix="volleyball-load-")
+    stub = StubAPIServer(args.latency_ms, args.jitter_ms).start()
+    results = []
+    started = time.time()
+    try:
+        environment = dict(os.environ, **benchmark_environment(stub, workdir))
+        environment.update({"LOG_LEVEL": "WARNING", "CONTINUOUS_PROFILING": "0",
+                            "GEMINI_ASYNC_MAX_CONNECTIONS": str(max(levels) * 3)})
+        print(f"Stub API at {stub.url} ({args.latency_ms} ms latency)")
+
+        for server in servers:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            command = server_command(server, port, args.workers, args.threads, args.flask_server)
+            process = ServerProcess(command, environment, os.path.join(workdir, f"{server}.log")).start(url)
+            try:
+                # Warm up connections, lazily created clients and caches
+                asyncio.run(run_load(url, path, make_request, 2, 4, args.timeout))
+                monitor = ProcessMonitor(process.process.pid)
+                for concurrency in levels:
+                    print(f"{server}: {args.requests} x {args.endpoint}, {concurrency} in flight")
+                    stub.reset_stats()
+                    with monitor:
+                        result = asyncio.run(run_load(url, path, make_request, concurrency, args.requests,
+                                                      args.timeout))
+                    result.update(server=server, endpoint=args.endpoint, concurrency=concurrency,
+                                  stub_requests=stub.stats()["gemini"], **monitor.results())
+                    results.append(result)
+            finally:
+                process.stop()
+    finally:
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+
+    commit, dirty = git_revision()
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "duration_seconds": round(time.time() - started, 1),
+        "environment": {"python": sys.version.split()[0], "cpu_count": os.cpu_count()},
+        "config": {
+            "servers": servers,
+            "endpoint": args.endpoint,
+            "analysis_type": args.analysis_type,
+            "concurrency": levels,
+            "requests": args.requests,
+            "videos": args.videos,
+            "stub_latency_ms": args.latency_ms,
+            "stub_jitter_ms": args.jitter_ms,
+            "workers": args.workers,
+            "threads": args.threads,
+            "flask_server": args.flask_server,
+        },
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"load-{stamp}-{(commit or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,638 @@
+"""
+Offline benchmark suite for the analysis pipeline.
+
+Generates synthetic videos, starts the stub Gemini/OpenAI server and times:
+
+    frame_extraction    decoding and sampling frames (OpenCV, ffmpeg, JPEG extraction)
+    feature_extraction  player detection, ball tracking, rally segmentation,
+                        image preprocessing and pose keypoints
+    classifier          local technique classifier inference
+    jpeg_decoding       JPEG decode time and decoded size at each DCT reduction,
+                        and full vs reduced decodes for the feature/classifier paths
+    end_to_end          POST /api/volleyball/analyze-video through the Flask app
+    live_pipeline       the volleyball-coach live pipeline (frame loop and analyses)
+    logging             log overhead per request: print vs queued JSON vs sampled logging
+
+Benchmarks whose dependencies are missing are reported as skipped. Results
+are written as JSON (see benchmarks/compare.py to diff two runs).
+
+Usage (from the repository root):
+    python -m benchmarks.run [--quick] [--only frame_extraction,end_to_end] [--output results.json]
+"""
+import argparse
+import collections
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+
+from benchmarks.stub_api import StubAPIServer
+from benchmarks.synthetic_videos import (
+    DEFAULT_SPECS, QUICK_SPECS, encode_jpeg, generate_videos, parse_spec, spec_name
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(REPO_ROOT, "server")
+SERVER_SRC = os.path.join(SERVER_DIR, "src")
+COACH_SRC = os.path.join(REPO_ROOT, "volleyball-coach", "src")
+CACHE_DIR = os.path.join(REPO_ROOT, "benchmarks", ".cache")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+BENCHMARKS = ["frame_extraction", "feature_extraction", "classifier", "jpeg_decoding", "end_to_end", "live_pipeline",
+              "logging"]
+SCHEMA_VERSION = 1
+
+
+class Skip(Exception):
+    """Raised by a benchmark whose dependencies are not available."""
+
+
+def summarize(samples, items=1):
+    """
+    Summary statistics of repeated timings.
+
+    Args:
+        samples: Durations in seconds
+        items: Items processed per sample (frames, requests, ...)
+
+    Returns:
+        Dictionary of millisecond statistics and throughput
+    """
+    values = np.array(samples, dtype=np.float64) * 1000
+    median = float(np.median(values))
+    return {
+        "repeats": len(samples),
+        "items": items,
+        "min_ms": round(float(values.min()), 3),
+        "median_ms": round(median, 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "max_ms": round(float(values.max()), 3),
+        "items_per_second": round(items / (median / 1000), 3) if median > 0 else None,
+    }
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silence the print-based logging of the code under test."""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def git_revision():
+    """Current commit and whether the work tree has changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except Exception:
+        return None, None
+
+
+def benchmark_environment(stub, workdir):
+    """Environment variables pointing the code under test at the stub server and a scratch directory."""
+    environment = dict(stub.environment())
+    environment.update({
+        "GOOGLE_AI_API_KEY": "benchmark-key-0000",
+        "GOOGLE_API_KEY": "benchmark-key-0000",
+        "OPENAI_API_KEY": "benchmark-key-0000",
+        # No client-side rate limit, even if the developer's .env sets one
+        "GEMINI_REQUESTS_PER_MINUTE": "0",
+        "RESULTS_DIR": os.path.join(workdir, "results"),
+        "ANALYSIS_HISTORY_DB": os.path.join(workdir, "analysis_history.sqlite3"),
+        "WARM_AGENTS": "0",
+    })
+    return environment
+
+
+def configure_environment(stub, workdir):
+    """
+    Point the code under test at the stub server and a scratch directory.
+
+    Must run before volleyball_ai or the coach modules are imported, since
+    they read their configuration at import time.
+    """
+    os.environ.update(benchmark_environment(stub, workdir))
+    for path in (SERVER_SRC, SERVER_DIR, COACH_SRC):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+class BenchmarkSuite:
+    """Runs the selected benchmarks over the synthetic videos."""
+
+    def __init__(self, videos, stub, workdir, repeats=3, warmup=1, verbose=False, model=None, labels=None):
+        self.videos = videos
+        self.stub = stub
+        self.workdir = workdir
+        self.repeats = repeats
+        self.warmup = warmup
+        self.verbose = verbose
+        self.model = model
+        self.labels = labels
+        self.results = []
+
+    # Helpers
+
+    def measure(self, func, items=None):
+        """
+        Time func() repeatedly.
+
+        func returns the number of items it processed (used when items is None).
+        """
+        with quiet(not self.verbose):
+            for _ in range(self.warmup):
+                func()
+            samples = []
+            for _ in range(self.repeats):
+                start = time.perf_counter()
+                count = func()
+                samples.append(time.perf_counter() - start)
+        return summarize(samples, items if items is not None else (count or 1))
+
+    def record(self, benchmark, name, stats=None, video=None, skipped=None, error=None, **extra):
+        entry = {"benchmark": benchmark, "name": name, "video": video}
+        if skipped:
+            entry["skipped"] = skipped
+        elif error:
+            entry["error"] = error
+        else:
+            entry["stats"] = stats
+        entry.update(extra)
+        self.results.append(entry)
+
+        label = f"{benchmark}/{name}" + (f" [{video}]" if video else "")
+        if skipped:
+            print(f"  {label}: skipped ({skipped})")
+        elif error:
+            print(f"  {label}: error ({error})")
+        else:
+            print(f"  {label}: median {stats['median_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms"
+                  + (f", {stats['items_per_second']:.1f}/s" if stats.get("items_per_second") else ""))
+
+    def run_case(self, benchmark, name, func, video=None, items=None, **extra):
+        """Measure one case, recording errors instead of aborting the suite."""
+        try:
+            stats = self.measure(func, items)
+        except Skip as e:
+            self.record(benchmark, name, video=video, skipped=str(e), **extra)
+        except Exception as e:
+            self.record(benchmark, name, video=video, error=f"{type(e).__name__}: {e}", **extra)
+        else:
+            self.record(benchmark, name, stats, video=video, **extra)
+
+    def sample_frames(self, path, step=15, limit=20):
+        """Decode every step-th frame (BGR) up to limit frames."""
+        frames = []
+        capture = cv2.VideoCapture(path)
+        index = 0
+        while len(frames) < limit:
+            success, frame = capture.read()
+            if not success:
+                break
+            if index % step == 0:
+                frames.append(frame)
+            index += 1
+        capture.release()
+        return frames
+
+    def consecutive_frames(self, path, limit=90):
+        frames = []
+        capture = cv2.VideoCapture(path)
+        while len(frames) < limit:
+            success, frame = capture.read()
+            if not success:
+                break
+            frames.append(frame)
+        capture.release()
+        return frames
+
+    # Benchmarks
+
+    def frame_extraction(self):
+        from volleyball_ai.video_decoder import ffmpeg_available, iter_sampled_frames
+        from volleyball_ai.google_ai_integration import extract_frames_from_video
+
+        decoders = ["opencv"] + (["ffmpeg"] if ffmpeg_available() else [])
+
+        for spec, path in self.videos:
+            video = spec_name(spec)
+
+            def decode_all():
+                capture = cv2.VideoCapture(path)
+                count = 0
+                while capture.grab():
+                    count += 1
+                capture.release()
+                return count
+            self.run_case("frame_extraction", "opencv_grab_all", decode_all, video)
+
+            for decoder in decoders:
+                self.run_case("frame_extraction", f"iter_sampled_frames[{decoder}]",
+                              lambda decoder=decoder: sum(1 for _ in iter_sampled_frames(path, 15, decoder)), video)
+
+            output_dir = os.path.join(self.workdir, "frames")
+
+            def extract_jpegs():
+                frames = extract_frames_from_video(path, output_dir=output_dir, frame_interval=1.0, max_frames=5)
+                shutil.rmtree(output_dir, ignore_errors=True)
+                return len(frames)
+            self.run_case("frame_extraction", "extract_frames_from_video[5 frames]", extract_jpegs, video)
+
+    def feature_extraction(self):
+        from volleyball_ai.player_detection import get_player_detector
+        from volleyball_ai.ball_tracking import BallTracker
+        from volleyball_ai.rally_segmentation import segment_rallies
+        from volleyball_ai.image_input import ImageInput
+
+        detector = get_player_detector()
+        keypoints = self._load_keypoint_extractor()
+
+        for spec, path in self.videos:
+            video = spec_name(spec)
+            frames = self.sample_frames(path)
+            sequence = self.consecutive_frames(path)
+
+            self.run_case("feature_extraction", f"player_detection[{detector.backend}]",
+                          lambda: len([detector.detect(frame) for frame in frames]), video)
+
+            def track_ball():
+                tracker = BallTracker()
+                return sum(1 for _ in tracker.track(sequence, fps=spec.fps))
+            self.run_case("feature_extraction", "ball_tracking", track_ball, video)
+
+            def segment():
+                segment_rallies(path, fps=spec.fps, save=False)
+                return spec.fps * spec.seconds
+            self.run_case("feature_extraction", "rally_segmentation", segment, video)
+
+            jpegs = [encode_jpeg(frame) for frame in frames]
+            for analysis_type in ("technique", "tactics"):
+                self.run_case("feature_extraction", f"image_preprocessing[{analysis_type}]",
+                              lambda analysis_type=analysis_type: len([
+                                  ImageInput.from_any(data).prepare(analysis_type) for data in jpegs
+                              ]), video)
+
+            if keypoints is None:
+                self.record("feature_extraction", "pose_keypoints", video=video,
+                            skipped="mediapipe is not installed")
+            else:
+                self.run_case("feature_extraction", "pose_keypoints",
+                              lambda: len([keypoints(data) for data in jpegs[:5]]), video)
+
+    def _load_keypoint_extractor(self):
+        if importlib.util.find_spec("mediapipe") is None:
+            return None
+        module_path = os.path.join(SERVER_SRC, "python", "extract_keypoints.py")
+        spec = importlib.util.spec_from_file_location("extract_keypoints", module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.extract_keypoints
+
+    def classifier(self):
+        frames = self.sample_frames(self.videos[0][1]) if self.videos else []
+        video = spec_name(self.videos[0][0]) if self.videos else None
+
+        # TensorFlow technique classifier (volleyball_inference)
+        if importlib.util.find_spec("tensorflow") is None:
+            self.record("classifier", "technique_classifier[tensorflow]", video=video,
+                        skipped="tensorflow is not installed")
+        else:
+            from volleyball_ai.volleyball_inference import VolleyballTechniqueClassifier
+            import tensorflow as tf
+
+            with quiet(not self.verbose):
+                classifier = VolleyballTechniqueClassifier(self.model, self.labels)
+                if classifier.model is None:
+                    # Untrained stand-in with a realistic architecture and input size
+                    tf.keras.utils.set_random_seed(0)
+                    classifier.model = tf.keras.applications.MobileNetV2(
+                        input_shape=(224, 224, 3), alpha=0.35, weights=None, classes=6
+                    )
+                    classifier.labels = {str(i): name for i, name in enumerate(
+                        ["serving", "setting", "spiking", "blocking", "digging", "passing"]
+                    )}
+            name = "technique_classifier[model]" if self.model else "technique_classifier[mobilenet_v2_0.35]"
+            self.run_case("classifier", name,
+                          lambda: len([classifier.predict_frame(frame) for frame in frames]), video)
+
+        # PyTorch form scoring network (server/src/python/train_model.py)
+        if importlib.util.find_spec("torch") is None:
+            self.record("classifier", "form_net[torch]", skipped="torch is not installed")
+        else:
+            import torch
+            module_path = os.path.join(SERVER_SRC, "python", "train_model.py")
+            spec = importlib.util.spec_from_file_location("train_model", module_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+            torch.manual_seed(0)
+            net = module.VolleyballFormNet().eval()
+            single = torch.rand(1, 99)
+            batch = torch.rand(64, 99)
+
+            def infer_single():
+                with torch.no_grad():
+                    for _ in range(100):
+                        net(single)
+                return 100
+
+            def infer_batch():
+                with torch.no_grad():
+                    net(batch)
+                return 64
+            self.run_case("classifier", "form_net[torch,batch=1]", infer_single)
+            self.run_case("classifier", "form_net[torch,batch=64]", infer_batch)
+
+    def jpeg_decoding(self):
+        from volleyball_ai.cpu_pool import FEATURE_SIZE
+        from volleyball_ai.image_loading import REDUCED_COLOR_FLAGS, decode_reduced, open_reduced
+        from volleyball_ai.volleyball_inference import MODEL_INPUT_SIZE
+
+        for spec, path in self.videos:
+            video = spec_name(spec)
+            jpegs = [encode_jpeg(frame) for frame in self.sample_frames(path, limit=10)]
+
+            for factor in (1, 2, 4, 8):
+                flags = REDUCED_COLOR_FLAGS.get(factor, cv2.IMREAD_COLOR)
+                decoded = cv2.imdecode(np.frombuffer(jpegs[0], dtype=np.uint8), flags)
+                self.run_case("jpeg_decoding", f"opencv[1/{factor}]",
+                              lambda flags=flags: len([
+                                  cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags) for data in jpegs
+                              ]), video, decoded_size=list(decoded.shape[1::-1]), decoded_bytes=decoded.nbytes)
+
+                size = (-(-spec.width // factor), -(-spec.height // factor))
+                image = open_reduced(jpegs[0], size if factor > 1 else None)
+                self.run_case("jpeg_decoding", f"pil_draft[1/{factor}]",
+                              lambda size=size, factor=factor: len([
+                                  open_reduced(data, size if factor > 1 else None) for data in jpegs
+                              ]), video, decoded_size=list(image.size),
+                              decoded_bytes=image.size[0] * image.size[1] * len(image.getbands()))
+
+            # Decode plus resize to the size the feature extractor and the classifier work at
+            full = cv2.imdecode(np.frombuffer(jpegs[0], dtype=np.uint8), cv2.IMREAD_COLOR)
+            for name, size in (("features", FEATURE_SIZE), ("classifier", MODEL_INPUT_SIZE)):
+                self.run_case("jpeg_decoding", f"{name}[full decode+resize]",
+                              lambda size=size: len([
+                                  cv2.resize(cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR), size)
+                                  for data in jpegs
+                              ]), video, decoded_size=list(full.shape[1::-1]), decoded_bytes=full.nbytes)
+                decoded = decode_reduced(jpegs[0], size)
+                self.run_case("jpeg_decoding", f"{name}[reduced decode+resize]",
+                              lambda size=size: len([cv2.resize(decode_reduced(data, size), size) for data in jpegs]),
+                              video, decoded_size=list(decoded.shape[1::-1]), decoded_bytes=decoded.nbytes)
+
+    def end_to_end(self):
+        if not os.path.exists(os.path.join(REPO_ROOT, ".env")):
+            self.record("end_to_end", "analyze_video", skipped="server/app.py needs a .env file at the repository root")
+            return
+
+        with quiet(not self.verbose):
+            import app as server_app
+
+        # Keep uploads and extracted frames out of server/uploads
+        server_app.UPLOAD_FOLDER = os.path.join(self.workdir, "uploads")
+        os.makedirs(server_app.UPLOAD_FOLDER, exist_ok=True)
+        client = server_app.app.test_client()
+
+        for spec, path in self.videos:
+            video = spec_name(spec)
+            with open(path, "rb") as file:
+                data = file.read()
+
+            def analyze():
+                response = client.post("/api/volleyball/analyze-video", data={
+                    "video": (io.BytesIO(data), os.path.basename(path)),
+                    "analysis_type": "technique",
+                    "interval_seconds": "1.0",
+                    "max_frames": "5",
+                }, content_type="multipart/form-data")
+                if response.status_code != 200:
+                    raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+                shutil.rmtree(os.path.join(server_app.UPLOAD_FOLDER, "temp_frames"), ignore_errors=True)
+                return 1
+
+            self.stub.reset_stats()
+            self.run_case("end_to_end", "analyze_video[technique,5 frames]", analyze, video,
+                          stub_latency_ms=self.stub.latency_ms)
+            if "stats" in self.results[-1]:
+                runs = self.repeats + self.warmup
+                self.results[-1]["gemini_requests_per_call"] = round(self.stub.stats()["gemini"] / runs, 2)
+
+    def live_pipeline(self):
+        try:
+            with quiet(not self.verbose):
+                from video.pipeline import VolleyballAnalysisPipeline
+        except ImportError as e:
+            self.record("live_pipeline", "pipeline", skipped=f"volleyball-coach dependencies missing: {e}")
+            return
+
+        for spec, path in self.videos:
+            video = spec_name(spec)
+            frames = self.sample_frames(path, limit=5)
+
+            with quiet(not self.verbose):
+                pipeline = VolleyballAnalysisPipeline(video_file=path, analysis_interval=1)
+            try:
+                for analysis_type in ("technique", "positioning", "tactics"):
+                    self.run_case("live_pipeline", f"analyze_frame[{analysis_type}]",
+                                  lambda analysis_type=analysis_type: len([
+                                      pipeline.analyze_frame(frame, analysis_type) for frame in frames
+                                  ]), video, stub_latency_ms=self.stub.latency_ms)
+            finally:
+                pipeline.cap.release()
+
+            def frame_loop():
+                with quiet(not self.verbose):
+                    loop = VolleyballAnalysisPipeline(video_file=path, analysis_interval=1)
+                    loop.start()
+                    try:
+                        count = sum(1 for _ in loop.get_frames())
+                    finally:
+                        loop.stop()
+                return count
+            self.run_case("live_pipeline", "frame_loop[overlay+queue]", frame_loop, video)
+
+    def logging(self, requests=20, request_lines=10, frame_events=300):
+        """
+        Time the logging done by one video analysis request on the request thread.
+
+        A simulated request writes request_lines request-level lines and
+        frame_events per-frame events (decoded and analyzed frames), first
+        with print, then through the queued JSON handler with every event
+        written, and with the per-frame events sampled. Output goes to a
+        pipe drained by another thread, as stdout does under a process
+        manager or container runtime; print is timed with the default block
+        buffering and line-buffered (python -u, PYTHONUNBUFFERED).
+        """
+        import logging
+        from volleyball_ai.structured_logging import configure_logging, flush_logs, log_context, logging_stats, sampled
+
+        logger = logging.getLogger("benchmarks.logging")
+        frame_log = sampled(logger)
+
+        def printed(stream):
+            def run():
+                with contextlib.redirect_stdout(stream):
+                    for number in range(requests):
+                        for line in range(request_lines):
+                            print(f"Request {number}: step {line} of video analysis")
+                        for frame in range(frame_events):
+                            print(f"Processed frame {frame} at {frame / 30.0:.2f}s")
+                    stream.flush()
+                return requests
+            return run
+
+        def queued(frame_logger):
+            def run():
+                for number in range(requests):
+                    with log_context(request_id=f"bench-{number}", route="/api/volleyball/analyze-video"):
+                        for line in range(request_lines):
+                            logger.info("Step %d of video analysis", line)
+                        for frame in range(frame_events):
+                            frame_logger.info("Processed frame %d at %.2fs", frame, frame / 30.0)
+                return requests
+            return run
+
+        read_fd, write_fd = os.pipe()
+        drain = threading.Thread(target=lambda: collections.deque(iter(lambda: os.read(read_fd, 65536), b""), 0),
+                                 name="log-pipe-drain", daemon=True)
+        drain.start()
+        pipe = open(write_fd, "w", closefd=False)
+        line_pipe = open(write_fd, "w", buffering=1, closefd=False)
+
+        cases = [
+            (f"print[pipe, {request_lines}+{frame_events} lines/request]", printed(pipe)),
+            ("print[pipe, line buffered]", printed(line_pipe)),
+            ("queued_json[every event]", queued(logger)),
+            ("queued_json[sampled frame events]", queued(frame_log)),
+        ]
+        try:
+            for name, func in cases:
+                if name.startswith("queued_json"):
+                    configure_logging(level="INFO", levels={}, log_format="json", stream=pipe, force=True)
+                self.run_case("logging", name, func, items=requests)
+                flush_logs()
+                if "stats" in self.results[-1]:
+                    self.results[-1]["request_overhead_us"] = round(
+                        self.results[-1]["stats"]["median_ms"] * 1000 / requests, 1
+                    )
+                    # Records dropped because the writer thread fell behind
+                    self.results[-1]["dropped_records"] = logging_stats().get("dropped", 0)
+        finally:
+            configure_logging(force=True)
+            pipe.close()
+            line_pipe.close()
+            os.close(write_fd)
+            drain.join()
+            os.close(read_fd)
+
+    def run(self, selected):
+        for name in selected:
+            print(f"{name}:")
+            try:
+                getattr(self, name)()
+            except Skip as e:
+                self.record(name, name, skipped=str(e))
+            except ImportError as e:
+                self.record(name, name, skipped=f"import failed: {e}")
+        return self.results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the volleyball analysis pipeline")
+    parser.add_argument("--quick", action="store_true", help="One short video and a single repeat")
+    parser.add_argument("--only", help=f"Comma-separated benchmarks ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--video", action="append", default=[],
+                        help='Video specification "WIDTHxHEIGHT:SECONDS[:CODEC[:FPS]]" (repeatable)')
+    parser.add_argument("--repeats", type=int, help="Timed repetitions per case (default 3, 1 with --quick)")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed repetitions per case")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Stub API response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Maximum extra stub API latency")
+    parser.add_argument("--model", help="TensorFlow model for the classifier benchmark (untrained stand-in if omitted)")
+    parser.add_argument("--labels", help="Labels JSON for --model")
+    parser.add_argument("--video-dir", default=os.path.join(CACHE_DIR, "videos"), help="Synthetic video cache")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the code under test")
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.only.split(",")] if args.only else BENCHMARKS
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    specs = [parse_spec(text) for text in args.video] or (QUICK_SPECS if args.quick else DEFAULT_SPECS)
+    repeats = args.repeats or (1 if args.quick else 3)
+
+    print(f"Generating {len(specs)} synthetic videos in {args.video_dir}")
+    videos = generate_videos(specs, args.video_dir)
+
+    workdir = tempfile.mkdtemp(prefix="volleyball-bench-")
+    stub = StubAPIServer(args.latency_ms, args.jitter_ms).start()
+    try:
+        configure_environment(stub, workdir)
+        print(f"Stub API at {stub.url} ({args.latency_ms} ms latency)")
+
+        suite = BenchmarkSuite(videos, stub, workdir, repeats, args.warmup, args.verbose, args.model, args.labels)
+        started = time.time()
+        results = suite.run(selected)
+    finally:
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit, dirty = git_revision()
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "duration_seconds": round(time.time() - started, 1),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+        },
+        "config": {
+            "benchmarks": selected,
+            "videos": [dict(spec._asdict(), name=spec_name(spec)) for spec, _ in videos],
+            "repeats": repeats,
+            "warmup": args.warmup,
+            "stub_latency_ms": args.latency_ms,
+            "stub_jitter_ms": args.jitter_ms,
+        },
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{(commit or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Local stand-in for the Gemini and OpenAI APIs.
+
+Serves the REST endpoints the SDKs call, with a configurable response
+latency, so benchmarks measure this repository's code rather than the
+network or model speed, and never need API keys:
+
+    POST /v1beta/models/<model>:generateContent    (google-generativeai, transport="rest")
+    POST /v1/chat/completions                     (openai, streaming and non-streaming)
+
+Point the clients at it with GEMINI_API_ENDPOINT / GEMINI_TRANSPORT=rest and
+OPENAI_BASE_URL (see StubAPIServer.environment). Responses are canned and
+deterministic; JSON-mode Gemini requests get a valid technique analysis.
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TECHNIQUES = ["serving", "setting", "spiking", "blocking", "digging", "passing"]
+
+TEXT_RESPONSES = {
+    "technique": "The player is spiking with a good approach. Improve arm swing timing and land on both feet.",
+    "positioning": "Players are in a 4-2 formation. The back row should shift left to cover the line.",
+    "tactics": "The offense is running quick sets to the middle. Suggest blocking the middle hitter earlier.",
+    "default": "A spike is being performed. Good form overall; work on follow-through.",
+}
+
+
+def _analysis_kind(prompt):
+    prompt = prompt.lower()
+    for kind in ("technique", "positioning", "tactics"):
+        if kind in prompt:
+            return kind
+    return "default"
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # Load tests open hundreds of connections at once (the default backlog is 5)
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubAPIServer:
+    """
+    Threaded HTTP server answering Gemini and OpenAI requests.
+
+    Every response waits latency_ms (plus up to jitter_ms, drawn from a seeded
+    generator) before it is sent.
+    """
+
+    def __init__(self, latency_ms=50.0, jitter_ms=0.0, host="127.0.0.1", port=0, seed=0):
+        """
+        Create the server (call start() to serve).
+
+        Args:
+            latency_ms: Fixed delay before each response
+            jitter_ms: Maximum extra random delay
+            host: Interface to listen on
+            port: Port to listen on (0 picks a free port)
+            seed: Seed of the jitter generator
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"gemini": 0, "openai": 0, "errors": 0}
+        self.bytes_received = 0
+
+        self.httpd = _HTTPServer((host, port), self._handler_class())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        """Environment variables that route both SDKs to this server."""
+        return {
+            "GEMINI_API_ENDPOINT": self.url,
+            "GEMINI_TRANSPORT": "rest",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="stub-api", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, bytes_received=self.bytes_received)
+
+    def reset_stats(self):
+        with self.lock:
+            self.counts = {"gemini": 0, "openai": 0, "errors": 0}
+            self.bytes_received = 0
+
+    def _delay(self):
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        time.sleep((self.latency_ms + jitter) / 1000.0)
+
+    def _count(self, provider, size):
+        with self.lock:
+            self.counts[provider] += 1
+            self.bytes_received += size
+            return self.counts[provider]
+
+    # Responses
+
+    def gemini_response(self, body, number):
+        """generateContent response for a request body."""
+        prompt = " ".join(
+            part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+        )
+        config = body.get("generationConfig") or body.get("generation_config") or {}
+        wants_json = (config.get("responseMimeType") or config.get("response_mime_type")) == "application/json"
+
+        if wants_json or "respond only with a json object" in prompt.lower():
+            technique = TECHNIQUES[number % len(TECHNIQUES)]
+            text = json.dumps({
+                "technique": technique,
+                "quality_score": round(0.4 + 0.1 * (number % 6), 2),
+                "summary": f"The player is {technique} with a balanced stance.",
+                "issues": ["Late arm swing"] if number % 2 else [],
+                "cues": ["Start the approach earlier"],
+            })
+        else:
+            text = TEXT_RESPONSES[_analysis_kind(prompt)]
+
+        prompt_tokens = 258 * sum(
+            1 for content in body.get("contents", []) for part in content.get("parts", []) if "inlineData" in part
+        ) + len(prompt) // 4
+        completion_tokens = len(text) // 4
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": completion_tokens,
+                "totalTokenCount": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def openai_message(self, body):
+        """Assistant message for a chat completion request (never calls tools)."""
+        messages = body.get("messages") or [{}]
+        content = messages[-1].get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        return {"role": "assistant", "content": TEXT_RESPONSES[_analysis_kind(content)]}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload, content_type="application/json"):
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    with server.lock:
+                        server.counts["errors"] += 1
+                    self._send(400, {"error": {"message": "Invalid JSON"}})
+                    return
+
+                path = self.path.split("?")[0]
+                if re.match(r"^/v1(beta)?/models/[^/:]+:generateContent$", path):
+                    number = server._count("gemini", len(raw))
+                    server._delay()
+                    self._send(200, server.gemini_response(body, number))
+                elif path.rstrip("/").endswith("/chat/completions"):
+                    server._count("openai", len(raw))
+                    server._delay()
+                    self._send_chat(body)
+                else:
+                    with server.lock:
+                        server.counts["errors"] += 1
+                    self._send(404, {"error": {"message": f"Unknown endpoint: {path}"}})
+
+            def _send_chat(self, body):
+                message = server.openai_message(body)
+                base = {"id": "chatcmpl-stub", "created": 0, "model": body.get("model", "stub")}
+                if body.get("stream"):
+                    chunks = [
+                        dict(base, object="chat.completion.chunk",
+                             choices=[{"index": 0, "delta": message, "finish_reason": None}]),
+                        dict(base, object="chat.completion.chunk",
+                             choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]),
+                    ]
+                    data = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+                    self._send(200, data.encode(), "text/event-stream")
+                    return
+
+                tokens = len(message["content"]) // 4
+                self._send(200, dict(
+                    base, object="chat.completion",
+                    choices=[{"index": 0, "message": message, "finish_reason": "stop"}],
+                    usage={"prompt_tokens": 100, "completion_tokens": tokens, "total_tokens": 100 + tokens},
+                ))
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stub Gemini/OpenAI API server for benchmarks")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Delay before each response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Maximum extra random delay")
+    args = parser.parse_args()
+
+    stub = StubAPIServer(args.latency_ms, args.jitter_ms, port=args.port).start()
+    print(f"Stub API listening on {stub.url}")
+    for name, value in stub.environment().items():
+        print(f"  export {name}={value}")
+    try:
+        stub.thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
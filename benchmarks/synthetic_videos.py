@@ -0,0 +1,206 @@
+"""
+Synthetic volleyball videos for benchmarks.
+
+Videos are drawn with OpenCV from a fixed random seed, so the same
+specification always produces the same frames: a court with lines and a
+net, players moving around their positions and a yellow ball flying in
+arcs over the net. The ball is hidden between rallies, so rally
+segmentation and ball tracking have something to find.
+"""
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+VideoSpec = namedtuple("VideoSpec", ["width", "height", "fps", "seconds", "codec"])
+
+# Codec FourCC -> container extension
+CODECS = {
+    "mp4v": ".mp4",
+    "MJPG": ".avi",
+    "XVID": ".avi",
+}
+
+# Default benchmark matrix: resolutions x codecs at a short duration, plus
+# one longer clip
+DEFAULT_SPECS = [
+    VideoSpec(640, 360, 30, 6, "mp4v"),
+    VideoSpec(1280, 720, 30, 6, "mp4v"),
+    VideoSpec(1920, 1080, 30, 6, "mp4v"),
+    VideoSpec(640, 360, 30, 6, "MJPG"),
+    VideoSpec(1280, 720, 30, 6, "MJPG"),
+    VideoSpec(1280, 720, 30, 30, "mp4v"),
+]
+
+QUICK_SPECS = [
+    VideoSpec(640, 360, 30, 3, "mp4v"),
+]
+
+COURT_COLOR = (60, 120, 200)  # BGR orange-brown
+LINE_COLOR = (245, 245, 245)
+NET_COLOR = (40, 40, 40)
+BALL_COLOR = (40, 220, 240)  # BGR yellow
+JERSEY_COLORS = [(180, 40, 40), (40, 40, 180)]
+
+# Rally timing in seconds: ball in play, then a break without a ball
+RALLY_SECONDS = 4.0
+BREAK_SECONDS = 1.5
+
+
+def spec_name(spec):
+    """File name of a video specification."""
+    return f"synthetic_{spec.width}x{spec.height}_{spec.fps}fps_{spec.seconds}s_{spec.codec}{CODECS[spec.codec]}"
+
+
+def parse_spec(text):
+    """Parse "WIDTHxHEIGHT:SECONDS[:CODEC[:FPS]]", e.g. "1280x720:10:MJPG"."""
+    parts = text.split(":")
+    width, height = (int(value) for value in parts[0].lower().split("x"))
+    seconds = int(parts[1]) if len(parts) > 1 else 6
+    codec = parts[2] if len(parts) > 2 else "mp4v"
+    fps = int(parts[3]) if len(parts) > 3 else 30
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec: {codec} (use one of {', '.join(CODECS)})")
+    return VideoSpec(width, height, fps, seconds, codec)
+
+
+class SyntheticScene:
+    """Deterministic volleyball scene drawn frame by frame."""
+
+    def __init__(self, width, height, fps, seed=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.rng = np.random.RandomState(seed)
+
+        # Court area with a margin, net in the middle
+        self.left, self.right = int(width * 0.08), int(width * 0.92)
+        self.top, self.bottom = int(height * 0.25), int(height * 0.95)
+        self.net_x = width // 2
+
+        # Six players per side around their rotation positions
+        self.players = []
+        for side in (0, 1):
+            for row in range(2):
+                for column in range(3):
+                    x0 = self.left if side == 0 else self.net_x
+                    court_w = self.net_x - self.left
+                    x = x0 + court_w * (0.3 + 0.45 * row if side == 0 else 0.25 + 0.45 * (1 - row))
+                    y = self.top + (self.bottom - self.top) * (0.2 + 0.3 * column)
+                    self.players.append({
+                        "home": (x, y),
+                        "phase": self.rng.uniform(0, 2 * np.pi),
+                        "speed": self.rng.uniform(0.5, 1.5),
+                        "color": JERSEY_COLORS[side],
+                    })
+
+        self.player_w = max(6, width // 40)
+        self.player_h = max(14, height // 8)
+        self.ball_radius = max(3, width // 120)
+
+        self.background = self._draw_court()
+        self.noise = self.rng.randint(-6, 7, size=(height, width, 1)).astype(np.int16)
+
+    def _draw_court(self):
+        frame = np.full((self.height, self.width, 3), (90, 90, 90), dtype=np.uint8)
+        cv2.rectangle(frame, (self.left, self.top), (self.right, self.bottom), COURT_COLOR, -1)
+        thickness = max(1, self.width // 320)
+        cv2.rectangle(frame, (self.left, self.top), (self.right, self.bottom), LINE_COLOR, thickness)
+        attack_offset = (self.net_x - self.left) // 3
+        for x in (self.net_x - attack_offset, self.net_x + attack_offset):
+            cv2.line(frame, (x, self.top), (x, self.bottom), LINE_COLOR, thickness)
+        cv2.line(frame, (self.net_x, int(self.height * 0.1)), (self.net_x, self.bottom), NET_COLOR, thickness * 3)
+        return frame
+
+    def ball_position(self, t):
+        """Ball centre at time t, or None during breaks."""
+        cycle = RALLY_SECONDS + BREAK_SECONDS
+        in_cycle = t % cycle
+        if in_cycle >= RALLY_SECONDS:
+            return None
+
+        # The ball crosses the net once per second, alternating sides
+        flight = in_cycle % 1.0
+        direction = 1 if int(in_cycle) % 2 == 0 else -1
+        start_x = self.net_x - direction * (self.net_x - self.left) * 0.6
+        x = start_x + direction * (self.net_x - self.left) * 1.2 * flight
+        peak = self.height * 0.08
+        base = self.top + (self.bottom - self.top) * 0.4
+        y = base - (base - peak) * 4 * flight * (1 - flight)
+        return int(x), int(y)
+
+    def render(self, index):
+        """Draw frame number index."""
+        t = index / self.fps
+        frame = self.background.copy()
+
+        for player in self.players:
+            hx, hy = player["home"]
+            angle = player["phase"] + t * player["speed"]
+            x = int(hx + np.cos(angle) * self.player_w * 1.5)
+            y = int(hy + np.sin(angle * 0.7) * self.player_h * 0.2)
+            cv2.rectangle(frame, (x - self.player_w // 2, y - self.player_h), (x + self.player_w // 2, y),
+                          player["color"], -1)
+            cv2.circle(frame, (x, y - self.player_h - self.player_w // 2), self.player_w // 2, (150, 180, 220), -1)
+
+        ball = self.ball_position(t)
+        if ball is not None:
+            cv2.circle(frame, ball, self.ball_radius, BALL_COLOR, -1)
+
+        # Sensor-like noise that shifts every frame, so encoders cannot skip frames
+        noise = np.roll(self.noise, index * 7, axis=1)
+        return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def generate_video(spec, output_dir, seed=0, overwrite=False):
+    """
+    Write a synthetic video (reusing an existing file with the same specification).
+
+    Args:
+        spec: VideoSpec
+        output_dir: Directory for the video
+        seed: Random seed of the scene
+        overwrite: Regenerate even if the file exists
+
+    Returns:
+        Path to the video file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, spec_name(spec))
+    if os.path.exists(path) and os.path.getsize(path) > 0 and not overwrite:
+        return path
+
+    writer = cv2.VideoWriter(path + ".tmp" + CODECS[spec.codec], cv2.VideoWriter_fourcc(*spec.codec),
+                             spec.fps, (spec.width, spec.height))
+    if not writer.isOpened():
+        raise ValueError(f"OpenCV cannot write {spec.codec} video on this system")
+
+    scene = SyntheticScene(spec.width, spec.height, spec.fps, seed)
+    try:
+        for index in range(spec.fps * spec.seconds):
+            writer.write(scene.render(index))
+    finally:
+        writer.release()
+
+    os.replace(path + ".tmp" + CODECS[spec.codec], path)
+    return path
+
+
+def generate_videos(specs, output_dir, seed=0):
+    """Generate all videos, returning a list of (spec, path) pairs."""
+    videos = []
+    for spec in specs:
+        try:
+            videos.append((spec, generate_video(spec, output_dir, seed)))
+        except ValueError as e:
+            print(f"Skipping {spec_name(spec)}: {e}")
+    return videos
+
+
+def encode_jpeg(frame, quality=90):
+    """Encode a frame as JPEG bytes."""
+    success, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("Could not encode frame")
+    return buffer.tobytes()
@@ -123,6 +123,19 @@ CREATE TABLE IF NOT EXISTS parent_volunteers (
     updated_at timestamp with time zone DEFAULT timezone('utc'::text, now())
 );
 
+-- Analysis History
+CREATE TABLE IF NOT EXISTS analysis_results (
+    id bigserial PRIMARY KEY,
+    player_id text,
+    team_id text,
+    analysis_type text NOT NULL,
+    technique text,
+    quality_score real CHECK (quality_score >= 0 AND quality_score <= 1),
+    source text,
+    result text NOT NULL,
+    created_at timestamp with time zone DEFAULT timezone('utc'::text, now())
+);
+
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_players_name ON players(name);
 CREATE INDEX IF NOT EXISTS idx_player_development_player_id ON player_development(player_id);
@@ -132,6 +145,8 @@ CREATE INDEX IF NOT EXISTS idx_campaigns_status ON campaigns(status);
 CREATE INDEX IF NOT EXISTS idx_donations_campaign_id ON donations(campaign_id);
 CREATE INDEX IF NOT EXISTS idx_parent_interests_status ON parent_interests(status);
 CREATE INDEX IF NOT EXISTS idx_parent_volunteers_parent_id ON parent_volunteers(parent_id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_player_technique_created ON analysis_results(player_id, technique, created_at);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_team_created ON analysis_results(team_id, created_at);
 
 -- Create triggers for updating timestamps
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -191,4 +206,5 @@ COMMENT ON TABLE tryout_evaluations IS 'Records player evaluations during tryout
 COMMENT ON TABLE campaigns IS 'Tracks fundraising campaigns for the volleyball program';
 COMMENT ON TABLE donations IS 'Records donations received for fundraising campaigns';
 COMMENT ON TABLE parent_interests IS 'Stores parent interest forms and volunteer preferences';
+COMMENT ON TABLE analysis_results IS 'Stores AI analysis results for player trends and training programs';
 COMMENT ON TABLE parent_volunteers IS 'Manages parent volunteer assignments and availability'; 
\ No newline at end of file
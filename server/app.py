@@ -22,15 +22,14 @@ else:
 
 # Now import other modules
 import tempfile
-import traceback
 import cv2
 import json
 import base64
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, g
+import time
+import logging
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from PIL import Image, UnidentifiedImageError
-import io
 import numpy as np
 
 # Add src directory to path to import from volleyball_ai package
@@ -52,9 +51,41 @@ from volleyball_ai import (
     analyze_play_sequence,
     PlayerAgent,
     CoachAgent,
-    TeamAnalysisAgent
+    TeamAnalysisAgent,
+    api_client_stats,
+    get_result_sink,
+    latest_results,
+    tracer,
+    span,
+    tracing_stats,
+    render_metrics,
+    HTTP_REQUESTS,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    configure_logging,
+    bind_context,
+    clear_context,
+    logging_stats,
+    start_profile,
+    valid_profile_id,
+    get_profile,
+    list_profiles,
+    start_sampler,
+    sampler,
+    collapsed_stacks,
+    profiling_stats,
+    cpu_pool,
+    is_intact_rgb_jpeg,
+    FEATURE_SIZE
 )
 
+# JSON log lines, written by a background thread (see LOG_LEVEL/LOG_FORMAT)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Low-frequency stack sampling of the whole process (see CONTINUOUS_PROFILING)
+start_sampler()
+
 # Create Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -63,11 +94,89 @@ CORS(app)  # Enable CORS for all routes
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
 UPLOAD_DIR = UPLOAD_FOLDER  # Alias for consistency
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-print(f"Upload folder: {UPLOAD_FOLDER}")
+logger.info("Upload folder: %s", UPLOAD_FOLDER)
 
 # Set maximum content length (100MB)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
 
+# Most result rows returned by /api/volleyball/results
+MAX_RESULTS_LIMIT = int(os.environ.get('MAX_RESULTS_LIMIT', '10000'))
+
+# Every API request is the root span of a trace; stages called while
+# handling it (upload, decode, remote calls, ...) become its child spans.
+# Request counts and latency are recorded per route for /metrics, and log
+# lines written while handling the request carry its ID, route and trace ID.
+# With PROFILING=1, requests with an X-Profile header (or ?profile=) of
+# "sample" or "cprofile" are profiled and the profile is stored under the
+# request ID.
+@app.before_request
+def start_request_span():
+    g.request_start = time.perf_counter()
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    route = request.url_rule.rule if request.url_rule else request.path
+    if request.path.startswith('/api/'):
+        g.request_span = tracer.start_span(f"{request.method} {route}", {
+            "http.method": request.method,
+            "http.route": route,
+            "http.request_content_length": request.content_length or 0,
+        })
+    # The request ID names profile files, so only safe client IDs are kept
+    g.request_id = valid_profile_id(request.headers.get('X-Request-Id'))
+    g.log_context = bind_context(
+        request_id=g.request_id,
+        method=request.method,
+        route=route,
+        trace_id=g.request_span.trace_id if 'request_span' in g else None,
+    )
+    
+    profile_mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if profile_mode:
+        g.profile = start_profile(g.request_id, f"{request.method} {route}", profile_mode.lower())
+
+@app.after_request
+def record_response_status(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+        response.headers['X-Profile-Url'] = f"/api/profiles/{profile.id}"
+    if 'request_id' in g:
+        response.headers['X-Request-Id'] = g.request_id
+    
+    # Label by route pattern, so the number of series stays bounded
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.labels(method=request.method, endpoint=endpoint, status=response.status_code).inc()
+    if 'request_start' in g:
+        HTTP_REQUEST_SECONDS.labels(method=request.method, endpoint=endpoint).observe(
+            time.perf_counter() - g.request_start
+        )
+    
+    request_span = g.pop('request_span', None)
+    if request_span is not None:
+        request_span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            request_span.record_error(RuntimeError(f"HTTP {response.status_code}"))
+        tracer.end_span(request_span)
+        response.headers['X-Trace-Id'] = request_span.trace_id or ''
+    return response
+
+@app.teardown_request
+def end_request_span(error=None):
+    if g.pop('request_start', None) is not None:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+    
+    # Only still running when the request failed before after_request ran
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+    
+    # Only still open when the request failed before after_request ran
+    request_span = g.pop('request_span', None)
+    if request_span is not None:
+        tracer.end_span(request_span, error)
+    
+    if 'log_context' in g:
+        clear_context(g.pop('log_context'))
+
 # Initialize the volleyball agent system
 try:
     agent_system = VolleyballAgentSystem(
@@ -75,9 +184,9 @@ try:
         labels_path=os.environ.get("LABELS_PATH", "../model/volleyball_labels.json"),
         api_key=os.environ.get("OPENAI_API_KEY")
     )
-    print("Volleyball Agent System initialized successfully")
+    logger.info("Volleyball Agent System initialized successfully")
 except Exception as e:
-    print(f"Error initializing Volleyball Agent System: {e}")
+    logger.error("Error initializing Volleyball Agent System: %s", e)
     agent_system = None
 
 # Utility function to validate and fix image files
@@ -85,108 +194,20 @@ def validate_and_fix_image(image_path):
     """
     Validates an image file and attempts to fix it if there are issues.
     
+    Intact RGB JPEGs are checked from their headers and used as they are.
+    Other files are repaired on the CPU worker pool (see
+    volleyball_ai.cpu_pool), so decoding and re-encoding them does not hold
+    up the other request threads.
+    
     Args:
         image_path: Path to the image file
         
     Returns:
-        Tuple of (success, fixed_image_path or error_message)
+        Tuple of (success, image path to use (the original or a fixed copy) or error_message)
     """
-    if not os.path.exists(image_path):
-        return False, f"Image file not found: {image_path}"
-    
-    if os.path.getsize(image_path) == 0:
-        return False, f"Image file is empty: {image_path}"
-    
-    # Try different methods to validate and fix the image
-    methods_tried = []
-    
-    # Method 1: Try with PIL directly
-    try:
-        methods_tried.append("PIL direct open")
-        with Image.open(image_path) as img:
-            img_format = img.format
-            img_size = img.size
-            img_mode = img.mode
-            
-            # Convert to RGB if needed
-            if img_mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Save a fixed copy
-            fixed_path = f"{os.path.splitext(image_path)[0]}_fixed.jpg"
-            img.save(fixed_path, format="JPEG", quality=95)
-            print(f"Successfully fixed image with PIL: {fixed_path}")
-            return True, fixed_path
-    except UnidentifiedImageError:
-        print(f"PIL could not identify the image format: {image_path}")
-    except Exception as e:
-        print(f"Error with PIL direct open: {str(e)}")
-    
-    # Method 2: Try with OpenCV
-    try:
-        methods_tried.append("OpenCV")
-        img = cv2.imread(image_path)
-        if img is None:
-            print(f"OpenCV could not load the image: {image_path}")
-        else:
-            # Convert BGR to RGB
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            
-            # Save using OpenCV
-            fixed_path = f"{os.path.splitext(image_path)[0]}_cv_fixed.jpg"
-            cv2.imwrite(fixed_path, img)
-            
-            # Verify the saved image
-            if os.path.exists(fixed_path) and os.path.getsize(fixed_path) > 0:
-                print(f"Successfully fixed image with OpenCV: {fixed_path}")
-                return True, fixed_path
-    except Exception as e:
-        print(f"Error with OpenCV: {str(e)}")
-    
-    # Method 3: Try reading as binary and converting with PIL
-    try:
-        methods_tried.append("Binary read + PIL")
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-        
-        # Try to create an image from binary data
-        img = Image.open(io.BytesIO(image_data))
-        img_format = img.format
-        
-        # Save a fixed copy
-        fixed_path = f"{os.path.splitext(image_path)[0]}_binary_fixed.jpg"
-        img.save(fixed_path, format="JPEG", quality=95)
-        print(f"Successfully fixed image with binary read + PIL: {fixed_path}")
-        return True, fixed_path
-    except Exception as e:
-        print(f"Error with binary read + PIL: {str(e)}")
-    
-    # Method 4: Create a blank image with error message
-    try:
-        methods_tried.append("Create blank image")
-        blank_img = Image.new('RGB', (800, 600), color='white')
-        
-        # Add text explaining the error
-        from PIL import ImageDraw, ImageFont
-        draw = ImageDraw.Draw(blank_img)
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except:
-            font = ImageFont.load_default()
-        
-        error_text = f"Could not process the original image. Methods tried: {', '.join(methods_tried)}"
-        draw.text((50, 50), error_text, fill="black", font=font)
-        draw.text((50, 100), "This is a placeholder image created due to processing errors.", fill="black", font=font)
-        
-        # Save the blank image
-        blank_path = f"{os.path.splitext(image_path)[0]}_blank.jpg"
-        blank_img.save(blank_path)
-        print(f"Created blank image with error message: {blank_path}")
-        return True, blank_path
-    except Exception as e:
-        print(f"Error creating blank image: {str(e)}")
-    
-    return False, f"Failed to validate or fix image after trying multiple methods: {', '.join(methods_tried)}"
+    if is_intact_rgb_jpeg(image_path):
+        return True, image_path
+    return cpu_pool.validate(image_path)
 
 @app.route('/')
 def index():
@@ -249,7 +270,7 @@ def analyze_video():
         return jsonify(results)
     
     except Exception as e:
-        print(f"Error analyzing video: {e}")
+        logger.exception("Error analyzing video: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball-agent/feedback', methods=['POST'])
@@ -283,24 +304,13 @@ def get_real_time_feedback():
         # Decode base64 frame data
         frame_bytes = base64.b64decode(frame_data)
         
-        # Save frame to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False, dir=UPLOAD_FOLDER) as temp_file:
-            temp_file.write(frame_bytes)
-            frame_path = temp_file.name
-        
-        # Get feedback for the frame
-        feedback = agent_system.get_real_time_feedback(frame_path, current_time)
-        
-        # Clean up temporary file
-        try:
-            os.unlink(frame_path)
-        except:
-            pass
+        # Get feedback for the frame (the encoded bytes are analyzed directly)
+        feedback = agent_system.get_real_time_feedback(frame_bytes, current_time)
         
         return jsonify(feedback)
     
     except Exception as e:
-        print(f"Error getting feedback: {e}")
+        logger.exception("Error getting feedback: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball-agent/training', methods=['POST'])
@@ -333,7 +343,7 @@ def generate_training_program():
         return jsonify(program)
     
     except Exception as e:
-        print(f"Error generating training program: {e}")
+        logger.exception("Error generating training program: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball-agent/team-analysis', methods=['POST'])
@@ -366,7 +376,7 @@ def analyze_team_performance():
         return jsonify(analysis)
     
     except Exception as e:
-        print(f"Error analyzing team performance: {e}")
+        logger.exception("Error analyzing team performance: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball-agent/collaborative-analysis', methods=['POST'])
@@ -399,23 +409,21 @@ def collaborative_analysis():
         
         # Decode base64 image data
         img_bytes = base64.b64decode(frame_data)
-        img_array = np.frombuffer(img_bytes, dtype=np.uint8)
-        frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        frame = cpu_pool.decode(img_bytes, min_size=FEATURE_SIZE)
+        if frame is None:
+            return jsonify({"error": "Could not decode frame data"}), 400
         
         # Extract features from the frame
-        if hasattr(agent_system.classifier, 'extract_features'):
-            features = agent_system.classifier.extract_features(frame)
-            features_dict = {f"feature_{i}": float(val) for i, val in enumerate(features)}
-            
-            # Perform collaborative analysis
-            results = agent_system.collaborative_analysis(features_dict, player_id)
-            
-            return jsonify(results)
-        else:
-            return jsonify({"error": "Feature extraction not available"}), 500
+        features = cpu_pool.features(frame)
+        features_dict = {f"feature_{i}": float(val) for i, val in enumerate(features)}
+        
+        # Perform collaborative analysis
+        results = agent_system.collaborative_analysis(features_dict, player_id)
+        
+        return jsonify(results)
     
     except Exception as e:
-        print(f"Error performing collaborative analysis: {e}")
+        logger.exception("Error performing collaborative analysis: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball-agent/vector-search', methods=['POST'])
@@ -448,23 +456,21 @@ def vector_search_analysis():
         
         # Decode base64 image data
         img_bytes = base64.b64decode(frame_data)
-        img_array = np.frombuffer(img_bytes, dtype=np.uint8)
-        frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        frame = cpu_pool.decode(img_bytes, min_size=FEATURE_SIZE)
+        if frame is None:
+            return jsonify({"error": "Could not decode frame data"}), 400
         
         # Extract features from the frame
-        if hasattr(agent_system.classifier, 'extract_features'):
-            features = agent_system.classifier.extract_features(frame)
-            features_dict = {f"feature_{i}": float(val) for i, val in enumerate(features)}
-            
-            # Perform vector search analysis
-            results = agent_system.analyze_with_vector_search(features_dict, player_id)
-            
-            return jsonify({"results": str(results)})
-        else:
-            return jsonify({"error": "Feature extraction not available"}), 500
+        features = cpu_pool.features(frame)
+        features_dict = {f"feature_{i}": float(val) for i, val in enumerate(features)}
+        
+        # Perform vector search analysis
+        results = agent_system.analyze_with_vector_search(features_dict, player_id)
+        
+        return jsonify({"results": str(results)})
     
     except Exception as e:
-        print(f"Error performing vector search analysis: {e}")
+        logger.exception("Error performing vector search analysis: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball-agent/metrics', methods=['GET'])
@@ -480,7 +486,7 @@ def get_agent_metrics():
         return jsonify(metrics)
     
     except Exception as e:
-        print(f"Error getting agent metrics: {e}")
+        logger.exception("Error getting agent metrics: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball-agent/batch-process', methods=['POST'])
@@ -513,7 +519,7 @@ def batch_process_videos():
         return jsonify(results)
     
     except Exception as e:
-        print(f"Error batch processing videos: {e}")
+        logger.exception("Error batch processing videos: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball-agent/analyze-image', methods=['POST'])
@@ -544,32 +550,20 @@ def analyze_image():
         # Decode base64 image data
         image_bytes = base64.b64decode(image_data)
         
-        # Save image to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False, dir=UPLOAD_FOLDER) as temp_file:
-            temp_file.write(image_bytes)
-            image_path = temp_file.name
-        
-        # Analyze the image based on the analysis type
-        try:
-            if analysis_type == 'technique':
-                result = analyze_technique(image_path)
-            elif analysis_type == 'positioning':
-                result = analyze_positioning(image_path)
-            elif analysis_type == 'tactics':
-                result = analyze_tactics(image_path)
-            else:
-                return jsonify({"error": f"Invalid analysis type: {analysis_type}"}), 400
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(image_path)
-            except:
-                pass
+        # Analyze the encoded image directly based on the analysis type
+        if analysis_type == 'technique':
+            result = analyze_technique(image_bytes)
+        elif analysis_type == 'positioning':
+            result = analyze_positioning(image_bytes)
+        elif analysis_type == 'tactics':
+            result = analyze_tactics(image_bytes)
+        else:
+            return jsonify({"error": f"Invalid analysis type: {analysis_type}"}), 400
         
         return jsonify(result)
     
     except Exception as e:
-        print(f"Error analyzing image: {e}")
+        logger.exception("Error analyzing image: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/volleyball/analyze-video', methods=['POST'])
@@ -582,6 +576,7 @@ def analyze_video_google():
     - analysis_type: Type of analysis (technique, positioning, tactics)
     - interval_seconds: Optional interval between frames to analyze (in seconds)
     - max_frames: Optional maximum number of frames to analyze
+    - in_play_only: Optional "true" to only analyze frames inside rallies
     
     Returns:
         JSON with analysis results
@@ -600,9 +595,14 @@ def analyze_video_google():
         analysis_type = request.form.get('analysis_type', 'technique')
         interval_seconds = float(request.form.get('interval_seconds', 2.0))
         max_frames = int(request.form.get('max_frames', 5))
+        in_play_only = request.form.get('in_play_only', 'false').lower() == 'true'
         
-        print(f"Received video: {video_file.filename}, Content-Type: {video_file.content_type}")
-        print(f"Analysis parameters: type={analysis_type}, interval={interval_seconds}s, max_frames={max_frames}")
+        logger.info("Received video %s", video_file.filename, extra={
+            "content_type": video_file.content_type,
+            "analysis_type": analysis_type,
+            "interval_seconds": interval_seconds,
+            "max_frames": max_frames,
+        })
         
         # Ensure uploads directory exists
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -624,8 +624,9 @@ def analyze_video_google():
         temp_video_path = os.path.join(UPLOAD_FOLDER, f"tmp{next(tempfile._get_candidate_names())}{file_extension}")
         
         try:
-            video_file.save(temp_video_path)
-            print(f"Saved video to: {temp_video_path}")
+            with span("upload", bytes=request.content_length or 0, content_type=video_file.content_type or ""):
+                video_file.save(temp_video_path)
+            logger.debug("Saved video to: %s", temp_video_path)
             
             # Check if file exists and has content
             if not os.path.exists(temp_video_path):
@@ -635,27 +636,23 @@ def analyze_video_google():
             if file_size == 0:
                 return jsonify({"error": "Uploaded video file is empty"}), 400
                 
-            print(f"Video file size: {file_size} bytes")
+            logger.debug("Video file size: %d bytes", file_size)
             
-            # For MOV files, convert to MP4 first
-            if file_extension.lower() == '.mov':
-                print("Converting MOV file to MP4 for better compatibility")
-                try:
-                    mp4_path = convert_video_to_mp4(temp_video_path)
-                    print(f"Converted video to MP4: {mp4_path}")
-                    
-                    # Use the converted file for analysis
-                    temp_video_path = mp4_path
-                except Exception as conv_error:
-                    print(f"Warning: Failed to convert MOV to MP4: {str(conv_error)}")
-                    print("Proceeding with original MOV file")
+            # Results of this upload are stored under its temporary file name
+            video_id = os.path.splitext(os.path.basename(temp_video_path))[0]
             
+            # MOV files are decoded with the ffmpeg pipe decoder when ffmpeg is
+            # installed (see video_decoder.should_use_ffmpeg), OpenCV otherwise
             # Use our new frame-based approach for video analysis
             output_file, results = analyze_video_frames_gemini(
                 temp_video_path,
                 analysis_type=analysis_type,
                 interval_seconds=interval_seconds,
-                max_frames=max_frames
+                max_frames=max_frames,
+                in_play_only=in_play_only,
+                video_id=video_id,
+                # The upload is deleted afterwards, so keep its rally index in memory only
+                save_rally_index=False
             )
             
             # Format results for JSON response
@@ -674,13 +671,13 @@ def analyze_video_google():
                 "video": video_file.filename,
                 "analysis_type": analysis_type,
                 "results": formatted_results,
+                "video_id": video_id,
                 "output_file": output_file
             })
             
         except Exception as e:
             error_msg = f"Error analyzing video: {str(e)}"
-            print(error_msg)
-            traceback.print_exc()
+            logger.exception(error_msg)
             return jsonify({"error": error_msg}), 500
             
         finally:
@@ -688,14 +685,13 @@ def analyze_video_google():
             try:
                 if os.path.exists(temp_video_path):
                     os.unlink(temp_video_path)
-                    print(f"Removed temporary video file: {temp_video_path}")
+                    logger.debug("Removed temporary video file: %s", temp_video_path)
             except Exception as e:
-                print(f"Warning: Could not remove temporary file {temp_video_path}: {str(e)}")
+                logger.warning("Could not remove temporary file %s: %s", temp_video_path, e)
     
     except Exception as e:
         error_msg = f"Server error: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception(error_msg)
         return jsonify({"error": error_msg}), 500
 
 @app.route('/api/volleyball/analyze-frame', methods=['POST'])
@@ -717,12 +713,12 @@ def analyze_frame():
         analysis_type = request.form.get('analysis_type', 'technique')
         
         # Debug information
-        print(f"Received frame: {frame_file.filename}, Content-Type: {frame_file.content_type}")
+        logger.info("Received frame %s", frame_file.filename, extra={"content_type": frame_file.content_type})
         
         # Ensure uploads directory exists
         if not os.path.exists(UPLOAD_FOLDER):
             os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-            print(f"Created uploads directory: {UPLOAD_FOLDER}")
+            logger.info("Created uploads directory: %s", UPLOAD_FOLDER)
         
         # Save frame to temporary file
         try:
@@ -732,8 +728,9 @@ def analyze_frame():
                 file_ext = '.jpg'  # Default to jpg
                 
             temp_file_path = os.path.join(UPLOAD_FOLDER, f"tmp{next(tempfile._get_candidate_names())}{file_ext}")
-            frame_file.save(temp_file_path)
-            print(f"Saved frame to: {temp_file_path}")
+            with span("upload", bytes=request.content_length or 0, content_type=frame_file.content_type or ""):
+                frame_file.save(temp_file_path)
+            logger.debug("Saved frame to: %s", temp_file_path)
             
             # Verify and fix the image if needed
             success, result_path = validate_and_fix_image(temp_file_path)
@@ -742,7 +739,7 @@ def analyze_frame():
                 
             # Use the fixed image path for analysis
             frame_path = result_path
-            print(f"Using validated/fixed frame: {frame_path}")
+            logger.debug("Using validated/fixed frame: %s", frame_path)
             
             # Analyze the frame
             try:
@@ -755,8 +752,7 @@ def analyze_frame():
                 else:
                     return jsonify({"error": f"Invalid analysis type: {analysis_type}"}), 400
             except Exception as analysis_error:
-                print(f"Error during frame analysis: {str(analysis_error)}")
-                traceback.print_exc()
+                logger.exception("Error during frame analysis: %s", analysis_error)
                 return jsonify({"error": f"Analysis error: {str(analysis_error)}"}), 500
             
             # Clean up temporary files
@@ -764,22 +760,185 @@ def analyze_frame():
                 os.unlink(temp_file_path)
                 if frame_path != temp_file_path:  # If we created a fixed version
                     os.unlink(frame_path)
-                print(f"Cleaned up temporary files")
+                logger.debug("Cleaned up temporary files")
             except Exception as cleanup_error:
-                print(f"Warning: Could not clean up temporary files: {str(cleanup_error)}")
+                logger.warning("Could not clean up temporary files: %s", cleanup_error)
             
             return jsonify({"analysis": result})
             
         except Exception as save_error:
-            print(f"Error saving or processing uploaded file: {str(save_error)}")
-            traceback.print_exc()
+            logger.exception("Error saving or processing uploaded file: %s", save_error)
             return jsonify({"error": f"Error processing uploaded file: {str(save_error)}"}), 500
     
     except Exception as e:
-        print(f"Error analyzing frame: {e}")
-        traceback.print_exc()
+        logger.exception("Error analyzing frame: %s", e)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/volleyball/results', methods=['GET'])
+def get_video_results():
+    """
+    Read stored video analysis results back from the results directory.
+    
+    Query parameters:
+    - video_id: Optional video ID (returned by /api/volleyball/analyze-video)
+    - analysis_type: Optional analysis type
+    - limit: Optional maximum number of rows (default 500, at most
+      MAX_RESULTS_LIMIT)
+    
+    Rows are returned once the result sink's writer has stored them (within
+    RESULTS_FLUSH_SECONDS).
+    
+    Returns:
+        JSON with the most recent result rows, oldest first
+    """
+    try:
+        limit = int(request.args.get('limit', 500))
+        if limit <= 0 or limit > MAX_RESULTS_LIMIT:
+            limit = MAX_RESULTS_LIMIT
+        
+        rows = latest_results(
+            limit,
+            get_result_sink().results_dir,
+            video_id=request.args.get('video_id'),
+            analysis_type=request.args.get('analysis_type')
+        )
+        
+        return jsonify({
+            "count": len(rows),
+            "results": rows
+        })
+    
+    except Exception as e:
+        logger.exception("Error reading video results: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Server metrics in the Prometheus text format, for scraping.
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Latency histograms of the traced stages.
+    
+    Query parameters:
+    - slow_ms: Optional; also list recent requests that took at least this
+      long, with the time they spent in each stage
+    - limit: Optional maximum number of slow requests (default 20)
+    
+    Returns:
+        JSON with p50/p95/p99 latency per span name
+    """
+    try:
+        metrics = {"tracing": tracing_stats(), "profiling": profiling_stats(), "cpu_pool": cpu_pool.stats()}
+        if 'slow_ms' in request.args:
+            metrics["slow_requests"] = tracer.trace_summaries(
+                limit=int(request.args.get('limit', 20)),
+                min_duration_ms=float(request.args['slow_ms'])
+            )
+        return jsonify(metrics)
+    
+    except Exception as e:
+        logger.exception("Error reading metrics: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/traces', methods=['GET'])
+def get_traces():
+    """
+    Export buffered spans as OpenTelemetry (OTLP/JSON) traces.
+    
+    Query parameters:
+    - trace_id: Optional trace ID (sent back in the X-Trace-Id header)
+    - limit: Optional maximum number of spans (default 1000)
+    
+    Returns:
+        OTLP/JSON ExportTraceServiceRequest
+    """
+    try:
+        spans = tracer.recent_spans(
+            limit=int(request.args.get('limit', 1000)),
+            trace_id=request.args.get('trace_id')
+        )
+        return jsonify(tracer.export_otlp(spans))
+    
+    except Exception as e:
+        logger.exception("Error exporting traces: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/profiles', methods=['GET'])
+def get_profiles():
+    """
+    List stored request profiles, newest first.
+    
+    Returns:
+        JSON with the ID, route, mode, duration and time per stage of each profile
+    """
+    return jsonify({"profiles": list_profiles()})
+
+@app.route('/api/profiles/hot', methods=['GET'])
+def get_hot_stacks():
+    """
+    Hot stacks found by the continuous sampler.
+    
+    Query parameters:
+    - stage: Optional stage (extraction, detection, encoding, remote_call, other)
+    - limit: Optional maximum number of stacks (default 20)
+    - format: "json" (default), "speedscope" or "collapsed"
+    
+    Returns:
+        JSON with sampled time per stage and the hottest stacks (innermost
+        frame first), or a profile file to download
+    """
+    try:
+        stage = request.args.get('stage')
+        output_format = request.args.get('format', 'json')
+        if output_format == 'speedscope':
+            return _profile_download(json.dumps(sampler.to_speedscope(stage)), "continuous.speedscope.json",
+                                     "application/json")
+        if output_format == 'collapsed':
+            return _profile_download(collapsed_stacks(sampler.snapshot(stage)), "continuous.collapsed.txt",
+                                     "text/plain")
+        return jsonify({
+            "profiling": profiling_stats(),
+            "stacks": sampler.hot_stacks(stage, int(request.args.get('limit', 20)))
+        })
+    
+    except Exception as e:
+        logger.exception("Error reading hot stacks: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """
+    Download a request profile.
+    
+    Query parameters:
+    - format: "speedscope" (default, open at https://www.speedscope.app),
+      "collapsed" (flamegraph.pl input) or "pstats" (cProfile profiles only)
+    
+    Returns:
+        The profile file
+    """
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": f"Profile not found: {profile_id}"}), 404
+    
+    output_format = request.args.get('format', 'speedscope')
+    if output_format == 'speedscope':
+        return _profile_download(json.dumps(profile.to_speedscope()), f"{profile.id}.speedscope.json",
+                                 "application/json")
+    if output_format == 'collapsed':
+        return _profile_download(profile.to_collapsed(), f"{profile.id}.collapsed.txt", "text/plain")
+    if output_format == 'pstats' and profile.pstats is not None:
+        return _profile_download(profile.to_pstats(), f"{profile.id}.prof", "application/octet-stream")
+    return jsonify({"error": f"Format not available for this profile: {output_format}"}), 400
+
+def _profile_download(data, filename, mimetype):
+    return Response(data, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
 @app.route('/api/health')
 def health_check():
     """
@@ -789,7 +948,10 @@ def health_check():
         "status": "ok",
         "message": "Server is running",
         "google_ai_integration": os.environ.get("GOOGLE_AI_API_KEY") is not None,
-        "openai_integration": os.environ.get("OPENAI_API_KEY") is not None
+        "openai_integration": os.environ.get("OPENAI_API_KEY") is not None,
+        "api_clients": api_client_stats(),
+        "analysis_results": get_result_sink().stats(),
+        "logging": logging_stats()
     })
 
 if __name__ == '__main__':
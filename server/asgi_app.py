@@ -0,0 +1,395 @@
+"""
+ASGI variant of the API server in app.py.
+
+Serves the same routes. The endpoints that spend most of their time waiting
+on Gemini (analyze-image, analyze-frame and analyze-video) are coroutines:
+remote calls are made with the async Gemini client, and decoding, image
+validation, frame extraction and file I/O run on the bounded CPU pool of
+volleyball_ai.async_analysis, so one process keeps hundreds of analyses in
+flight. Every other route is handled by the Flask app itself, mounted
+through WSGIMiddleware (on the threadpool), so both servers always expose
+the same API.
+
+Run with (needs the "asgi" extra: starlette, uvicorn, python-multipart, a2wsgi):
+    uvicorn asgi_app:app --app-dir server --host 0.0.0.0 --port 5000
+
+benchmarks/load_test.py compares this server with the Flask one.
+"""
+
+import base64
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    # Deprecated in newer Starlette releases in favour of a2wsgi
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+# Loads the environment, configures logging and builds the Flask app
+import app as flask_server
+
+from volleyball_ai import (
+    ANALYSIS_PROMPTS,
+    analyze_image_async,
+    analyze_video_frames_async,
+    run_cpu,
+    cpu_pool,
+    is_intact_rgb_jpeg,
+    tracer,
+    span,
+    HTTP_REQUESTS,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    bind_context,
+    clear_context,
+    valid_profile_id
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_CONTENT_LENGTH = flask_server.app.config['MAX_CONTENT_LENGTH']
+
+
+class RequestTooLarge(Exception):
+    """The request body is larger than MAX_CONTENT_LENGTH."""
+
+
+class _LimitedReceive:
+    """
+    ASGI receive callable counting the request body as it is read.
+
+    Raises RequestTooLarge once more than `limit` bytes have arrived, so
+    bodies without (or with a wrong) Content-Length are stopped while they
+    are read instead of being spooled in full.
+    """
+
+    def __init__(self, receive, limit):
+        self.receive = receive
+        self.limit = limit
+        self.received = 0
+
+    async def __call__(self):
+        message = await self.receive()
+        if message['type'] == 'http.request':
+            self.received += len(message.get('body', b''))
+            if self.received > self.limit:
+                raise RequestTooLarge(f"Request body exceeds {self.limit} bytes")
+        return message
+
+
+def _cors(response, methods):
+    # Same policy as flask_cors.CORS(app) on the Flask routes
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Methods'] = ', '.join(methods)
+    return response
+
+
+def instrumented(route, methods=('POST',)):
+    """
+    Wrap an async endpoint with the request handling of the Flask app.
+
+    The request is the root span of a trace, counted in the HTTP metrics
+    under its route, and log lines written while handling it carry its ID,
+    route and trace ID. CORS preflight requests are answered here, and
+    bodies larger than the Flask app's MAX_CONTENT_LENGTH are rejected with
+    413: up front from Content-Length, otherwise as soon as the endpoint
+    has read more than that.
+
+    Args:
+        route: Route pattern, used as span name and metrics label
+        methods: Methods the route accepts
+    """
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            if request.method == 'OPTIONS':
+                response = _cors(Response(status_code=200), methods)
+                requested_headers = request.headers.get('Access-Control-Request-Headers')
+                if requested_headers:
+                    response.headers['Access-Control-Allow-Headers'] = requested_headers
+                return response
+
+            start_time = time.perf_counter()
+            HTTP_REQUESTS_IN_FLIGHT.inc()
+            content_length = int(request.headers.get('content-length') or 0)
+            request_span = tracer.start_span(f"{request.method} {route}", {
+                "http.method": request.method,
+                "http.route": route,
+                "http.request_content_length": content_length,
+            })
+            request_id = valid_profile_id(request.headers.get('X-Request-Id'))
+            log_token = bind_context(request_id=request_id, method=request.method, route=route,
+                                     trace_id=request_span.trace_id)
+
+            status_code = 500
+            error = None
+            try:
+                if content_length > MAX_CONTENT_LENGTH:
+                    raise RequestTooLarge(f"Content-Length {content_length} exceeds {MAX_CONTENT_LENGTH} bytes")
+                response = await endpoint(Request(request.scope, _LimitedReceive(request.receive,
+                                                                                 MAX_CONTENT_LENGTH)))
+                status_code = response.status_code
+            except RequestTooLarge as e:
+                logger.warning("Rejected request: %s", e)
+                response = JSONResponse({"error": "Uploaded file is too large"}, status_code=413)
+                status_code = response.status_code
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                HTTP_REQUESTS.labels(method=request.method, endpoint=route, status=status_code).inc()
+                HTTP_REQUEST_SECONDS.labels(method=request.method, endpoint=route).observe(
+                    time.perf_counter() - start_time
+                )
+                HTTP_REQUESTS_IN_FLIGHT.dec()
+                request_span.set_attribute("http.status_code", status_code)
+                if error is None and status_code >= 500:
+                    request_span.record_error(RuntimeError(f"HTTP {status_code}"))
+                tracer.end_span(request_span, error)
+                clear_context(log_token)
+
+            response.headers['X-Request-Id'] = request_id
+            response.headers['X-Trace-Id'] = request_span.trace_id or ''
+            return _cors(response, methods)
+        return wrapper
+    return decorator
+
+
+def _save_upload(upload, path):
+    """Copy an uploaded file to disk (runs on the CPU pool)"""
+    upload.file.seek(0)
+    with open(path, 'wb') as output:
+        shutil.copyfileobj(upload.file, output, 1024 * 1024)
+
+
+def _remove_files(*paths):
+    for path in paths:
+        try:
+            if path and os.path.exists(path):
+                os.unlink(path)
+        except OSError as e:
+            logger.warning("Could not remove temporary file %s: %s", path, e)
+
+
+@instrumented('/api/volleyball-agent/analyze-image')
+async def analyze_image(request):
+    """
+    Analyze a single image for volleyball technique.
+
+    Expected JSON payload:
+    {
+        "image_data": "base64 encoded image data",
+        "analysis_type": "technique|positioning|tactics"
+    }
+    """
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+
+        if not data or 'image_data' not in data:
+            return JSONResponse({"error": "Missing image data"}, status_code=400)
+
+        image_data = data.get('image_data')
+        analysis_type = data.get('analysis_type', 'technique')
+        if analysis_type not in ANALYSIS_PROMPTS:
+            return JSONResponse({"error": f"Invalid analysis type: {analysis_type}"}, status_code=400)
+
+        # Remove data:image/jpeg;base64, prefix if present
+        if ',' in image_data:
+            image_data = image_data.split(',')[1]
+
+        image_bytes = await run_cpu(base64.b64decode, image_data)
+        result = await analyze_image_async(image_bytes, analysis_type)
+        return JSONResponse(result)
+
+    except RequestTooLarge:
+        raise
+    except Exception as e:
+        logger.exception("Error analyzing image: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@instrumented('/api/volleyball/analyze-frame')
+async def analyze_frame(request):
+    """
+    Analyze a single video frame using Google AI.
+
+    Expected form data:
+    - frame: The frame image file to analyze
+    - analysis_type: "technique" | "positioning" | "tactics"
+    """
+    try:
+        async with request.form() as form:
+            frame_file = form.get('frame')
+            if frame_file is None or isinstance(frame_file, str):
+                return JSONResponse({"error": "Missing frame file"}, status_code=400)
+
+            analysis_type = form.get('analysis_type', 'technique')
+            if analysis_type not in ANALYSIS_PROMPTS:
+                return JSONResponse({"error": f"Invalid analysis type: {analysis_type}"}, status_code=400)
+
+            logger.info("Received frame %s", frame_file.filename, extra={"content_type": frame_file.content_type})
+            os.makedirs(flask_server.UPLOAD_FOLDER, exist_ok=True)
+
+            file_ext = os.path.splitext(frame_file.filename or '')[1].lower()
+            if not file_ext or file_ext not in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
+                file_ext = '.jpg'
+            temp_file_path = os.path.join(flask_server.UPLOAD_FOLDER,
+                                          f"tmp{next(tempfile._get_candidate_names())}{file_ext}")
+            frame_path = None
+
+            try:
+                with span("upload", bytes=frame_file.size or 0, content_type=frame_file.content_type or ""):
+                    await run_cpu(_save_upload, frame_file, temp_file_path)
+
+                # Verify and fix the image if needed
+                if is_intact_rgb_jpeg(temp_file_path):
+                    success, result_path = True, temp_file_path
+                else:
+                    success, result_path = await cpu_pool.run_async("validate", temp_file_path)
+                if not success:
+                    return JSONResponse({"error": result_path}, status_code=400)
+                frame_path = result_path
+
+                result = await analyze_image_async(frame_path, analysis_type)
+                return JSONResponse({"analysis": result})
+
+            finally:
+                await run_cpu(_remove_files, temp_file_path, frame_path)
+
+    except RequestTooLarge:
+        raise
+    except Exception as e:
+        logger.exception("Error analyzing frame: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@instrumented('/api/volleyball/analyze-video')
+async def analyze_video_google(request):
+    """
+    Analyze a volleyball video using Google AI.
+
+    Expects a multipart/form-data request with:
+    - video: The video file
+    - analysis_type: Type of analysis (technique, positioning, tactics)
+    - interval_seconds: Optional interval between frames to analyze (in seconds)
+    - max_frames: Optional maximum number of frames to analyze
+    - in_play_only: Optional "true" to only analyze frames inside rallies
+
+    Returns:
+        JSON with analysis results
+    """
+    content_length = int(request.headers.get('content-length') or 0)
+
+    try:
+        async with request.form() as form:
+            video_file = form.get('video')
+            if video_file is None or isinstance(video_file, str):
+                return JSONResponse({"error": "No video file provided"}, status_code=400)
+            if not video_file.filename:
+                return JSONResponse({"error": "Empty video file name"}, status_code=400)
+
+            analysis_type = form.get('analysis_type', 'technique')
+            interval_seconds = float(form.get('interval_seconds', 2.0))
+            max_frames = int(form.get('max_frames', 5))
+            in_play_only = form.get('in_play_only', 'false').lower() == 'true'
+            content_type = video_file.content_type or ''
+
+            logger.info("Received video %s", video_file.filename, extra={
+                "content_type": content_type,
+                "analysis_type": analysis_type,
+                "interval_seconds": interval_seconds,
+                "max_frames": max_frames,
+            })
+            os.makedirs(flask_server.UPLOAD_FOLDER, exist_ok=True)
+
+            file_extension = os.path.splitext(video_file.filename)[1].lower()
+            if not file_extension:
+                if 'mp4' in content_type:
+                    file_extension = '.mp4'
+                elif 'quicktime' in content_type or 'mov' in content_type:
+                    file_extension = '.mov'
+                elif 'avi' in content_type:
+                    file_extension = '.avi'
+                else:
+                    file_extension = '.mp4'
+
+            temp_video_path = os.path.join(flask_server.UPLOAD_FOLDER,
+                                           f"tmp{next(tempfile._get_candidate_names())}{file_extension}")
+
+            try:
+                with span("upload", bytes=content_length, content_type=content_type):
+                    await run_cpu(_save_upload, video_file, temp_video_path)
+
+                if os.path.getsize(temp_video_path) == 0:
+                    return JSONResponse({"error": "Uploaded video file is empty"}, status_code=400)
+
+                video_id = os.path.splitext(os.path.basename(temp_video_path))[0]
+
+                # MOV files are decoded with the ffmpeg pipe decoder when ffmpeg
+                # is installed (see video_decoder.should_use_ffmpeg)
+                output_file, results = await analyze_video_frames_async(
+                    temp_video_path,
+                    analysis_type=analysis_type,
+                    interval_seconds=interval_seconds,
+                    max_frames=max_frames,
+                    in_play_only=in_play_only,
+                    video_id=video_id,
+                    # The upload is deleted afterwards, so keep its rally index in memory only
+                    save_rally_index=False
+                )
+
+                formatted_results = []
+                for result in results:
+                    formatted_result = {
+                        "timestamp": result.get("timestamp", "Unknown"),
+                        "analysis": result.get("analysis", "No analysis available")
+                    }
+                    if "error" in result:
+                        formatted_result["error"] = result["error"]
+                    formatted_results.append(formatted_result)
+
+                return JSONResponse({
+                    "success": True,
+                    "video": video_file.filename,
+                    "analysis_type": analysis_type,
+                    "results": formatted_results,
+                    "video_id": video_id,
+                    "output_file": output_file
+                })
+
+            except Exception as e:
+                error_msg = f"Error analyzing video: {str(e)}"
+                logger.exception(error_msg)
+                return JSONResponse({"error": error_msg}, status_code=500)
+
+            finally:
+                await run_cpu(_remove_files, temp_video_path)
+
+    except RequestTooLarge:
+        raise
+    except Exception as e:
+        error_msg = f"Server error: {str(e)}"
+        logger.exception(error_msg)
+        return JSONResponse({"error": error_msg}, status_code=500)
+
+
+app = Starlette(routes=[
+    Route('/api/volleyball-agent/analyze-image', analyze_image, methods=['POST', 'OPTIONS']),
+    Route('/api/volleyball/analyze-frame', analyze_frame, methods=['POST', 'OPTIONS']),
+    Route('/api/volleyball/analyze-video', analyze_video_google, methods=['POST', 'OPTIONS']),
+    # Everything else, including the static frontend, is served by the Flask app
+    Mount('/', app=WSGIMiddleware(flask_server.app)),
+])
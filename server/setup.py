@@ -4,6 +4,7 @@ setup(
     name="volleyball_ai",
     version="0.1.0",
     packages=find_packages(where="src"),
+    py_modules=["volleyball_cpu_tasks"],
     package_dir={"": "src"},
     install_requires=[
         "flask>=2.0.0",
@@ -19,7 +20,10 @@ setup(
     ],
     extras_require={
         'tensorflow': ['tensorflow>=2.12.0'],
-        'tensorflow-cpu': ['tensorflow-cpu>=2.12.0']
+        'tensorflow-cpu': ['tensorflow-cpu>=2.12.0'],
+        'parquet': ['pyarrow>=10.0.0'],
+        'asgi': ['starlette>=0.27.0', 'uvicorn>=0.23.0', 'python-multipart>=0.0.6', 'a2wsgi>=1.7.0',
+                 'httpx>=0.24.0']
     },
     author="Your Name",
     author_email="your.email@example.com",
@@ -1,9 +1,45 @@
+import os
 import sys
 import json
 import cv2
 import mediapipe as mp
 import numpy as np
 
+# Load the player detector module directly (the volleyball_ai package itself
+# needs API keys at import time)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'volleyball_ai'))
+try:
+    from player_detection import get_player_detector
+    PLAYER_DETECTION_AVAILABLE = True
+except ImportError:
+    PLAYER_DETECTION_AVAILABLE = False
+
+def crop_to_main_player(frame):
+    """
+    Crop the frame to the most confident player detection.
+    
+    Returns:
+        Tuple of (cropped frame, (x, y, w, h) of the crop in the full frame)
+    """
+    height, width = frame.shape[:2]
+    full_frame = (frame, (0, 0, width, height))
+    if not PLAYER_DETECTION_AVAILABLE:
+        return full_frame
+    
+    detections = get_player_detector().detect(frame)
+    if not detections:
+        return full_frame
+    
+    x, y, w, h = max(detections, key=lambda d: d["confidence"])["bbox"]
+    # Pad the box so wrists and feet at full extension stay in view
+    pad_x, pad_y = int(w * 0.3), int(h * 0.15)
+    left, top = max(x - pad_x, 0), max(y - pad_y, 0)
+    right, bottom = min(x + w + pad_x, width), min(y + h + pad_y, height)
+    if right - left < 32 or bottom - top < 32:
+        return full_frame
+    
+    return frame[top:bottom, left:right], (left, top, right - left, bottom - top)
+
 def extract_keypoints(frame_data):
     # Initialize MediaPipe Pose
     mp_pose = mp.solutions.pose
@@ -18,8 +54,12 @@ def extract_keypoints(frame_data):
     nparr = np.frombuffer(frame_data, np.uint8)
     frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     
+    # Run pose estimation on the player rather than the whole court
+    full_height, full_width = frame.shape[:2]
+    player, (crop_x, crop_y, crop_w, crop_h) = crop_to_main_player(frame)
+    
     # Convert BGR to RGB
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    frame_rgb = cv2.cvtColor(player, cv2.COLOR_BGR2RGB)
     
     # Process the frame
     results = pose.process(frame_rgb)
@@ -27,10 +67,15 @@ def extract_keypoints(frame_data):
     if not results.pose_landmarks:
         return None
     
-    # Extract keypoints
+    # Extract keypoints, mapped back to full-frame normalized coordinates
     keypoints = []
     for landmark in results.pose_landmarks.landmark:
-        keypoints.extend([landmark.x, landmark.y, landmark.z, landmark.visibility])
+        keypoints.extend([
+            (landmark.x * crop_w + crop_x) / full_width,
+            (landmark.y * crop_h + crop_y) / full_height,
+            landmark.z * crop_w / full_width,
+            landmark.visibility
+        ])
     
     return keypoints
 
@@ -2,6 +2,24 @@ from .google_ai_integration import *
 from .volleyball_agent import *
 from .volleyball_inference import *
 from .volleyball_agents import *
+from .video_decoder import *
+from .image_preprocessing import *
+from .player_detection import *
+from .ball_tracking import *
+from .rally_segmentation import *
+from .rate_limiting import *
+from .analysis_fanout import *
+from .image_input import *
+from .api_clients import *
+from .analysis_history import *
+from .result_sink import *
+from .tracing import *
+from .metrics import *
+from .structured_logging import *
+from .profiling import *
+from .async_analysis import *
+from .cpu_pool import *
+from .image_loading import *
 
 __all__ = [
     # From google_ai_integration
@@ -11,6 +29,7 @@ __all__ = [
     'analyze_tactics',
     'process_video_frames',
     'analyze_video_frames_gemini',
+    'ANALYSIS_PROMPTS',
     'setup_real_time_analysis',
     
     # From volleyball_agent
@@ -26,5 +45,124 @@ __all__ = [
     # From volleyball_agents
     'PlayerAgent',
     'CoachAgent',
-    'TeamAnalysisAgent'
+    'TeamAnalysisAgent',
+    
+    # From video_decoder
+    'FFmpegFrameReader',
+    'ffmpeg_available',
+    'probe_video',
+    'iter_sampled_frames',
+    'should_use_ffmpeg',
+    
+    # From image_preprocessing
+    'preprocess_image',
+    'configure_profile',
+    'estimate_image_tokens',
+    
+    # From player_detection
+    'PlayerDetector',
+    'get_player_detector',
+    'crop_to_players',
+    
+    # From ball_tracking
+    'BallTracker',
+    'iter_video_frames',
+    
+    # From rally_segmentation
+    'RallySegmenter',
+    'segment_rallies',
+    'load_rally_index',
+    'in_play_frame_indices',
+    
+    # From rate_limiting
+    'TokenBucket',
+    'gemini_rate_limiter',
+    
+    # From analysis_fanout
+    'AnalysisFanout',
+    
+    # From image_input
+    'ImageInput',
+    
+    # From api_clients
+    'get_gemini_model',
+    'get_openai_client',
+    'get_gemini_async_model',
+    'api_client_stats',
+    
+    # From analysis_history
+    'AnalysisHistoryStore',
+    'get_history_store',
+    'record_analysis_results',
+    'QUERY_DATABASE_TOOL',
+    
+    # From result_sink
+    'ResultSink',
+    'get_result_sink',
+    'load_results',
+    'latest_results',
+    'iter_results',
+    
+    # From tracing
+    'Tracer',
+    'tracer',
+    'span',
+    'traced',
+    'current_span',
+    'context_wrap',
+    'tracing_stats',
+    
+    # From metrics
+    'MetricsRegistry',
+    'render_metrics',
+    'metrics_snapshot',
+    'HTTP_REQUESTS',
+    'HTTP_REQUEST_SECONDS',
+    'HTTP_REQUESTS_IN_FLIGHT',
+    
+    # From structured_logging
+    'configure_logging',
+    'bind_context',
+    'clear_context',
+    'log_context',
+    'sampled',
+    'SampledLogger',
+    'logging_stats',
+    'flush_logs',
+    
+    # From profiling
+    'start_profile',
+    'valid_profile_id',
+    'get_profile',
+    'list_profiles',
+    'start_sampler',
+    'sampler',
+    'speedscope_document',
+    'collapsed_stacks',
+    'profiling_stats',
+    
+    # From async_analysis
+    'run_cpu',
+    'get_cpu_executor',
+    'cpu_pool_stats',
+    'generate_image_analysis_async',
+    'analyze_image_async',
+    'analyze_video_frames_async',
+    
+    # From cpu_pool
+    'cpu_pool',
+    'CPUWorkerPool',
+    'SharedFrame',
+    'frame_features',
+    'validate_image_file',
+    'is_intact_rgb_jpeg',
+    'FEATURE_SIZE',
+    
+    # From image_loading
+    'decode_reduced',
+    'read_reduced',
+    'open_reduced',
+    'reduction_for',
+    'image_header',
+    'REDUCED_COLOR_FLAGS'
 ] 
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Concurrent Multi-Analysis of Video Frames
+
+Technique, positioning and tactics analysis of a video all look at the same
+sampled frames. AnalysisFanout converts and preprocesses each frame once
+(player detection and encoding are shared between analysis types with the
+same preprocessing profile) and sends all analysis requests for it
+concurrently, under the shared Gemini rate limiter. Per-frame latency then
+approaches the slowest single request instead of the sum of all of them.
+
+Frames are consumed from any iterable, and only a few frames are in flight
+at a time, so the scheduler works directly on streaming frame sources such
+as video_decoder.iter_sampled_frames.
+"""
+
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .google_ai_integration import ANALYSIS_PROMPTS, find_players_for_crop, generate_image_analysis
+from .image_input import ImageInput
+from .image_preprocessing import get_profile
+from .metrics import JOBS_IN_FLIGHT
+from .structured_logging import sampled
+from .tracing import context_wrap
+
+logger = logging.getLogger(__name__)
+frame_errors = sampled(logger, every=1, per_second=5)
+
+# Concurrent Gemini requests per fan-out (the rate limiter still applies)
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', '6'))
+
+
+class AnalysisFanout:
+    """
+    Run several analysis types over a stream of frames concurrently.
+
+    Results are returned per analysis type, in frame order, as the same text
+    (or error message) the individual analyze_* functions return.
+    """
+
+    def __init__(self, analysis_types=None, max_workers=None, max_pending_frames=2):
+        """
+        Initialize the fan-out scheduler.
+
+        Args:
+            analysis_types: Analysis types to run (defaults to all ANALYSIS_PROMPTS)
+            max_workers: Maximum concurrent requests (defaults to ANALYSIS_WORKERS)
+            max_pending_frames: Frames whose requests may be in flight at once
+        """
+        self.analysis_types = list(analysis_types or ANALYSIS_PROMPTS)
+        unknown = [t for t in self.analysis_types if t not in ANALYSIS_PROMPTS]
+        if unknown:
+            raise ValueError(f"Invalid analysis type: {', '.join(unknown)}")
+
+        self.max_workers = max_workers or ANALYSIS_WORKERS
+        self.max_pending_frames = max(max_pending_frames, 1)
+
+    def prepare_frame(self, frame):
+        """
+        Convert and preprocess a frame once for all analysis types.
+
+        Args:
+            frame: RGB numpy array, PIL image, encoded bytes, path or ImageInput
+
+        Returns:
+            Dictionary of analysis type -> PreparedImage
+        """
+        source = ImageInput.from_any(frame)
+
+        # Detect players at most once, and only if a profile crops to them
+        detections = []
+
+        def find_players(image):
+            if not detections:
+                detections.append(find_players_for_crop(image))
+            return detections[0]
+
+        # Analysis types with identical settings share one encoded image
+        prepared = {}
+        by_profile = {}
+        for analysis_type in self.analysis_types:
+            key = tuple(sorted(get_profile(analysis_type).items()))
+            if key not in by_profile:
+                by_profile[key] = source.prepare(analysis_type, find_players=find_players)
+            prepared[analysis_type] = by_profile[key]
+
+        return prepared
+
+    def _request(self, analysis_type, prepared):
+        """Send one analysis request, returning an error message on failure."""
+        try:
+            analysis, _ = generate_image_analysis(
+                ANALYSIS_PROMPTS[analysis_type], None, analysis_type, prepared=prepared
+            )
+            return analysis
+        except Exception as e:
+            error_msg = f"Error analyzing image: {str(e)}"
+            frame_errors.error("Error analyzing image: %s", e)
+            return f"Unable to analyze the image. {error_msg}"
+
+    def analyze_frame(self, frame, executor):
+        """
+        Submit all analysis requests for one frame.
+
+        Args:
+            frame: Frame accepted by prepare_frame
+            executor: Executor to run the requests on
+
+        Returns:
+            Dictionary of analysis type -> Future with the analysis text
+        """
+        prepared = self.prepare_frame(frame)
+        return {
+            analysis_type: executor.submit(context_wrap(self._request), analysis_type, prepared[analysis_type])
+            for analysis_type in self.analysis_types
+        }
+
+    @JOBS_IN_FLIGHT.track_inprogress(job="frame_fanout")
+    def analyze_frames(self, frames):
+        """
+        Analyze a stream of frames with all analysis types.
+
+        Args:
+            frames: Iterable of frames (numpy arrays, PIL images, bytes or paths)
+
+        Returns:
+            Dictionary of analysis type -> list of results in frame order
+        """
+        results = {analysis_type: [] for analysis_type in self.analysis_types}
+        pending = deque()
+
+        def collect(futures):
+            for analysis_type, future in futures.items():
+                results[analysis_type].append(future.result())
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="analysis") as executor:
+            for frame in frames:
+                # Preprocess the next frame while earlier requests are in flight
+                pending.append(self.analyze_frame(frame, executor))
+                while len(pending) > self.max_pending_frames:
+                    collect(pending.popleft())
+
+            while pending:
+                collect(pending.popleft())
+
+        return results
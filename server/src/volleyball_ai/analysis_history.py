@@ -0,0 +1,544 @@
+"""
+Analysis History Store
+
+Keeps every analysis result so player trends, training programs and team
+reports can be built from real data. Locally results go to a SQLite file;
+in production DATABASE_URL points at Postgres, where the analysis_results
+table from database/schema.sql is used.
+
+Results are queued by the analysis paths and written in batches (one
+transaction per batch) by a background thread, so recording never blocks an
+analysis request. Queries use the (player_id, technique, created_at) index.
+"""
+
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import psycopg2
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
+from .metrics import QUEUE_DEPTH
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Database location: a postgres:// URL, or a SQLite file path
+DEFAULT_SQLITE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'db', 'analysis_history.sqlite3'
+)
+ANALYSIS_HISTORY_DB = os.environ.get('ANALYSIS_HISTORY_DB') or os.environ.get('DATABASE_URL') or DEFAULT_SQLITE_PATH
+
+# Batched writes
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', '100'))
+HISTORY_FLUSH_SECONDS = float(os.environ.get('HISTORY_FLUSH_SECONDS', '1.0'))
+
+# A failed batch is retried on a new connection this many times, waiting
+# HISTORY_RETRY_SECONDS before the first retry and twice as long before each
+# further one (at most HISTORY_RETRY_MAX_SECONDS)
+HISTORY_WRITE_RETRIES = int(os.environ.get('HISTORY_WRITE_RETRIES', '5'))
+HISTORY_RETRY_SECONDS = float(os.environ.get('HISTORY_RETRY_SECONDS', '0.5'))
+HISTORY_RETRY_MAX_SECONDS = float(os.environ.get('HISTORY_RETRY_MAX_SECONDS', '30'))
+
+# SQLite version of the analysis_results table in database/schema.sql
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    player_id TEXT,
+    team_id TEXT,
+    analysis_type TEXT NOT NULL,
+    technique TEXT,
+    quality_score REAL,
+    source TEXT,
+    result TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_player_technique_created
+    ON analysis_results(player_id, technique, created_at);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_team_created
+    ON analysis_results(team_id, created_at);
+"""
+
+COLUMNS = ("player_id", "team_id", "analysis_type", "technique", "quality_score", "source", "result", "created_at")
+
+# Techniques recognized in free-text analyses, in priority order
+TECHNIQUE_PATTERNS = {
+    "serve": r"serv(?:e|es|ing)",
+    "set": r"set(?:s|ting)?\b|overhead pass",
+    "spike": r"spik(?:e|es|ing)|attack|hitting",
+    "block": r"block(?:s|ing)?",
+    "dig": r"dig(?:s|ging)?\b",
+    "pass": r"pass(?:es|ing)?\b|bump|forearm pass",
+}
+TECHNIQUE_PATTERN = re.compile(
+    r"\b(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in TECHNIQUE_PATTERNS.items()) + ")",
+    re.IGNORECASE,
+)
+# Whole words only: "improve" is left out because every prompt asks for areas
+# of improvement
+QUALITY_PATTERN = re.compile(
+    r"\b(?:(?P<high>excellent|perfect|great)|(?P<good>good)|(?P<low>poor(?:ly)?|incorrect(?:ly)?|improper(?:ly)?))\b",
+    re.IGNORECASE,
+)
+QUALITY_SCORES = {"high": 0.9, "good": 0.7, "low": 0.3}
+
+# Function tool the agents use to query the history (answered by AnalysisHistoryStore.query)
+QUERY_DATABASE_TOOL = {
+    "name": "query_volleyball_database",
+    "description": "Query the volleyball technique database for player history and analysis",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "player_id": {
+                "type": "string",
+                "description": "The ID of the player to query"
+            },
+            "technique": {
+                "type": "string",
+                "description": "The specific technique to query (optional)"
+            },
+            "date_range": {
+                "type": "string",
+                "description": "Date range for the query (optional, format: YYYY-MM-DD to YYYY-MM-DD)"
+            }
+        },
+        "required": ["player_id"]
+    }
+}
+
+# Texts the analysis paths return instead of an analysis when a request fails
+ERROR_RESULT_PREFIXES = ("Unable to analyze", "Error")
+
+
+def detect_technique(text):
+    """Return the highest-priority technique mentioned in an analysis, or None."""
+    found = {match.lastgroup for match in TECHNIQUE_PATTERN.finditer(text or "")}
+    return next((technique for technique in TECHNIQUE_PATTERNS if technique in found), None)
+
+
+def estimate_quality(text):
+    """Estimate a 0-1 quality score from the wording of an analysis, or None."""
+    found = {match.lastgroup for match in QUALITY_PATTERN.finditer(text or "")}
+    return next((QUALITY_SCORES[level] for level in QUALITY_SCORES if level in found), None)
+
+
+def is_error_result(result):
+    """Check whether an analysis result is an error message rather than an analysis."""
+    if isinstance(result, dict):
+        return "error" in result
+    return str(result).lstrip().startswith(ERROR_RESULT_PREFIXES)
+
+
+def parse_date_range(date_range):
+    """
+    Parse "YYYY-MM-DD to YYYY-MM-DD" (either side may be omitted).
+
+    Returns:
+        (start, end) ISO timestamps, or None for open ends
+    """
+    if not date_range:
+        return None, None
+    parts = [part.strip() for part in re.split(r"\s+to\s+", date_range.strip(), maxsplit=1)]
+    start = parts[0] or None
+    end = parts[1] if len(parts) > 1 and parts[1] else None
+    if start:
+        start = datetime.strptime(start, "%Y-%m-%d").strftime("%Y-%m-%d 00:00:00")
+    if end:
+        end = datetime.strptime(end, "%Y-%m-%d").strftime("%Y-%m-%d 23:59:59.999999")
+    return start, end
+
+
+def _utc_datetime(value=None):
+    """Timezone-aware UTC datetime of a datetime, epoch seconds or now (None)."""
+    if value is None:
+        return datetime.now(timezone.utc)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    # Naive datetimes are taken as UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _close(conn):
+    """Close a connection that may already be broken."""
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _timestamp(value=None):
+    """UTC timestamp text that sorts correctly in SQLite."""
+    return _utc_datetime(value).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class AnalysisHistoryStore:
+    """
+    Analysis result history with batched background writes.
+
+    record() only queues a row; a writer thread inserts queued rows in
+    batches of up to batch_size, at least every flush_seconds.
+    """
+
+    def __init__(self, database=None, batch_size=None, flush_seconds=None):
+        """
+        Open (and if needed create) the history database.
+
+        Args:
+            database: postgres:// URL or SQLite file path (defaults to ANALYSIS_HISTORY_DB)
+            batch_size: Maximum rows per write transaction
+            flush_seconds: Maximum time a queued row waits before being written
+        """
+        self.database = database or ANALYSIS_HISTORY_DB
+        self.batch_size = batch_size or HISTORY_BATCH_SIZE
+        self.flush_seconds = flush_seconds or HISTORY_FLUSH_SECONDS
+        self.postgres = self.database.startswith(("postgres://", "postgresql://"))
+
+        if self.postgres and not PSYCOPG2_AVAILABLE:
+            raise ValueError("psycopg2 is required for a Postgres analysis history database")
+
+        if not self.postgres:
+            directory = os.path.dirname(os.path.abspath(self.database))
+            os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.executescript(SQLITE_SCHEMA)
+
+        self.local = threading.local()
+        self.pending = queue.Queue()
+        self.writer = None
+        self.writer_lock = threading.Lock()
+
+    def _connect(self):
+        if self.postgres:
+            return psycopg2.connect(self.database)
+        conn = sqlite3.connect(self.database, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _time(self, value):
+        """Bind a UTC timestamp from parse_date_range for comparison with created_at."""
+        return f"{value}+00:00" if self.postgres else value
+
+    def _sql(self, sql):
+        """Adapt ? placeholders to the driver's parameter style."""
+        return sql.replace("?", "%s") if self.postgres else sql
+
+    def _reader(self):
+        """Per-thread connection for queries."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            if self.postgres:
+                conn.autocommit = True
+            self.local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        conn = self._reader()
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self._sql(sql), params)
+                names = [column[0] for column in cursor.description]
+                rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception:
+            # The connection may have been lost; the next query reconnects
+            self.local.conn = None
+            _close(conn)
+            raise
+
+        for row in rows:
+            if row.get("avg_quality") is not None:
+                row["avg_quality"] = round(float(row["avg_quality"]), 3)
+            if row.get("created_at") is not None and not isinstance(row["created_at"], str):
+                row["created_at"] = _timestamp(row["created_at"])
+        return rows
+
+    # Writing
+
+    def _ensure_writer(self):
+        if self.writer is None or not self.writer.is_alive():
+            with self.writer_lock:
+                if self.writer is None or not self.writer.is_alive():
+                    self.writer = threading.Thread(target=self._write_loop, name="analysis-history", daemon=True)
+                    self.writer.start()
+
+    def record(self, analysis_type, result, player_id=None, team_id=None, technique=None,
+               quality_score=None, source=None, created_at=None):
+        """
+        Queue an analysis result for writing.
+
+        Args:
+            analysis_type: technique, positioning, tactics, ...
+            result: Analysis text
+            player_id: Player the analysis is about
+            team_id: Team of the player
+            technique: Technique shown (detected from the text if not given)
+            quality_score: 0-1 execution quality (estimated from the text if not given)
+            source: Where the analysis came from (e.g. "video", "feedback")
+            created_at: datetime or epoch seconds (defaults to now)
+        """
+        if result is None or is_error_result(result):
+            return
+        result = str(result)
+        if analysis_type == "technique":
+            technique = technique or detect_technique(result)
+            if quality_score is None:
+                quality_score = estimate_quality(result)
+
+        self.pending.put((
+            None if player_id is None else str(player_id),
+            None if team_id is None else str(team_id),
+            analysis_type, technique, quality_score, source, result,
+            # timestamptz in Postgres, sortable UTC text in SQLite
+            _utc_datetime(created_at) if self.postgres else _timestamp(created_at)
+        ))
+        self._ensure_writer()
+
+    def record_many(self, results, **fields):
+        """
+        Queue results of several analysis types.
+
+        Args:
+            results: Dictionary of analysis type -> text or list of texts
+            **fields: Arguments passed to record() for every result
+        """
+        for analysis_type, values in results.items():
+            if isinstance(values, (list, tuple)):
+                for value in values:
+                    self.record(analysis_type, value, **fields)
+            else:
+                self.record(analysis_type, values, **fields)
+
+    def _write_loop(self):
+        conn = None
+        sql = self._sql(
+            f"INSERT INTO analysis_results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        )
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                conn = self._write_batch(conn, sql, batch)
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+
+    def _write_batch(self, conn, sql, batch):
+        """
+        Insert a batch in one transaction.
+
+        After an error the connection is closed (the database may have
+        restarted or dropped it) and the batch is retried on a new one with
+        exponential backoff; it is dropped after HISTORY_WRITE_RETRIES
+        retries.
+
+        Returns:
+            The connection to use for the next batch (None to reconnect)
+        """
+        delay = HISTORY_RETRY_SECONDS
+        for attempt in range(HISTORY_WRITE_RETRIES + 1):
+            try:
+                if conn is None:
+                    conn = self._connect()
+                with span("write", sink="history", rows=len(batch), attempt=attempt):
+                    cursor = conn.cursor()
+                    try:
+                        cursor.executemany(sql, batch)
+                        conn.commit()
+                    finally:
+                        cursor.close()
+                return conn
+            except Exception as e:
+                _close(conn)
+                conn = None
+                if attempt == HISTORY_WRITE_RETRIES:
+                    logger.error("Dropping %s analysis history rows after %s attempts: %s",
+                                 len(batch), attempt + 1, e)
+                    return None
+                logger.warning("Error writing analysis history (%s rows), retrying in %.1fs: %s",
+                               len(batch), delay, e)
+                time.sleep(delay)
+                delay = min(delay * 2, HISTORY_RETRY_MAX_SECONDS)
+
+    def flush(self):
+        """Wait until all queued results have been written."""
+        if self.writer is not None:
+            self.pending.join()
+
+    # Queries
+
+    def player_history(self, player_id, technique=None, start=None, end=None, limit=50):
+        """
+        Most recent analyses of a player.
+
+        Args:
+            player_id: Player ID
+            technique: Only analyses of this technique
+            start: Earliest timestamp (ISO text)
+            end: Latest timestamp (ISO text)
+            limit: Maximum number of rows
+
+        Returns:
+            List of result dictionaries, newest first
+        """
+        sql = "SELECT analysis_type, technique, quality_score, source, result, created_at FROM analysis_results WHERE player_id = ?"
+        params = [str(player_id)]
+        if technique:
+            sql += " AND technique = ?"
+            params.append(technique)
+        if start:
+            sql += " AND created_at >= ?"
+            params.append(self._time(start))
+        if end:
+            sql += " AND created_at <= ?"
+            params.append(self._time(end))
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(int(limit))
+        return self._query(sql, params)
+
+    def player_trend(self, player_id, technique=None, start=None, end=None):
+        """
+        Daily analysis counts and average quality of a player, per technique.
+
+        Returns:
+            List of {day, technique, analyses, avg_quality} in date order
+        """
+        day = "to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD')" if self.postgres else "substr(created_at, 1, 10)"
+        sql = (
+            f"SELECT {day} AS day, technique, COUNT(*) AS analyses, AVG(quality_score) AS avg_quality "
+            "FROM analysis_results WHERE player_id = ? AND technique IS NOT NULL"
+        )
+        params = [str(player_id)]
+        if technique:
+            sql += " AND technique = ?"
+            params.append(technique)
+        if start:
+            sql += " AND created_at >= ?"
+            params.append(self._time(start))
+        if end:
+            sql += " AND created_at <= ?"
+            params.append(self._time(end))
+        sql += f" GROUP BY {day}, technique ORDER BY day, technique"
+        return self._query(sql, params)
+
+    def technique_summary(self, player_id=None, team_id=None, start=None, end=None):
+        """
+        Analyses and average quality per technique, for a player or a team.
+
+        Returns:
+            List of {technique, analyses, avg_quality}, weakest technique first
+        """
+        sql = (
+            "SELECT technique, COUNT(*) AS analyses, AVG(quality_score) AS avg_quality "
+            "FROM analysis_results WHERE technique IS NOT NULL"
+        )
+        params = []
+        if player_id is not None:
+            sql += " AND player_id = ?"
+            params.append(str(player_id))
+        if team_id is not None:
+            sql += " AND team_id = ?"
+            params.append(str(team_id))
+        if start:
+            sql += " AND created_at >= ?"
+            params.append(self._time(start))
+        if end:
+            sql += " AND created_at <= ?"
+            params.append(self._time(end))
+        sql += " GROUP BY technique"
+        rows = self._query(sql, params)
+        return sorted(rows, key=lambda row: (row["avg_quality"] is None, row["avg_quality"] or 0))
+
+    def query(self, player_id, technique=None, date_range=None, limit=20):
+        """
+        Answer a query_volleyball_database tool call.
+
+        Args:
+            player_id: Player ID
+            technique: Optional technique
+            date_range: Optional "YYYY-MM-DD to YYYY-MM-DD" (UTC days)
+            limit: Maximum number of recent analyses returned
+
+        Returns:
+            Dictionary with recent analyses, per-technique summary and daily trend
+        """
+        start, end = parse_date_range(date_range)
+        return {
+            "player_id": player_id,
+            "technique": technique,
+            "date_range": date_range,
+            "summary": self.technique_summary(player_id=player_id, start=start, end=end),
+            "trend": self.player_trend(player_id, technique, start, end),
+            "recent": self.player_history(player_id, technique, start, end, limit),
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Get the shared analysis history store for this process."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AnalysisHistoryStore()
+    return _store
+
+
+def _reset_after_fork():
+    global _store, _store_lock
+    _store = None
+    _store_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Rows waiting for the writer thread (without creating the store)
+QUEUE_DEPTH.set_function(lambda: _store.pending.qsize() if _store is not None else 0, queue="analysis_history")
+
+
+def record_analysis_results(results, player_data=None, source=None):
+    """
+    Queue analysis results for the history store, never raising.
+
+    Args:
+        results: Dictionary of analysis type -> text or list of texts
+        player_data: Player information (player_id/playerId, team_id/teamId)
+        source: Where the analysis came from
+    """
+    player_data = player_data or {}
+    try:
+        get_history_store().record_many(
+            results,
+            player_id=player_data.get("player_id") or player_data.get("playerId"),
+            team_id=player_data.get("team_id") or player_data.get("teamId"),
+            source=source,
+        )
+    except Exception as e:
+        logger.error("Error recording analysis history: %s", e)
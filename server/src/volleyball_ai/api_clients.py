@@ -0,0 +1,427 @@
+"""
+Shared, Connection-Pooled API Clients
+
+Creating a Gemini model or an OpenAI client per agent or per request opens
+new connections (TLS handshakes included) for every call. This module keeps
+one client per provider per process and hands the same instance to every
+caller, so HTTP keep-alive connections are reused across requests and
+threads. Clients are recreated after a fork (e.g. gunicorn workers with
+--preload), since sockets and gRPC channels must not be shared between
+processes.
+
+Each provider also gets request, error and latency counters, available from
+api_client_stats() and as Prometheus metrics. get_gemini_async_model() is
+the asyncio counterpart of the Gemini model, used by the ASGI app.
+"""
+
+import base64
+import itertools
+import os
+import threading
+import time
+
+from .metrics import REMOTE_CALLS, REMOTE_CALL_ERRORS, REMOTE_CALL_SECONDS, REMOTE_CALLS_IN_FLIGHT, count_cache
+
+try:
+    import google.generativeai as genai
+    GENAI_AVAILABLE = True
+except ImportError:
+    GENAI_AVAILABLE = False
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    from openai import OpenAI
+    OPENAI_AVAILABLE = HTTPX_AVAILABLE
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+# Connection pool settings for the OpenAI HTTP client
+OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', '20'))
+OPENAI_KEEPALIVE_SECONDS = float(os.environ.get('OPENAI_KEEPALIVE_SECONDS', '30'))
+OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', '60'))
+
+# Gemini transport: "grpc", "rest" or unset for the library default
+GEMINI_TRANSPORT = os.environ.get('GEMINI_TRANSPORT')
+
+# Alternative Gemini API endpoint (e.g. a local stub server, used with GEMINI_TRANSPORT=rest)
+GEMINI_API_ENDPOINT = os.environ.get('GEMINI_API_ENDPOINT')
+
+# Connection pool settings for the async Gemini REST client
+GEMINI_ASYNC_MAX_CONNECTIONS = int(os.environ.get('GEMINI_ASYNC_MAX_CONNECTIONS', '256'))
+GEMINI_ASYNC_POOLS = int(os.environ.get('GEMINI_ASYNC_POOLS', '16'))
+GEMINI_KEEPALIVE_SECONDS = float(os.environ.get('GEMINI_KEEPALIVE_SECONDS', '30'))
+GEMINI_TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '60'))
+
+
+class ProviderStats:
+    """Thread-safe request counters for one API provider."""
+
+    def __init__(self, provider=None):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        labels = {"provider": provider or "unknown"}
+        self._calls = REMOTE_CALLS.labels(**labels)
+        self._errors = REMOTE_CALL_ERRORS.labels(**labels)
+        self._seconds = REMOTE_CALL_SECONDS.labels(**labels)
+        self._in_flight = REMOTE_CALLS_IN_FLIGHT.labels(**labels)
+
+    def start(self):
+        """Record the start of a request and return its start time."""
+        with self.lock:
+            self.in_flight += 1
+        self._in_flight.inc()
+        return time.perf_counter()
+
+    def finish(self, start_time, error=False):
+        """Record the end of a request started with start()."""
+        latency = time.perf_counter() - start_time
+        with self.lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.errors += int(error)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        self._in_flight.dec()
+        self._calls.inc()
+        self._seconds.observe(latency)
+        if error:
+            self._errors.inc()
+
+    def snapshot(self):
+        """Return the counters as a dictionary."""
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "avg_latency_ms": round(self.total_latency / self.requests * 1000, 1) if self.requests else 0.0,
+                "max_latency_ms": round(self.max_latency * 1000, 1),
+            }
+
+
+class ClientRegistry:
+    """
+    Process-wide cache of API clients.
+
+    get() returns the cached client for a key, creating it once (under a
+    lock) on first use. The cache is dropped when the process id changes, so
+    forked workers build their own clients.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._stats = {}
+        self._pid = os.getpid()
+
+    def _reset_after_fork(self):
+        """Forget clients and counters inherited from the parent process."""
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._stats = {}
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+    def get(self, key, factory):
+        """
+        Get the client for a key, creating it with factory() if needed.
+
+        Args:
+            key: Hashable cache key (provider plus settings)
+            factory: Function creating the client
+
+        Returns:
+            The shared client
+        """
+        self._check_pid()
+        client = self._clients.get(key)
+        count_cache("api_clients", client is not None)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = factory()
+                    self._clients[key] = client
+        return client
+
+    def provider_stats(self, provider):
+        """Get the counters for a provider, creating them if needed."""
+        self._check_pid()
+        stats = self._stats.get(provider)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(provider, ProviderStats(provider))
+        return stats
+
+    def snapshot(self):
+        """Return the counters of every provider."""
+        self._check_pid()
+        return {provider: stats.snapshot() for provider, stats in list(self._stats.items())}
+
+
+client_registry = ClientRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=client_registry._reset_after_fork)
+
+
+class InstrumentedModel:
+    """Proxy for a Gemini GenerativeModel that counts generate_content calls."""
+
+    def __init__(self, model, stats):
+        self._model = model
+        self._stats = stats
+
+    def generate_content(self, *args, **kwargs):
+        start_time = self._stats.start()
+        error = True
+        try:
+            response = self._model.generate_content(*args, **kwargs)
+            error = False
+            return response
+        finally:
+            self._stats.finish(start_time, error)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+def get_gemini_model(model_name='gemini-1.5-flash', api_key=None, **model_kwargs):
+    """
+    Get the shared Gemini model for this process.
+
+    The library is configured once per process (the configuration, and with
+    it the connection, is global in google.generativeai).
+
+    Args:
+        model_name: Gemini model name
+        api_key: Google AI API key (defaults to GOOGLE_AI_API_KEY)
+        **model_kwargs: Extra GenerativeModel arguments (e.g. generation_config)
+
+    Returns:
+        GenerativeModel wrapped with request counters
+    """
+    if not GENAI_AVAILABLE:
+        raise ValueError("google-generativeai is not installed")
+
+    api_key = api_key or os.environ.get('GOOGLE_AI_API_KEY')
+
+    def configure():
+        options = {"transport": GEMINI_TRANSPORT} if GEMINI_TRANSPORT else {}
+        if GEMINI_API_ENDPOINT:
+            options["client_options"] = {"api_endpoint": GEMINI_API_ENDPOINT}
+        genai.configure(api_key=api_key, **options)
+        return True
+
+    client_registry.get(("gemini-config", api_key), configure)
+
+    key = ("gemini", model_name, api_key, repr(sorted(model_kwargs.items())))
+    return client_registry.get(key, lambda: InstrumentedModel(
+        genai.GenerativeModel(model_name, **model_kwargs), client_registry.provider_stats("gemini")
+    ))
+
+
+class GeminiAPIError(Exception):
+    """Error response from the Gemini REST API."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class AsyncGeminiModel:
+    """
+    Gemini generateContent over the REST API with a pooled httpx.AsyncClient.
+
+    The SDK's generate_content blocks a thread for the whole request; with
+    this client one event loop keeps many requests in flight on a bounded
+    pool of keep-alive connections. The connections are split over `pools`
+    httpx clients used in turn, because httpcore scans its whole pool on
+    every request: one client with 300 requests in flight is several times
+    slower than 16 small ones. The clients are created on first use and
+    belong to that event loop.
+    """
+
+    def __init__(self, model_name, api_key, stats, endpoint=None, max_connections=None, timeout=None, pools=None):
+        """
+        Initialize the client.
+
+        Args:
+            model_name: Gemini model name
+            api_key: Google AI API key
+            stats: ProviderStats recording every request
+            endpoint: API base URL (defaults to GEMINI_API_ENDPOINT or the public API)
+            max_connections: Connection pool size (defaults to GEMINI_ASYNC_MAX_CONNECTIONS)
+            timeout: Request timeout in seconds (defaults to GEMINI_TIMEOUT)
+            pools: Number of httpx clients sharing the connections (defaults to GEMINI_ASYNC_POOLS)
+        """
+        endpoint = endpoint or GEMINI_API_ENDPOINT or 'https://generativelanguage.googleapis.com'
+        if '://' not in endpoint:
+            endpoint = f"https://{endpoint}"
+        self.model_name = model_name
+        self.url = f"{endpoint.rstrip('/')}/v1beta/models/{model_name}:generateContent"
+        self.api_key = api_key
+        self.max_connections = max_connections or GEMINI_ASYNC_MAX_CONNECTIONS
+        self.timeout = timeout or GEMINI_TIMEOUT
+        self.pools = max(min(pools or GEMINI_ASYNC_POOLS, self.max_connections), 1)
+        self._stats = stats
+        self._clients = []
+        self._next = itertools.count()
+
+    def _http_client(self):
+        if not self._clients:
+            per_pool = -(-self.max_connections // self.pools)
+            limits = httpx.Limits(
+                max_connections=per_pool,
+                max_keepalive_connections=per_pool,
+                keepalive_expiry=GEMINI_KEEPALIVE_SECONDS,
+            )
+            self._clients = [httpx.AsyncClient(limits=limits, timeout=self.timeout) for _ in range(self.pools)]
+        return self._clients[next(self._next) % len(self._clients)]
+
+    async def generate_content(self, parts, generation_config=None):
+        """
+        Send a generateContent request.
+
+        Args:
+            parts: Prompt text and inline-data parts ({"mime_type", "data"}
+                dictionaries, as PreparedImage.to_gemini_part returns)
+            generation_config: Optional generationConfig dictionary
+
+        Returns:
+            Tuple of (response text, total token count or None)
+        """
+        body = {"contents": [{"role": "user", "parts": [self._rest_part(part) for part in parts]}]}
+        if generation_config:
+            body["generationConfig"] = generation_config
+
+        start_time = self._stats.start()
+        error = True
+        try:
+            response = await self._http_client().post(self.url, json=body, headers={"x-goog-api-key": self.api_key})
+            if response.status_code >= 400:
+                # Error bodies (e.g. from a proxy on 429/5xx) are not always JSON
+                try:
+                    data = response.json()
+                except ValueError:
+                    data = None
+                message = (data.get("error") or {}).get("message") if isinstance(data, dict) else None
+                raise GeminiAPIError(response.status_code, message or response.reason_phrase)
+            data = response.json()
+            error = False
+        finally:
+            self._stats.finish(start_time, error)
+
+        candidates = data.get("candidates") or []
+        if not candidates:
+            feedback = data.get("promptFeedback") or {}
+            raise GeminiAPIError(response.status_code, f"No candidates returned ({feedback.get('blockReason', 'unknown')})")
+        text = "".join(part.get("text", "") for part in candidates[0].get("content", {}).get("parts", []))
+        return text, (data.get("usageMetadata") or {}).get("totalTokenCount")
+
+    @staticmethod
+    def _rest_part(part):
+        if isinstance(part, str):
+            return {"text": part}
+        return {"inlineData": {"mimeType": part["mime_type"], "data": base64.b64encode(part["data"]).decode("ascii")}}
+
+    async def aclose(self):
+        """Close the pooled connections."""
+        clients, self._clients = self._clients, []
+        for client in clients:
+            await client.aclose()
+
+
+def get_gemini_async_model(model_name='gemini-1.5-flash', api_key=None):
+    """
+    Get the shared async Gemini client for this process.
+
+    Requests are counted with the same "gemini" provider counters as the
+    synchronous model.
+
+    Args:
+        model_name: Gemini model name
+        api_key: Google AI API key (defaults to GOOGLE_AI_API_KEY)
+
+    Returns:
+        AsyncGeminiModel
+    """
+    if not HTTPX_AVAILABLE:
+        raise ValueError("httpx is not installed")
+
+    api_key = api_key or os.environ.get('GOOGLE_AI_API_KEY')
+    return client_registry.get(("gemini-async", model_name, api_key), lambda: AsyncGeminiModel(
+        model_name, api_key, client_registry.provider_stats("gemini")
+    ))
+
+
+if OPENAI_AVAILABLE:
+    class CountingTransport(httpx.HTTPTransport):
+        """HTTP transport that records every request in ProviderStats."""
+
+        def __init__(self, stats, **kwargs):
+            super().__init__(**kwargs)
+            self.stats = stats
+
+        def handle_request(self, request):
+            start_time = self.stats.start()
+            error = True
+            try:
+                response = super().handle_request(request)
+                error = response.status_code >= 400
+                return response
+            finally:
+                self.stats.finish(start_time, error)
+
+
+def get_openai_client(api_key=None):
+    """
+    Get the shared OpenAI client for this process.
+
+    The client uses one pooled HTTP client with keep-alive connections.
+
+    Args:
+        api_key: OpenAI API key (defaults to OPENAI_API_KEY)
+
+    Returns:
+        OpenAI client
+    """
+    if not OPENAI_AVAILABLE:
+        raise ValueError("openai is not installed")
+
+    api_key = api_key or os.environ.get('OPENAI_API_KEY')
+
+    def create():
+        limits = httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+        )
+        transport = CountingTransport(client_registry.provider_stats("openai"), limits=limits)
+        http_client = httpx.Client(transport=transport, timeout=OPENAI_TIMEOUT)
+        return OpenAI(api_key=api_key, http_client=http_client)
+
+    return client_registry.get(("openai", api_key), create)
+
+
+def api_client_stats():
+    """
+    Get request counters for every API provider used in this process.
+
+    Returns:
+        Dictionary of provider -> counters
+    """
+    return client_registry.snapshot()
@@ -0,0 +1,308 @@
+"""
+Asyncio Analysis for the ASGI App
+
+The Flask app handles an analysis on a worker thread that is blocked for the
+whole Gemini round trip, so the number of threads caps the number of
+analyses in flight. The coroutines here never block the event loop: remote
+calls go through the async Gemini client (see get_gemini_async_model) and
+wait on the shared rate limiter with asyncio.sleep, while CPU-bound work
+(image decoding and preprocessing, frame extraction, file I/O) runs on a
+bounded thread pool. One event loop then keeps hundreds of analyses in
+flight with a handful of threads.
+
+run_cpu() also applies backpressure: at most ASYNC_CPU_QUEUE calls are
+queued on or running in the pool, later callers wait on the event loop.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .api_clients import get_gemini_async_model
+from .google_ai_integration import (
+    ANALYSIS_PROMPTS, API_KEY, extract_frames_from_video, find_players_for_crop, parse_frame_filename
+)
+from .image_input import ImageInput
+from .metrics import FRAMES_ANALYZED, JOBS_IN_FLIGHT
+from .rally_segmentation import in_play_frame_indices, segment_rallies
+from .rate_limiting import gemini_rate_limiter
+from .result_sink import get_result_sink
+from .structured_logging import sampled
+from .tracing import context_wrap, span
+
+logger = logging.getLogger(__name__)
+frame_errors = sampled(logger, every=1, per_second=5)
+request_log = sampled(logger, every=10, per_second=1)
+
+# Threads for CPU-bound work (OpenCV and Pillow release the GIL while decoding and encoding)
+ASYNC_CPU_WORKERS = int(os.environ.get('ASYNC_CPU_WORKERS', str(os.cpu_count() or 4)))
+
+# CPU-bound calls queued on or running in the pool at once
+ASYNC_CPU_QUEUE = int(os.environ.get('ASYNC_CPU_QUEUE', '64'))
+
+# Concurrent Gemini requests per video analysis (the rate limiter still applies)
+ASYNC_FRAME_CONCURRENCY = int(os.environ.get('ASYNC_FRAME_CONCURRENCY', os.environ.get('ANALYSIS_WORKERS', '6')))
+
+_executor = None
+_executor_lock = threading.Lock()
+_cpu_slots = weakref.WeakKeyDictionary()
+
+
+def get_cpu_executor():
+    """
+    Get the process-wide thread pool for CPU-bound work.
+
+    Returns:
+        ThreadPoolExecutor with ASYNC_CPU_WORKERS threads
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ASYNC_CPU_WORKERS, thread_name_prefix="async-cpu")
+    return _executor
+
+
+def _reset_after_fork():
+    # Pool threads do not survive a fork
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _cpu_slots.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Run a blocking function on the CPU pool.
+
+    The function runs in the caller's trace and log context.
+
+    Args:
+        func: Function to call
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The function's return value
+    """
+    loop = asyncio.get_running_loop()
+    slots = _cpu_slots.get(loop)
+    if slots is None:
+        slots = _cpu_slots.setdefault(loop, asyncio.Semaphore(ASYNC_CPU_QUEUE))
+    async with slots:
+        return await loop.run_in_executor(get_cpu_executor(), functools.partial(context_wrap(func), *args, **kwargs))
+
+
+def cpu_pool_stats():
+    """
+    Get the size and backlog of the CPU pool.
+
+    Returns:
+        Dictionary of pool settings and queued work items
+    """
+    executor = _executor
+    return {
+        "workers": ASYNC_CPU_WORKERS,
+        "max_queued": ASYNC_CPU_QUEUE,
+        "threads": len(executor._threads) if executor is not None else 0,
+        "queued": executor._work_queue.qsize() if executor is not None else 0,
+    }
+
+
+async def generate_image_analysis_async(prompt, image, analysis_type=None, original_bytes=None, prepared=None):
+    """
+    Send an image and prompt to Gemini without blocking the event loop.
+
+    The coroutine counterpart of generate_image_analysis: preprocessing runs
+    on the CPU pool, the request waits on the shared Gemini rate limiter and
+    is sent with the async REST client.
+
+    Args:
+        prompt: Prompt for the analysis
+        image: Image to analyze (path, encoded bytes, RGB numpy array, PIL
+            image or ImageInput)
+        analysis_type: Analysis type used to pick the preprocessing profile
+        original_bytes: Size of the original image file, for reporting
+        prepared: Already preprocessed PreparedImage to send instead of image
+
+    Returns:
+        Tuple of (analysis text, dictionary of request stats)
+    """
+    if prepared is None:
+        prepared = await run_cpu(
+            lambda: ImageInput.from_any(image).prepare(analysis_type, find_players=find_players_for_crop)
+        )
+    if original_bytes is not None and prepared.original_bytes is None:
+        prepared.original_bytes = original_bytes
+
+    stats = {"analysis_type": analysis_type}
+    stats.update(prepared.stats())
+    model = get_gemini_async_model('gemini-1.5-flash', API_KEY)
+
+    wait_start = time.perf_counter()
+    with span("rate_limit_wait", provider="gemini"):
+        await gemini_rate_limiter.acquire_async()
+    stats["rate_limit_wait_ms"] = round((time.perf_counter() - wait_start) * 1000, 1)
+
+    start_time = time.perf_counter()
+    with span("remote_call", provider="gemini", model=model.model_name, analysis_type=analysis_type or "image",
+              bytes_sent=stats["bytes_sent"]) as remote_span:
+        text, stats["tokens"] = await model.generate_content([prompt, prepared.to_gemini_part()])
+        remote_span.set_attributes(bytes_received=len(text), tokens=stats["tokens"] or 0)
+    stats["latency_ms"] = round((time.perf_counter() - start_time) * 1000, 1)
+    FRAMES_ANALYZED.labels(analysis_type=analysis_type or "image").inc()
+
+    request_log.info("Gemini %s analysis: %s (%s bytes) -> %s (%s bytes), preprocess %s ms, request %s ms",
+                     analysis_type or 'image', stats['original_size'], stats['original_bytes'], stats['sent_size'],
+                     stats['bytes_sent'], stats['preprocess_ms'], stats['latency_ms'], extra={"request_stats": stats})
+
+    return text, stats
+
+
+async def analyze_image_async(image, analysis_type):
+    """
+    Analyze an image, returning an error message instead of raising.
+
+    The coroutine counterpart of analyze_technique, analyze_positioning and
+    analyze_tactics.
+
+    Args:
+        image: Path, encoded bytes, RGB numpy array, PIL image or ImageInput
+        analysis_type: "technique", "positioning" or "tactics"
+
+    Returns:
+        Analysis text or error message
+    """
+    if analysis_type not in ANALYSIS_PROMPTS:
+        raise ValueError(f"Invalid analysis type: {analysis_type}")
+
+    try:
+        analysis, _ = await generate_image_analysis_async(ANALYSIS_PROMPTS[analysis_type], image, analysis_type)
+        return analysis
+    except Exception as e:
+        error_msg = f"Error analyzing image: {str(e)}"
+        logger.error("Error analyzing image: %s", e)
+
+        if "API key not valid" in str(e):
+            return "Unable to analyze the image. Your Google AI API key is invalid. Please update your .env file with a valid API key from https://makersuite.google.com/app/apikey"
+
+        return f"Unable to analyze the image. {error_msg}"
+
+
+def _extract_frames(video_path, temp_dir, interval_seconds, max_frames, in_play_only, save_rally_index=True):
+    """Pick and extract the frames to analyze (runs on the CPU pool)"""
+    frame_indices = None
+    if in_play_only:
+        rally_index = segment_rallies(video_path, save=save_rally_index)
+        frame_indices = in_play_frame_indices(rally_index, interval_seconds, max_frames)
+        logger.info("Targeting %s in-play frames from %s rallies", len(frame_indices), len(rally_index['rallies']))
+        if not frame_indices:
+            logger.info("No rallies found, analyzing the whole video")
+
+    logger.info("Extracting frames from video at %s second intervals, max %s frames", interval_seconds, max_frames)
+    return extract_frames_from_video(
+        video_path,
+        output_dir=temp_dir,
+        frame_interval=interval_seconds,
+        max_frames=max_frames,
+        frame_indices=frame_indices
+    )
+
+
+async def analyze_video_frames_async(video_path, analysis_type="technique", interval_seconds=2.0, max_frames=5,
+                                     output_file=None, in_play_only=False, video_id=None, concurrency=None,
+                                     save_rally_index=True):
+    """
+    Analyze frames from a video with Gemini without blocking the event loop.
+
+    The coroutine counterpart of analyze_video_frames_gemini, with the same
+    results: frames are extracted on the CPU pool, then all frames are
+    analyzed concurrently (at most `concurrency` requests at a time) and
+    written to the result sink in frame order.
+
+    Args:
+        video_path: Path to the video file
+        analysis_type: Type of analysis (technique, positioning, tactics)
+        interval_seconds: Time interval between frames in seconds
+        max_frames: Maximum number of frames to analyze
+        output_file: Optional path to also save the results as a per-video CSV
+        in_play_only: Only analyze frames inside rallies
+        video_id: ID stored with the results (defaults to the video file name)
+        concurrency: Concurrent requests (defaults to ASYNC_FRAME_CONCURRENCY)
+        save_rally_index: Store a newly built rally index next to the video
+            (False for temporary uploads)
+
+    Returns:
+        Path to the results file (see result_sink) and list of analysis results
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video file not found: {video_path}")
+    if analysis_type not in ANALYSIS_PROMPTS:
+        raise ValueError(f"Invalid analysis type: {analysis_type}")
+
+    video_id = video_id or os.path.splitext(os.path.basename(video_path))[0]
+    prompt = ANALYSIS_PROMPTS[analysis_type]
+    # Frame file names only depend on the frame, so each analysis extracts
+    # into its own directory next to the video
+    temp_dir = tempfile.mkdtemp(prefix="frames_", dir=os.path.dirname(video_path) or None)
+
+    try:
+        with JOBS_IN_FLIGHT.track_inprogress(job="async_video_analysis"):
+            frame_paths = await run_cpu(_extract_frames, video_path, temp_dir, interval_seconds, max_frames,
+                                        in_play_only, save_rally_index)
+            if not frame_paths:
+                raise ValueError("No frames could be extracted from the video")
+
+            requests = asyncio.Semaphore(max(concurrency or ASYNC_FRAME_CONCURRENCY, 1))
+
+            async def analyze(frame_path):
+                frame_num, timestamp, timestamp_display = parse_frame_filename(frame_path)
+                async with requests:
+                    try:
+                        analysis, request_stats = await generate_image_analysis_async(
+                            prompt, frame_path, analysis_type, original_bytes=os.path.getsize(frame_path)
+                        )
+                    except Exception as e:
+                        error_msg = f"Error analyzing frame: {str(e)}"
+                        frame_errors.error("Error analyzing frame: %s", e)
+                        return frame_num, timestamp, {
+                            "timestamp": timestamp_display,
+                            "frame_path": frame_path,
+                            "error": error_msg
+                        }, None
+                return frame_num, timestamp, {
+                    "timestamp": timestamp_display,
+                    "frame_path": frame_path,
+                    "analysis": analysis,
+                    "bytes_sent": request_stats["bytes_sent"],
+                    "original_bytes": request_stats["original_bytes"],
+                    "latency_ms": request_stats["latency_ms"]
+                }, request_stats
+
+            analyzed = await asyncio.gather(*(analyze(frame_path) for frame_path in frame_paths))
+
+            results = []
+            with get_result_sink().video(video_id, analysis_type, output_file) as video_results:
+                for frame_num, timestamp, result_item, request_stats in analyzed:
+                    results.append(result_item)
+                    if request_stats is None:
+                        video_results.write(frame_num, timestamp, f"Error: {result_item['error']}")
+                    else:
+                        video_results.write(frame_num, timestamp, result_item["analysis"],
+                                            request_stats["latency_ms"], request_stats.get("tokens"))
+    finally:
+        await run_cpu(shutil.rmtree, temp_dir, ignore_errors=True)
+
+    logger.info("Video analysis complete. Analyzed %s frames.", len(results))
+    return video_results.path, results
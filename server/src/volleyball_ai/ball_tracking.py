@@ -0,0 +1,279 @@
+"""
+Ball Tracking for Volleyball Video
+
+Finds the ball in each frame by combining background subtraction (the ball
+is almost always moving) with a colour mask for common volleyball colours and
+a roundness check, all on downscaled frames. A constant-velocity Kalman
+filter associates candidates across frames, bridges short gaps (occlusion,
+motion blur) and splits the track into trajectory segments.
+
+Frames are consumed one at a time, so the tracker works on generators (e.g.
+FFmpegFrameReader or an OpenCV capture loop) without materializing a video.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+from .video_decoder import FFmpegFrameReader, ffmpeg_available
+
+# HSV ranges (OpenCV hue is 0-179) for yellow/blue match balls and white balls
+VOLLEYBALL_HSV_RANGES = [
+    ((18, 80, 110), (38, 255, 255)),   # yellow
+    ((95, 80, 70), (130, 255, 255)),   # blue
+    ((0, 0, 190), (179, 50, 255)),     # white
+]
+
+
+class BallTracker:
+    """
+    Track the ball through a stream of frames.
+
+    Each call to update() returns a position dictionary:
+        {"frame": int, "timestamp": float, "position": [x, y] or None,
+         "radius": float or None, "status": "detected" | "predicted" | "lost",
+         "segment": int or None}
+    with coordinates in pixels of the original frames.
+    """
+
+    def __init__(self, process_width=640, min_radius=2, max_radius=30, min_circularity=0.55,
+                 gate_distance=90, max_missed=8, min_segment_length=5, hsv_ranges=None):
+        """
+        Initialize the ball tracker.
+
+        Args:
+            process_width: Width frames are downscaled to before processing
+            min_radius: Smallest ball radius in processed pixels
+            max_radius: Largest ball radius in processed pixels
+            min_circularity: Minimum contour circularity (1.0 is a perfect circle)
+            gate_distance: Maximum distance in processed pixels between the
+                predicted and the detected position
+            max_missed: Frames the Kalman prediction bridges before a track ends
+            min_segment_length: Shortest trajectory segment that is reported
+            hsv_ranges: Colour ranges for the ball (defaults to VOLLEYBALL_HSV_RANGES)
+        """
+        self.process_width = process_width
+        self.min_radius = min_radius
+        self.max_radius = max_radius
+        self.min_circularity = min_circularity
+        self.gate_distance = gate_distance
+        self.max_missed = max_missed
+        self.min_segment_length = min_segment_length
+        self.hsv_ranges = hsv_ranges or VOLLEYBALL_HSV_RANGES
+
+        self.background = cv2.createBackgroundSubtractorMOG2(history=120, varThreshold=25, detectShadows=False)
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.kalman = None
+        self.missed = 0
+        self.scale = 1.0
+
+        self.segments = []
+        self._current = None
+        self._next_segment_id = 0
+
+    def _create_kalman(self, x, y):
+        """Create a constant-velocity Kalman filter starting at (x, y)."""
+        kalman = cv2.KalmanFilter(4, 2)
+        kalman.transitionMatrix = np.array(
+            [[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]], dtype=np.float32
+        )
+        kalman.measurementMatrix = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], dtype=np.float32)
+        kalman.processNoiseCov = np.eye(4, dtype=np.float32) * 0.5
+        kalman.measurementNoiseCov = np.eye(2, dtype=np.float32) * 2.0
+        kalman.errorCovPost = np.eye(4, dtype=np.float32) * 10.0
+        kalman.statePost = np.array([[x], [y], [0], [0]], dtype=np.float32)
+        return kalman
+
+    def _find_candidates(self, small):
+        """Return (x, y, radius, circularity) ball candidates in a processed frame."""
+        foreground = self.background.apply(small)
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_OPEN, self.kernel)
+
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        colour = np.zeros(foreground.shape, dtype=np.uint8)
+        for lower, upper in self.hsv_ranges:
+            colour |= cv2.inRange(hsv, lower, upper)
+
+        mask = cv2.bitwise_and(foreground, colour)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        candidates = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            perimeter = cv2.arcLength(contour, True)
+            if area <= 0 or perimeter <= 0:
+                continue
+
+            (x, y), radius = cv2.minEnclosingCircle(contour)
+            if not self.min_radius <= radius <= self.max_radius:
+                continue
+
+            circularity = 4 * math.pi * area / (perimeter * perimeter)
+            if circularity >= self.min_circularity:
+                candidates.append((x, y, radius, circularity))
+
+        return candidates
+
+    def _select_candidate(self, candidates, predicted):
+        """Pick the candidate closest to the prediction (or the roundest one)."""
+        if not candidates:
+            return None
+
+        if predicted is None:
+            return max(candidates, key=lambda c: c[3])
+
+        px, py = predicted
+        distance, best = min(
+            (math.hypot(c[0] - px, c[1] - py), c) for c in candidates
+        )
+        return best if distance <= self.gate_distance else None
+
+    def update(self, frame, frame_index, timestamp=None):
+        """
+        Process the next frame.
+
+        Args:
+            frame: Video frame as numpy array (BGR)
+            frame_index: Index of the frame in the video
+            timestamp: Frame time in seconds (optional)
+
+        Returns:
+            Position dictionary for this frame
+        """
+        if frame.shape[1] > self.process_width:
+            self.scale = self.process_width / frame.shape[1]
+            small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            self.scale = 1.0
+            small = frame
+
+        candidates = self._find_candidates(small)
+        predicted = None
+        if self.kalman is not None:
+            prediction = self.kalman.predict()
+            predicted = (float(prediction[0, 0]), float(prediction[1, 0]))
+
+        candidate = self._select_candidate(candidates, predicted)
+
+        if candidate is not None:
+            x, y, radius, _ = candidate
+            if self.kalman is None:
+                self.kalman = self._create_kalman(x, y)
+            else:
+                self.kalman.correct(np.array([[x], [y]], dtype=np.float32))
+            self.missed = 0
+            status = "detected"
+            point = (x, y)
+        elif predicted is not None and self.missed < self.max_missed:
+            self.missed += 1
+            status = "predicted"
+            point = predicted
+            radius = None
+        else:
+            self._end_segment()
+            self.kalman = None
+            self.missed = 0
+            return {
+                "frame": frame_index, "timestamp": timestamp, "position": None,
+                "radius": None, "status": "lost", "segment": None,
+            }
+
+        position = [round(point[0] / self.scale, 1), round(point[1] / self.scale, 1)]
+        if self._current is None:
+            self._current = {"id": self._next_segment_id, "points": []}
+            self._next_segment_id += 1
+        self._current["points"].append({
+            "frame": frame_index, "timestamp": timestamp, "position": position, "status": status
+        })
+
+        return {
+            "frame": frame_index,
+            "timestamp": timestamp,
+            "position": position,
+            "radius": round(radius / self.scale, 1) if radius else None,
+            "status": status,
+            "segment": self._current["id"],
+        }
+
+    def _end_segment(self):
+        """Close the current trajectory segment."""
+        if self._current is None:
+            return
+
+        # Drop trailing predictions that were never confirmed by a detection
+        points = self._current["points"]
+        while points and points[-1]["status"] == "predicted":
+            points.pop()
+
+        if len(points) >= self.min_segment_length:
+            self.segments.append({
+                "id": self._current["id"],
+                "start_frame": points[0]["frame"],
+                "end_frame": points[-1]["frame"],
+                "start_time": points[0]["timestamp"],
+                "end_time": points[-1]["timestamp"],
+                "points": points,
+            })
+        self._current = None
+
+    def track(self, frames, fps=30.0):
+        """
+        Track the ball through a stream of frames.
+
+        Args:
+            frames: Iterable of frames, or of (timestamp, frame) tuples
+            fps: Frame rate used for timestamps when frames carry none
+
+        Yields:
+            Position dictionary for each frame
+        """
+        for index, item in enumerate(frames):
+            if isinstance(item, tuple):
+                timestamp, frame = item
+            else:
+                timestamp, frame = index / fps, item
+            yield self.update(frame, index, timestamp)
+
+    def finish(self):
+        """
+        Close any open trajectory and return all segments.
+
+        Returns:
+            List of trajectory segments
+        """
+        self._end_segment()
+        return self.segments
+
+
+def iter_video_frames(video_path, width=640):
+    """
+    Stream (timestamp, frame) tuples from a video, downscaled for tracking.
+
+    Uses the ffmpeg pipe decoder (which scales inside ffmpeg) when available
+    and OpenCV otherwise.
+
+    Args:
+        video_path: Path to the video file
+        width: Output frame width
+
+    Yields:
+        (timestamp_seconds, frame) tuples
+    """
+    if ffmpeg_available():
+        for timestamp, frame in FFmpegFrameReader(video_path, width=width, num_buffers=2):
+            yield timestamp, frame
+        return
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video {video_path}")
+
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame
+    finally:
+        cap.release()
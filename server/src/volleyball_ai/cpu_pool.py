@@ -0,0 +1,294 @@
+"""
+Process Pool for CPU-Bound Image Work
+
+Request handlers decode uploads, compute frame features, encode JPEGs and
+validate uploaded images. In a threaded server (Flask threaded=True,
+gunicorn gthread) these compete for the GIL, which Pillow, OpenCV and NumPy
+only release inside their C loops, so the work does not spread over cores
+and slows down every other request. CPUWorkerPool runs it in worker
+processes instead, through a small typed task API:
+
+    decode    encoded image bytes -> BGR frame (cv2.imdecode)
+    resize    frame -> frame of another size
+    features  frame -> feature vector (see frame_features)
+    encode    frame -> JPEG (or PNG) bytes
+    validate  image file -> (success, path of the image or of a fixed RGB JPEG,
+              or error message)
+
+Frames of at least CPU_POOL_SHM_MIN_BYTES are passed through
+multiprocessing.shared_memory in both directions, so only a small
+descriptor is pickled; everything else is pickled as usual. The calling
+thread waits without holding the GIL. CPU_POOL_WORKERS=0 runs the tasks in
+the calling thread.
+
+The task functions live in the top-level volleyball_cpu_tasks module, which
+workers import without loading the volleyball_ai package (and its API
+clients). Workers are started on first use with the forkserver start method
+(spawn where it does not exist), never by forking a process that is already
+running request threads, and the pool is recreated after a fork (gunicorn
+workers with --preload).
+"""
+
+import asyncio
+import atexit
+import contextlib
+import importlib.machinery
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+import volleyball_cpu_tasks
+from volleyball_cpu_tasks import (
+    FEATURE_SIZE, TASKS, SharedFrame, attach_shared, close_block, frame_features,
+    is_intact_rgb_jpeg, share_array, validate_image_file
+)
+
+from .metrics import CPU_TASK_SECONDS, QUEUE_DEPTH
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Worker processes (0 runs tasks in the calling thread)
+CPU_POOL_WORKERS = int(os.environ.get('CPU_POOL_WORKERS', str(os.cpu_count() or 1)))
+
+# Arrays at least this large go through shared memory instead of being pickled
+CPU_POOL_SHM_MIN_BYTES = int(os.environ.get('CPU_POOL_SHM_MIN_BYTES', str(256 * 1024)))
+
+# "forkserver", "spawn" or "fork" (fork is only safe before any threads start)
+CPU_POOL_START_METHOD = os.environ.get('CPU_POOL_START_METHOD') or (
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+
+@contextlib.contextmanager
+def _main_script_hidden():
+    """Keep new worker processes from re-running the __main__ script."""
+    # Spawned and forkserver children execute the parent's main script as
+    # __mp_main__ (python app.py would build the whole app in every worker);
+    # multiprocessing skips that for a main module named "__main__"
+    main = sys.modules.get('__main__')
+    if main is None or getattr(main, '__spec__', None) is not None or not getattr(main, '__file__', None):
+        yield
+        return
+    main.__spec__ = importlib.machinery.ModuleSpec('__main__', None)
+    try:
+        yield
+    finally:
+        main.__spec__ = None
+
+
+class CPUWorkerPool:
+    """
+    Process pool running the CPU-bound image tasks.
+
+    Typed methods (decode, resize, features, encode, validate) block until
+    the result is ready; submit() returns a Future and run_async() can be
+    awaited from an event loop.
+    """
+
+    def __init__(self, workers=None, shm_min_bytes=None, start_method=None):
+        """
+        Initialize the pool (processes start on first use).
+
+        Args:
+            workers: Worker processes (defaults to CPU_POOL_WORKERS, 0 runs inline)
+            shm_min_bytes: Smallest array sent through shared memory
+                (defaults to CPU_POOL_SHM_MIN_BYTES)
+            start_method: multiprocessing start method (defaults to CPU_POOL_START_METHOD)
+        """
+        self.workers = CPU_POOL_WORKERS if workers is None else workers
+        self.shm_min_bytes = CPU_POOL_SHM_MIN_BYTES if shm_min_bytes is None else shm_min_bytes
+        self.start_method = start_method or CPU_POOL_START_METHOD
+        self.lock = threading.Lock()
+        self.spawn_lock = threading.Lock()
+        self.executor = None
+        self.pending = 0
+        self.completed = 0
+        self.shared_bytes = 0
+        self.restarts = 0
+
+    def _reset_after_fork(self):
+        """Forget the parent's worker processes."""
+        self.lock = threading.Lock()
+        self.spawn_lock = threading.Lock()
+        self.executor = None
+        self.pending = 0
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    context.set_forkserver_preload([volleyball_cpu_tasks.__name__])
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context, initializer=volleyball_cpu_tasks.init_worker
+                )
+            return self.executor
+
+    def _share_input(self, arg, blocks):
+        if isinstance(arg, np.ndarray) and arg.nbytes >= self.shm_min_bytes:
+            frame, block = share_array(arg)
+            blocks.append(block)
+            with self.lock:
+                self.shared_bytes += arg.nbytes
+            return frame
+        return arg
+
+    def _receive(self, result):
+        if not isinstance(result, SharedFrame):
+            return result
+        view, block = attach_shared(result)
+        try:
+            with self.lock:
+                self.shared_bytes += view.nbytes
+            return view.copy()
+        finally:
+            view = None
+            close_block(block, unlink=True)
+
+    def _submit(self, task, args, kwargs):
+        executor = self._get_executor()
+        # Worker processes are started on demand by submit
+        with self.spawn_lock, _main_script_hidden():
+            return executor.submit(volleyball_cpu_tasks.run_task, task, args, kwargs, self.shm_min_bytes)
+
+    def submit(self, task, *args, **kwargs):
+        """
+        Start a task.
+
+        Args:
+            task: Task name (decode, resize, features, encode or validate)
+            *args: Positional arguments of the task
+            **kwargs: Keyword arguments of the task
+
+        Returns:
+            Future with the task result
+        """
+        if task not in TASKS:
+            raise ValueError(f"Unknown CPU task: {task}")
+
+        result = Future()
+        if self.workers <= 0:
+            try:
+                result.set_result(TASKS[task](*args, **kwargs))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+
+        blocks = []
+        shared_args = [self._share_input(arg, blocks) for arg in args]
+        try:
+            try:
+                future = self._submit(task, shared_args, kwargs)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a new pool once
+                with self.lock:
+                    self.executor = None
+                    self.restarts += 1
+                future = self._submit(task, shared_args, kwargs)
+        except Exception:
+            for block in blocks:
+                close_block(block, unlink=True)
+            raise
+
+        with self.lock:
+            self.pending += 1
+
+        def finished(future):
+            for block in blocks:
+                close_block(block, unlink=True)
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+            try:
+                result.set_result(self._receive(future.result()))
+            except BaseException as e:
+                result.set_exception(e)
+
+        future.add_done_callback(finished)
+        return result
+
+    def run(self, task, *args, **kwargs):
+        """Run a task and wait for its result."""
+        start_time = time.perf_counter()
+        with span(task, executor="process" if self.workers > 0 else "inline"):
+            result = self.submit(task, *args, **kwargs).result()
+        CPU_TASK_SECONDS.labels(task=task).observe(time.perf_counter() - start_time)
+        return result
+
+    async def run_async(self, task, *args, **kwargs):
+        """Run a task without blocking the event loop."""
+        start_time = time.perf_counter()
+        with span(task, executor="process" if self.workers > 0 else "inline"):
+            result = await asyncio.wrap_future(self.submit(task, *args, **kwargs))
+        CPU_TASK_SECONDS.labels(task=task).observe(time.perf_counter() - start_time)
+        return result
+
+    def decode(self, data, flags=cv2.IMREAD_COLOR, min_size=None):
+        """
+        Decode encoded image bytes to a BGR frame (None if they are not an image).
+
+        Pass min_size when the frame is resized right after, so large JPEGs
+        are decoded at a reduced scale (e.g. FEATURE_SIZE before features()).
+        """
+        return self.run("decode", bytes(data), flags, min_size)
+
+    def resize(self, frame, size, interpolation=cv2.INTER_AREA):
+        """Resize a frame to (width, height)."""
+        return self.run("resize", frame, tuple(size), interpolation)
+
+    def features(self, frame):
+        """Compute the feature vector of a BGR frame (see frame_features)."""
+        return self.run("features", frame)
+
+    def encode(self, frame, ext=".jpg", quality=90):
+        """Encode a frame as JPEG (or another OpenCV format), returning bytes."""
+        return self.run("encode", frame, ext, quality)
+
+    def validate(self, image_path):
+        """Validate an image file, writing a fixed RGB JPEG if needed (see validate_image_file)."""
+        return self.run("validate", image_path)
+
+    def stats(self):
+        """
+        Get pool settings and counters.
+
+        Returns:
+            Dictionary of workers, start method, pending and completed tasks
+        """
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "start_method": self.start_method if self.workers > 0 else "inline",
+                "started": self.executor is not None,
+                "pending": self.pending,
+                "completed": self.completed,
+                "shared_memory_bytes": self.shared_bytes,
+                "restarts": self.restarts,
+            }
+
+    def shutdown(self, wait=True):
+        """Stop the worker processes."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# Shared pool for the request handlers of this process
+cpu_pool = CPUWorkerPool()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=cpu_pool._reset_after_fork)
+
+atexit.register(cpu_pool.shutdown, wait=False)
+
+QUEUE_DEPTH.set_function(lambda: cpu_pool.pending, queue="cpu_pool")
@@ -6,8 +6,9 @@ and tactics using Google's Gemini Pro Vision model.
 """
 
 import os
+import logging
 import cv2
-import csv
+import numpy as np
 import time
 import google.generativeai as genai
 from PIL import Image
@@ -15,42 +16,128 @@ from pathlib import Path
 import subprocess
 import tempfile
 import shutil
+import sys
+
+from .video_decoder import FFmpegFrameReader, ffmpeg_available, probe_video, should_use_ffmpeg
+from .image_input import ImageInput
+from .rally_segmentation import in_play_frame_indices, segment_rallies
+from .rate_limiting import gemini_rate_limiter
+from .api_clients import get_gemini_model
+from .result_sink import format_timestamp, get_result_sink
+from .tracing import span
+from .metrics import FRAMES_ANALYZED, FRAMES_DECODED, JOBS_IN_FLIGHT
+from .structured_logging import sampled
+
+logger = logging.getLogger(__name__)
+
+# Per-frame and per-request events are sampled; per-frame failures are only
+# rate-limited
+frame_log = sampled(logger)
+frame_errors = sampled(logger, every=1, per_second=5)
+request_log = sampled(logger, every=10, per_second=1)
 
 # Try to import imghdr, but make it optional
 try:
     import imghdr
     IMGHDR_AVAILABLE = True
 except ImportError:
-    print("Warning: imghdr module not available. Image type detection will be limited.")
+    logger.warning("imghdr module not available. Image type detection will be limited.")
     IMGHDR_AVAILABLE = False
 
 # Get API key directly from environment variables
 API_KEY = os.environ.get('GOOGLE_AI_API_KEY')
 
 if not API_KEY:
-    print("\nAvailable environment variables:")
+    logger.error("Available environment variables:")
     for key in os.environ:
         if 'KEY' in key:
             value = os.environ[key]
             masked_value = value[:4] + '...' + value[-4:] if len(value) > 8 else '***'
-            print(f"{key}={masked_value}")
+            logger.error("%s=%s", key, masked_value)
     raise ValueError("GOOGLE_AI_API_KEY not found in environment variables")
 
-print(f"Configuring Google AI with API Key: {API_KEY[:4]}...{API_KEY[-4:] if len(API_KEY) > 8 else ''}")
+logger.info("Configuring Google AI with API Key: %s...%s", API_KEY[:4], API_KEY[-4:] if len(API_KEY) > 8 else '')
 
 try:
-    genai.configure(api_key=API_KEY)
-    # Initialize the Gemini model - using gemini-1.5-flash
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    print("Successfully configured Google Generative AI with gemini-1.5-flash model")
+    # Shared gemini-1.5-flash model for this process (see api_clients)
+    model = get_gemini_model('gemini-1.5-flash', API_KEY)
+    logger.info("Successfully configured Google Generative AI with gemini-1.5-flash model")
 except Exception as e:
-    print(f"Error configuring Google Generative AI: {e}")
+    logger.error("Error configuring Google Generative AI: %s", e)
     if "API key not valid" in str(e):
-        print("\n⚠️ Your Google AI API key is invalid.")
-        print("Please get a valid API key from: https://makersuite.google.com/app/apikey")
-        print("Then update your .env file with the new key.")
+        logger.error("⚠️ Your Google AI API key is invalid.")
+        logger.error("Please get a valid API key from: https://makersuite.google.com/app/apikey")
+        logger.error("Then update your .env file with the new key.")
     raise
 
+opencv_frames_decoded = FRAMES_DECODED.labels(decoder="opencv")
+
+# Prompts for the standard analysis types
+ANALYSIS_PROMPTS = {
+    "technique": """
+        Identify and analyze the volleyball technique being performed in this image.
+        
+        Please include:
+        1. The specific technique being performed (e.g., serve, set, spike, block, dig)
+        2. Assessment of proper form and body positioning
+        3. Strengths in the execution
+        4. Areas for improvement
+        5. Specific coaching cues for better performance
+        """,
+    "positioning": """
+        Analyze the volleyball court positioning in this image.
+        
+        Please include:
+        1. The formation being used (e.g., 5-1, 6-2, 4-2)
+        2. Evaluation of court coverage
+        3. Player positioning relative to the ball
+        4. Defensive or offensive readiness
+        5. Suggested positioning improvements
+        """,
+    "tactics": """
+        Provide a tactical analysis of this volleyball scenario.
+        
+        Please include:
+        1. The game situation (e.g., serve receive, transition, free ball)
+        2. Offensive or defensive strategies in use
+        3. Team formation effectiveness
+        4. Decision-making assessment
+        5. Potential tactical adjustments
+        """,
+}
+
+# OpenCV capture backends to retry with when the default backend fails
+# (Media Foundation only exists on Windows)
+CAPTURE_BACKENDS = [cv2.CAP_FFMPEG, cv2.CAP_GSTREAMER]
+if sys.platform == 'win32':
+    CAPTURE_BACKENDS.append(cv2.CAP_MSMF)
+
+def open_video_capture(video_path):
+    """
+    Open a video with OpenCV, retrying with alternative backends.
+    
+    Args:
+        video_path: Path to the video file
+        
+    Returns:
+        An opened cv2.VideoCapture, or None if no backend could open the file
+    """
+    video = cv2.VideoCapture(video_path)
+    if video.isOpened():
+        return video
+    
+    logger.warning("First attempt to open video failed, trying with different backend...")
+    for backend in CAPTURE_BACKENDS:
+        try:
+            video = cv2.VideoCapture(video_path, backend)
+            if video.isOpened():
+                logger.info("Successfully opened video with backend %s", backend)
+                return video
+        except:
+            continue
+    
+    return None
+
 # Function to save frame properly
 def save_frame_properly(frame, path):
     """Helper function to save a frame with proper error handling"""
@@ -76,10 +163,10 @@ def save_frame_properly(frame, path):
             img_size = pil_img.size
             pil_img.close()
             
-            print(f"Frame saved and verified: {path}, format={img_format}, size={img_size}")
+            frame_log.debug("Frame saved and verified: %s, format=%s, size=%s", path, img_format, img_size)
             return True, path
         except Exception as pil_error:
-            print(f"PIL verification failed: {str(pil_error)}")
+            logger.warning("PIL verification failed: %s", pil_error)
             
             # Try to convert and save with PIL
             try:
@@ -91,12 +178,12 @@ def save_frame_properly(frame, path):
                 pil_img.save(pil_path, format="JPEG", quality=95)
                 
                 if os.path.exists(pil_path) and os.path.getsize(pil_path) > 0:
-                    print(f"Frame saved with PIL: {pil_path}")
+                    logger.info("Frame saved with PIL: %s", pil_path)
                     return True, pil_path
                 else:
                     raise ValueError("Failed to save with PIL")
             except Exception as pil_save_error:
-                print(f"PIL save failed: {str(pil_save_error)}")
+                logger.warning("PIL save failed: %s", pil_save_error)
                 
                 # Try one more approach - save as PNG
                 try:
@@ -104,14 +191,14 @@ def save_frame_properly(frame, path):
                     cv2.imwrite(png_path, frame)
                     
                     if os.path.exists(png_path) and os.path.getsize(png_path) > 0:
-                        print(f"Frame saved as PNG: {png_path}")
+                        logger.info("Frame saved as PNG: %s", png_path)
                         return True, png_path
                     else:
                         raise ValueError("Failed to save as PNG")
                 except Exception as png_error:
-                    print(f"PNG save failed: {str(png_error)}")
+                    logger.warning("PNG save failed: %s", png_error)
     except Exception as e:
-        print(f"Error saving frame: {str(e)}")
+        logger.error("Error saving frame: %s", e)
     
     # Last resort - create a blank image with error message
     try:
@@ -131,14 +218,88 @@ def save_frame_properly(frame, path):
         # Save the blank image
         blank_path = f"{os.path.splitext(path)[0]}_blank.jpg"
         blank_img.save(blank_path)
-        print(f"Created blank image as fallback: {blank_path}")
+        logger.info("Created blank image as fallback: %s", blank_path)
         return True, blank_path
     except Exception as blank_error:
-        print(f"Even blank image creation failed: {str(blank_error)}")
+        logger.error("Even blank image creation failed: %s", blank_error)
         return False, None
 
+def find_players_for_crop(image):
+    """
+    Detect players in a PIL image for region-of-interest cropping.
+    
+    Args:
+        image: PIL image
+        
+    Returns:
+        List of player detections (empty if detection is unavailable)
+    """
+    # Imported here because volleyball_inference imports this module
+    from .volleyball_inference import detect_players
+    
+    try:
+        frame = cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+        return detect_players(frame)
+    except Exception as e:
+        logger.error("Player detection for cropping failed: %s", e)
+        return []
+
+def generate_image_analysis(prompt, image, analysis_type=None, original_bytes=None, prepared=None):
+    """
+    Send an image and prompt to Gemini, preprocessing the image first.
+    
+    The image is downscaled, cropped and encoded according to the profile
+    for the analysis type (see image_preprocessing), unless preprocessing
+    is disabled with IMAGE_PREPROCESSING=0. Encoded images that already fit
+    the profile are sent unchanged. Requests wait on the shared Gemini rate
+    limiter.
+    
+    Args:
+        prompt: Prompt for the analysis
+        image: Image to analyze (path, encoded bytes, RGB numpy array, PIL
+            image or ImageInput)
+        analysis_type: Analysis type used to pick the preprocessing profile
+        original_bytes: Size of the original image file, for reporting
+        prepared: Already preprocessed PreparedImage to send instead of image
+        
+    Returns:
+        Tuple of (analysis text, dictionary of request stats)
+    """
+    if prepared is None:
+        prepared = ImageInput.from_any(image).prepare(analysis_type, find_players=find_players_for_crop)
+    if original_bytes is not None and prepared.original_bytes is None:
+        prepared.original_bytes = original_bytes
+    
+    stats = {"analysis_type": analysis_type}
+    stats.update(prepared.stats())
+    image_part = prepared.to_gemini_part()
+    
+    wait_start = time.perf_counter()
+    with span("rate_limit_wait", provider="gemini"):
+        gemini_rate_limiter.acquire()
+    stats["rate_limit_wait_ms"] = round((time.perf_counter() - wait_start) * 1000, 1)
+    
+    start_time = time.perf_counter()
+    with span("remote_call", provider="gemini", model=model.model_name, analysis_type=analysis_type or "image",
+              bytes_sent=stats["bytes_sent"]):
+        response = model.generate_content([prompt, image_part])
+    stats["latency_ms"] = round((time.perf_counter() - start_time) * 1000, 1)
+    with span("parse", analysis_type=analysis_type or "image") as parse_span:
+        text = response.text
+        usage = getattr(response, "usage_metadata", None)
+        stats["tokens"] = getattr(usage, "total_token_count", None) if usage else None
+        parse_span.set_attributes(bytes_received=len(text), tokens=stats["tokens"] or 0)
+    FRAMES_ANALYZED.labels(analysis_type=analysis_type or "image").inc()
+    
+    request_log.info("Gemini %s analysis: %s (%s bytes) -> %s (%s bytes), preprocess %s ms, request %s ms",
+                     analysis_type or 'image', stats['original_size'], stats['original_bytes'], stats['sent_size'],
+                     stats['bytes_sent'], stats['preprocess_ms'], stats['latency_ms'], extra={"request_stats": stats})
+    
+    return text, stats
+
 # Extract frames from a video file in a memory-efficient way
-def extract_frames_from_video(video_path, output_dir=None, frame_interval=30, max_frames=None):
+def extract_frames_from_video(video_path, output_dir=None, frame_interval=30, max_frames=None, decoder=None,
+                              frame_indices=None):
     """
     Extract frames from a video file in a memory-efficient way.
     
@@ -147,39 +308,34 @@ def extract_frames_from_video(video_path, output_dir=None, frame_interval=30, ma
         output_dir: Directory to save frames (temporary if None)
         frame_interval: Extract 1 frame per this many frames (or seconds if float)
         max_frames: Maximum number of frames to extract (evenly distributed if specified)
+        decoder: "auto", "opencv" or "ffmpeg" (defaults to VIDEO_DECODER)
+        frame_indices: Exact frame numbers to extract (overrides frame_interval and max_frames)
     
     Returns:
         List of paths to extracted frames
     """
-    print(f"Extracting frames from video: {video_path}")
+    logger.info("Extracting frames from video: %s", video_path)
     
     # Create temporary directory if not specified
     if output_dir is None:
         output_dir = tempfile.mkdtemp()
-        print(f"Created temporary directory for frames: {output_dir}")
+        logger.info("Created temporary directory for frames: %s", output_dir)
     else:
         os.makedirs(output_dir, exist_ok=True)
-        print(f"Using specified directory for frames: {output_dir}")
+        logger.info("Using specified directory for frames: %s", output_dir)
+    
+    # Decode with a single ffmpeg pipe when OpenCV is not suitable
+    if should_use_ffmpeg(video_path, decoder):
+        return extract_frames_with_ffmpeg(video_path, output_dir, frame_interval, max_frames, frame_indices)
     
     # Open the video
-    video = cv2.VideoCapture(video_path)
+    video = open_video_capture(video_path)
     
-    if not video.isOpened():
-        # Try with different backend if default fails
-        print("First attempt to open video failed, trying with different backend...")
-        
-        # Try with different backend options
-        for backend in [cv2.CAP_FFMPEG, cv2.CAP_GSTREAMER, cv2.CAP_MSMF]:
-            try:
-                video = cv2.VideoCapture(video_path, backend)
-                if video.isOpened():
-                    print(f"Successfully opened video with backend {backend}")
-                    break
-            except:
-                continue
-        
-        if not video.isOpened():
-            raise ValueError(f"Could not open video file: {video_path}")
+    if video is None:
+        if ffmpeg_available():
+            logger.info("OpenCV could not open the video, falling back to the ffmpeg decoder")
+            return extract_frames_with_ffmpeg(video_path, output_dir, frame_interval, max_frames, frame_indices)
+        raise ValueError(f"Could not open video file: {video_path}")
     
     # Get video properties
     fps = video.get(cv2.CAP_PROP_FPS)
@@ -187,28 +343,28 @@ def extract_frames_from_video(video_path, output_dir=None, frame_interval=30, ma
     width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
     
-    print(f"Video properties: {width}x{height}, {fps} fps, {frame_count} frames")
+    logger.info("Video properties: %sx%s, %s fps, %s frames", width, height, fps, frame_count)
     
     if fps <= 0:
-        print("Warning: Invalid fps detected, using default value of 30")
+        logger.warning("Invalid fps detected, using default value of 30")
         fps = 30
     
     if frame_count <= 0 or frame_count > 100000:  # Unreasonably large frame count
-        print("Warning: Invalid frame count detected, estimating based on duration")
+        logger.warning("Invalid frame count detected, estimating based on duration")
         # Try to estimate frame count based on duration if available
         duration = video.get(cv2.CAP_PROP_POS_MSEC) / 1000
         if duration > 0:
             frame_count = int(duration * fps)
         else:
             # Default to 10 seconds if we can't determine
-            print("Warning: Could not determine video duration, assuming 10 seconds")
+            logger.warning("Could not determine video duration, assuming 10 seconds")
             frame_count = int(10 * fps)
     
     # Calculate frame interval
     if isinstance(frame_interval, float):
         # Convert seconds to frames
         frame_interval_frames = int(fps * frame_interval)
-        print(f"Converting {frame_interval} seconds to {frame_interval_frames} frames")
+        logger.info("Converting %s seconds to %s frames", frame_interval, frame_interval_frames)
     else:
         frame_interval_frames = frame_interval
     
@@ -216,7 +372,10 @@ def extract_frames_from_video(video_path, output_dir=None, frame_interval=30, ma
         frame_interval_frames = 1
     
     # Determine which frames to extract
-    if max_frames and max_frames > 0:
+    if frame_indices:
+        target_frames = sorted(frame_indices)
+        logger.info("Extracting %s selected frames", len(target_frames))
+    elif max_frames and max_frames > 0:
         # Distribute frames evenly across the video
         target_frames = []
         if max_frames > 1 and frame_count > max_frames:
@@ -224,23 +383,23 @@ def extract_frames_from_video(video_path, output_dir=None, frame_interval=30, ma
                 # This ensures even distribution across the entire video
                 target_frame = int((i / (max_frames - 1)) * (frame_count - 1))
                 target_frames.append(target_frame)
-            print(f"Extracting {max_frames} frames evenly distributed across video")
+            logger.info("Extracting %s frames evenly distributed across video", max_frames)
         else:
             # Just use interval-based extraction but cap at max_frames
             target_frames = list(range(0, frame_count, frame_interval_frames))[:max_frames]
-            print(f"Extracting frames at interval of {frame_interval_frames} frames, capped at {max_frames}")
+            logger.info("Extracting frames at interval of %s frames, capped at %s", frame_interval_frames, max_frames)
     else:
         # Use all frames at the specified interval
         target_frames = list(range(0, frame_count, frame_interval_frames))
-        print(f"Extracting frames at interval of {frame_interval_frames} frames")
+        logger.info("Extracting frames at interval of %s frames", frame_interval_frames)
     
     # Extract frames
     frame_paths = []
     frames_processed = 0
     
     # For videos with unreliable frame counts, use time-based approach
-    if frame_count > 10000 or os.path.splitext(video_path)[1].lower() == '.mov':
-        print("Using time-based frame extraction for large video or MOV file")
+    if not frame_indices and (frame_count > 10000 or os.path.splitext(video_path)[1].lower() == '.mov'):
+        logger.info("Using time-based frame extraction for large video or MOV file")
         
         # Calculate time intervals based on estimated duration
         duration = frame_count / fps
@@ -249,38 +408,45 @@ def extract_frames_from_video(video_path, output_dir=None, frame_interval=30, ma
         for i, _ in enumerate(target_frames):
             # Set position by time (milliseconds)
             time_pos = i * time_interval
-            video.set(cv2.CAP_PROP_POS_MSEC, time_pos * 1000)
+            with span("seek", position_ms=round(time_pos * 1000)):
+                video.set(cv2.CAP_PROP_POS_MSEC, time_pos * 1000)
             
-            success, frame = video.read()
+            with span("decode", decoder="opencv", position_ms=round(time_pos * 1000)):
+                success, frame = video.read()
+                opencv_frames_decoded.inc(int(success))
             frames_processed += 1
             
             if not success:
-                print(f"Failed to read frame at time position {time_pos:.2f} seconds")
+                frame_errors.warning("Failed to read frame at time position %.2f seconds", time_pos)
                 continue
             
             # Save frame
             frame_path = os.path.join(output_dir, f"frame_{i:06d}_{time_pos:.2f}s.jpg")
             
-            success, saved_path = save_frame_properly(frame, frame_path)
+            with span("encode", format="jpeg", position_ms=round(time_pos * 1000)):
+                success, saved_path = save_frame_properly(frame, frame_path)
             if success:
                 frame_paths.append(saved_path)
-                print(f"Saved frame at time position {time_pos:.2f} seconds")
+                frame_log.debug("Saved frame at time position %.2f seconds", time_pos)
             else:
-                print(f"Warning: Failed to save frame at time position {time_pos:.2f} seconds")
+                frame_errors.warning("Failed to save frame at time position %.2f seconds", time_pos)
             
             # Safety check
             if frames_processed >= 100:  # Limit for safety
-                print("Maximum frame processing limit reached")
+                logger.info("Maximum frame processing limit reached")
                 break
     else:
         # Standard frame-based approach
         for i, frame_num in enumerate(target_frames):
-            video.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-            success, frame = video.read()
+            with span("seek", frame_idx=frame_num):
+                video.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            with span("decode", decoder="opencv", frame_idx=frame_num):
+                success, frame = video.read()
+                opencv_frames_decoded.inc(int(success))
             frames_processed += 1
             
             if not success:
-                print(f"Failed to read frame at position {frame_num}")
+                frame_errors.warning("Failed to read frame at position %s", frame_num)
                 continue
             
             # Calculate timestamp for filename
@@ -289,20 +455,104 @@ def extract_frames_from_video(video_path, output_dir=None, frame_interval=30, ma
             # Save frame
             frame_path = os.path.join(output_dir, f"frame_{i:06d}_{frame_num}_{timestamp:.2f}s.jpg")
             
-            success, saved_path = save_frame_properly(frame, frame_path)
+            with span("encode", format="jpeg", frame_idx=frame_num):
+                success, saved_path = save_frame_properly(frame, frame_path)
             if success:
                 frame_paths.append(saved_path)
-                print(f"Saved frame at position {frame_num} (time: {timestamp:.2f}s)")
+                frame_log.debug("Saved frame at position %s (time: %.2fs)", frame_num, timestamp)
             else:
-                print(f"Warning: Failed to save frame at position {frame_num}")
+                frame_errors.warning("Failed to save frame at position %s", frame_num)
     
     video.release()
-    print(f"Extracted {len(frame_paths)} frames from video")
+    logger.info("Extracted %s frames from video", len(frame_paths))
+    
+    return frame_paths
+
+def extract_frames_with_ffmpeg(video_path, output_dir, frame_interval=30, max_frames=None, frame_indices=None):
+    """
+    Extract frames from a video file through the ffmpeg pipe decoder.
     
+    Frames are selected inside ffmpeg, so only the sampled frames are
+    converted and transferred. Accepts the same sampling arguments as
+    extract_frames_from_video and writes frames with the same file names.
+    
+    Args:
+        video_path: Path to the video file
+        output_dir: Directory to save frames
+        frame_interval: Extract 1 frame per this many frames (or seconds if float)
+        max_frames: Maximum number of frames to extract (evenly distributed if specified)
+        frame_indices: Exact frame numbers to extract (overrides frame_interval and max_frames)
+    
+    Returns:
+        List of paths to extracted frames
+    """
+    info = probe_video(video_path)
+    fps = info["fps"] or 30
+    frame_count = info["frame_count"] or 0
+    logger.info("Video properties (ffmpeg): %sx%s, %s fps, %s frames", info['width'], info['height'], fps, frame_count)
+    
+    # Seconds are converted to a frame step, like the OpenCV path, so frame
+    # numbers are exact indices
+    if isinstance(frame_interval, float):
+        reader_args = {"every_n_frames": max(int(fps * frame_interval), 1)}
+    else:
+        reader_args = {"every_n_frames": max(int(frame_interval), 1)}
+    
+    if frame_indices:
+        reader_args = {"frame_indices": sorted(frame_indices)}
+        max_frames = None
+        logger.info("Extracting %s selected frames", len(frame_indices))
+    elif max_frames and max_frames > 1 and frame_count > max_frames:
+        # Distribute frames evenly across the video, like the OpenCV path
+        target_frames = [int((i / (max_frames - 1)) * (frame_count - 1)) for i in range(max_frames)]
+        reader_args = {"frame_indices": target_frames}
+        logger.info("Extracting %s frames evenly distributed across video", max_frames)
+    
+    frame_paths = []
+    reader = FFmpegFrameReader(video_path, max_frames=max_frames or None, **reader_args)
+    for i, (timestamp, frame) in enumerate(reader):
+        # pts for the time, the reader's count for the frame number
+        frame_num = reader.frame_number
+        timestamp = timestamp if timestamp is not None else frame_num / fps
+        frame_path = os.path.join(output_dir, f"frame_{i:06d}_{frame_num}_{timestamp:.2f}s.jpg")
+        
+        success, saved_path = save_frame_properly(frame, frame_path)
+        if success:
+            frame_paths.append(saved_path)
+        else:
+            frame_errors.warning("Failed to save frame at time position %.2f seconds", timestamp)
+    
+    logger.info("Extracted %s frames from video with ffmpeg", len(frame_paths))
     return frame_paths
 
+def parse_frame_filename(frame_path):
+    """
+    Read the frame number and timestamp from an extracted frame's file name.
+    
+    Args:
+        frame_path: Path written by extract_frames_from_video, named
+            frame_000001_30_1.00s.jpg (or frame_000001_1.00s.jpg)
+        
+    Returns:
+        Tuple of (frame number or None, timestamp in seconds or None, display text)
+    """
+    parts = os.path.basename(frame_path).split('_')
+    frame_num = None
+    timestamp = None
+    try:
+        if len(parts) >= 4:
+            frame_num = int(parts[2])
+        timestamp = float(parts[-1].replace('s.jpg', ''))
+    except ValueError:
+        pass
+    if timestamp is None and frame_num is None:
+        return frame_num, timestamp, f"Frame {parts[1]}"
+    return frame_num, timestamp, format_timestamp(timestamp, frame_num)
+
 # New function to analyze video frames with Gemini
-def analyze_video_frames_gemini(video_path, analysis_type="technique", interval_seconds=2.0, max_frames=5, output_file=None):
+@JOBS_IN_FLIGHT.track_inprogress(job="video_analysis")
+def analyze_video_frames_gemini(video_path, analysis_type="technique", interval_seconds=2.0, max_frames=5, output_file=None,
+                                in_play_only=False, video_id=None, save_rally_index=True):
     """
     Analyze frames from a video using Google's Gemini model.
     
@@ -311,70 +561,49 @@ def analyze_video_frames_gemini(video_path, analysis_type="technique", interval_
         analysis_type: Type of analysis to perform ("technique", "positioning", or "tactics")
         interval_seconds: Time interval between frames in seconds
         max_frames: Maximum number of frames to analyze
-        output_file: Path to save the analysis results (CSV format)
+        output_file: Optional path to also save the results as a per-video CSV
+        in_play_only: Only analyze frames inside rallies (uses the stored rally
+            index next to the video, building it if needed)
+        video_id: ID stored with the results (defaults to the video file name)
+        save_rally_index: Store a newly built rally index next to the video
+            (False for temporary uploads)
         
     Returns:
-        Path to the output file with analysis results and list of analysis results
+        Path to the results file (see result_sink) and list of analysis results
     """
     # Check if file exists
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video file not found: {video_path}")
     
-    # Determine the output file path if not provided
-    if output_file is None:
-        base_name = os.path.splitext(os.path.basename(video_path))[0]
-        output_file = f"{base_name}_analysis.csv"
+    video_id = video_id or os.path.splitext(os.path.basename(video_path))[0]
     
     # Create a directory for temporary frames
     temp_dir = os.path.join(os.path.dirname(video_path), "temp_frames")
     os.makedirs(temp_dir, exist_ok=True)
-    print(f"Created temporary directory: {temp_dir}")
+    logger.info("Created temporary directory: %s", temp_dir)
     
-    # Select the analysis function based on type
-    if analysis_type == "technique":
-        prompt = """
-        Identify and analyze the volleyball technique being performed in this image.
-        
-        Please include:
-        1. The specific technique being performed (e.g., serve, set, spike, block, dig)
-        2. Assessment of proper form and body positioning
-        3. Strengths in the execution
-        4. Areas for improvement
-        5. Specific coaching cues for better performance
-        """
-    elif analysis_type == "positioning":
-        prompt = """
-        Analyze the volleyball court positioning in this image.
-        
-        Please include:
-        1. The formation being used (e.g., 5-1, 6-2, 4-2)
-        2. Evaluation of court coverage
-        3. Player positioning relative to the ball
-        4. Defensive or offensive readiness
-        5. Suggested positioning improvements
-        """
-    elif analysis_type == "tactics":
-        prompt = """
-        Provide a tactical analysis of this volleyball scenario.
-        
-        Please include:
-        1. The game situation (e.g., serve receive, transition, free ball)
-        2. Offensive or defensive strategies in use
-        3. Team formation effectiveness
-        4. Decision-making assessment
-        5. Potential tactical adjustments
-        """
-    else:
+    # Select the prompt based on type
+    if analysis_type not in ANALYSIS_PROMPTS:
         raise ValueError(f"Invalid analysis type: {analysis_type}")
+    prompt = ANALYSIS_PROMPTS[analysis_type]
     
     try:
         # Extract frames from the video
-        print(f"Extracting frames from video at {interval_seconds} second intervals, max {max_frames} frames")
+        frame_indices = None
+        if in_play_only:
+            rally_index = segment_rallies(video_path, save=save_rally_index)
+            frame_indices = in_play_frame_indices(rally_index, interval_seconds, max_frames)
+            logger.info("Targeting %s in-play frames from %s rallies", len(frame_indices), len(rally_index['rallies']))
+            if not frame_indices:
+                logger.info("No rallies found, analyzing the whole video")
+        
+        logger.info("Extracting frames from video at %s second intervals, max %s frames", interval_seconds, max_frames)
         frame_paths = extract_frames_from_video(
             video_path, 
             output_dir=temp_dir,
             frame_interval=interval_seconds,
-            max_frames=max_frames
+            max_frames=max_frames,
+            frame_indices=frame_indices
         )
         
         if not frame_paths:
@@ -383,73 +612,58 @@ def analyze_video_frames_gemini(video_path, analysis_type="technique", interval_
         # Analyze each frame
         results = []
         
-        # Create CSV file for results
-        with open(output_file, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Timestamp", "Analysis"])
-            
+        # Results are queued for the result sink (and the per-video CSV if requested)
+        with get_result_sink().video(video_id, analysis_type, output_file) as video_results:
             for frame_path in frame_paths:
                 try:
-                    # Extract timestamp from filename
-                    filename = os.path.basename(frame_path)
-                    # Format: frame_000001_30_1.00s.jpg
-                    parts = filename.split('_')
-                    if len(parts) >= 4:
-                        # Try to get timestamp from filename
-                        try:
-                            timestamp_str = parts[3].replace('s.jpg', '')
-                            timestamp = float(timestamp_str)
-                            minutes = int(timestamp // 60)
-                            seconds = int(timestamp % 60)
-                            timestamp_display = f"{minutes}:{seconds:02d}"
-                        except:
-                            # Fallback to frame number
-                            frame_num = int(parts[2])
-                            timestamp_display = f"Frame {frame_num}"
-                    else:
-                        timestamp_display = f"Frame {parts[1]}"
+                    frame_num, timestamp, timestamp_display = parse_frame_filename(frame_path)
                     
-                    print(f"Analyzing frame: {frame_path} (Timestamp: {timestamp_display})")
+                    frame_log.debug("Analyzing frame: %s (Timestamp: %s)", frame_path, timestamp_display)
                     
                     # Analyze the frame
                     try:
                         # Load the image with PIL
                         image = Image.open(frame_path)
                         
-                        # Generate content with the image and prompt
-                        response = model.generate_content([prompt, image])
-                        analysis = response.text
+                        # Generate content with the downscaled image and prompt
+                        analysis, request_stats = generate_image_analysis(
+                            prompt, image, analysis_type, original_bytes=os.path.getsize(frame_path)
+                        )
                         
                         # Add to results
                         result_item = {
                             "timestamp": timestamp_display,
                             "frame_path": frame_path,
-                            "analysis": analysis
+                            "analysis": analysis,
+                            "bytes_sent": request_stats["bytes_sent"],
+                            "original_bytes": request_stats["original_bytes"],
+                            "latency_ms": request_stats["latency_ms"]
                         }
                         results.append(result_item)
                         
-                        # Write to CSV
-                        writer.writerow([timestamp_display, analysis])
-                        print(f"Successfully analyzed frame at {timestamp_display}")
+                        video_results.write(
+                            frame_num, timestamp, analysis, request_stats["latency_ms"], request_stats.get("tokens")
+                        )
+                        frame_log.debug("Successfully analyzed frame at %s", timestamp_display)
                         
                     except Exception as e:
                         error_msg = f"Error analyzing frame: {str(e)}"
-                        print(error_msg)
+                        frame_errors.error("Error analyzing frame: %s", e)
                         result_item = {
                             "timestamp": timestamp_display,
                             "frame_path": frame_path,
                             "error": error_msg
                         }
                         results.append(result_item)
-                        writer.writerow([timestamp_display, f"Error: {error_msg}"])
+                        video_results.write(frame_num, timestamp, f"Error: {error_msg}")
                 
                 except Exception as e:
-                    print(f"Error processing frame {frame_path}: {str(e)}")
+                    frame_errors.error("Error processing frame %s: %s", frame_path, e)
         
-        print(f"Video analysis complete. Analyzed {len(results)} frames.")
-        print(f"Results saved to: {output_file}")
+        logger.info("Video analysis complete. Analyzed %s frames.", len(results))
+        logger.info("Results saved to: %s", video_results.path)
         
-        return output_file, results
+        return video_results.path, results
     
     finally:
         # Clean up temporary frames (optional)
@@ -465,39 +679,52 @@ def analyze_video_frames_gemini(video_path, analysis_type="technique", interval_
         #     pass
         pass
 
-def safe_analyze_image(image_path, prompt):
+def safe_analyze_image(image, prompt, analysis_type=None):
     """
     Safely analyze an image with error handling.
     
     Args:
-        image_path: Path to the image
+        image: Path to the image, encoded bytes, RGB numpy array, PIL image
+            or ImageInput
         prompt: Prompt for the analysis
+        analysis_type: Analysis type used to pick the preprocessing profile
         
     Returns:
         Analysis text or error message
     """
     try:
-        return analyze_volleyball_image(image_path, prompt)
+        return analyze_volleyball_image(image, prompt, analysis_type)
     except Exception as e:
         error_msg = f"Error analyzing image: {str(e)}"
-        print(error_msg)
+        logger.error("Error analyzing image: %s", e)
         
         if "API key not valid" in str(e):
             return "Unable to analyze the image. Your Google AI API key is invalid. Please update your .env file with a valid API key from https://makersuite.google.com/app/apikey"
         
         return f"Unable to analyze the image. {error_msg}"
 
-def analyze_volleyball_image(image_path, prompt):
+def analyze_volleyball_image(image, prompt, analysis_type=None):
     """
     Analyze a volleyball image using Google's Gemini 1.5 Flash model.
     
     Args:
-        image_path: Path to the volleyball image
+        image: The volleyball image as a path, encoded bytes, RGB numpy
+            array, PIL image or ImageInput
         prompt: Question about the volleyball technique
+        analysis_type: Analysis type used to pick the preprocessing profile
         
     Returns:
         The model's analysis of the volleyball technique
     """
+    source = ImageInput.from_any(image)
+    
+    # In-memory images go straight to the request, without temporary files
+    if source.path is None:
+        analysis, _ = generate_image_analysis(prompt, source, analysis_type)
+        return analysis
+    
+    image_path = source.path
+    
     # Check if file exists
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
@@ -507,58 +734,47 @@ def analyze_volleyball_image(image_path, prompt):
     if file_size == 0:
         raise ValueError(f"Image file is empty: {image_path}")
     
-    print(f"Loading image from: {image_path} (size: {file_size} bytes)")
+    logger.debug("Loading image from: %s (size: %s bytes)", image_path, file_size)
     
     # Try to verify the image file format using imghdr if available
     if IMGHDR_AVAILABLE:
         try:
             img_type = imghdr.what(image_path)
-            print(f"Image type detected by imghdr: {img_type}")
+            logger.debug("Image type detected by imghdr: %s", img_type)
             if img_type is None:
-                print("Warning: imghdr could not identify the image type")
+                logger.warning("imghdr could not identify the image type")
         except Exception as e:
-            print(f"Error in imghdr: {str(e)}")
+            logger.error("Error in imghdr: %s", e)
     else:
         # Alternative method to check image type using file extension
         file_ext = os.path.splitext(image_path)[1].lower()
-        print(f"Using file extension for image type detection: {file_ext}")
+        logger.debug("Using file extension for image type detection: %s", file_ext)
         if file_ext not in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-            print(f"Warning: Unrecognized image file extension: {file_ext}")
+            logger.warning("Unrecognized image file extension: %s", file_ext)
     
     try:
-        # Load the image with PIL
-        image = Image.open(image_path)
-        
-        # Verify image was loaded correctly
-        img_format = image.format
-        img_size = image.size
-        img_mode = image.mode
-        print(f"Image loaded successfully: format={img_format}, size={img_size}, mode={img_mode}")
-        
-        # Convert to RGB if needed (some formats like RGBA can cause issues)
-        if img_mode != 'RGB':
-            print(f"Converting image from {img_mode} to RGB")
-            image = image.convert('RGB')
-        
-        # Save a copy of the image in a standard format for debugging
-        debug_path = f"{os.path.splitext(image_path)[0]}_debug.jpg"
-        image.save(debug_path, format="JPEG")
-        print(f"Saved debug copy of image to: {debug_path}")
+        # Check the image headers with PIL (the pixels are decoded once, when preparing the request)
+        with Image.open(image_path) as image:
+            img_format = image.format
+            img_size = image.size
+            img_mode = image.mode
+        logger.debug("Image loaded successfully: format=%s, size=%s, mode=%s", img_format, img_size, img_mode)
         
         # Generate content with the image and prompt
-        print("Sending image to Google AI for analysis using gemini-1.5-flash model...")
+        logger.debug("Sending image to Google AI for analysis using gemini-1.5-flash model...")
         
-        # For gemini-1.5-flash, we can use the simpler API
-        response = model.generate_content([prompt, image])
+        # Send the file as-is when it already fits the analysis type,
+        # otherwise downscale/crop it first
+        analysis, _ = generate_image_analysis(prompt, source, analysis_type)
         
         # Return the text response
-        return response.text
+        return analysis
     except Exception as e:
-        print(f"Error in analyze_volleyball_image with PIL: {str(e)}")
+        logger.warning("Error in analyze_volleyball_image with PIL: %s", e)
         
         # Try alternative approach for problematic images
         try:
-            print("Attempting alternative approach with OpenCV...")
+            logger.debug("Attempting alternative approach with OpenCV...")
             # Try loading with OpenCV and converting to PIL
             cv_img = cv2.imread(image_path)
             if cv_img is None:
@@ -567,26 +783,21 @@ def analyze_volleyball_image(image_path, prompt):
             # Convert from BGR to RGB (OpenCV uses BGR)
             cv_img_rgb = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
             
-            # Save a debug copy of the OpenCV-processed image
-            cv_debug_path = f"{os.path.splitext(image_path)[0]}_cv_debug.jpg"
-            cv2.imwrite(cv_debug_path, cv_img)
-            print(f"Saved OpenCV debug copy to: {cv_debug_path}")
-            
             # Convert to PIL image
             pil_img = Image.fromarray(cv_img_rgb)
             
-            print("Successfully converted image with OpenCV, sending to Google AI...")
+            logger.debug("Successfully converted image with OpenCV, sending to Google AI...")
             
             # Try with the alternative format
             response = model.generate_content([prompt, pil_img])
             
             return response.text
         except Exception as cv_error:
-            print(f"Alternative approach also failed: {str(cv_error)}")
+            logger.warning("Alternative approach also failed: %s", cv_error)
             
             # Last resort: try to create a blank image with text
             try:
-                print("Creating a blank image with error message as last resort...")
+                logger.info("Creating a blank image with error message as last resort...")
                 # Create a blank image
                 blank_img = Image.new('RGB', (800, 600), color='white')
                 
@@ -605,7 +816,7 @@ def analyze_volleyball_image(image_path, prompt):
                 # Save the blank image for debugging
                 blank_path = f"{os.path.splitext(image_path)[0]}_blank.jpg"
                 blank_img.save(blank_path)
-                print(f"Saved blank image to: {blank_path}")
+                logger.info("Saved blank image to: %s", blank_path)
                 
                 # Try to analyze with the blank image
                 response = model.generate_content([
@@ -615,76 +826,51 @@ def analyze_volleyball_image(image_path, prompt):
                 
                 return "ERROR PROCESSING IMAGE: " + response.text
             except Exception as blank_error:
-                print(f"Even blank image approach failed: {str(blank_error)}")
+                logger.error("Even blank image approach failed: %s", blank_error)
                 raise Exception(f"Failed to process image with all methods: {str(e)} | {str(cv_error)} | {str(blank_error)}")
 
-def analyze_technique(image_path):
+def analyze_technique(image):
     """
     Analyze volleyball technique in an image.
     
     Args:
-        image_path: Path to the volleyball image
+        image: The volleyball image as a path, encoded bytes, RGB numpy
+            array, PIL image or ImageInput
         
     Returns:
         Analysis of the volleyball technique
     """
-    prompt = """
-    Identify and analyze the volleyball technique being performed in this image.
-    
-    Please include:
-    1. The specific technique being performed (e.g., serve, set, spike, block, dig)
-    2. Assessment of proper form and body positioning
-    3. Strengths in the execution
-    4. Areas for improvement
-    5. Specific coaching cues for better performance
-    """
-    return safe_analyze_image(image_path, prompt)
+    return safe_analyze_image(image, ANALYSIS_PROMPTS["technique"], "technique")
 
-def analyze_positioning(image_path):
+def analyze_positioning(image):
     """
     Analyze volleyball court positioning in an image.
     
     Args:
-        image_path: Path to the volleyball image
+        image: The volleyball image as a path, encoded bytes, RGB numpy
+            array, PIL image or ImageInput
         
     Returns:
         Analysis of the volleyball court positioning
     """
-    prompt = """
-    Analyze the volleyball court positioning in this image.
-    
-    Please include:
-    1. The formation being used (e.g., 5-1, 6-2, 4-2)
-    2. Evaluation of court coverage
-    3. Player positioning relative to the ball
-    4. Defensive or offensive readiness
-    5. Suggested positioning improvements
-    """
-    return safe_analyze_image(image_path, prompt)
+    return safe_analyze_image(image, ANALYSIS_PROMPTS["positioning"], "positioning")
 
-def analyze_tactics(image_path):
+def analyze_tactics(image):
     """
     Provide tactical analysis of a volleyball scenario.
     
     Args:
-        image_path: Path to the volleyball image
+        image: The volleyball image as a path, encoded bytes, RGB numpy
+            array, PIL image or ImageInput
         
     Returns:
         Tactical analysis of the volleyball scenario
     """
-    prompt = """
-    Provide a tactical analysis of this volleyball scenario.
-    
-    Please include:
-    1. The game situation (e.g., serve receive, transition, free ball)
-    2. Offensive or defensive strategies in use
-    3. Team formation effectiveness
-    4. Decision-making assessment
-    5. Potential tactical adjustments
-    """
-    return safe_analyze_image(image_path, prompt)
+    return safe_analyze_image(image, ANALYSIS_PROMPTS["tactics"], "tactics")
 
-def process_video_frames(video_path, analysis_type="technique", interval_seconds=2, output_file=None):
+@JOBS_IN_FLIGHT.track_inprogress(job="video_frames")
+def process_video_frames(video_path, analysis_type="technique", interval_seconds=2, output_file=None, decoder=None,
+                         video_id=None):
     """
     Process video frames at regular intervals and analyze them.
     
@@ -692,10 +878,12 @@ def process_video_frames(video_path, analysis_type="technique", interval_seconds
         video_path: Path to the volleyball video
         analysis_type: Type of analysis to perform ("technique", "positioning", or "tactics")
         interval_seconds: Interval between frames to analyze (in seconds)
-        output_file: Path to save the analysis results (CSV format)
+        output_file: Optional path to also save the results as a per-video CSV
+        decoder: "auto", "opencv" or "ffmpeg" (defaults to VIDEO_DECODER)
+        video_id: ID stored with the results (defaults to the video file name)
         
     Returns:
-        Path to the output file with analysis results
+        Path to the results file (see result_sink)
     """
     # Check if file exists
     if not os.path.exists(video_path):
@@ -708,90 +896,81 @@ def process_video_frames(video_path, analysis_type="technique", interval_seconds
     
     # Get file extension
     file_extension = os.path.splitext(video_path)[1].lower()
-    print(f"Processing video from: {video_path} (size: {file_size} bytes, extension: {file_extension})")
+    logger.info("Processing video from: %s (size: %s bytes, extension: %s)", video_path, file_size, file_extension)
     
-    # Determine the output file path if not provided
-    if output_file is None:
-        base_name = os.path.splitext(os.path.basename(video_path))[0]
-        output_file = f"{base_name}_analysis.csv"
+    video_id = video_id or os.path.splitext(os.path.basename(video_path))[0]
     
     # Create a directory for temporary frames
     temp_dir = os.path.join(os.path.dirname(video_path), "temp_frames")
     os.makedirs(temp_dir, exist_ok=True)
-    print(f"Created temporary directory: {temp_dir}")
+    logger.info("Created temporary directory: %s", temp_dir)
     
-    # Open the video
-    video = cv2.VideoCapture(video_path)
-    if not video.isOpened():
-        # Try with different backend if default fails (especially for MOV files)
-        print("First attempt to open video failed, trying with different backend...")
-        
-        # Try with different backend options
-        for backend in [cv2.CAP_FFMPEG, cv2.CAP_GSTREAMER, cv2.CAP_MSMF]:
-            try:
-                video = cv2.VideoCapture(video_path, backend)
-                if video.isOpened():
-                    print(f"Successfully opened video with backend {backend}")
-                    break
-            except:
-                continue
-        
-        if not video.isOpened():
-            raise ValueError(f"Could not open video file: {video_path}. Make sure it's a valid video format (MP4, MOV, AVI).")
+    # Select the analysis function
+    if analysis_type == "technique":
+        analysis_func = analyze_technique
+    elif analysis_type == "positioning":
+        analysis_func = analyze_positioning
+    elif analysis_type == "tactics":
+        analysis_func = analyze_tactics
+    else:
+        raise ValueError(f"Invalid analysis type: {analysis_type}")
+    
+    # Decode with a single ffmpeg pipe when OpenCV is not suitable
+    use_ffmpeg = should_use_ffmpeg(video_path, decoder)
+    if not use_ffmpeg:
+        # Open the video
+        video = open_video_capture(video_path)
+        if video is None:
+            if not ffmpeg_available():
+                raise ValueError(f"Could not open video file: {video_path}. Make sure it's a valid video format (MP4, MOV, AVI).")
+            logger.info("OpenCV could not open the video, falling back to the ffmpeg decoder")
+            use_ffmpeg = True
+    
+    if use_ffmpeg:
+        return process_video_frames_with_ffmpeg(
+            video_path, analysis_func, interval_seconds, output_file, temp_dir, video_id, analysis_type
+        )
     
     fps = video.get(cv2.CAP_PROP_FPS)
     frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
     width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
     
-    print(f"Video properties: {width}x{height}, {fps} fps, {frame_count} frames, duration: {frame_count/fps:.2f} seconds")
+    logger.info("Video properties: %sx%s, %s fps, %s frames, duration: %.2f seconds", width, height, fps, frame_count, frame_count/fps)
     
     if fps <= 0:
-        print("Warning: Invalid fps detected, using default value of 30")
+        logger.warning("Invalid fps detected, using default value of 30")
         fps = 30
     
     if frame_count <= 0:
-        print("Warning: Invalid frame count detected, estimating based on duration")
+        logger.warning("Invalid frame count detected, estimating based on duration")
         # Try to estimate frame count based on duration if available
         duration = video.get(cv2.CAP_PROP_POS_MSEC) / 1000
         if duration > 0:
             frame_count = int(duration * fps)
         else:
             # Default to 10 seconds if we can't determine
-            print("Warning: Could not determine video duration, assuming 10 seconds")
+            logger.warning("Could not determine video duration, assuming 10 seconds")
             frame_count = int(10 * fps)
     
     if width <= 0 or height <= 0:
         raise ValueError(f"Invalid video dimensions: {width}x{height}")
     
-    # Select the analysis function
-    if analysis_type == "technique":
-        analysis_func = analyze_technique
-    elif analysis_type == "positioning":
-        analysis_func = analyze_positioning
-    elif analysis_type == "tactics":
-        analysis_func = analyze_tactics
-    else:
-        raise ValueError(f"Invalid analysis type: {analysis_type}")
-    
-    # Create CSV file for results
-    with open(output_file, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["Timestamp", "Analysis"])
-        
+    # Results are queued for the result sink (and the per-video CSV if requested)
+    with get_result_sink().video(video_id, analysis_type, output_file) as video_results:
         # Process frames at intervals
         interval_frames = int(fps * interval_seconds)
         if interval_frames <= 0:
             interval_frames = 1
         
-        print(f"Analyzing frames at intervals of {interval_frames} frames ({interval_seconds} seconds)")
+        logger.info("Analyzing frames at intervals of %s frames (%s seconds)", interval_frames, interval_seconds)
         
         frames_processed = 0
         frames_analyzed = 0
         
         # For MOV files or when frame count is unreliable, use a different approach
         if file_extension == '.mov' or frame_count > 10000:  # Unreasonably large frame count
-            print("Using time-based frame extraction for MOV file or large frame count")
+            logger.info("Using time-based frame extraction for MOV file or large frame count")
             current_time = 0
             max_duration = 600  # Maximum 10 minutes to prevent infinite loops
             
@@ -799,10 +978,11 @@ def process_video_frames(video_path, analysis_type="technique", interval_seconds
                 # Set position by time (milliseconds)
                 video.set(cv2.CAP_PROP_POS_MSEC, current_time * 1000)
                 success, frame = video.read()
+                opencv_frames_decoded.inc(int(success))
                 frames_processed += 1
                 
                 if not success:
-                    print(f"End of video reached at {current_time} seconds")
+                    logger.info("End of video reached at %s seconds", current_time)
                     break
                 
                 # Process this frame
@@ -811,7 +991,7 @@ def process_video_frames(video_path, analysis_type="technique", interval_seconds
                 # Save frame with proper error handling
                 success, saved_path = save_frame_properly(frame, temp_frame_path)
                 if not success:
-                    print(f"Warning: Failed to save frame at time {current_time}")
+                    frame_errors.warning("Failed to save frame at time %s", current_time)
                     current_time += interval_seconds
                     continue
                 
@@ -821,36 +1001,39 @@ def process_video_frames(video_path, analysis_type="technique", interval_seconds
                 timestamp_str = f"{minutes}:{seconds:02d}"
                 
                 # Analyze frame
+                frame_num = int(round(current_time * fps))
                 try:
-                    print(f"Analyzing frame at {timestamp_str} (time {current_time}s)")
+                    frame_log.debug("Analyzing frame at %s (time %ss)", timestamp_str, current_time)
+                    start_time = time.perf_counter()
                     analysis = analysis_func(saved_path)
+                    latency_ms = round((time.perf_counter() - start_time) * 1000, 1)
                     frames_analyzed += 1
                     
-                    # Write to CSV
-                    writer.writerow([timestamp_str, analysis])
-                    print(f"Successfully analyzed frame at {timestamp_str}")
+                    video_results.write(frame_num, current_time, analysis, latency_ms)
+                    frame_log.debug("Successfully analyzed frame at %s", timestamp_str)
                 except Exception as e:
-                    print(f"Error analyzing frame at {timestamp_str}: {str(e)}")
-                    writer.writerow([timestamp_str, f"Error: {str(e)}"])
+                    frame_errors.error("Error analyzing frame at %s: %s", timestamp_str, e)
+                    video_results.write(frame_num, current_time, f"Error: {str(e)}")
                 
                 # Clean up
                 try:
                     os.unlink(saved_path)
                 except Exception as e:
-                    print(f"Warning: Could not delete temporary file {saved_path}: {str(e)}")
+                    frame_errors.warning("Could not delete temporary file %s: %s", saved_path, e)
                 
                 # Move to next interval
                 current_time += interval_seconds
                 
                 # Safety check to prevent infinite loops
                 if frames_processed > 1000:
-                    print("Maximum frame limit reached, stopping analysis")
+                    logger.info("Maximum frame limit reached, stopping analysis")
                     break
         else:
             # Standard frame-based approach for normal videos
             for frame_num in range(0, frame_count, interval_frames):
                 video.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
                 success, frame = video.read()
+                opencv_frames_decoded.inc(int(success))
                 frames_processed += 1
                 
                 if success:
@@ -860,7 +1043,7 @@ def process_video_frames(video_path, analysis_type="technique", interval_seconds
                     # Save frame with proper error handling
                     success, saved_path = save_frame_properly(frame, temp_frame_path)
                     if not success:
-                        print(f"Warning: Failed to save frame at position {frame_num}")
+                        frame_errors.warning("Failed to save frame at position %s", frame_num)
                         continue
                     
                     # Get timestamp
@@ -869,37 +1052,113 @@ def process_video_frames(video_path, analysis_type="technique", interval_seconds
                     
                     # Analyze frame
                     try:
-                        print(f"Analyzing frame at {timestamp_str} (frame {frame_num})")
+                        frame_log.debug("Analyzing frame at %s (frame %s)", timestamp_str, frame_num)
+                        start_time = time.perf_counter()
                         analysis = analysis_func(saved_path)
+                        latency_ms = round((time.perf_counter() - start_time) * 1000, 1)
                         frames_analyzed += 1
                         
-                        # Write to CSV
-                        writer.writerow([timestamp_str, analysis])
-                        print(f"Successfully analyzed frame at {timestamp_str}")
+                        video_results.write(frame_num, timestamp, analysis, latency_ms)
+                        frame_log.debug("Successfully analyzed frame at %s", timestamp_str)
                     except Exception as e:
-                        print(f"Error analyzing frame at {timestamp_str}: {str(e)}")
-                        writer.writerow([timestamp_str, f"Error: {str(e)}"])
+                        frame_errors.error("Error analyzing frame at %s: %s", timestamp_str, e)
+                        video_results.write(frame_num, timestamp, f"Error: {str(e)}")
                     
                     # Clean up
                     try:
                         os.unlink(saved_path)
                     except Exception as e:
-                        print(f"Warning: Could not delete temporary file {saved_path}: {str(e)}")
+                        frame_errors.warning("Could not delete temporary file %s: %s", saved_path, e)
                 else:
-                    print(f"Warning: Could not read frame at position {frame_num}")
+                    frame_errors.warning("Could not read frame at position %s", frame_num)
     
     # Clean up temp directory
     try:
         os.rmdir(temp_dir)
-        print(f"Removed temporary directory: {temp_dir}")
+        logger.info("Removed temporary directory: %s", temp_dir)
     except Exception as e:
-        print(f"Warning: Could not remove temporary directory {temp_dir}: {str(e)}")
+        logger.warning("Could not remove temporary directory %s: %s", temp_dir, e)
     
     video.release()
-    print(f"Video processing complete. Processed {frames_processed} frames, successfully analyzed {frames_analyzed} frames.")
-    print(f"Results saved to: {output_file}")
+    logger.info("Video processing complete. Processed %s frames, successfully analyzed %s frames.", frames_processed, frames_analyzed)
+    logger.info("Results saved to: %s", video_results.path)
+    
+    return video_results.path
+
+def process_video_frames_with_ffmpeg(video_path, analysis_func, interval_seconds, output_file, temp_dir,
+                                     video_id=None, analysis_type=None):
+    """
+    Analyze frames at regular intervals using the ffmpeg pipe decoder.
+    
+    Args:
+        video_path: Path to the volleyball video
+        analysis_func: Analysis function to call with each saved frame path
+        interval_seconds: Interval between frames to analyze (in seconds)
+        output_file: Optional path to also save the results as a per-video CSV
+        temp_dir: Directory for temporary frame files
+        video_id: ID stored with the results (defaults to the video file name)
+        analysis_type: Analysis type stored with the results
+        
+    Returns:
+        Path to the results file (see result_sink)
+    """
+    frames_analyzed = 0
+    video_id = video_id or os.path.splitext(os.path.basename(video_path))[0]
+    
+    # Select every Nth frame when the frame rate is known, so the reader
+    # knows each frame's number; otherwise select by time without numbers
+    try:
+        fps = probe_video(video_path)["fps"]
+    except Exception:
+        fps = None
+    if fps:
+        reader = FFmpegFrameReader(video_path, every_n_frames=max(int(round(fps * interval_seconds)), 1))
+    else:
+        reader = FFmpegFrameReader(video_path, interval_seconds=interval_seconds)
+    
+    with get_result_sink().video(video_id, analysis_type, output_file) as video_results:
+        logger.info("Analyzing frames at intervals of %s seconds with ffmpeg", interval_seconds)
+        
+        for timestamp, frame in reader:
+            timestamp = timestamp or 0.0
+            timestamp_str = f"{int(timestamp // 60)}:{int(timestamp % 60):02d}"
+            
+            # Save frame with proper error handling
+            temp_frame_path = os.path.join(temp_dir, f"frame_{timestamp:.2f}.jpg")
+            success, saved_path = save_frame_properly(frame, temp_frame_path)
+            if not success:
+                frame_errors.warning("Failed to save frame at time %.2f", timestamp)
+                continue
+            
+            # Analyze frame
+            frame_num = reader.frame_number
+            try:
+                start_time = time.perf_counter()
+                analysis = analysis_func(saved_path)
+                latency_ms = round((time.perf_counter() - start_time) * 1000, 1)
+                frames_analyzed += 1
+                video_results.write(frame_num, timestamp, analysis, latency_ms)
+                frame_log.debug("Successfully analyzed frame at %s", timestamp_str)
+            except Exception as e:
+                frame_errors.error("Error analyzing frame at %s: %s", timestamp_str, e)
+                video_results.write(frame_num, timestamp, f"Error: {str(e)}")
+            
+            # Clean up
+            try:
+                os.unlink(saved_path)
+            except Exception as e:
+                frame_errors.warning("Could not delete temporary file %s: %s", saved_path, e)
+    
+    # Clean up temp directory
+    try:
+        os.rmdir(temp_dir)
+    except Exception as e:
+        logger.warning("Could not remove temporary directory %s: %s", temp_dir, e)
+    
+    logger.info("Video processing complete. Decoded %s frames, successfully analyzed %s frames.", reader.frames_read, frames_analyzed)
+    logger.info("Results saved to: %s", video_results.path)
     
-    return output_file
+    return video_results.path
 
 def setup_real_time_analysis(camera_index=0):
     """
@@ -981,7 +1240,7 @@ def convert_video_to_mp4(input_path, output_path=None):
         base_name = os.path.splitext(input_path)[0]
         output_path = f"{base_name}_converted.mp4"
     
-    print(f"Converting video from {input_path} to {output_path}")
+    logger.info("Converting video from %s to %s", input_path, output_path)
     
     try:
         # First try using FFmpeg if available
@@ -1000,26 +1259,26 @@ def convert_video_to_mp4(input_path, output_path=None):
                 output_path
             ]
             
-            print(f"Running FFmpeg command: {' '.join(cmd)}")
+            logger.debug("Running FFmpeg command: %s", ' '.join(cmd))
             subprocess.run(cmd, check=True)
             
             if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                print(f"Successfully converted video to {output_path}")
+                logger.info("Successfully converted video to %s", output_path)
                 return output_path
             else:
-                print("FFmpeg conversion failed or produced empty file")
+                logger.error("FFmpeg conversion failed or produced empty file")
                 raise Exception("FFmpeg conversion failed")
                 
         except (subprocess.SubprocessError, FileNotFoundError) as e:
-            print(f"FFmpeg not available or failed: {str(e)}")
+            logger.warning("FFmpeg not available or failed: %s", e)
             raise
             
     except Exception as e:
-        print(f"Error converting video with FFmpeg: {str(e)}")
+        logger.error("Error converting video with FFmpeg: %s", e)
         
         # Fallback to OpenCV if FFmpeg fails
         try:
-            print("Attempting conversion with OpenCV...")
+            logger.info("Attempting conversion with OpenCV...")
             
             # Open the input video
             input_video = cv2.VideoCapture(input_path)
@@ -1049,20 +1308,20 @@ def convert_video_to_mp4(input_path, output_path=None):
                 frame_count += 1
                 
                 if frame_count % 100 == 0:
-                    print(f"Processed {frame_count} frames")
+                    logger.debug("Processed %s frames", frame_count)
             
             # Release resources
             input_video.release()
             output_video.release()
             
             if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                print(f"Successfully converted video with OpenCV to {output_path} ({frame_count} frames)")
+                logger.info("Successfully converted video with OpenCV to %s (%s frames)", output_path, frame_count)
                 return output_path
             else:
                 raise ValueError("OpenCV conversion failed or produced empty file")
                 
         except Exception as cv_error:
-            print(f"Error converting video with OpenCV: {str(cv_error)}")
+            logger.error("Error converting video with OpenCV: %s", cv_error)
             raise Exception(f"Failed to convert video with both FFmpeg and OpenCV: {str(e)} | {str(cv_error)}")
     
     return output_path
@@ -0,0 +1,212 @@
+"""
+Unified Image Input for Analysis Requests
+
+Analysis functions receive images in many forms: file paths from the upload
+endpoints, encoded bytes from base64 payloads, NumPy frames from video
+decoding and PIL images from preprocessing. ImageInput wraps any of them and
+turns it into the request payload as cheaply as possible: an encoded JPEG
+that already fits the analysis profile is sent as-is, without decoding or
+re-encoding, and anything else is decoded at most once and preprocessed.
+"""
+
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from .image_preprocessing import (
+    PREPROCESSING_ENABLED, PreparedImage, get_profile, preprocess_image, target_size
+)
+from .metrics import count_cache
+from .tracing import span
+
+# Encoded formats that can be sent without re-encoding
+PASSTHROUGH_FORMATS = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+class ImageInput:
+    """
+    An image given as a NumPy array, PIL image, encoded bytes or file path.
+
+    Arrays are assumed to be RGB (as produced by iter_sampled_frames); pass
+    color_order="BGR" for frames straight from OpenCV.
+    """
+
+    def __init__(self, source, color_order="RGB"):
+        """
+        Wrap an image source.
+
+        Args:
+            source: numpy array, PIL image, bytes/bytearray/memoryview or path
+            color_order: Channel order of numpy arrays ("RGB" or "BGR")
+        """
+        if isinstance(source, np.ndarray):
+            self.kind = "array"
+        elif isinstance(source, Image.Image):
+            self.kind = "pil"
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self.kind = "bytes"
+            source = bytes(source)
+        elif isinstance(source, (str, os.PathLike)):
+            self.kind = "path"
+            source = os.fspath(source)
+        else:
+            raise ValueError(f"Unsupported image input: {type(source).__name__}")
+
+        self.source = source
+        self.color_order = color_order
+        self._data = None
+        self._header = None
+        self._image = None
+
+    @classmethod
+    def from_any(cls, source):
+        """Return source if it already is an ImageInput, otherwise wrap it."""
+        return source if isinstance(source, cls) else cls(source)
+
+    @property
+    def path(self):
+        """File path of the image, or None for in-memory inputs."""
+        return self.source if self.kind == "path" else None
+
+    @property
+    def data(self):
+        """Encoded bytes for path and bytes inputs (None for decoded inputs)."""
+        if self._data is None:
+            if self.kind == "bytes":
+                self._data = self.source
+            elif self.kind == "path":
+                if not os.path.exists(self.source):
+                    raise FileNotFoundError(f"Image file not found: {self.source}")
+                with open(self.source, 'rb') as f:
+                    self._data = f.read()
+        return self._data
+
+    @property
+    def original_bytes(self):
+        """Size of the encoded input in bytes, if it is encoded."""
+        return len(self.data) if self.data is not None else None
+
+    def _read_header(self):
+        """Identify an encoded image without decoding the pixel data."""
+        if self._header is None:
+            with Image.open(io.BytesIO(self.data)) as image:
+                self._header = (image.format, image.size, image.mode)
+        return self._header
+
+    @property
+    def format(self):
+        """Encoded format ("JPEG", "PNG", ...) or None for decoded inputs."""
+        return self._read_header()[0] if self.data is not None else None
+
+    @property
+    def size(self):
+        """(width, height) of the image."""
+        if self.kind == "array":
+            return self.source.shape[1], self.source.shape[0]
+        if self.kind == "pil":
+            return self.source.size
+        return self._read_header()[1]
+
+    def to_pil(self):
+        """Decode the image into a PIL image (done at most once)."""
+        count_cache("decoded_images", self._image is not None)
+        if self._image is None:
+            if self.kind == "pil":
+                self._image = self.source
+            elif self.kind == "array":
+                frame = self.source
+                if frame.ndim == 3 and self.color_order == "BGR":
+                    frame = frame[:, :, ::-1]
+                self._image = Image.fromarray(np.ascontiguousarray(frame))
+            else:
+                image = Image.open(io.BytesIO(self.data))
+                image.load()
+                self._image = image
+        return self._image
+
+    def to_array(self):
+        """Return the image as an RGB numpy array."""
+        if self.kind == "array" and self.color_order == "RGB":
+            return self.source
+        return np.asarray(self.to_pil().convert('RGB'))
+
+    def can_pass_through(self, profile, boxes=None):
+        """
+        Check whether the encoded input can be sent unchanged.
+
+        Args:
+            profile: Preprocessing profile for the analysis type
+            boxes: Player detections (a crop is needed if there are any and
+                the profile crops to players)
+
+        Returns:
+            True if the input is already a suitable encoded image
+        """
+        if self.data is None:
+            return False
+
+        image_format, size, mode = self._read_header()
+        if not PREPROCESSING_ENABLED:
+            return image_format in PASSTHROUGH_FORMATS
+
+        if image_format != profile["format"].upper() or mode not in ('RGB', 'L'):
+            return False
+        if profile["crop_to_players"] and boxes:
+            return False
+        if target_size(size, profile["max_long_edge"], profile["token_budget"]) != size:
+            return False
+        return profile["max_bytes"] is None or len(self.data) <= profile["max_bytes"]
+
+    def prepare(self, analysis_type=None, find_players=None):
+        """
+        Produce the request payload for an analysis type.
+
+        Args:
+            analysis_type: Analysis type whose preprocessing profile applies
+            find_players: Function returning player detections for a PIL
+                image, used when the profile crops to the players
+
+        Returns:
+            PreparedImage
+        """
+        start_time = time.perf_counter()
+        profile = get_profile(analysis_type)
+
+        boxes = None
+        if PREPROCESSING_ENABLED and profile["crop_to_players"] and find_players is not None:
+            boxes = find_players(self.to_pil())
+
+        if self.can_pass_through(profile, boxes):
+            image_format, size, _ = self._read_header()
+            return PreparedImage(
+                data=self.data,
+                mime_type=PASSTHROUGH_FORMATS[image_format],
+                size=size,
+                quality=None,
+                original_size=size,
+                original_bytes=len(self.data),
+                preprocess_seconds=time.perf_counter() - start_time,
+            )
+
+        with span("encode", analysis_type=analysis_type or "default") as encode_span:
+            image = self.to_pil()
+            if not PREPROCESSING_ENABLED:
+                # Only encode, keeping the full image
+                prepared = preprocess_image(
+                    image, analysis_type, original_bytes=self.original_bytes,
+                    max_long_edge=None, token_budget=None, max_bytes=None, crop_to_players=False
+                )
+            else:
+                prepared = preprocess_image(image, analysis_type, boxes=boxes, original_bytes=self.original_bytes)
+            encode_span.set_attribute("bytes", len(prepared.data))
+
+        prepared.preprocess_seconds = time.perf_counter() - start_time
+        return prepared
+
@@ -0,0 +1,65 @@
+"""
+Reduced-Resolution Image Decoding
+
+Most consumers of an uploaded frame only need it small: the feature vector
+is computed at 128x128, the technique classifier runs at 224x224. Decoding
+a 4K JPEG at full size and resizing it right away spends most of the time
+and memory on pixels that are thrown away. libjpeg can decode straight to
+1/2, 1/4 or 1/8 scale by skipping part of the inverse DCT; these helpers
+pick the largest reduction that still leaves the image at least as large as
+the size it is resized to afterwards:
+
+    decode_reduced  encoded bytes -> BGR frame (cv2.IMREAD_REDUCED_*)
+    read_reduced    image file -> BGR frame
+    open_reduced    path or encoded bytes -> PIL image (Image.draft)
+
+Other formats are decoded at full size. reduction_for, image_header and
+decode_reduced are defined in volleyball_cpu_tasks, which the CPU pool
+workers import without the volleyball_ai package.
+"""
+
+import io
+
+from PIL import Image
+
+# The decoding primitives are shared with the CPU pool workers
+from volleyball_cpu_tasks import (
+    REDUCED_COLOR_FLAGS, REDUCED_GRAYSCALE_FLAGS, REDUCTIONS, decode_reduced, image_header, reduction_for
+)
+
+
+def read_reduced(image_path, min_size=None, grayscale=False):
+    """
+    Read an image file at the smallest scale that is at least min_size.
+
+    Args:
+        image_path: Path to the image file
+        min_size: (width, height) the frame will be resized to
+        grayscale: Decode to a single channel
+
+    Returns:
+        BGR (or grayscale) numpy array, or None if the file is not an image
+    """
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    return decode_reduced(data, min_size, grayscale)
+
+
+def open_reduced(source, min_size=None, mode='RGB'):
+    """
+    Load an image with PIL at the smallest scale that is at least min_size.
+
+    Args:
+        source: Image file path or encoded bytes
+        min_size: (width, height) the image will be resized to
+        mode: Mode to decode JPEGs to (the image is not converted otherwise)
+
+    Returns:
+        Loaded PIL image
+    """
+    image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    if min_size and image.format == 'JPEG':
+        # draft picks the largest scale that keeps the image at least min_size
+        image.draft(mode, tuple(min_size))
+    image.load()
+    return image
@@ -0,0 +1,279 @@
+"""
+Image Preprocessing for Gemini Requests
+
+Full-resolution phone frames (often 4K) cost upload bytes, encode time and
+image tokens without improving the analysis. This module downscales images
+to a target long edge, optionally crops to the players in the frame, and
+picks the encoder quality that fits a byte budget. Settings are kept per
+analysis type: technique analysis works on a tight crop around the players,
+while positioning and tactics need the full court.
+"""
+
+import io
+import math
+import os
+import time
+
+from PIL import Image
+
+# Gemini bills images by 768x768 tiles of roughly 258 tokens each
+TOKENS_PER_TILE = 258
+TILE_SIZE = 768
+
+# Quality settings tried (highest first) when fitting an image into the byte budget
+QUALITY_STEPS = [90, 80, 70, 60, 50, 40]
+
+# Set IMAGE_PREPROCESSING=0 to send images unchanged (e.g. to compare before/after)
+PREPROCESSING_ENABLED = os.environ.get('IMAGE_PREPROCESSING', '1') != '0'
+
+ANALYSIS_PROFILES = {
+    "technique": {
+        "max_long_edge": 768,
+        "token_budget": TOKENS_PER_TILE,
+        "max_bytes": 120 * 1024,
+        "format": "JPEG",
+        "crop_to_players": True,
+        "crop_margin": 0.25,
+    },
+    "positioning": {
+        "max_long_edge": 1280,
+        "token_budget": 4 * TOKENS_PER_TILE,
+        "max_bytes": 250 * 1024,
+        "format": "JPEG",
+        "crop_to_players": False,
+        "crop_margin": 0.0,
+    },
+    "tactics": {
+        "max_long_edge": 1280,
+        "token_budget": 4 * TOKENS_PER_TILE,
+        "max_bytes": 250 * 1024,
+        "format": "JPEG",
+        "crop_to_players": False,
+        "crop_margin": 0.0,
+    },
+}
+
+DEFAULT_PROFILE = {
+    "max_long_edge": 1024,
+    "token_budget": None,
+    "max_bytes": 200 * 1024,
+    "format": "JPEG",
+    "crop_to_players": False,
+    "crop_margin": 0.0,
+}
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+class PreparedImage:
+    """An encoded image ready to send, with the stats of how it was produced."""
+
+    def __init__(self, data, mime_type, size, quality, original_size,
+                 original_bytes=None, crop_box=None, preprocess_seconds=0.0):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.quality = quality
+        self.original_size = original_size
+        self.original_bytes = original_bytes
+        self.crop_box = crop_box
+        self.preprocess_seconds = preprocess_seconds
+
+    def to_gemini_part(self):
+        """Return the inline-data part accepted by generate_content."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def stats(self):
+        """Return a dictionary describing the preprocessing result."""
+        return {
+            "original_size": list(self.original_size),
+            "original_bytes": self.original_bytes,
+            "sent_size": list(self.size),
+            "bytes_sent": len(self.data),
+            "quality": self.quality,
+            "mime_type": self.mime_type,
+            "crop_box": list(self.crop_box) if self.crop_box else None,
+            "estimated_tokens": estimate_image_tokens(self.size),
+            "preprocess_ms": round(self.preprocess_seconds * 1000, 1),
+        }
+
+
+def get_profile(analysis_type=None):
+    """
+    Get the preprocessing settings for an analysis type.
+
+    Args:
+        analysis_type: "technique", "positioning", "tactics" or None
+
+    Returns:
+        Dictionary of preprocessing settings
+    """
+    return dict(ANALYSIS_PROFILES.get(analysis_type, DEFAULT_PROFILE))
+
+
+def configure_profile(analysis_type, **settings):
+    """
+    Override preprocessing settings for an analysis type.
+
+    Args:
+        analysis_type: Analysis type to configure
+        **settings: Any of max_long_edge, token_budget, max_bytes, format,
+            crop_to_players and crop_margin
+    """
+    unknown = set(settings) - set(DEFAULT_PROFILE)
+    if unknown:
+        raise ValueError(f"Unknown preprocessing settings: {', '.join(sorted(unknown))}")
+
+    profile = ANALYSIS_PROFILES.setdefault(analysis_type, dict(DEFAULT_PROFILE))
+    profile.update(settings)
+
+
+def estimate_image_tokens(size):
+    """
+    Estimate the number of Gemini image tokens for an image size.
+
+    Args:
+        size: (width, height) tuple
+
+    Returns:
+        Estimated token count
+    """
+    width, height = size
+    return TOKENS_PER_TILE * math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+def target_size(size, max_long_edge=None, token_budget=None):
+    """
+    Compute the output size for a long-edge limit and a token budget.
+
+    Args:
+        size: (width, height) of the input image
+        max_long_edge: Maximum length of the longer side in pixels
+        token_budget: Maximum estimated image tokens
+
+    Returns:
+        (width, height) no larger than the input
+    """
+    width, height = size
+    scale = 1.0
+
+    if max_long_edge and max(width, height) > max_long_edge:
+        scale = max_long_edge / max(width, height)
+
+    if token_budget:
+        max_tiles = max(token_budget // TOKENS_PER_TILE, 1)
+        while scale > 0.05:
+            tiles = math.ceil(width * scale / TILE_SIZE) * math.ceil(height * scale / TILE_SIZE)
+            if tiles <= max_tiles:
+                break
+            # Shrink just enough to drop a row or column of tiles
+            scale *= 0.9
+
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def player_crop_box(image_size, boxes, margin=0.25):
+    """
+    Compute a crop box covering all player detections plus a margin.
+
+    Args:
+        image_size: (width, height) of the image
+        boxes: Player detections as dicts with a "bbox" of [x, y, w, h]
+            (or plain [x, y, w, h] lists)
+        margin: Extra space around the players, as a fraction of the box size
+
+    Returns:
+        (left, top, right, bottom) crop box, or None if there are no boxes
+    """
+    rects = [box["bbox"] if isinstance(box, dict) else box for box in boxes or []]
+    if not rects:
+        return None
+
+    left = min(x for x, _, _, _ in rects)
+    top = min(y for _, y, _, _ in rects)
+    right = max(x + w for x, _, w, _ in rects)
+    bottom = max(y + h for _, y, _, h in rects)
+
+    pad_x = (right - left) * margin
+    pad_y = (bottom - top) * margin
+    width, height = image_size
+
+    return (
+        max(int(left - pad_x), 0),
+        max(int(top - pad_y), 0),
+        min(int(right + pad_x), width),
+        min(int(bottom + pad_y), height),
+    )
+
+
+def encode_within_budget(image, max_bytes=None, image_format="JPEG"):
+    """
+    Encode an image at the highest quality step that fits the byte budget.
+
+    Args:
+        image: PIL image in RGB mode
+        max_bytes: Maximum encoded size in bytes (None for the top quality)
+        image_format: "JPEG" or "WEBP"
+
+    Returns:
+        Tuple of (encoded bytes, quality used)
+    """
+    data = b""
+    quality = QUALITY_STEPS[0]
+    for quality in QUALITY_STEPS:
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, quality=quality)
+        data = buffer.getvalue()
+        if max_bytes is None or len(data) <= max_bytes:
+            break
+    return data, quality
+
+
+def preprocess_image(image, analysis_type=None, boxes=None, original_bytes=None, **overrides):
+    """
+    Downscale, crop and encode an image for a Gemini request.
+
+    Args:
+        image: PIL image
+        analysis_type: Analysis type whose profile should be used
+        boxes: Optional player detections used for region-of-interest cropping
+        original_bytes: Size of the original upload, for reporting
+        **overrides: Profile settings to override for this call
+
+    Returns:
+        PreparedImage with the encoded data and preprocessing stats
+    """
+    start_time = time.perf_counter()
+    profile = get_profile(analysis_type)
+    profile.update(overrides)
+
+    original_size = image.size
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    crop_box = None
+    if profile["crop_to_players"] and boxes:
+        crop_box = player_crop_box(image.size, boxes, profile["crop_margin"])
+        if crop_box:
+            image = image.crop(crop_box)
+
+    size = target_size(image.size, profile["max_long_edge"], profile["token_budget"])
+    if size != image.size:
+        image = image.resize(size, Image.LANCZOS)
+
+    image_format = profile["format"].upper()
+    data, quality = encode_within_budget(image, profile["max_bytes"], image_format)
+
+    return PreparedImage(
+        data=data,
+        mime_type=MIME_TYPES.get(image_format, "image/jpeg"),
+        size=image.size,
+        quality=quality,
+        original_size=original_size,
+        original_bytes=original_bytes,
+        crop_box=crop_box,
+        preprocess_seconds=time.perf_counter() - start_time,
+    )
@@ -0,0 +1,465 @@
+"""
+Prometheus Metrics
+
+Counters, gauges and histograms for the server, rendered in the Prometheus
+text exposition format by render_metrics(). Updates are cheap enough to
+leave on in production: every thread writes only to its own shard (plain
+dictionaries in thread-local storage), so increments never take a lock.
+Scrapes merge the shards under a lock that writers never take, and the
+shards of exited threads are folded into a base shard, so Flask's
+per-request threads don't make the shard list grow.
+
+Hot paths should bind label values once with labels() and call inc() or
+observe() on the result. Gauges can also be computed at scrape time with
+set_function(), which is how queue depths are reported.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from single frames to whole video analyses
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _Shard:
+    """Metric values written by a single thread."""
+
+    __slots__ = ("values", "histograms")
+
+    def __init__(self):
+        self.values = {}
+        self.histograms = {}
+
+    def add(self, other):
+        """Fold another shard into this one."""
+        for key, value in dict(other.values).items():
+            self.values[key] = self.values.get(key, 0.0) + value
+        for key, counts in dict(other.histograms).items():
+            mine = self.histograms.get(key)
+            if mine is None:
+                self.histograms[key] = list(counts)
+            else:
+                for index, count in enumerate(counts):
+                    mine[index] += count
+
+
+class _ShardOwner:
+    """Lives in a thread's local storage; collected when the thread exits."""
+
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class _Child:
+    """A metric with its label values bound."""
+
+    __slots__ = ("metric", "key")
+
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount=1.0):
+        values = self.metric.registry._shard().values
+        values[self.key] = values.get(self.key, 0.0) + amount
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.metric.registry.set_values[self.key] = value
+
+    def set_function(self, func):
+        self.metric.registry.functions[self.key] = func
+
+    def observe(self, value):
+        histograms = self.metric.registry._shard().histograms
+        counts = histograms.get(self.key)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the sum
+            counts = histograms[self.key] = [0.0] * (len(self.metric.buckets) + 2)
+        counts[bisect.bisect_left(self.metric.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of a block in seconds."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time)
+
+    @contextmanager
+    def track_inprogress(self):
+        """Count a block as in progress while it runs."""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Metric:
+    """
+    A named metric with optional labels.
+
+    The update methods take the label values as keyword arguments; use
+    labels() to bind them once for hot paths.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=None):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) if buckets else None
+        self._children = {}
+        self._default = _Child(self, (name, ())) if not self.labelnames else None
+
+    def labels(self, **labels):
+        """Bind label values, returning an object with the update methods."""
+        try:
+            values = tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError as e:
+            raise ValueError(f"Missing label {e} for metric {self.name}")
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} takes the labels {', '.join(self.labelnames)}")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, _Child(self, (self.name, values)))
+        return child
+
+    def _child(self, labels):
+        return self._default if not labels and self._default is not None else self.labels(**labels)
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        self._child(labels).inc(amount)
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down.
+
+    inc()/dec() are sharded like counters; set() and set_function() store a
+    value (or a function called at scrape time) that the increments are
+    added to.
+    """
+
+    kind = "gauge"
+
+    def inc(self, amount=1.0, **labels):
+        self._child(labels).inc(amount)
+
+    def dec(self, amount=1.0, **labels):
+        self._child(labels).inc(-amount)
+
+    def set(self, value, **labels):
+        self._child(labels).set(value)
+
+    def set_function(self, func, **labels):
+        self._child(labels).set_function(func)
+
+    def track_inprogress(self, **labels):
+        return self._child(labels).track_inprogress()
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets."""
+
+    kind = "histogram"
+
+    def observe(self, value, **labels):
+        self._child(labels).observe(value)
+
+    def time(self, **labels):
+        return self._child(labels).time()
+
+
+def _format_value(value):
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics with per-thread shards.
+
+    Writers update the calling thread's shard without locking. Readers merge
+    the shards under a lock that only readers, shard registration and shard
+    retirement take.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.metrics_lock = threading.Lock()
+        # Scrape-time functions are kept across forks
+        self.functions = {}
+        self._reset_values()
+
+    def _reset_values(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = []
+        self.base = _Shard()
+        self.set_values = {}
+        self.started_at = time.time()
+
+    def _reset_after_fork(self):
+        """Start from zero in a forked child (metrics are per process)."""
+        self._reset_values()
+
+    def _shard(self):
+        """Get the calling thread's shard, registering it on first use."""
+        owner = getattr(self.local, "owner", None)
+        if owner is None:
+            shard = _Shard()
+            owner = _ShardOwner(shard)
+            with self.lock:
+                self.shards.append(shard)
+            weakref.finalize(owner, self._retire, shard)
+            self.local.owner = owner
+        return owner.shard
+
+    def _retire(self, shard):
+        """Fold the shard of an exited thread into the base shard."""
+        with self.lock:
+            if shard in self.shards:
+                self.base.add(shard)
+                self.shards.remove(shard)
+
+    # Definitions
+
+    def _register(self, cls, name, documentation, labelnames, buckets=None):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.metrics_lock:
+                metric = self.metrics.get(name)
+                if metric is None:
+                    metric = cls(self, name, documentation, labelnames, buckets)
+                    self.metrics[name] = metric
+        if not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name} is already registered with a different type or labels")
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Get or create a counter."""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Get or create a gauge."""
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Get or create a histogram."""
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    # Reading
+
+    def collect(self):
+        """
+        Merge all shards.
+
+        Returns:
+            Tuple of (values, histograms): dictionaries keyed by
+            (metric name, label values)
+        """
+        merged = _Shard()
+        with self.lock:
+            merged.add(self.base)
+            for shard in self.shards:
+                merged.add(shard)
+
+        values = merged.values
+        for key, value in dict(self.set_values).items():
+            values[key] = values.get(key, 0.0) + value
+        for key, func in dict(self.functions).items():
+            try:
+                values[key] = values.get(key, 0.0) + float(func())
+            except Exception as e:
+                logger.error("Error reading metric %s: %s", key[0], e)
+        return values, merged.histograms
+
+    def value(self, name, **labels):
+        """Current value of a counter or gauge (0 if it was never updated)."""
+        values, _ = self.collect()
+        metric = self.metrics[name]
+        return values.get((name, tuple(str(labels[label]) for label in metric.labelnames)), 0.0)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        values, histograms = self.collect()
+        by_metric = {}
+        for (name, label_values), value in values.items():
+            by_metric.setdefault(name, []).append((label_values, value))
+        for (name, label_values), counts in histograms.items():
+            by_metric.setdefault(name, []).append((label_values, counts))
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for label_values, value in sorted(by_metric.get(name, []), key=lambda item: item[0]):
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_format_labels(metric.labelnames, label_values)} {_format_value(value)}")
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(metric.buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    labels = _format_labels(metric.labelnames, label_values, ("le", _format_value(bound)))
+                    lines.append(f"{name}_bucket{labels} {_format_value(cumulative)}")
+                labels = _format_labels(metric.labelnames, label_values)
+                lines.append(f"{name}_sum{labels} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{labels} {_format_value(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        All metrics as a dictionary (histograms as count, sum and mean).
+
+        Returns:
+            Dictionary of metric name -> list of {"labels": ..., ...} entries
+        """
+        values, histograms = self.collect()
+        snapshot = {}
+        for (name, label_values), value in sorted(values.items()):
+            labels = dict(zip(self.metrics[name].labelnames, label_values))
+            snapshot.setdefault(name, []).append({"labels": labels, "value": value})
+        for (name, label_values), counts in sorted(histograms.items()):
+            labels = dict(zip(self.metrics[name].labelnames, label_values))
+            count = sum(counts[:-1])
+            snapshot.setdefault(name, []).append({
+                "labels": labels,
+                "count": count,
+                "sum": round(counts[-1], 6),
+                "mean": round(counts[-1] / count, 6) if count else None,
+            })
+        return snapshot
+
+    def cache_hit_rates(self):
+        """Hit rate of every cache counted in volleyball_cache_requests_total."""
+        values, _ = self.collect()
+        totals = {}
+        for (name, label_values), value in values.items():
+            if name == CACHE_REQUESTS.name:
+                cache, result = label_values
+                hits, total = totals.get(cache, (0.0, 0.0))
+                totals[cache] = (hits + (value if result == "hit" else 0.0), total + value)
+        return {
+            cache: {"requests": int(total), "hit_rate": round(hits / total, 4) if total else None}
+            for cache, (hits, total) in sorted(totals.items())
+        }
+
+
+registry = MetricsRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry._reset_after_fork)
+
+# Server metrics
+
+HTTP_REQUESTS = registry.counter(
+    "volleyball_http_requests_total", "HTTP requests by endpoint and status", ("method", "endpoint", "status"))
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "volleyball_http_request_duration_seconds", "HTTP request latency", ("method", "endpoint"))
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge(
+    "volleyball_http_requests_in_flight", "HTTP requests being handled")
+
+REMOTE_CALLS = registry.counter(
+    "volleyball_remote_calls_total", "Remote API calls by provider", ("provider",))
+REMOTE_CALL_ERRORS = registry.counter(
+    "volleyball_remote_call_errors_total", "Failed remote API calls by provider", ("provider",))
+REMOTE_CALL_SECONDS = registry.histogram(
+    "volleyball_remote_call_duration_seconds", "Remote API call latency", ("provider",))
+REMOTE_CALLS_IN_FLIGHT = registry.gauge(
+    "volleyball_remote_calls_in_flight", "Remote API calls waiting for a response", ("provider",))
+
+FRAMES_DECODED = registry.counter(
+    "volleyball_frames_decoded_total", "Video frames decoded", ("decoder",))
+FRAMES_ANALYZED = registry.counter(
+    "volleyball_frames_analyzed_total", "Frames analyzed by the vision model", ("analysis_type",))
+CPU_TASK_SECONDS = registry.histogram(
+    "volleyball_cpu_task_duration_seconds", "CPU pool task latency including queueing", ("task",))
+
+CACHE_REQUESTS = registry.counter(
+    "volleyball_cache_requests_total", "Cache lookups by cache and result (hit or miss)", ("cache", "result"))
+
+AGENT_OPERATIONS = registry.counter(
+    "volleyball_agent_operations_total", "Agent system operations by result (ok or error)", ("operation", "result"))
+
+QUEUE_DEPTH = registry.gauge(
+    "volleyball_queue_depth", "Items waiting in background queues", ("queue",))
+JOBS_IN_FLIGHT = registry.gauge(
+    "volleyball_jobs_in_flight", "Analysis jobs running", ("job",))
+
+UPTIME_SECONDS = registry.gauge(
+    "volleyball_uptime_seconds", "Seconds since the metrics registry was created")
+UPTIME_SECONDS.set_function(lambda: time.time() - registry.started_at)
+
+
+def count_cache(cache, hit):
+    """Count a cache lookup."""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def render_metrics():
+    """All metrics of this process in the Prometheus text format."""
+    return registry.render()
+
+
+def metrics_snapshot():
+    """All metrics of this process as a dictionary."""
+    return registry.snapshot()
+
+
+def metric_totals(name, label):
+    """
+    Values of a counter or gauge summed by one of its labels.
+
+    Args:
+        name: Metric name
+        label: Label to group by
+
+    Returns:
+        Dictionary of label value -> total
+    """
+    values, _ = registry.collect()
+    index = registry.metrics[name].labelnames.index(label)
+    totals = {}
+    for (metric_name, label_values), value in values.items():
+        if metric_name == name:
+            totals[label_values[index]] = totals.get(label_values[index], 0.0) + value
+    return {key: int(value) if value == int(value) else value for key, value in sorted(totals.items())}
@@ -0,0 +1,297 @@
+"""
+CPU Player Detection for Volleyball Frames
+
+Detects players (people) in video frames so analysis and pose extraction can
+work on a crop around them instead of the full frame. Uses an OpenCV DNN
+ONNX detector (YOLOv5/YOLOv8-style person detector) when a model is
+configured with PLAYER_DETECTOR_MODEL, and OpenCV's HOG people detector
+otherwise. For video, detections can be reused between keyframes by shifting
+each box with sparse optical flow, which is much cheaper than detecting on
+every frame.
+
+This module only depends on OpenCV and NumPy so it can also be loaded by the
+standalone scripts in server/src/python.
+"""
+
+import logging
+import os
+import threading
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Optional ONNX person detector (e.g. yolov8n.onnx exported at 320 or 640)
+DETECTOR_MODEL_PATH = os.environ.get('PLAYER_DETECTOR_MODEL')
+
+# COCO class index for "person"
+PERSON_CLASS_ID = 0
+
+
+class PlayerDetector:
+    """
+    Person detector returning bounding boxes with confidences.
+
+    Each detection is a dictionary:
+        {"bbox": [x, y, w, h], "confidence": float, "source": "detected" | "tracked"}
+    with coordinates in pixels of the input frame.
+    """
+
+    def __init__(self, model_path=None, input_size=320, confidence_threshold=0.4,
+                 nms_threshold=0.45, hog_width=640):
+        """
+        Initialize the player detector.
+
+        Args:
+            model_path: Path to an ONNX person detector (defaults to PLAYER_DETECTOR_MODEL)
+            input_size: Square network input size for the ONNX model
+            confidence_threshold: Minimum confidence for a detection
+            nms_threshold: IoU threshold for non-maximum suppression
+            hog_width: Frame width the HOG detector runs at (frames are downscaled)
+        """
+        self.input_size = input_size
+        self.confidence_threshold = confidence_threshold
+        self.nms_threshold = nms_threshold
+        self.hog_width = hog_width
+        self.net = None
+        # A cv2.dnn.Net holds its input and activations, so concurrent
+        # setInput/forward calls on the shared detector are serialized
+        self.net_lock = threading.Lock()
+        self.hog = None
+
+        model_path = model_path or DETECTOR_MODEL_PATH
+        if model_path and os.path.exists(model_path):
+            try:
+                self.net = cv2.dnn.readNetFromONNX(model_path)
+                self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+                self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+                logger.info("Player detector using ONNX model: %s", model_path)
+            except Exception as e:
+                logger.warning("Could not load ONNX player detector, falling back to HOG: %s", e)
+                self.net = None
+
+        if self.net is None:
+            self.hog = cv2.HOGDescriptor()
+            self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    @property
+    def backend(self):
+        """Name of the detection backend in use."""
+        return "onnx" if self.net is not None else "hog"
+
+    def detect(self, frame):
+        """
+        Detect players in a single BGR frame.
+
+        Args:
+            frame: Video frame as numpy array (BGR)
+
+        Returns:
+            List of detections
+        """
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        """
+        Detect players in a batch of BGR frames.
+
+        Args:
+            frames: List of video frames as numpy arrays
+
+        Returns:
+            List with one list of detections per frame
+        """
+        if not frames:
+            return []
+        if self.net is not None:
+            return self._detect_onnx(frames)
+        return [self._detect_hog(frame) for frame in frames]
+
+    def _detect_onnx(self, frames):
+        """Run the ONNX detector on a batch of frames."""
+        blob = cv2.dnn.blobFromImages(
+            frames, scalefactor=1 / 255.0, size=(self.input_size, self.input_size),
+            swapRB=True, crop=False
+        )
+
+        with self.net_lock:
+            try:
+                self.net.setInput(blob)
+                outputs = self.net.forward()
+            except cv2.error:
+                # Models exported with a fixed batch size of 1
+                outputs = []
+                for i in range(len(frames)):
+                    self.net.setInput(blob[i:i + 1])
+                    outputs.append(self.net.forward()[0])
+                outputs = np.stack(outputs)
+
+        return [
+            self._parse_onnx_output(output, frame.shape[1], frame.shape[0])
+            for output, frame in zip(outputs, frames)
+        ]
+
+    def _parse_onnx_output(self, output, frame_width, frame_height):
+        """Convert raw YOLO output rows into person detections."""
+        # YOLOv8 exports (84, N); YOLOv5 exports (N, 85) with an objectness column
+        if output.shape[0] < output.shape[1]:
+            output = output.T
+
+        if output.shape[1] == 85:
+            scores = output[:, 4] * output[:, 5 + PERSON_CLASS_ID]
+        else:
+            scores = output[:, 4 + PERSON_CLASS_ID]
+
+        keep = scores >= self.confidence_threshold
+        rows, scores = output[keep], scores[keep]
+        if len(rows) == 0:
+            return []
+
+        scale_x = frame_width / self.input_size
+        scale_y = frame_height / self.input_size
+        boxes = []
+        for cx, cy, w, h in rows[:, :4]:
+            boxes.append([
+                int((cx - w / 2) * scale_x),
+                int((cy - h / 2) * scale_y),
+                int(w * scale_x),
+                int(h * scale_y),
+            ])
+
+        return self._suppress(boxes, scores.tolist())
+
+    def _detect_hog(self, frame):
+        """Run the HOG people detector on a downscaled frame."""
+        scale = 1.0
+        if frame.shape[1] > self.hog_width:
+            scale = self.hog_width / frame.shape[1]
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        rects, weights = self.hog.detectMultiScale(frame, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        if len(rects) == 0:
+            return []
+
+        boxes = [[int(v / scale) for v in rect] for rect in rects]
+        # HOG weights are SVM margins; squash them into a 0-1 confidence
+        scores = [float(1.0 / (1.0 + np.exp(-w))) for w in np.ravel(weights)]
+        return self._suppress(boxes, scores, threshold=0.5)
+
+    def _suppress(self, boxes, scores, threshold=None):
+        """Apply non-maximum suppression and build detection dictionaries."""
+        threshold = self.confidence_threshold if threshold is None else threshold
+        indices = cv2.dnn.NMSBoxes(boxes, scores, threshold, self.nms_threshold)
+        return [
+            {"bbox": boxes[i], "confidence": round(float(scores[i]), 3), "source": "detected"}
+            for i in np.ravel(indices)
+        ]
+
+    def track(self, frames, detect_interval=5, flow_width=480):
+        """
+        Detect players on keyframes and track them through the frames between.
+
+        Args:
+            frames: Iterable of BGR frames (a list or a generator)
+            detect_interval: Run the detector every this many frames
+            flow_width: Frame width used for optical flow
+
+        Yields:
+            List of detections for each input frame
+        """
+        detections = []
+        previous_gray = None
+        flow_scale = 1.0
+
+        for index, frame in enumerate(frames):
+            if frame.shape[1] > flow_width:
+                flow_scale = flow_width / frame.shape[1]
+                small = cv2.resize(frame, None, fx=flow_scale, fy=flow_scale, interpolation=cv2.INTER_AREA)
+            else:
+                flow_scale = 1.0
+                small = frame
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+            if index % detect_interval == 0 or previous_gray is None or not detections:
+                detections = self.detect(frame)
+            else:
+                detections = self._propagate(previous_gray, gray, detections, flow_scale)
+
+            previous_gray = gray
+            yield detections
+
+    def _propagate(self, previous_gray, gray, detections, flow_scale):
+        """Shift detections by the median optical flow inside each box."""
+        propagated = []
+        for detection in detections:
+            x, y, w, h = [int(v * flow_scale) for v in detection["bbox"]]
+            region = previous_gray[max(y, 0):y + h, max(x, 0):x + w]
+            if region.size == 0:
+                continue
+
+            points = cv2.goodFeaturesToTrack(region, maxCorners=20, qualityLevel=0.01, minDistance=3)
+            if points is None:
+                propagated.append(dict(detection, source="tracked"))
+                continue
+
+            points = points + np.array([[max(x, 0), max(y, 0)]], dtype=np.float32)
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None)
+            good = status.ravel() == 1
+            if not good.any():
+                continue
+
+            dx, dy = np.median((moved[good] - points[good]).reshape(-1, 2), axis=0) / flow_scale
+            bx, by, bw, bh = detection["bbox"]
+            propagated.append({
+                "bbox": [int(bx + dx), int(by + dy), bw, bh],
+                "confidence": detection["confidence"],
+                "source": "tracked",
+            })
+        return propagated
+
+
+def crop_to_players(frame, detections, margin=0.2):
+    """
+    Crop a frame to the region covering the detected players.
+
+    Args:
+        frame: Video frame as numpy array
+        detections: Detections from PlayerDetector
+        margin: Extra space around the players, as a fraction of the box size
+
+    Returns:
+        Tuple of (cropped frame view, (x, y) offset of the crop)
+    """
+    if not detections:
+        return frame, (0, 0)
+
+    height, width = frame.shape[:2]
+    left = min(d["bbox"][0] for d in detections)
+    top = min(d["bbox"][1] for d in detections)
+    right = max(d["bbox"][0] + d["bbox"][2] for d in detections)
+    bottom = max(d["bbox"][1] + d["bbox"][3] for d in detections)
+
+    pad_x = int((right - left) * margin)
+    pad_y = int((bottom - top) * margin)
+    left, top = max(left - pad_x, 0), max(top - pad_y, 0)
+    right, bottom = min(right + pad_x, width), min(bottom + pad_y, height)
+
+    return frame[top:bottom, left:right], (left, top)
+
+
+_default_detector = None
+_default_detector_lock = threading.Lock()
+
+
+def get_player_detector():
+    """
+    Get the shared player detector, creating it on first use.
+
+    Returns:
+        PlayerDetector instance
+    """
+    global _default_detector
+    if _default_detector is None:
+        with _default_detector_lock:
+            if _default_detector is None:
+                _default_detector = PlayerDetector()
+    return _default_detector
@@ -0,0 +1,584 @@
+"""
+Profiling
+
+Two ways to see where analysis time goes:
+
+Per-request profiles: a request sent with an X-Profile header (or a
+?profile= query parameter) of "sample" or "cprofile" is profiled on its
+own. "sample" snapshots the stacks of the request thread, and of pool
+threads running work submitted for it through context_wrap(), every
+PROFILE_SAMPLE_INTERVAL_MS. "cprofile" runs cProfile on the request thread
+(deterministic, but slower and blind to pool threads). Finished profiles
+are kept under the request ID (see valid_profile_id; the last PROFILE_BUFFER_SIZE, and as files
+in PROFILE_DIR when set) and export as speedscope JSON, collapsed stacks
+for flamegraph.pl, or pstats for cProfile runs.
+
+Continuous sampling: a background thread snapshots every busy thread
+PROFILE_SAMPLE_HZ times per second and aggregates the stacks by stage
+(extraction, detection, encoding, remote_call, other), so hot paths show up without
+reproducing a slow request.
+
+Settings (environment):
+    PROFILING                    Allow per-request profiles (default 0: any client
+                                 could otherwise profile its requests)
+    PROFILE_SAMPLE_INTERVAL_MS   Per-request sampling interval (default 5)
+    PROFILE_BUFFER_SIZE          Profiles kept in memory (default 20)
+    PROFILE_DIR                  Also write profiles here (default: memory only)
+    CONTINUOUS_PROFILING         Run the background sampler (default 1)
+    PROFILE_SAMPLE_HZ            Background sampling rate (default 5)
+    PROFILE_MAX_STACKS           Distinct stacks kept by the background sampler (default 5000)
+"""
+
+import contextvars
+import cProfile
+import json
+import logging
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from .tracing import context_wrap
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.environ.get('PROFILING', '0').lower() not in ('0', 'false', 'no')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_BUFFER_SIZE = int(os.environ.get('PROFILE_BUFFER_SIZE', '20'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '')
+CONTINUOUS_PROFILING = os.environ.get('CONTINUOUS_PROFILING', '1').lower() not in ('0', 'false', 'no')
+PROFILE_SAMPLE_HZ = float(os.environ.get('PROFILE_SAMPLE_HZ', '5'))
+PROFILE_MAX_STACKS = int(os.environ.get('PROFILE_MAX_STACKS', '5000'))
+
+PROFILE_MODES = ("sample", "cprofile")
+
+# Profile IDs double as file names in PROFILE_DIR
+PROFILE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Deepest stack recorded (frames nearest the root are dropped beyond this)
+MAX_STACK_DEPTH = 128
+
+# Stage of a stack: the first rule matching a frame, from the innermost
+# frame outwards. Rules match a path fragment of the file or a function name.
+STAGE_RULES = (
+    ("remote_call", ("/google/generativeai/", "/google/api_core/", "/openai/", "/httpx/", "/httpcore/",
+                     "/urllib3/", "/requests/", "/http/client.py", "/ssl.py", "/volleyball_ai/api_clients.py"),
+     ("generate_content",)),
+    ("detection", ("/volleyball_ai/player_detection.py", "/volleyball_ai/ball_tracking.py"), ()),
+    ("encoding", ("/volleyball_ai/image_input.py", "/PIL/JpegImagePlugin.py", "/PIL/ImageFile.py"),
+     ("save_frame_properly", "encode_frame")),
+    ("extraction", ("/volleyball_ai/video_decoder.py", "/volleyball_ai/rally_segmentation.py"),
+     ("extract_frames_from_video", "extract_frames_with_ffmpeg", "open_video_capture")),
+)
+STAGES = tuple(rule[0] for rule in STAGE_RULES) + ("other",)
+
+# A thread outside the stages whose innermost frame is in one of these files
+# is waiting for work (or for a client)
+IDLE_FILES = ("/threading.py", "/queue.py", "/selectors.py", "/socketserver.py", "/socket.py",
+              "/concurrent/futures/thread.py", "/logging/handlers.py")
+
+# Code object of the function context_wrap() returns; work running under it
+# carries the context (and so the profile) of the request that submitted it
+_CONTEXT_WRAPPER_CODE = context_wrap(lambda: None).__code__
+
+_active_profile = contextvars.ContextVar('volleyball_ai_active_profile', default=None)
+
+
+# Stacks
+
+def _frame_key(frame):
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename.replace(os.sep, "/"), code.co_firstlineno)
+
+
+def _stack(frame):
+    """Frames of a stack as (function, file, line) tuples, root first."""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(_frame_key(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def stack_stage(stack):
+    """Stage (see STAGE_RULES) of a root-first stack."""
+    for function, filename, _ in reversed(stack):
+        for stage, files, functions in STAGE_RULES:
+            if function.rsplit(".", 1)[-1] in functions or any(part in filename for part in files):
+                return stage
+    return "other"
+
+
+def _is_idle(stack, stage):
+    return not stack or (stage == "other" and stack[-1][1].endswith(IDLE_FILES))
+
+
+def _frame_label(key):
+    function, filename, line = key
+    return f"{function} ({os.path.basename(filename)}:{line})"
+
+
+def _submitted_by(frame):
+    """Profile bound to the context_wrap() call a thread is running, if any."""
+    while frame is not None:
+        if frame.f_code is _CONTEXT_WRAPPER_CODE:
+            context = frame.f_locals.get("context")
+            return context.get(_active_profile) if context is not None else None
+        frame = frame.f_back
+    return None
+
+
+def speedscope_document(name, profiles, exporter="volleyball_ai"):
+    """
+    Speedscope file for weighted stacks.
+
+    Args:
+        name: Document name
+        profiles: List of (profile name, Counter of root-first stacks to weights in ms)
+
+    Returns:
+        Dictionary in the speedscope file format
+    """
+    frames, index = [], {}
+    entries = []
+    for profile_name, stacks in profiles:
+        samples, weights = [], []
+        for stack, weight in stacks.most_common():
+            sample = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                sample.append(index[key])
+            samples.append(sample)
+            weights.append(round(weight, 3))
+        total = round(sum(weights), 3)
+        entries.append({
+            "type": "sampled",
+            "name": profile_name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": total,
+            "samples": samples,
+            "weights": weights,
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": exporter,
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": entries,
+    }
+
+
+def collapsed_stacks(stacks):
+    """Stacks in the collapsed format of flamegraph.pl ("a;b;c weight" lines)."""
+    lines = []
+    for stack, weight in stacks.most_common():
+        labels = (_frame_label(key).replace(";", ":").replace(" ", "_") for key in stack)
+        lines.append(f"{';'.join(labels)} {max(int(round(weight)), 1)}")
+    return "\n".join(lines) + "\n"
+
+
+def _cprofile_stacks(stats):
+    """
+    Approximate stacks from cProfile's caller graph.
+
+    cProfile keeps per-function totals and per-edge times, not stacks, so a
+    function's time is split over the paths reaching it in proportion to
+    the time each caller spent in it (as gprof does).
+    """
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+
+    def key(function):
+        filename, line, name = function
+        return (name, filename.replace(os.sep, "/"), line)
+
+    stacks = Counter()
+
+    def walk(function, share, path, on_path):
+        total = stats[function][3]
+        # Paths under 10 microseconds are dropped, which also bounds the walk
+        if total <= 0 or share < 1e-5:
+            return
+        fraction = min(share / total, 1.0)
+        stack = path + (key(function),)
+        stacks[stack] += stats[function][2] * fraction * 1000
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(function, ()):
+            if callee not in on_path:
+                walk(callee, edge_time * fraction, stack, on_path | {callee})
+
+    roots = [function for function, entry in stats.items() if not entry[4]]
+    for root in roots:
+        walk(root, stats[root][3], (), {root})
+    return stacks
+
+
+# Per-request profiles
+
+class Profile:
+    """A finished profile of one request."""
+
+    def __init__(self, profile_id, name, mode, started, duration_ms, stacks, pstats=None):
+        self.id = profile_id
+        self.name = name
+        self.mode = mode
+        self.started = started
+        self.duration_ms = duration_ms
+        self.stacks = stacks
+        self.pstats = pstats
+
+    def summary(self):
+        stages = Counter()
+        for stack, weight in self.stacks.items():
+            stages[stack_stage(stack)] += weight
+        return {
+            "id": self.id,
+            "name": self.name,
+            "mode": self.mode,
+            "started": self.started,
+            "duration_ms": round(self.duration_ms, 3),
+            "stacks": len(self.stacks),
+            "stage_ms": {stage: round(value, 3) for stage, value in stages.most_common()},
+        }
+
+    def to_speedscope(self):
+        return speedscope_document(f"{self.name} [{self.id}]", [(f"{self.name} ({self.mode})", self.stacks)])
+
+    def to_collapsed(self):
+        return collapsed_stacks(self.stacks)
+
+    def to_pstats(self):
+        """cProfile statistics in the pstats file format (None for sampled profiles)."""
+        return marshal.dumps(self.pstats) if self.pstats is not None else None
+
+
+class _SamplingSession:
+    """Samples the request thread and the work it submits until stopped."""
+
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000.0
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=context_wrap(self._run), name="request-profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        profile = _active_profile.get()
+        names = {}
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = (now - last) * 1000, now
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.thread_id or (thread_id != threading.get_ident()
+                                                   and _submitted_by(frame) is profile):
+                    stack = _stack(frame)
+                    if thread_id != self.thread_id and _is_idle(stack, stack_stage(stack)):
+                        continue
+                    if thread_id not in names:
+                        names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                    thread = ("thread " + names.get(thread_id, str(thread_id)), "", 0)
+                    self.stacks[(thread,) + stack] += weight
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self.stacks, None
+
+
+class _CProfileSession:
+    """cProfile on the request thread."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.profiler.create_stats()
+        return _cprofile_stacks(self.profiler.stats), self.profiler.stats
+
+
+def valid_profile_id(profile_id):
+    """
+    Use a client-supplied ID (e.g. X-Request-Id) only if it is a safe file name.
+
+    Args:
+        profile_id: Requested ID, or None
+
+    Returns:
+        The ID if it matches PROFILE_ID_PATTERN, otherwise a new random ID
+    """
+    if profile_id and PROFILE_ID_PATTERN.fullmatch(profile_id):
+        return profile_id
+    return uuid.uuid4().hex[:16]
+
+
+class ProfileStore:
+    """The most recent request profiles, by ID."""
+
+    def __init__(self, size=PROFILE_BUFFER_SIZE, directory=PROFILE_DIR):
+        self.size = size
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.profiles = OrderedDict()
+
+    def add(self, profile):
+        if not PROFILE_ID_PATTERN.fullmatch(profile.id):
+            raise ValueError(f"Invalid profile ID: {profile.id!r}")
+        with self.lock:
+            self.profiles.pop(profile.id, None)
+            self.profiles[profile.id] = profile
+            while len(self.profiles) > self.size:
+                self.profiles.popitem(last=False)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"{profile.id}.speedscope.json")
+                with open(path, "w") as file:
+                    json.dump(profile.to_speedscope(), file)
+            except OSError as e:
+                logger.warning("Could not write profile %s: %s", profile.id, e)
+
+    def get(self, profile_id):
+        if not PROFILE_ID_PATTERN.fullmatch(profile_id or ""):
+            return None
+        with self.lock:
+            profile = self.profiles.get(profile_id)
+        if profile is None and self.directory:
+            path = os.path.join(self.directory, f"{profile_id}.speedscope.json")
+            if os.path.exists(path):
+                return _load_speedscope(profile_id, path)
+        return profile
+
+    def list(self):
+        with self.lock:
+            return [profile.summary() for profile in reversed(self.profiles.values())]
+
+
+def _load_speedscope(profile_id, path):
+    """Profile read back from a speedscope file written by ProfileStore."""
+    with open(path) as file:
+        document = json.load(file)
+    frames = [(frame["name"], frame.get("file", ""), frame.get("line", 0)) for frame in document["shared"]["frames"]]
+    entry = document["profiles"][0]
+    stacks = Counter()
+    for sample, weight in zip(entry["samples"], entry["weights"]):
+        stacks[tuple(frames[index] for index in sample)] += weight
+    return Profile(profile_id, entry["name"], "file", None, entry["endValue"], stacks)
+
+
+profiles = ProfileStore()
+
+
+class RequestProfile:
+    """A running profile; stop() stores it under its ID."""
+
+    def __init__(self, profile_id, name, mode):
+        self.id = valid_profile_id(profile_id)
+        self.name = name
+        self.mode = mode
+        self.started = time.time()
+        self.start_time = time.perf_counter()
+        self.session = None
+        self.token = _active_profile.set(self)
+
+        if mode == "cprofile":
+            try:
+                self.session = _CProfileSession()
+                self.session.start()
+            except ValueError:
+                # Another profiler is active (one cProfile per process on 3.12+)
+                self.mode = "sample"
+                self.session = None
+        if self.session is None:
+            self.session = _SamplingSession(PROFILE_SAMPLE_INTERVAL_MS)
+            self.session.start()
+
+    def stop(self):
+        stacks, pstats = self.session.stop()
+        try:
+            _active_profile.reset(self.token)
+        except ValueError:
+            _active_profile.set(None)
+        profile = Profile(self.id, self.name, self.mode, self.started,
+                          (time.perf_counter() - self.start_time) * 1000, stacks, pstats)
+        profiles.add(profile)
+        return profile
+
+
+def start_profile(profile_id, name, mode="sample"):
+    """
+    Start profiling the current request.
+
+    Args:
+        profile_id: ID to store the profile under (the request ID; replaced
+            by a random ID unless it is a safe file name that no stored
+            profile uses yet)
+        name: Profile name, e.g. "POST /api/volleyball/analyze-video"
+        mode: "sample" or "cprofile"
+
+    Returns:
+        RequestProfile (call stop() when the request is done), or None when
+        profiling is disabled or the mode is unknown
+    """
+    if not PROFILING_ENABLED or mode not in PROFILE_MODES:
+        return None
+    if profile_id and profiles.get(profile_id) is not None:
+        # Never replace another request's profile
+        profile_id = None
+    return RequestProfile(profile_id, name, mode)
+
+
+def get_profile(profile_id):
+    """A stored profile, or None."""
+    return profiles.get(profile_id)
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    return profiles.list()
+
+
+# Continuous sampling
+
+class StackSampler:
+    """Background thread aggregating the stacks of busy threads by stage."""
+
+    def __init__(self, hz=PROFILE_SAMPLE_HZ, max_stacks=PROFILE_MAX_STACKS):
+        self.interval = 1.0 / hz if hz > 0 else 0
+        self.max_stacks = max_stacks
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.stages = {}
+        self.samples = 0
+        self.dropped = 0
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        if self.interval <= 0 or (self.thread is not None and self.thread.is_alive()):
+            return
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            self.sample(skip=(own_id,))
+
+    def sample(self, skip=()):
+        """Record one snapshot of every busy thread."""
+        stacks = [_stack(frame) for thread_id, frame in sys._current_frames().items() if thread_id not in skip]
+        weight = self.interval * 1000 or 1.0
+        with self.lock:
+            self.samples += 1
+            for stack in stacks:
+                stage = self.stages.get(stack) or stack_stage(stack)
+                if _is_idle(stack, stage):
+                    continue
+                if stack not in self.stacks:
+                    if len(self.stacks) >= self.max_stacks:
+                        self.dropped += 1
+                        continue
+                    self.stages[stack] = stage
+                self.stacks[stack] += weight
+
+    def snapshot(self, stage=None):
+        """Counter of stacks to sampled milliseconds, optionally for one stage."""
+        with self.lock:
+            if not stage:
+                return Counter(self.stacks)
+            return Counter({stack: weight for stack, weight in self.stacks.items() if self.stages[stack] == stage})
+
+    def hot_stacks(self, stage=None, limit=20):
+        """The most sampled stacks with their stage and sampled milliseconds."""
+        return [
+            {
+                "stage": self.stages.get(stack, "other"),
+                "ms": round(weight, 3),
+                "stack": [_frame_label(key) for key in reversed(stack)],
+            }
+            for stack, weight in self.snapshot(stage).most_common(limit)
+        ]
+
+    def stage_totals(self):
+        totals = Counter()
+        with self.lock:
+            for stack, weight in self.stacks.items():
+                totals[self.stages[stack]] += weight
+        return {stage: round(totals.get(stage, 0.0), 3) for stage in STAGES}
+
+    def to_speedscope(self, stage=None):
+        if stage:
+            return speedscope_document(f"continuous profile ({stage})", [(stage, self.snapshot(stage))])
+        return speedscope_document("continuous profile", [(name, self.snapshot(name)) for name in STAGES])
+
+    def reset(self):
+        with self.lock:
+            self.stacks = Counter()
+            self.stages = {}
+            self.samples = 0
+            self.dropped = 0
+
+    def _reset_after_fork(self):
+        # The sampling thread does not survive a fork
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.stages = {}
+        running = self.thread is not None
+        self.thread = None
+        if running:
+            self.start()
+
+
+sampler = StackSampler()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=sampler._reset_after_fork)
+
+
+def start_sampler():
+    """Start the continuous sampler (once; no-op with CONTINUOUS_PROFILING=0)."""
+    if CONTINUOUS_PROFILING:
+        sampler.start()
+    return sampler
+
+
+def profiling_stats():
+    """Stored profiles and continuous sampler totals for the metrics endpoint."""
+    return {
+        "request_profiling": PROFILING_ENABLED,
+        "stored_profiles": len(profiles.profiles),
+        "continuous": {
+            "running": sampler.thread is not None and sampler.thread.is_alive(),
+            "hz": round(1.0 / sampler.interval, 3) if sampler.interval else 0,
+            "samples": sampler.samples,
+            "stacks": len(sampler.stacks),
+            "dropped_stacks": sampler.dropped,
+            "stage_ms": sampler.stage_totals(),
+        },
+    }
@@ -0,0 +1,306 @@
+"""
+Rally Segmentation and Play-Sequence Indexing
+
+Splits a match video into rallies (serve to dead ball) using two cheap
+signals computed while streaming the video once: motion energy between
+consecutive downscaled frames, and the continuity of the ball track from
+BallTracker. Within each rally it marks key events (serve, contacts and net
+crossings) from the ball trajectory.
+
+The resulting time index is stored next to the video as
+<video name>.rallies.json, so later analysis (e.g. Gemini frame analysis)
+can target only the in-play parts of a match.
+"""
+
+import json
+import logging
+import math
+import os
+
+import cv2
+import numpy as np
+
+from .ball_tracking import BallTracker, iter_video_frames
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.rallies.json'
+
+
+class RallySegmenter:
+    """
+    Accumulate per-frame motion and ball-track signals and split them into rallies.
+
+    Only a few numbers are kept per frame, so a full match can be streamed
+    through update() without holding frames in memory.
+    """
+
+    def __init__(self, fps=30.0, motion_factor=1.5, ball_gap_seconds=1.5, merge_gap_seconds=1.0,
+                 min_rally_seconds=2.0, contact_min_speed=2.0, net_x=None, tracker=None):
+        """
+        Initialize the rally segmenter.
+
+        Args:
+            fps: Frame rate used for timestamps when frames carry none
+            motion_factor: Motion energy above this multiple of the median counts as active play
+            ball_gap_seconds: How long play continues without a ball sighting while there is motion
+            merge_gap_seconds: In-play runs separated by less than this are merged into one rally
+            min_rally_seconds: Shorter runs are discarded
+            contact_min_speed: Ball speed (pixels per frame) needed on both sides
+                of a direction change for it to count as a contact
+            net_x: Horizontal net position in pixels (defaults to the frame centre)
+            tracker: BallTracker to use (a new one by default)
+        """
+        self.fps = fps
+        self.motion_factor = motion_factor
+        self.ball_gap_seconds = ball_gap_seconds
+        self.merge_gap_seconds = merge_gap_seconds
+        self.min_rally_seconds = min_rally_seconds
+        self.contact_min_speed = contact_min_speed
+        self.net_x = net_x
+        self.tracker = tracker or BallTracker()
+
+        self.timestamps = []
+        self.motion = []
+        self.ball_positions = []
+        self.frame_size = None
+        self._previous_gray = None
+
+    def update(self, frame, timestamp=None):
+        """
+        Add the next frame of the video.
+
+        Args:
+            frame: Video frame as numpy array (BGR)
+            timestamp: Frame time in seconds
+        """
+        index = len(self.timestamps)
+        timestamp = timestamp if timestamp is not None else index / self.fps
+        if self.frame_size is None:
+            self.frame_size = (frame.shape[1], frame.shape[0])
+
+        # Motion energy on a tiny grayscale copy of the frame
+        gray = cv2.cvtColor(cv2.resize(frame, (160, 90), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        if self._previous_gray is None:
+            energy = 0.0
+        else:
+            energy = float(cv2.absdiff(gray, self._previous_gray).mean())
+        self._previous_gray = gray
+
+        self.timestamps.append(timestamp)
+        self.motion.append(energy)
+        self.ball_positions.append(self.tracker.update(frame, index, timestamp))
+
+    def _in_play_mask(self):
+        """Classify every frame as in play or not."""
+        motion = np.array(self.motion)
+        threshold = float(np.median(motion)) * self.motion_factor if len(motion) else 0.0
+        gap_frames = int(self.ball_gap_seconds * self.fps)
+
+        in_play = []
+        last_ball_frame = None
+        for index, position in enumerate(self.ball_positions):
+            if position["status"] != "lost":
+                last_ball_frame = index
+                in_play.append(True)
+                continue
+
+            recently_seen = last_ball_frame is not None and index - last_ball_frame <= gap_frames
+            in_play.append(bool(recently_seen and motion[index] > threshold))
+
+        return in_play
+
+    def _runs(self, in_play):
+        """Turn the in-play mask into merged (start, end) frame ranges."""
+        runs = []
+        start = None
+        for index, playing in enumerate(in_play + [False]):
+            if playing and start is None:
+                start = index
+            elif not playing and start is not None:
+                runs.append([start, index - 1])
+                start = None
+
+        merged = []
+        for run in runs:
+            if merged and self.timestamps[run[0]] - self.timestamps[merged[-1][1]] < self.merge_gap_seconds:
+                merged[-1][1] = run[1]
+            else:
+                merged.append(run)
+
+        return [
+            (start, end) for start, end in merged
+            if self.timestamps[end] - self.timestamps[start] >= self.min_rally_seconds
+        ]
+
+    def _events(self, start, end):
+        """Find serve, contact and net-crossing events between two frames."""
+        net_x = self.net_x if self.net_x is not None else (self.frame_size[0] / 2 if self.frame_size else 0)
+        points = [
+            p for p in self.ball_positions[start:end + 1]
+            if p["status"] == "detected" and p["position"] is not None
+        ]
+        if not points:
+            return []
+
+        events = [{"type": "serve", "time": points[0]["timestamp"], "frame": points[0]["frame"],
+                   "position": points[0]["position"]}]
+
+        min_speed = self.contact_min_speed
+        for previous, current, following in zip(points, points[1:], points[2:]):
+            # Velocities in pixels per frame (detections may skip frames)
+            gap1 = max(current["frame"] - previous["frame"], 1)
+            gap2 = max(following["frame"] - current["frame"], 1)
+            vx1 = (current["position"][0] - previous["position"][0]) / gap1
+            vy1 = (current["position"][1] - previous["position"][1]) / gap1
+            vx2 = (following["position"][0] - current["position"][0]) / gap2
+            vy2 = (following["position"][1] - current["position"][1]) / gap2
+
+            # Ball falling (image y increasing) then rising, or a sharp change of
+            # direction; slow movement (e.g. the top of an arc) is ignored
+            bounced_up = vy1 > min_speed and vy2 < -min_speed
+            speed1, speed2 = math.hypot(vx1, vy1), math.hypot(vx2, vy2)
+            turned = (speed1 > min_speed and speed2 > min_speed
+                      and (vx1 * vx2 + vy1 * vy2) / (speed1 * speed2) < 0.5)
+            if bounced_up or turned:
+                events.append({"type": "contact", "time": current["timestamp"], "frame": current["frame"],
+                               "position": current["position"]})
+
+        for previous, current in zip(points, points[1:]):
+            if (previous["position"][0] - net_x) * (current["position"][0] - net_x) < 0:
+                events.append({"type": "net_crossing", "time": current["timestamp"], "frame": current["frame"],
+                               "position": current["position"]})
+
+        events.sort(key=lambda event: event["frame"])
+        return events
+
+    def finish(self):
+        """
+        Finish segmentation and build the rally index.
+
+        Returns:
+            Dictionary with the rallies, their events and in-play totals
+        """
+        trajectories = self.tracker.finish()
+        rallies = []
+        for rally_id, (start, end) in enumerate(self._runs(self._in_play_mask())):
+            rallies.append({
+                "id": rally_id,
+                "start_frame": start,
+                "end_frame": end,
+                "start_time": round(self.timestamps[start], 3),
+                "end_time": round(self.timestamps[end], 3),
+                "events": self._events(start, end),
+            })
+
+        total_seconds = self.timestamps[-1] if self.timestamps else 0.0
+        in_play_seconds = sum(r["end_time"] - r["start_time"] for r in rallies)
+
+        return {
+            "fps": self.fps,
+            "frame_count": len(self.timestamps),
+            "frame_size": list(self.frame_size) if self.frame_size else None,
+            "duration": round(total_seconds, 3),
+            "in_play_seconds": round(in_play_seconds, 3),
+            "rallies": rallies,
+            "ball_trajectories": [
+                {"id": t["id"], "start_time": t["start_time"], "end_time": t["end_time"]}
+                for t in trajectories
+            ],
+        }
+
+
+def rally_index_path(video_path):
+    """Path of the rally index stored alongside a video."""
+    return os.path.splitext(video_path)[0] + INDEX_SUFFIX
+
+
+def load_rally_index(video_path):
+    """
+    Load the stored rally index for a video if it is up to date.
+
+    Args:
+        video_path: Path to the video file
+
+    Returns:
+        Rally index dictionary, or None if there is no current index
+    """
+    index_path = rally_index_path(video_path)
+    if not os.path.exists(index_path):
+        return None
+    if os.path.getmtime(index_path) < os.path.getmtime(video_path):
+        return None
+
+    try:
+        with open(index_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read rally index %s: %s", index_path, e)
+        return None
+
+
+def segment_rallies(video_path, fps=None, save=True, **options):
+    """
+    Build (or load) the rally index for a video.
+
+    Args:
+        video_path: Path to the video file
+        fps: Frame rate of the video (read from the video if not given)
+        save: Store the index next to the video (pass False for temporary
+            uploads, which are deleted after the analysis)
+        **options: Extra RallySegmenter options
+
+    Returns:
+        Rally index dictionary
+    """
+    index = load_rally_index(video_path)
+    if index is not None:
+        return index
+
+    if fps is None:
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+        cap.release()
+    segmenter = RallySegmenter(fps=fps or 30.0, **options)
+
+    for timestamp, frame in iter_video_frames(video_path, width=640):
+        segmenter.update(frame, timestamp)
+
+    index = segmenter.finish()
+    index["video"] = os.path.basename(video_path)
+
+    # Positions were tracked on 640px frames; keep the index in those pixels
+    index["tracking_width"] = 640
+
+    if save:
+        with open(rally_index_path(video_path), 'w') as f:
+            json.dump(index, f, indent=2)
+        logger.info("Saved rally index with %s rallies to %s", len(index['rallies']), rally_index_path(video_path))
+
+    return index
+
+
+def in_play_frame_indices(index, interval_seconds=2.0, max_frames=None):
+    """
+    Pick frames to analyze from inside the rallies only.
+
+    Args:
+        index: Rally index from segment_rallies
+        interval_seconds: Time between sampled frames within a rally
+        max_frames: Maximum number of frames (spread evenly over all rallies)
+
+    Returns:
+        Sorted list of frame indices
+    """
+    fps = index.get("fps") or 30.0
+    step = max(int(interval_seconds * fps), 1)
+
+    frames = []
+    for rally in index["rallies"]:
+        frames.extend(range(rally["start_frame"], rally["end_frame"] + 1, step))
+
+    if max_frames and len(frames) > max_frames:
+        picks = np.linspace(0, len(frames) - 1, max_frames).round().astype(int)
+        frames = [frames[i] for i in picks]
+
+    return frames
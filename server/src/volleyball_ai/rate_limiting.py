@@ -0,0 +1,114 @@
+"""
+Rate Limiting for Model API Requests
+
+A thread-safe token bucket shared by everything that calls the same API, so
+concurrent analysis requests (see analysis_fanout) stay under the provider's
+requests-per-minute quota instead of failing with rate-limit errors.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+# Requests per minute allowed to Gemini across all threads of this process
+# (0, the default, means no limit; set it to the account's quota)
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get('GEMINI_REQUESTS_PER_MINUTE') or '0')
+
+# Requests that may start at once when limited (e.g. all analyses of one frame)
+GEMINI_REQUEST_BURST = int(os.environ.get('GEMINI_REQUEST_BURST', '5'))
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Tokens are added continuously at `rate` per second up to `capacity`;
+    each request takes one. Up to `capacity` requests can start at once,
+    after which requests are spaced out to the average rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Initialize the token bucket.
+
+        Args:
+            rate: Tokens added per second (0 or less disables limiting)
+            capacity: Maximum burst size (defaults to one second of tokens, at least 1)
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def _refill(self):
+        """Add the tokens accumulated since the last update."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Wait until tokens are available and take them.
+
+        Args:
+            tokens: Number of tokens to take
+            timeout: Maximum seconds to wait (None waits as long as needed)
+
+        Returns:
+            True if the tokens were taken, False on timeout
+        """
+        if self.rate <= 0:
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+
+            time.sleep(wait)
+            with self.lock:
+                self.waited_seconds += wait
+
+    async def acquire_async(self, tokens=1, timeout=None):
+        """
+        Like acquire(), but waits with asyncio.sleep instead of blocking the thread.
+
+        Args:
+            tokens: Number of tokens to take
+            timeout: Maximum seconds to wait (None waits as long as needed)
+
+        Returns:
+            True if the tokens were taken, False on timeout
+        """
+        if self.rate <= 0:
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+
+            await asyncio.sleep(wait)
+            with self.lock:
+                self.waited_seconds += wait
+
+
+# Shared limiter for all Gemini requests in this process
+gemini_rate_limiter = TokenBucket(GEMINI_REQUESTS_PER_MINUTE / 60.0, GEMINI_REQUEST_BURST)
@@ -0,0 +1,476 @@
+"""
+Video Analysis Result Sink
+
+Collects per-frame video analysis results in a results directory instead of
+one CSV per video in the working directory. Every row has the same fields
+(video id, frame index, timestamp, analysis type, text, latency, tokens), so
+the files can be bulk-loaded later with load_results, pandas, DuckDB and so
+on.
+
+Rows are queued by the analysis paths and appended in batches by a background
+thread. Files are CSV, JSON Lines or Parquet (with pyarrow installed) and are
+rotated once they reach RESULTS_MAX_ROWS rows or RESULTS_MAX_BYTES bytes.
+Parquet files are written under a .part name and renamed when they are
+complete; CSV and JSONL files are readable as soon as a batch is written.
+"""
+
+import atexit
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+from .metrics import QUEUE_DEPTH
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Results location and file format (csv, jsonl or parquet)
+DEFAULT_RESULTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'results'
+)
+RESULTS_DIR = os.environ.get('RESULTS_DIR', DEFAULT_RESULTS_DIR)
+RESULTS_FORMAT = os.environ.get('RESULTS_FORMAT', 'csv').lower()
+
+# Batched writes
+RESULTS_BATCH_SIZE = int(os.environ.get('RESULTS_BATCH_SIZE', '200'))
+RESULTS_FLUSH_SECONDS = float(os.environ.get('RESULTS_FLUSH_SECONDS', '2.0'))
+
+# Rotation
+RESULTS_MAX_ROWS = int(os.environ.get('RESULTS_MAX_ROWS', '100000'))
+RESULTS_MAX_BYTES = int(os.environ.get('RESULTS_MAX_BYTES', str(64 * 1024 * 1024)))
+
+RESULT_FIELDS = ("video_id", "frame_idx", "timestamp", "analysis_type", "text", "latency_ms", "tokens")
+RESULT_FORMATS = {"csv": ".csv", "jsonl": ".jsonl", "parquet": ".parquet"}
+FILE_PREFIX = "analysis_results"
+
+if PYARROW_AVAILABLE:
+    PARQUET_SCHEMA = pa.schema([
+        ("video_id", pa.string()),
+        ("frame_idx", pa.int64()),
+        ("timestamp", pa.float64()),
+        ("analysis_type", pa.string()),
+        ("text", pa.string()),
+        ("latency_ms", pa.float64()),
+        ("tokens", pa.int64()),
+    ])
+
+
+def format_timestamp(timestamp, frame_idx=None):
+    """Display form of a frame position ("m:ss", or "Frame N" without a timestamp)."""
+    if timestamp is None:
+        return f"Frame {frame_idx}"
+    return f"{int(timestamp // 60)}:{int(timestamp % 60):02d}"
+
+
+def _typed(row):
+    """Convert a row read back from CSV or JSONL to the schema types."""
+    def number(value, kind):
+        if value is None or value == "":
+            return None
+        return kind(float(value)) if kind is int else kind(value)
+
+    return {
+        "video_id": row.get("video_id"),
+        "frame_idx": number(row.get("frame_idx"), int),
+        "timestamp": number(row.get("timestamp"), float),
+        "analysis_type": row.get("analysis_type"),
+        "text": row.get("text"),
+        "latency_ms": number(row.get("latency_ms"), float),
+        "tokens": number(row.get("tokens"), int),
+    }
+
+
+class VideoResults:
+    """
+    Rows of one video analysis run.
+
+    Used as a context manager around the frame loop. When output_file is
+    given the rows are also written there in the old per-video CSV format
+    (Timestamp, Analysis).
+    """
+
+    def __init__(self, sink, video_id, analysis_type, output_file=None):
+        self.sink = sink
+        self.video_id = video_id
+        self.analysis_type = analysis_type
+        self.output_file = output_file
+        self.rows = 0
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        if self.output_file:
+            self._file = open(self.output_file, 'w', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["Timestamp", "Analysis"])
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write(self, frame_idx, timestamp, text, latency_ms=None, tokens=None):
+        """
+        Queue the result of one frame.
+
+        Args:
+            frame_idx: Frame number in the video (None if unknown)
+            timestamp: Position in the video in seconds (None if unknown)
+            text: Analysis text (or error message)
+            latency_ms: Model request latency
+            tokens: Tokens used by the request, if reported
+        """
+        self.sink.write(self.video_id, frame_idx, timestamp, self.analysis_type, text, latency_ms, tokens)
+        if self._writer is not None:
+            self._writer.writerow([format_timestamp(timestamp, frame_idx), text])
+        self.rows += 1
+
+    @property
+    def path(self):
+        """Per-video CSV if one was requested, otherwise the sink file the rows go to."""
+        return self.output_file or self.sink.path
+
+
+class ResultSink:
+    """
+    Append-only result files with batched background writes.
+
+    write() only queues a row; a writer thread appends queued rows in
+    batches of up to batch_size, at least every flush_seconds, rotating to a
+    new file when the current one is full.
+    """
+
+    def __init__(self, results_dir=None, file_format=None, batch_size=None, flush_seconds=None,
+                 max_rows=None, max_bytes=None):
+        """
+        Create the sink (files are opened on the first write).
+
+        Args:
+            results_dir: Directory for result files (defaults to RESULTS_DIR)
+            file_format: "csv", "jsonl" or "parquet" (defaults to RESULTS_FORMAT)
+            batch_size: Maximum rows per write
+            flush_seconds: Maximum time a queued row waits before being written
+            max_rows: Rotate after this many rows per file
+            max_bytes: Rotate once a file reaches this size
+        """
+        self.results_dir = results_dir or RESULTS_DIR
+        self.file_format = (file_format or RESULTS_FORMAT).lower()
+        self.batch_size = batch_size or RESULTS_BATCH_SIZE
+        self.flush_seconds = flush_seconds or RESULTS_FLUSH_SECONDS
+        self.max_rows = max_rows or RESULTS_MAX_ROWS
+        self.max_bytes = max_bytes or RESULTS_MAX_BYTES
+
+        if self.file_format not in RESULT_FORMATS:
+            raise ValueError(f"Unsupported results format: {self.file_format}")
+        if self.file_format == "parquet" and not PYARROW_AVAILABLE:
+            raise ValueError("pyarrow is required for the parquet results format")
+
+        os.makedirs(self.results_dir, exist_ok=True)
+
+        self.pending = queue.Queue()
+        self.writer = None
+        self.writer_lock = threading.Lock()
+        self.file_lock = threading.Lock()
+        self.sequence = 0
+        self.rows_written = 0
+        self.files_written = 0
+
+        self._file = None
+        self._parquet = None
+        self._file_rows = 0
+        self.path = self._next_path()
+
+    # Files
+
+    def _next_path(self):
+        """Name of the next result file (unique per process and rotation)."""
+        self.sequence += 1
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        name = f"{FILE_PREFIX}-{stamp}-{os.getpid()}-{self.sequence:04d}{RESULT_FORMATS[self.file_format]}"
+        return os.path.join(self.results_dir, name)
+
+    def _open(self):
+        if self.file_format == "parquet":
+            self._parquet = pq.ParquetWriter(self.path + ".part", PARQUET_SCHEMA)
+        else:
+            self._file = open(self.path, 'a', newline='', encoding='utf-8')
+            if self.file_format == "csv" and self._file.tell() == 0:
+                csv.writer(self._file).writerow(RESULT_FIELDS)
+        self._file_rows = 0
+
+    def _size(self):
+        if self.file_format == "parquet":
+            return os.path.getsize(self.path + ".part")
+        return self._file.tell()
+
+    def _close_file(self):
+        """Close the current file and pick the name of the next one (caller holds file_lock)."""
+        if self._file is None and self._parquet is None:
+            return
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+            os.replace(self.path + ".part", self.path)
+        else:
+            self._file.close()
+            self._file = None
+        self.files_written += 1
+        self.path = self._next_path()
+
+    def _write_batch(self, batch):
+        with self.file_lock, span("write", sink="results", format=self.file_format, rows=len(batch)):
+            if self._file is None and self._parquet is None:
+                self._open()
+
+            if self.file_format == "parquet":
+                columns = list(zip(*batch))
+                self._parquet.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, PARQUET_SCHEMA)],
+                    schema=PARQUET_SCHEMA,
+                ))
+            elif self.file_format == "jsonl":
+                self._file.write("".join(
+                    json.dumps(dict(zip(RESULT_FIELDS, row)), ensure_ascii=False) + "\n" for row in batch
+                ))
+                self._file.flush()
+            else:
+                csv.writer(self._file).writerows(batch)
+                self._file.flush()
+
+            self._file_rows += len(batch)
+            self.rows_written += len(batch)
+
+            if self._file_rows >= self.max_rows or self._size() >= self.max_bytes:
+                self._close_file()
+
+    # Writing
+
+    def _ensure_writer(self):
+        if self.writer is None or not self.writer.is_alive():
+            with self.writer_lock:
+                if self.writer is None or not self.writer.is_alive():
+                    self.writer = threading.Thread(target=self._write_loop, name="result-sink", daemon=True)
+                    self.writer.start()
+
+    def write(self, video_id, frame_idx, timestamp, analysis_type, text, latency_ms=None, tokens=None):
+        """
+        Queue one result row.
+
+        Args:
+            video_id: Video the frame belongs to
+            frame_idx: Frame number in the video (None if unknown)
+            timestamp: Position in the video in seconds (None if unknown)
+            analysis_type: technique, positioning, tactics, ...
+            text: Analysis text
+            latency_ms: Model request latency
+            tokens: Tokens used by the request
+        """
+        self.pending.put((
+            str(video_id),
+            None if frame_idx is None else int(frame_idx),
+            None if timestamp is None else round(float(timestamp), 3),
+            analysis_type,
+            None if text is None else str(text),
+            None if latency_ms is None else float(latency_ms),
+            None if tokens is None else int(tokens),
+        ))
+        self._ensure_writer()
+
+    def video(self, video_id, analysis_type, output_file=None):
+        """Start collecting the rows of one video analysis run (see VideoResults)."""
+        return VideoResults(self, video_id, analysis_type, output_file)
+
+    def _write_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error("Error writing analysis results (%s rows): %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+
+    def flush(self):
+        """Wait until all queued rows have been written."""
+        if self.writer is not None:
+            self.pending.join()
+
+    def close(self):
+        """Write queued rows and close the current file."""
+        self.flush()
+        with self.file_lock:
+            self._close_file()
+
+    def stats(self):
+        """Counters for health endpoints."""
+        return {
+            "results_dir": self.results_dir,
+            "format": self.file_format,
+            "current_file": self.path,
+            "rows_written": self.rows_written,
+            "files_written": self.files_written,
+            "queued": self.pending.qsize(),
+        }
+
+    # Reading
+
+    def files(self):
+        """Completed and in-progress result files of this sink's format, oldest first."""
+        return result_files(self.results_dir, self.file_format)
+
+
+def result_files(results_dir=None, file_format=None):
+    """
+    List result files in a results directory, oldest first.
+
+    Args:
+        results_dir: Directory to look in (defaults to RESULTS_DIR)
+        file_format: Only files of this format (all formats if None)
+
+    Returns:
+        List of file paths (Parquet files still being written are skipped)
+    """
+    results_dir = results_dir or RESULTS_DIR
+    if not os.path.isdir(results_dir):
+        return []
+    extensions = tuple(RESULT_FORMATS[file_format] for file_format in ([file_format] if file_format else RESULT_FORMATS))
+    return sorted(
+        os.path.join(results_dir, name) for name in os.listdir(results_dir)
+        if name.startswith(FILE_PREFIX) and name.endswith(extensions)
+    )
+
+
+def _iter_file(path, video_id=None, analysis_type=None):
+    """Matching rows of one result file."""
+    if path.endswith(".parquet"):
+        if not PYARROW_AVAILABLE:
+            logger.warning("Skipping %s: pyarrow is not installed", path)
+            return
+        filters = []
+        if video_id is not None:
+            filters.append(("video_id", "=", str(video_id)))
+        if analysis_type is not None:
+            filters.append(("analysis_type", "=", analysis_type))
+        yield from pq.read_table(path, filters=filters or None).to_pylist()
+        return
+
+    with open(path, newline='', encoding='utf-8') as file:
+        rows = csv.DictReader(file) if path.endswith(".csv") else (json.loads(line) for line in file if line.strip())
+        for row in rows:
+            row = _typed(row)
+            if video_id is not None and row["video_id"] != str(video_id):
+                continue
+            if analysis_type is not None and row["analysis_type"] != analysis_type:
+                continue
+            yield row
+
+
+def iter_results(results_dir=None, video_id=None, analysis_type=None, file_format=None):
+    """
+    Read result rows back from a results directory.
+
+    Args:
+        results_dir: Directory to read (defaults to RESULTS_DIR)
+        video_id: Only rows of this video
+        analysis_type: Only rows of this analysis type
+        file_format: Only files of this format
+
+    Returns:
+        Generator of row dictionaries with the RESULT_FIELDS keys
+    """
+    for path in result_files(results_dir, file_format):
+        yield from _iter_file(path, video_id, analysis_type)
+
+
+def load_results(results_dir=None, video_id=None, analysis_type=None, file_format=None):
+    """Read result rows into a list (see iter_results)."""
+    return list(iter_results(results_dir, video_id, analysis_type, file_format))
+
+
+def latest_results(limit, results_dir=None, video_id=None, analysis_type=None, file_format=None):
+    """
+    Read the last `limit` matching rows, oldest first.
+
+    Files are read newest first and reading stops once enough rows were
+    found, so the cost depends on `limit` rather than on how many results
+    have accumulated.
+
+    Args:
+        limit: Maximum number of rows
+        results_dir: Directory to read (defaults to RESULTS_DIR)
+        video_id: Only rows of this video
+        analysis_type: Only rows of this analysis type
+        file_format: Only files of this format
+
+    Returns:
+        List of row dictionaries with the RESULT_FIELDS keys
+    """
+    rows = []
+    for path in reversed(result_files(results_dir, file_format)):
+        if len(rows) >= limit:
+            break
+        newest = deque(_iter_file(path, video_id, analysis_type), maxlen=limit - len(rows))
+        rows[:0] = newest
+    return rows
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_result_sink():
+    """Get the shared result sink for this process."""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = ResultSink()
+    return _sink
+
+
+def _close_at_exit():
+    if _sink is not None:
+        try:
+            _sink.close()
+        except Exception as e:
+            logger.error("Error closing analysis results: %s", e)
+
+
+def _reset_after_fork():
+    global _sink, _sink_lock
+    _sink = None
+    _sink_lock = threading.Lock()
+
+
+atexit.register(_close_at_exit)
+
+# Rows waiting for the writer thread (without creating the sink)
+QUEUE_DEPTH.set_function(lambda: _sink.pending.qsize() if _sink is not None else 0, queue="result_sink")
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,372 @@
+"""
+Structured Logging
+
+Log records are written as JSON lines (or plain text with LOG_FORMAT=text)
+by a background thread: the request thread only puts the record on a queue,
+so formatting and stdout writes never add latency to a request. Records
+carry the request-scoped context bound with bind_context() (request ID,
+route, trace ID) and can be filtered per module with LOG_LEVELS.
+
+Per-frame events go through sampled() loggers, which keep every Nth call
+and at most a number of calls per second for each message, recording how
+many events a written record stands for.
+
+Settings (environment):
+    LOG_LEVEL          Root level (default INFO)
+    LOG_LEVELS         Per-module levels, e.g. "volleyball_ai.video_decoder=DEBUG,werkzeug=WARNING"
+    LOG_FORMAT         "json" (default) or "text"
+    LOG_QUEUE_SIZE     Records buffered for the writer thread (default 10000)
+    LOG_SAMPLE_EVERY   Keep every Nth per-frame event (default 50)
+    LOG_SAMPLE_PER_SECOND  Maximum per-frame events per second, message and thread (default 2)
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_SAMPLE_EVERY = int(os.environ.get('LOG_SAMPLE_EVERY', '50'))
+LOG_SAMPLE_PER_SECOND = float(os.environ.get('LOG_SAMPLE_PER_SECOND', '2'))
+
+# Attributes of every LogRecord; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context"}
+
+_log_context = contextvars.ContextVar('volleyball_ai_log_context', default=None)
+
+
+# Request-scoped context
+
+def bind_context(**fields):
+    """
+    Add fields to the log context of the current request or task.
+
+    Returns:
+        Token for clear_context()
+    """
+    context = dict(_log_context.get() or {})
+    context.update(fields)
+    return _log_context.set(context)
+
+
+def clear_context(token=None):
+    """Restore the context from before bind_context() (or drop it entirely)."""
+    if token is not None:
+        try:
+            _log_context.reset(token)
+            return
+        except ValueError:
+            pass
+    _log_context.set(None)
+
+
+@contextmanager
+def log_context(**fields):
+    """Bind fields to the log context for the duration of a block."""
+    token = bind_context(**fields)
+    try:
+        yield
+    finally:
+        clear_context(token)
+
+
+def current_context():
+    """Fields bound to the log context of the caller."""
+    return dict(_log_context.get() or {})
+
+
+# Formatting
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        context = getattr(record, "context", None)
+        if context:
+            entry.update(context)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text with the context and extra fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = dict(getattr(record, "context", None) or {})
+        fields.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_")
+        )
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+# Queue handler
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without formatting them.
+
+    The record keeps its message arguments (formatting happens in the writer
+    thread) and gets the caller's log context attached. When the queue is
+    full, records are dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.context = _log_context.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    """Writer thread; stopping it waits for room in a full queue."""
+
+    def enqueue_sentinel(self):
+        # put_nowait would fail on a full queue and leave the thread running
+        self.queue.put(self._sentinel)
+
+
+class _Logging:
+    """Handler and writer thread installed by configure_logging()."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handler = None
+        self.listener = None
+        self.output = None
+        self.formatter = None
+
+
+_state = _Logging()
+
+
+def _parse_levels(levels):
+    parsed = {}
+    for item in (levels or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def configure_logging(level=None, levels=None, log_format=None, stream=None, force=False):
+    """
+    Install the queue handler on the root logger (once per process).
+
+    Args:
+        level: Root level (defaults to LOG_LEVEL)
+        levels: Dictionary or "name=LEVEL,..." string of per-module levels
+            (defaults to LOG_LEVELS)
+        log_format: "json" or "text" (defaults to LOG_FORMAT)
+        stream: Output stream (defaults to stdout)
+        force: Replace an existing configuration
+
+    Returns:
+        The root logger
+    """
+    root = logging.getLogger()
+    with _state.lock:
+        if _state.handler is not None and not force:
+            return root
+        _stop_listener()
+
+        _state.formatter = TextFormatter() if (log_format or LOG_FORMAT) == "text" else JsonFormatter()
+        _state.output = logging.StreamHandler(stream or sys.stdout)
+        _state.output.setFormatter(_state.formatter)
+
+        if _state.handler is not None:
+            root.removeHandler(_state.handler)
+        _state.handler = ContextQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        root.addHandler(_state.handler)
+        # Neither formatter writes the source file, line or function, so skip
+        # the caller lookup (a stack walk per record on the request thread)
+        logging._srcfile = None
+        root.setLevel(level or LOG_LEVEL)
+
+        levels = LOG_LEVELS if levels is None else levels
+        if isinstance(levels, str):
+            levels = _parse_levels(levels)
+        for name, module_level in levels.items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _start_listener()
+    return root
+
+
+def _start_listener():
+    _state.listener = _Listener(_state.handler.queue, _state.output, respect_handler_level=True)
+    _state.listener.start()
+
+
+def _stop_listener():
+    if _state.listener is not None:
+        try:
+            _state.listener.stop()
+        except Exception:
+            pass
+        _state.listener = None
+
+
+def flush_logs():
+    """Write all queued records (e.g. before the process exits)."""
+    with _state.lock:
+        if _state.listener is not None:
+            _stop_listener()
+            _start_listener()
+
+
+def logging_stats():
+    """Queue usage of the logging handler."""
+    handler = _state.handler
+    if handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "queued": handler.queue.qsize(),
+        "dropped": handler.dropped,
+        "format": "text" if isinstance(_state.formatter, TextFormatter) else "json",
+    }
+
+
+def _reset_after_fork():
+    # The writer thread does not survive a fork
+    _state.lock = threading.Lock()
+    if _state.handler is not None:
+        _state.handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        _start_listener()
+
+
+atexit.register(lambda: _stop_listener())
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# Sampling
+
+class SampledLogger:
+    """
+    Logger wrapper for high-volume events.
+
+    Each message (keyed by its format string, so pass values as arguments
+    rather than formatting them into the message) is written for the first
+    call, then for every Nth call, and never more than per_second times per
+    second. Written records get a sample_weight field with the number of
+    calls they stand for. Counters are kept per thread, so a skipped call
+    costs a level check and a counter increment (no lock, no clock read).
+    """
+
+    # Forget a thread's counters when it has seen this many different messages
+    MAX_KEYS = 1000
+
+    def __init__(self, logger, every=None, per_second=None):
+        self.logger = logger
+        self.every = max(int(every or LOG_SAMPLE_EVERY), 1)
+        self.per_second = per_second if per_second is not None else LOG_SAMPLE_PER_SECOND
+        self.local = threading.local()
+
+    def _admit(self, key):
+        """Return the number of calls a record for key stands for, or 0 to skip it."""
+        try:
+            counts = self.local.counts
+        except AttributeError:
+            counts = self.local.counts = {}
+        # [calls, skipped since the last record, window start, records in window]
+        state = counts.get(key)
+        if state is None:
+            if len(counts) >= self.MAX_KEYS:
+                counts.clear()
+            state = counts[key] = [0, 0, 0.0, 0]
+        state[0] += 1
+        if state[0] != 1 and state[0] % self.every:
+            state[1] += 1
+            return 0
+        if self.per_second:
+            now = time.monotonic()
+            if now - state[2] >= 1.0:
+                state[2], state[3] = now, 0
+            if state[3] >= self.per_second:
+                state[1] += 1
+                return 0
+            state[3] += 1
+        weight, state[1] = state[1] + 1, 0
+        return weight
+
+    def _log(self, level, msg, args, kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        weight = self._admit(msg)
+        if weight:
+            extra = dict(kwargs.pop("extra", None) or {})
+            extra["sample_weight"] = weight
+            self.logger.log(level, msg, *args, extra=extra, **kwargs)
+
+    def log(self, level, msg, *args, **kwargs):
+        self._log(level, msg, args, kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self._log(logging.DEBUG, msg, args, kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self._log(logging.INFO, msg, args, kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self._log(logging.WARNING, msg, args, kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self._log(logging.ERROR, msg, args, kwargs)
+
+
+def sampled(logger, every=None, per_second=None):
+    """
+    Wrap a logger (or logger name) for per-frame events (see SampledLogger).
+
+    Args:
+        logger: Logger or logger name
+        every: Keep every Nth call per message (defaults to LOG_SAMPLE_EVERY)
+        per_second: Maximum records per second per message and thread
+            (defaults to LOG_SAMPLE_PER_SECOND; 0 for no limit)
+
+    Returns:
+        SampledLogger
+    """
+    if isinstance(logger, str):
+        logger = logging.getLogger(logger)
+    return SampledLogger(logger, every, per_second)
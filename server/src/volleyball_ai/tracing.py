@@ -0,0 +1,414 @@
+"""
+Lightweight Tracing
+
+Spans time the stages of the analysis path (upload, decode, seek, encode,
+remote call, parse, write) and carry attributes such as the frame index,
+byte counts and model. Spans nest through a context variable, so a stage
+started inside a request becomes part of that request's trace; executors
+that should keep the trace submit work through context_wrap().
+
+Finished spans go to an in-process ring buffer (TRACE_BUFFER_SIZE spans)
+and into per-stage latency histograms. export_otlp() returns spans in the
+OpenTelemetry OTLP/JSON format, latency_summary() the p50/p95/p99 per stage
+and trace_summaries() the time each recent request spent per stage.
+"""
+
+import bisect
+import contextvars
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Tracing can be switched off entirely (spans become no-ops)
+TRACING_ENABLED = os.environ.get('TRACING', '1').lower() not in ('0', 'false', 'no')
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', '10000'))
+TRACE_SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'volleyball-ai')
+
+# Histogram bucket bounds in milliseconds: 0.01 ms to ~10 min, 10% apart
+HISTOGRAM_BOUNDS_MS = [0.01 * 1.1 ** i for i in range(int(math.log(600000 / 0.01, 1.1)) + 2)]
+
+# OTLP span status codes
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+_current_span = contextvars.ContextVar('volleyball_ai_current_span', default=None)
+
+
+def _new_id(num_bytes):
+    return os.urandom(num_bytes).hex()
+
+
+class Span:
+    """One timed operation."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes",
+                 "status", "status_message", "_start_perf", "_token")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = STATUS_UNSET
+        self.status_message = None
+        self._start_perf = time.perf_counter()
+        self._token = None
+
+    @property
+    def duration_ms(self):
+        if self.end_ns is None:
+            return (time.perf_counter() - self._start_perf) * 1000
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        """Mark the span as failed."""
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": dict(self.attributes),
+            "status": {STATUS_UNSET: "unset", STATUS_OK: "ok", STATUS_ERROR: "error"}[self.status],
+            "status_message": self.status_message,
+        }
+
+    def to_otlp(self):
+        """The span as an OTLP/JSON span object."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """Returned by disabled tracers; accepts and ignores everything."""
+
+    name = None
+    trace_id = None
+    span_id = None
+    duration_ms = 0.0
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (10% resolution) with percentile estimates."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.errors = 0
+
+    def record(self, duration_ms, error=False):
+        index = bisect.bisect_left(HISTOGRAM_BOUNDS_MS, duration_ms)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += duration_ms
+            if duration_ms > self.max_ms:
+                self.max_ms = duration_ms
+            if error:
+                self.errors += 1
+
+    def percentile(self, fraction, counts=None, count=None):
+        """Upper bound of the bucket holding the given fraction of samples."""
+        counts = counts or self.counts
+        count = count if count is not None else self.count
+        if not count:
+            return None
+        rank = max(1, math.ceil(fraction * count))
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                if index < len(HISTOGRAM_BOUNDS_MS):
+                    return min(HISTOGRAM_BOUNDS_MS[index], self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+    def summary(self):
+        with self.lock:
+            counts = list(self.counts)
+            count, total_ms, max_ms, errors = self.count, self.total_ms, self.max_ms, self.errors
+        if not count:
+            return {"count": 0}
+
+        def rounded(value):
+            return round(value, 3) if value is not None else None
+
+        return {
+            "count": count,
+            "errors": errors,
+            "mean_ms": rounded(total_ms / count),
+            "p50_ms": rounded(self.percentile(0.50, counts, count)),
+            "p95_ms": rounded(self.percentile(0.95, counts, count)),
+            "p99_ms": rounded(self.percentile(0.99, counts, count)),
+            "max_ms": rounded(max_ms),
+        }
+
+
+class Tracer:
+    """Creates spans and keeps finished ones in a ring buffer and histograms."""
+
+    def __init__(self, service_name=None, buffer_size=None, enabled=None):
+        self.service_name = service_name or TRACE_SERVICE_NAME
+        self.enabled = TRACING_ENABLED if enabled is None else enabled
+        self.spans = deque(maxlen=buffer_size or TRACE_BUFFER_SIZE)
+        self.histograms = {}
+        self.histograms_lock = threading.Lock()
+        self.started_at = time.time()
+
+    # Spans
+
+    def start_span(self, name, attributes=None, parent=None, activate=True):
+        """
+        Start a span (prefer the span() context manager).
+
+        Args:
+            name: Stage name (upload, decode, seek, encode, remote_call, parse, write, ...)
+            attributes: Initial attributes
+            parent: Parent span (defaults to the current span)
+            activate: Make the span the current span until end_span()
+
+        Returns:
+            Span
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        span = Span(name, parent if parent is not None else _current_span.get(), attributes)
+        if activate:
+            span._token = _current_span.set(span)
+        return span
+
+    def end_span(self, span, error=None):
+        """Finish a span started with start_span()."""
+        if span is NOOP_SPAN or span.end_ns is not None:
+            return
+        span.end_ns = span.start_ns + int((time.perf_counter() - span._start_perf) * 1e9)
+        if error is not None:
+            span.record_error(error)
+        elif span.status == STATUS_UNSET:
+            span.status = STATUS_OK
+
+        if span._token is not None:
+            try:
+                _current_span.reset(span._token)
+            except ValueError:
+                # Ended in a different context than it was started in
+                _current_span.set(None)
+            span._token = None
+
+        self.spans.append(span)
+        self._histogram(span.name).record(span.duration_ms, span.status == STATUS_ERROR)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Time a block as a span.
+
+        Example:
+            with tracer.span("remote_call", model="gemini-1.5-flash") as span:
+                response = model.generate_content(...)
+                span.set_attribute("bytes_received", len(response.text))
+        """
+        span = self.start_span(name, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span)
+
+    def traced(self, name=None, **attributes):
+        """Decorator running a function inside a span (named after the function by default)."""
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, **attributes):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.histograms_lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    # Reading
+
+    def recent_spans(self, limit=None, trace_id=None, name=None):
+        """Finished spans from the ring buffer, oldest first."""
+        spans = list(self.spans)
+        if trace_id:
+            spans = [span for span in spans if span.trace_id == trace_id]
+        if name:
+            spans = [span for span in spans if span.name == name]
+        return spans[-limit:] if limit else spans
+
+    def export_otlp(self, spans=None):
+        """
+        Spans as an OTLP/JSON ExportTraceServiceRequest.
+
+        Args:
+            spans: Spans to export (defaults to the whole ring buffer)
+
+        Returns:
+            Dictionary that can be POSTed to an OTLP/HTTP collector's /v1/traces
+        """
+        spans = self.recent_spans() if spans is None else spans
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "volleyball_ai.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    def latency_summary(self):
+        """p50/p95/p99 latency per span name."""
+        with self.histograms_lock:
+            histograms = dict(self.histograms)
+        return {name: histogram.summary() for name, histogram in sorted(histograms.items())}
+
+    def trace_summaries(self, limit=20, min_duration_ms=0.0):
+        """
+        Recent root spans with the time their trace spent in each stage.
+
+        Args:
+            limit: Maximum number of traces
+            min_duration_ms: Only traces whose root span took at least this long
+
+        Returns:
+            List of dictionaries, newest first
+        """
+        spans = self.recent_spans()
+        by_trace = {}
+        for span in spans:
+            by_trace.setdefault(span.trace_id, []).append(span)
+
+        summaries = []
+        for span in reversed(spans):
+            if span.parent_id is not None or span.duration_ms < min_duration_ms:
+                continue
+            stages = {}
+            for child in by_trace[span.trace_id]:
+                if child is span:
+                    continue
+                stage = stages.setdefault(child.name, {"count": 0, "total_ms": 0.0})
+                stage["count"] += 1
+                stage["total_ms"] += child.duration_ms
+            for stage in stages.values():
+                stage["total_ms"] = round(stage["total_ms"], 3)
+            summaries.append(dict(span.to_dict(), stages=stages))
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def reset(self):
+        """Drop buffered spans and histograms."""
+        self.spans.clear()
+        with self.histograms_lock:
+            self.histograms = {}
+
+
+tracer = Tracer()
+
+
+def span(name, **attributes):
+    """Time a block as a span of the shared tracer (see Tracer.span)."""
+    return tracer.span(name, **attributes)
+
+
+def traced(name=None, **attributes):
+    """Decorator running a function inside a span of the shared tracer."""
+    return tracer.traced(name, **attributes)
+
+
+def current_span():
+    """The active span, or a no-op span outside any trace."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def context_wrap(func):
+    """Bind func to the caller's trace context, for running it on another thread."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return wrapper
+
+
+def tracing_stats():
+    """Latency histograms and buffer usage for the metrics endpoint."""
+    return {
+        "enabled": tracer.enabled,
+        "service": tracer.service_name,
+        "buffered_spans": len(tracer.spans),
+        "buffer_size": tracer.spans.maxlen,
+        "stages": tracer.latency_summary(),
+    }
@@ -0,0 +1,431 @@
+"""
+FFmpeg Pipe Decoder for Sampled Frame Extraction
+
+This module provides an alternative to OpenCV's VideoCapture backends for
+videos they struggle with (e.g. iPhone HEVC MOV files). A single ffmpeg
+process selects and scales the sampled frames and streams them as raw video
+over a pipe, where they are read straight into preallocated NumPy buffers.
+Frame timestamps come from ffmpeg's showinfo filter; frame numbers are
+counted by the reader, so they match OpenCV's frame indices even on
+variable frame rate footage.
+
+It also provides iter_sampled_frames, a streaming frame source with bounded
+lookahead, and should_use_ffmpeg, which every frame source uses to pick
+between OpenCV and the ffmpeg pipe.
+"""
+
+import logging
+import os
+import re
+import queue
+import shutil
+import subprocess
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+from .metrics import FRAMES_DECODED
+from .tracing import context_wrap, span
+
+logger = logging.getLogger(__name__)
+
+# Path or name of the ffmpeg binary, overridable for custom builds
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+# Frame decoder: "auto" (OpenCV, with ffmpeg for MOV files and as a fallback),
+# "opencv" or "ffmpeg"
+VIDEO_DECODER = os.environ.get('VIDEO_DECODER', 'auto')
+
+# Bytes per pixel for the raw output formats we support
+PIXEL_FORMATS = {
+    'bgr24': 3,
+    'rgb24': 3,
+    'gray': 1,
+}
+
+_SHOWINFO_PATTERN = re.compile(r"\bn:\s*(\d+)\s.*?\bpts_time:\s*(\S+).*?\bs:(\d+)x(\d+)")
+_DURATION_PATTERN = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_VIDEO_STREAM_PATTERN = re.compile(r"Stream #.*?Video:.*?(\d{2,5})x(\d{2,5})")
+_FPS_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*fps")
+
+
+def ffmpeg_available():
+    """
+    Check whether the ffmpeg binary can be found.
+
+    Returns:
+        True if ffmpeg is on the PATH (or FFMPEG_BINARY points to it)
+    """
+    return shutil.which(FFMPEG_BINARY) is not None
+
+
+def should_use_ffmpeg(video_path, decoder=None):
+    """
+    Decide whether a video should be decoded with the ffmpeg pipe decoder.
+
+    Args:
+        video_path: Path to the video file
+        decoder: "auto", "opencv" or "ffmpeg" (defaults to VIDEO_DECODER)
+
+    Returns:
+        True to decode with ffmpeg up front, False to start with OpenCV
+    """
+    decoder = decoder or VIDEO_DECODER
+    if decoder == 'ffmpeg':
+        if not ffmpeg_available():
+            raise ValueError("ffmpeg decoder requested but ffmpeg is not installed")
+        return True
+    if decoder == 'auto':
+        # OpenCV's backends are unreliable with (iPhone HEVC) MOV files
+        return os.path.splitext(video_path)[1].lower() == '.mov' and ffmpeg_available()
+    return False
+
+
+def probe_video(video_path):
+    """
+    Read basic video properties from ffmpeg's stream summary.
+
+    Args:
+        video_path: Path to the video file
+
+    Returns:
+        Dictionary with width, height, fps, duration and frame_count
+        (values are None when ffmpeg does not report them)
+    """
+    result = subprocess.run(
+        [FFMPEG_BINARY, '-hide_banner', '-nostdin', '-i', video_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    output = result.stderr.decode('utf-8', errors='replace')
+
+    info = {"width": None, "height": None, "fps": None, "duration": None, "frame_count": None}
+
+    duration_match = _DURATION_PATTERN.search(output)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    for line in output.splitlines():
+        stream_match = _VIDEO_STREAM_PATTERN.search(line)
+        if not stream_match:
+            continue
+        info["width"], info["height"] = int(stream_match.group(1)), int(stream_match.group(2))
+        fps_match = _FPS_PATTERN.search(line)
+        if fps_match:
+            info["fps"] = float(fps_match.group(1))
+        break
+
+    if info["width"] is None:
+        raise ValueError(f"Could not find a video stream in: {video_path}")
+
+    if info["fps"] and info["duration"]:
+        info["frame_count"] = int(info["duration"] * info["fps"])
+
+    return info
+
+
+class FFmpegFrameReader:
+    """
+    Decode sampled frames from a video through a single ffmpeg pipe.
+
+    Iterating the reader yields (timestamp_seconds, frame) tuples, and
+    frame_number holds the index of the last yielded frame in the video.
+    Frames are
+    read directly into preallocated buffers; with num_buffers > 0 the buffers
+    are reused round-robin, so a yielded frame is only valid until that many
+    further frames have been read. Use num_buffers=0 to get a fresh array per
+    frame (still filled in place, without an extra copy).
+
+    Timestamps are the frames' pts, which are not evenly spaced in variable
+    frame rate video, so frame numbers are counted from the selection
+    instead (None with interval_seconds, which selects by time).
+    """
+
+    def __init__(self, video_path, interval_seconds=None, every_n_frames=None,
+                 frame_indices=None, width=None, height=None, max_frames=None,
+                 pix_fmt='bgr24', num_buffers=2):
+        """
+        Initialize the frame reader.
+
+        Args:
+            video_path: Path to the video file
+            interval_seconds: Select one frame every this many seconds
+            every_n_frames: Select every Nth decoded frame
+            frame_indices: Explicit list of frame numbers to select
+            width: Output width (-2 keeps aspect ratio when height is set)
+            height: Output height (-2 keeps aspect ratio when width is set)
+            max_frames: Stop after this many frames
+            pix_fmt: Raw output pixel format ('bgr24', 'rgb24' or 'gray')
+            num_buffers: Number of reusable output buffers (0 allocates per frame)
+        """
+        if pix_fmt not in PIXEL_FORMATS:
+            raise ValueError(f"Unsupported pixel format: {pix_fmt}")
+
+        self.video_path = video_path
+        self.interval_seconds = interval_seconds
+        self.every_n_frames = every_n_frames
+        self.frame_indices = sorted(set(frame_indices)) if frame_indices else None
+        self.width = width
+        self.height = height
+        self.max_frames = max_frames
+        self.pix_fmt = pix_fmt
+        self.num_buffers = num_buffers
+
+        self.frames_read = 0
+        self.frame_number = None
+        self._process = None
+        self._stderr_thread = None
+        self._frame_info = queue.Queue()
+        self._stderr_tail = deque(maxlen=20)
+        self._buffers = []
+
+    def _build_filters(self):
+        """Build the ffmpeg video filter chain."""
+        filters = []
+
+        if self.frame_indices:
+            expression = '+'.join(f"eq(n\\,{index})" for index in self.frame_indices)
+            filters.append(f"select='{expression}'")
+        elif self.every_n_frames and self.every_n_frames > 1:
+            filters.append(f"select='not(mod(n\\,{int(self.every_n_frames)}))'")
+        elif self.interval_seconds and self.interval_seconds > 0:
+            filters.append(
+                f"select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{float(self.interval_seconds)})'"
+            )
+
+        if self.width or self.height:
+            filters.append(f"scale={self.width or -2}:{self.height or -2}")
+
+        # showinfo must be last so it reports the final size of each frame
+        filters.append('showinfo')
+        return ','.join(filters)
+
+    def _build_command(self):
+        """Build the full ffmpeg command line."""
+        return [
+            FFMPEG_BINARY,
+            '-hide_banner',
+            '-nostdin',
+            '-loglevel', 'info',
+            '-i', self.video_path,
+            '-an', '-sn',
+            '-vf', self._build_filters(),
+            '-vsync', 'passthrough',
+            '-f', 'rawvideo',
+            '-pix_fmt', self.pix_fmt,
+            'pipe:1',
+        ]
+
+    def _read_stderr(self):
+        """Collect frame timestamps and sizes reported by showinfo."""
+        for raw_line in iter(self._process.stderr.readline, b''):
+            line = raw_line.decode('utf-8', errors='replace').rstrip()
+            match = _SHOWINFO_PATTERN.search(line)
+            if match:
+                try:
+                    timestamp = float(match.group(2))
+                except ValueError:
+                    timestamp = None  # NOPTS frames still carry image data
+                self._frame_info.put((timestamp, int(match.group(3)), int(match.group(4))))
+            elif line and 'side data' not in line:
+                self._stderr_tail.append(line)
+        self._frame_info.put(None)
+
+    def _start(self):
+        """Launch the ffmpeg process and the stderr reader thread."""
+        if not os.path.exists(self.video_path):
+            raise FileNotFoundError(f"Video file not found: {self.video_path}")
+
+        self._process = subprocess.Popen(
+            self._build_command(),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self._stderr_thread = threading.Thread(target=self._read_stderr)
+        self._stderr_thread.daemon = True
+        self._stderr_thread.start()
+
+    def _source_frame_number(self, output_index):
+        """Index in the video of the output_index-th selected frame."""
+        if self.frame_indices:
+            return self.frame_indices[output_index]
+        if self.every_n_frames and self.every_n_frames > 1:
+            return output_index * int(self.every_n_frames)
+        if self.interval_seconds and self.interval_seconds > 0:
+            return None
+        return output_index
+
+    def _next_buffer(self, width, height):
+        """Return the output buffer to decode the next frame into."""
+        channels = PIXEL_FORMATS[self.pix_fmt]
+        shape = (height, width, channels) if channels > 1 else (height, width)
+
+        if self.num_buffers <= 0:
+            return np.empty(shape, dtype=np.uint8)
+
+        if not self._buffers or self._buffers[0].shape != shape:
+            self._buffers = [np.empty(shape, dtype=np.uint8) for _ in range(self.num_buffers)]
+
+        return self._buffers[self.frames_read % self.num_buffers]
+
+    def _read_into(self, frame):
+        """Fill a frame buffer from the pipe. Returns False on a short read."""
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < len(view):
+            count = self._process.stdout.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    def __iter__(self):
+        self._start()
+        frames_decoded = FRAMES_DECODED.labels(decoder="ffmpeg")
+        try:
+            while self.max_frames is None or self.frames_read < self.max_frames:
+                info = self._frame_info.get()
+                if info is None:
+                    break
+
+                timestamp, width, height = info
+                frame = self._next_buffer(width, height)
+                with span("decode", decoder="ffmpeg", frame_idx=self.frames_read, bytes=frame.nbytes):
+                    if not self._read_into(frame):
+                        break
+
+                self.frame_number = self._source_frame_number(self.frames_read)
+                self.frames_read += 1
+                frames_decoded.inc()
+                yield timestamp, frame
+        finally:
+            self.close()
+
+        if self.frames_read == 0 and self._process.returncode not in (0, None):
+            details = ' | '.join(self._stderr_tail)
+            raise ValueError(f"ffmpeg could not decode video file: {self.video_path}. {details}")
+
+    def close(self):
+        """Stop the ffmpeg process and release the pipes."""
+        if self._process is None:
+            return
+
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.stdout.close()
+        self._process.wait()
+        if self._stderr_thread is not None:
+            self._stderr_thread.join(timeout=1.0)
+        self._process.stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_sampled_frames(video_path, sample_rate=15, decoder=None, lookahead=4):
+    """
+    Stream every Nth frame of a video as RGB.
+
+    With OpenCV, frames are decoded in a background thread at most
+    `lookahead` frames ahead of the consumer, so memory stays bounded
+    regardless of video length; skipped frames are only grabbed, never
+    converted. With ffmpeg, the frames are selected inside ffmpeg. The
+    decoder is chosen by should_use_ffmpeg, like extract_frames_from_video.
+
+    Args:
+        video_path: Path to the video file
+        sample_rate: Yield every Nth frame
+        decoder: "auto" (ffmpeg for MOV files, otherwise OpenCV with ffmpeg as
+            a fallback), "opencv" or "ffmpeg" (defaults to VIDEO_DECODER)
+        lookahead: Maximum number of decoded frames waiting to be consumed
+
+    Yields:
+        Frames as numpy arrays (RGB)
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video file not found: {video_path}")
+
+    decoder = decoder or VIDEO_DECODER
+    if should_use_ffmpeg(video_path, decoder):
+        yield from _iter_ffmpeg_frames(video_path, sample_rate)
+        return
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        if decoder == "auto" and ffmpeg_available():
+            logger.warning("OpenCV could not open %s, falling back to the ffmpeg decoder", video_path)
+            yield from _iter_ffmpeg_frames(video_path, sample_rate)
+            return
+        raise ValueError(f"Could not open video {video_path}")
+
+    frames = queue.Queue(maxsize=max(lookahead, 1))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up when the consumer has stopped reading
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def decode():
+        frames_decoded = FRAMES_DECODED.labels(decoder="opencv")
+        try:
+            frame_count = 0
+            while not stop.is_set():
+                # grab() only demuxes/decodes; retrieve() is needed just for sampled frames
+                if not cap.grab():
+                    break
+
+                if frame_count % sample_rate == 0:
+                    with span("decode", decoder="opencv", frame_idx=frame_count):
+                        ret, frame = cap.retrieve()
+                        if ret:
+                            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    if not ret:
+                        break
+                    frames_decoded.inc()
+                    if not put(frame):
+                        return
+
+                frame_count += 1
+            put(done)
+        except Exception as e:
+            put(e)
+
+    # The decoder thread records its spans in the caller's trace
+    decoder_thread = threading.Thread(target=context_wrap(decode), name="frame-decoder", daemon=True)
+    decoder_thread.start()
+
+    try:
+        while True:
+            item = frames.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        decoder_thread.join()
+        cap.release()
+
+
+def _iter_ffmpeg_frames(video_path, sample_rate):
+    """Stream every Nth frame as RGB through the ffmpeg pipe decoder."""
+    # ffmpeg selects the frames and converts them to RGB itself, and each
+    # frame is read into its own array so consumers may keep it
+    with FFmpegFrameReader(video_path, every_n_frames=sample_rate, pix_fmt='rgb24', num_buffers=0) as reader:
+        for _, frame in reader:
+            yield frame
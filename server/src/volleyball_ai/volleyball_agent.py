@@ -1,5 +1,6 @@
 import os
 import json
+import logging
 import cv2
 import numpy as np
 from pathlib import Path
@@ -11,6 +12,12 @@ import agents  # Import the agents module
 
 # Import the Google AI integration
 from .google_ai_integration import analyze_technique, analyze_positioning, analyze_tactics, process_video_frames
+from .video_decoder import iter_sampled_frames
+from .analysis_fanout import AnalysisFanout
+from .image_input import ImageInput
+from .analysis_history import QUERY_DATABASE_TOOL, get_history_store, record_analysis_results
+
+logger = logging.getLogger(__name__)
 
 class VolleyballAgentSystem:
     """
@@ -49,7 +56,8 @@ class VolleyballAgentSystem:
             self.model = None
             self.labels = None
         
-        # Initialize tools
+        # Initialize tools (function tools register their handler in tool_handlers)
+        self.tool_handlers = {}
         self.file_search_tool = self._create_file_search_tool()
         self.private_database_tool = self._create_database_tool()
         self.web_search_tool = self._create_web_search_tool()
@@ -73,31 +81,44 @@ class VolleyballAgentSystem:
     
     def _create_database_tool(self):
         """Create a database tool for storing and retrieving analysis results."""
-        return agents.Tool(
-            type="function",
-            function={
-                "name": "query_volleyball_database",
-                "description": "Query the volleyball technique database for player history and analysis",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "player_id": {
-                            "type": "string",
-                            "description": "The ID of the player to query"
-                        },
-                        "technique": {
-                            "type": "string",
-                            "description": "The specific technique to query (optional)"
-                        },
-                        "date_range": {
-                            "type": "string",
-                            "description": "Date range for the query (optional, format: YYYY-MM-DD to YYYY-MM-DD)"
-                        }
-                    },
-                    "required": ["player_id"]
-                }
-            }
-        )
+        # Calls are answered by query_volleyball_database (see call_tool)
+        self.tool_handlers["query_volleyball_database"] = self.query_volleyball_database
+        return agents.Tool(type="function", function=QUERY_DATABASE_TOOL)
+    
+    def query_volleyball_database(self, player_id, technique=None, date_range=None):
+        """
+        Run the query_volleyball_database tool against the analysis history.
+        
+        Args:
+            player_id: The ID of the player to query
+            technique: The specific technique to query (optional)
+            date_range: Date range (optional, format: YYYY-MM-DD to YYYY-MM-DD)
+            
+        Returns:
+            Dictionary with the player's recent analyses, technique summary and trend
+        """
+        try:
+            return get_history_store().query(player_id, technique, date_range)
+        except Exception as e:
+            logger.error("Error querying analysis history: %s", e)
+            return {"player_id": player_id, "error": str(e), "summary": [], "trend": [], "recent": []}
+    
+    def call_tool(self, name, arguments):
+        """
+        Run a function tool call made by an agent.
+        
+        Args:
+            name: Tool name
+            arguments: Tool arguments as a dictionary or JSON text
+            
+        Returns:
+            Tool result
+        """
+        if name not in self.tool_handlers:
+            raise ValueError(f"Unknown tool: {name}")
+        if isinstance(arguments, str):
+            arguments = json.loads(arguments or "{}")
+        return self.tool_handlers[name](**arguments)
     
     def _create_web_search_tool(self):
         """Create a web search tool for finding latest training methods."""
@@ -257,68 +278,60 @@ class VolleyballAgentSystem:
             Dictionary containing analysis results
         """
         try:
-            # Process video frames
-            frames = process_video_frames(video_path)
-            
-            # Analyze technique in each frame
-            technique_results = []
-            for frame in frames:
-                result = analyze_technique(frame)
-                technique_results.append(result)
-            
-            # Analyze player positioning
-            positioning_results = analyze_positioning(frames)
-            
-            # Analyze team tactics if available
-            tactics_results = analyze_tactics(frames)
+            # Stream sampled frames and run technique, positioning and tactics
+            # analysis for each frame concurrently
+            frames = iter_sampled_frames(video_path)
+            results = AnalysisFanout(["technique", "positioning", "tactics"]).analyze_frames(frames)
             
             # Combine results
             analysis = {
-                "technique": technique_results,
-                "positioning": positioning_results,
-                "tactics": tactics_results,
+                "technique": results["technique"],
+                "positioning": results["positioning"],
+                "tactics": results["tactics"],
                 "player_data": player_data
             }
             
+            # Keep the results for player history queries
+            record_analysis_results(results, player_data, source="video")
+            
             return analysis
             
         except Exception as e:
             print(f"Error analyzing video: {e}")
             return {"error": str(e)}
     
-    def get_real_time_feedback(self, frame_path, current_time=0):
+    def get_real_time_feedback(self, frame, current_time=0):
         """
         Get real-time feedback for a single video frame.
         
         Args:
-            frame_path: Path to the frame image file
+            frame: The frame as an image file path, encoded bytes, RGB numpy
+                array or PIL image
             current_time: Current time in the video (seconds)
             
         Returns:
             Dictionary containing feedback
         """
         try:
-            # Load and analyze the frame
-            frame = cv2.imread(frame_path)
-            if frame is None:
+            # Decode the frame at most once and run both analyses concurrently
+            try:
+                frame = ImageInput.from_any(frame)
+                # Reading the size checks that the image can be identified
+                frame.size
+            except Exception:
                 return {"error": "Could not load frame"}
             
-            # Convert BGR to RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Analyze technique
-            technique = analyze_technique(frame_rgb)
-            
-            # Analyze positioning
-            positioning = analyze_positioning([frame_rgb])
+            results = AnalysisFanout(["technique", "positioning"]).analyze_frames([frame])
             
             # Combine feedback
             feedback = {
                 "timestamp": current_time,
-                "technique": technique,
-                "positioning": positioning[0] if positioning else None
+                "technique": results["technique"][0],
+                "positioning": results["positioning"][0]
             }
             
+            record_analysis_results(results, source="feedback")
+            
             return feedback
             
         except Exception as e:
@@ -341,10 +354,22 @@ class VolleyballAgentSystem:
         if technique_focus:
             prompt += f" focusing on {technique_focus} technique"
         
-        # For now, return a mock response
+        # Base the program on the player's analysis history
+        history = self.query_volleyball_database(player_id)
+        summary = history["summary"]
+        
+        # Without a requested focus, work on the weakest technique on record
+        if not technique_focus and summary and summary[0]["avg_quality"] is not None:
+            technique_focus = summary[0]["technique"]
+        
         return {
             "player_id": player_id,
             "technique_focus": technique_focus,
+            "history": {
+                "analyses": sum(row["analyses"] for row in summary),
+                "techniques": summary,
+                "trend": [row for row in history["trend"] if not technique_focus or row["technique"] == technique_focus]
+            },
             "program": {
                 "title": f"Personalized {technique_focus or 'Volleyball'} Training Program",
                 "description": "This program is designed to improve your volleyball skills with a focus on proper technique and form.",
@@ -388,10 +413,40 @@ class VolleyballAgentSystem:
         Returns:
             Dictionary containing team analysis
         """
-        # Use the team analysis agent to analyze performance
-        # For now, return a mock response
+        # Use the team's analysis history when there is any
+        try:
+            summary = get_history_store().technique_summary(team_id=team_id)
+        except Exception as e:
+            logger.error("Error querying analysis history: %s", e)
+            summary = []
+        
+        rated = [row for row in summary if row["avg_quality"] is not None]
+        if rated:
+            strengths = [row for row in rated if row["avg_quality"] >= 0.7]
+            weaknesses = [row for row in rated if row["avg_quality"] < 0.5]
+            return {
+                "team_id": team_id,
+                "source": "history",
+                "techniques": summary,
+                "analysis": {
+                    "strengths": [
+                        f"Strong {row['technique']} execution (average quality {row['avg_quality']:.2f} over {row['analyses']} analyses)"
+                        for row in reversed(strengths)
+                    ],
+                    "weaknesses": [
+                        f"Inconsistent {row['technique']} execution (average quality {row['avg_quality']:.2f} over {row['analyses']} analyses)"
+                        for row in weaknesses
+                    ],
+                    "recommendations": [
+                        f"Focus on {row['technique']} drills in practice" for row in weaknesses
+                    ]
+                }
+            }
+        
+        # No recorded analyses for this team yet
         return {
             "team_id": team_id,
+            "source": "default",
             "analysis": {
                 "strengths": [
                     "Strong serving performance",
@@ -1,13 +1,21 @@
 # volleyball_agents.py
 import os
 import json
+import logging
 import numpy as np
 import cv2
-from pathlib import Path
 import datetime
-from openai import OpenAI
 from .google_ai_integration import analyze_technique, analyze_positioning, analyze_tactics
 from .volleyball_inference import VolleyballTechniqueClassifier
+from .video_decoder import iter_sampled_frames
+from .analysis_fanout import AnalysisFanout
+from .image_input import ImageInput
+from .api_clients import get_openai_client, api_client_stats
+from .analysis_history import QUERY_DATABASE_TOOL, get_history_store, record_analysis_results
+from .metrics import (
+    AGENT_OPERATIONS, FRAMES_ANALYZED, FRAMES_DECODED, JOBS_IN_FLIGHT, QUEUE_DEPTH,
+    metric_totals, metrics_snapshot, registry
+)
 
 try:
     import tensorflow as tf
@@ -15,6 +23,8 @@ try:
 except ImportError:
     TENSORFLOW_AVAILABLE = False
 
+logger = logging.getLogger(__name__)
+
 class VolleyballAgentSystem:
     """
     A comprehensive volleyball coaching system using OpenAI's API.
@@ -34,22 +44,26 @@ class VolleyballAgentSystem:
         # Set up OpenAI client
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         if self.api_key:
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = get_openai_client(self.api_key)
         
         # Initialize the base classifier if TensorFlow is available
         if TENSORFLOW_AVAILABLE and model_path and labels_path:
             try:
                 self.classifier = VolleyballTechniqueClassifier(model_path, labels_path)
-                print("Volleyball Technique Classifier initialized successfully")
+                logger.info("Volleyball Technique Classifier initialized successfully")
             except Exception as e:
-                print(f"Error initializing classifier: {e}")
+                logger.error("Error initializing classifier: %s", e)
                 self.classifier = None
         else:
             self.classifier = None
             if not TENSORFLOW_AVAILABLE:
-                print("TensorFlow not available. Running without local model.")
+                logger.info("TensorFlow not available. Running without local model.")
+        
+        # Function tools offered to the OpenAI model, answered by call_tool
+        self.tools = [{"type": "function", "function": QUERY_DATABASE_TOOL}]
+        self.tool_handlers = {"query_volleyball_database": self.query_volleyball_database}
         
-        print("Volleyball Agent System initialized successfully")
+        logger.info("Volleyball Agent System initialized successfully")
     
     def analyze_player_video(self, video_path, player_data=None):
         """
@@ -63,149 +77,328 @@ class VolleyballAgentSystem:
             Dictionary containing analysis results
         """
         try:
-            # Extract frames from video
-            frames = self.extract_frames(video_path)
-            
-            # Analyze technique in each frame
-            technique_results = []
-            for frame in frames:
-                result = analyze_technique(frame)
-                technique_results.append(result)
-            
-            # Analyze player positioning
-            positioning_results = analyze_positioning(frames)
-            
-            # Analyze team tactics if available
-            tactics_results = analyze_tactics(frames)
+            # Stream sampled frames and run technique, positioning and tactics
+            # analysis for each frame concurrently
+            results = AnalysisFanout(["technique", "positioning", "tactics"]).analyze_frames(
+                self.iter_frames(video_path)
+            )
             
             # Combine results
             analysis = {
-                "technique": technique_results,
-                "positioning": positioning_results,
-                "tactics": tactics_results,
+                "technique": results["technique"],
+                "positioning": results["positioning"],
+                "tactics": results["tactics"],
                 "player_data": player_data
             }
             
+            # Keep the results for player history queries
+            record_analysis_results(results, player_data, source="video")
+            
+            AGENT_OPERATIONS.labels(operation="analyze_player_video", result="ok").inc()
             return analysis
             
         except Exception as e:
-            print(f"Error analyzing video: {e}")
+            logger.error("Error analyzing video: %s", e)
+            AGENT_OPERATIONS.labels(operation="analyze_player_video", result="error").inc()
             return {"error": str(e)}
     
-    def get_real_time_feedback(self, frame_path, current_time=0):
+    def get_real_time_feedback(self, frame, current_time=0):
         """
         Get real-time feedback for a single video frame.
         
         Args:
-            frame_path: Path to the frame image file
+            frame: The frame as an image file path, encoded bytes, RGB numpy
+                array or PIL image
             current_time: Current time in the video (seconds)
             
         Returns:
             Dictionary containing feedback
         """
         try:
-            # Load and analyze the frame
-            frame = cv2.imread(frame_path)
-            if frame is None:
+            # Decode the frame at most once and run both analyses concurrently
+            try:
+                frame = ImageInput.from_any(frame)
+                # Reading the size checks that the image can be identified
+                frame.size
+            except Exception:
+                AGENT_OPERATIONS.labels(operation="real_time_feedback", result="error").inc()
                 return {"error": "Could not load frame"}
             
-            # Convert BGR to RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Analyze technique
-            technique = analyze_technique(frame_rgb)
-            
-            # Analyze positioning
-            positioning = analyze_positioning([frame_rgb])
+            results = AnalysisFanout(["technique", "positioning"]).analyze_frames([frame])
             
             # Combine feedback
             feedback = {
                 "timestamp": current_time,
-                "technique": technique,
-                "positioning": positioning[0] if positioning else None
+                "technique": results["technique"][0],
+                "positioning": results["positioning"][0]
             }
             
+            record_analysis_results(results, source="feedback")
+            
+            AGENT_OPERATIONS.labels(operation="real_time_feedback", result="ok").inc()
             return feedback
             
         except Exception as e:
-            print(f"Error getting feedback: {e}")
+            logger.error("Error getting feedback: %s", e)
+            AGENT_OPERATIONS.labels(operation="real_time_feedback", result="error").inc()
             return {"error": str(e)}
     
-    def extract_frames(self, video_path, sample_rate=15):
+    def query_volleyball_database(self, player_id, technique=None, date_range=None):
+        """
+        Run the query_volleyball_database tool against the analysis history.
+        
+        Args:
+            player_id: The ID of the player to query
+            technique: The specific technique to query (optional)
+            date_range: Date range (optional, format: YYYY-MM-DD to YYYY-MM-DD)
+            
+        Returns:
+            Dictionary with the player's recent analyses, technique summary and trend
+        """
+        try:
+            return get_history_store().query(player_id, technique, date_range)
+        except Exception as e:
+            logger.error("Error querying analysis history: %s", e)
+            return {"player_id": player_id, "error": str(e), "summary": [], "trend": [], "recent": []}
+    
+    def call_tool(self, name, arguments):
+        """
+        Run a function tool call made by an agent.
+        
+        Args:
+            name: Tool name
+            arguments: Tool arguments as a dictionary or JSON text
+            
+        Returns:
+            Tool result
+        """
+        if name not in self.tool_handlers:
+            raise ValueError(f"Unknown tool: {name}")
+        if isinstance(arguments, str):
+            arguments = json.loads(arguments or "{}")
+        return self.tool_handlers[name](**arguments)
+    
+    def generate_training_program(self, player_id, technique_focus=None):
+        """
+        Generate a personalized training program.
+        
+        Args:
+            player_id: Player ID
+            technique_focus: Specific technique to focus on
+            
+        Returns:
+            Dictionary containing training program
+        """
+        # Base the program on the player's analysis history
+        history = self.query_volleyball_database(player_id)
+        summary = history["summary"]
+        
+        # Without a requested focus, work on the weakest technique on record
+        if not technique_focus and summary and summary[0]["avg_quality"] is not None:
+            technique_focus = summary[0]["technique"]
+        
+        return {
+            "player_id": player_id,
+            "technique_focus": technique_focus,
+            "history": {
+                "analyses": sum(row["analyses"] for row in summary),
+                "techniques": summary,
+                "trend": [row for row in history["trend"] if not technique_focus or row["technique"] == technique_focus]
+            },
+            "program": {
+                "title": f"Personalized {technique_focus or 'Volleyball'} Training Program",
+                "description": "This program is designed to improve your volleyball skills with a focus on proper technique and form.",
+                "drills": [
+                    {
+                        "name": "Warm-up Drill",
+                        "description": "Start with a 10-minute warm-up to prepare your body for training.",
+                        "duration": "10 minutes",
+                        "intensity": "Low"
+                    },
+                    {
+                        "name": "Technique Focus Drill",
+                        "description": f"Focus on {technique_focus or 'general'} technique with guided practice.",
+                        "duration": "20 minutes",
+                        "intensity": "Medium"
+                    },
+                    {
+                        "name": "Application Drill",
+                        "description": "Apply the technique in game-like situations.",
+                        "duration": "15 minutes",
+                        "intensity": "High"
+                    },
+                    {
+                        "name": "Cool-down",
+                        "description": "Finish with a 5-minute cool-down to recover.",
+                        "duration": "5 minutes",
+                        "intensity": "Low"
+                    }
+                ]
+            }
+        }
+    
+    def analyze_team_performance(self, team_id, game_data=None):
+        """
+        Analyze team performance.
+        
+        Args:
+            team_id: Team ID
+            game_data: Game data for analysis
+            
+        Returns:
+            Dictionary containing team analysis
+        """
+        # Use the team's analysis history when there is any
+        try:
+            summary = get_history_store().technique_summary(team_id=team_id)
+        except Exception as e:
+            logger.error("Error querying analysis history: %s", e)
+            summary = []
+        
+        rated = [row for row in summary if row["avg_quality"] is not None]
+        if rated:
+            strengths = [row for row in rated if row["avg_quality"] >= 0.7]
+            weaknesses = [row for row in rated if row["avg_quality"] < 0.5]
+            return {
+                "team_id": team_id,
+                "source": "history",
+                "techniques": summary,
+                "analysis": {
+                    "strengths": [
+                        f"Strong {row['technique']} execution (average quality {row['avg_quality']:.2f} over {row['analyses']} analyses)"
+                        for row in reversed(strengths)
+                    ],
+                    "weaknesses": [
+                        f"Inconsistent {row['technique']} execution (average quality {row['avg_quality']:.2f} over {row['analyses']} analyses)"
+                        for row in weaknesses
+                    ],
+                    "recommendations": [
+                        f"Focus on {row['technique']} drills in practice" for row in weaknesses
+                    ]
+                }
+            }
+        
+        # No recorded analyses for this team yet
+        return {
+            "team_id": team_id,
+            "source": "default",
+            "analysis": {
+                "strengths": [
+                    "Strong serving performance",
+                    "Effective blocking at the net",
+                    "Good communication between players"
+                ],
+                "weaknesses": [
+                    "Inconsistent passing in serve receive",
+                    "Defensive positioning needs improvement",
+                    "Transition offense is slow"
+                ],
+                "recommendations": [
+                    "Focus on serve receive drills in practice",
+                    "Work on defensive positioning and movement",
+                    "Practice faster transitions from defense to offense"
+                ]
+            }
+        }
+    
+    def get_agent_metrics(self):
+        """
+        Get usage and performance metrics of the agent system.
+        
+        The numbers come from the process-wide metrics registry (see metrics),
+        so they cover every request handled by this process.
+        
+        Returns:
+            Dictionary of metrics
+        """
+        operations = {}
+        for entry in metrics_snapshot().get(AGENT_OPERATIONS.name, []):
+            counts = operations.setdefault(entry["labels"]["operation"], {"ok": 0, "error": 0})
+            counts[entry["labels"]["result"]] = int(entry["value"])
+        
+        return {
+            "agents": {
+                "classifier_loaded": self.classifier is not None,
+                "openai_configured": bool(self.api_key)
+            },
+            "operations": operations,
+            "frames_decoded": metric_totals(FRAMES_DECODED.name, "decoder"),
+            "frames_analyzed": metric_totals(FRAMES_ANALYZED.name, "analysis_type"),
+            "jobs_in_flight": metric_totals(JOBS_IN_FLIGHT.name, "job"),
+            "queue_depth": metric_totals(QUEUE_DEPTH.name, "queue"),
+            "caches": registry.cache_hit_rates(),
+            "api_clients": api_client_stats(),
+            "uptime_seconds": round(registry.value("volleyball_uptime_seconds"), 1)
+        }
+    
+    def extract_frames(self, video_path, sample_rate=15, decoder=None):
         """
         Extract frames from a video file.
         
+        Holds every sampled frame in memory; prefer iter_frames for long videos.
+        
         Args:
             video_path: Path to the video file
             sample_rate: Extract every Nth frame
+            decoder: "auto", "opencv" or "ffmpeg" (defaults to video_decoder.VIDEO_DECODER)
             
         Returns:
             List of extracted frames as numpy arrays
         """
-        if not Path(video_path).exists():
-            raise FileNotFoundError(f"Video file not found: {video_path}")
-        
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise ValueError(f"Could not open video {video_path}")
+        return list(self.iter_frames(video_path, sample_rate, decoder))
+    
+    def iter_frames(self, video_path, sample_rate=15, decoder=None, lookahead=4):
+        """
+        Stream sampled RGB frames from a video file.
         
-        frames = []
-        frame_count = 0
+        Memory stays bounded by the lookahead regardless of video length
+        (see video_decoder.iter_sampled_frames).
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_count % sample_rate == 0:
-                # Convert BGR to RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frames.append(frame_rgb)
+        Args:
+            video_path: Path to the video file
+            sample_rate: Yield every Nth frame
+            decoder: "auto", "opencv" or "ffmpeg" (defaults to video_decoder.VIDEO_DECODER)
+            lookahead: Maximum number of decoded frames waiting to be consumed
             
-            frame_count += 1
-        
-        cap.release()
-        return frames
+        Returns:
+            Generator of frames as numpy arrays (RGB)
+        """
+        return iter_sampled_frames(video_path, sample_rate, decoder, lookahead)
 
 class PlayerAgent:
     def __init__(self, api_key=None):
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         if self.api_key:
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = get_openai_client(self.api_key)
     
     def analyze_performance(self, video_frames):
         """
         Analyze a player's performance in video frames.
         
         Args:
-            video_frames: List of video frames as numpy arrays
+            video_frames: Video frames as numpy arrays (a list, or a generator
+                such as VolleyballAgentSystem.iter_frames)
             
         Returns:
             Dictionary containing performance analysis
         """
         try:
-            # Analyze technique
-            technique_results = []
-            for frame in video_frames:
-                result = analyze_technique(frame)
-                technique_results.append(result)
-            
-            # Analyze positioning
-            positioning_results = analyze_positioning(video_frames)
+            # Analyze each frame as it arrives, both analyses concurrently
+            results = AnalysisFanout(["technique", "positioning"]).analyze_frames(video_frames)
             
             return {
-                "technique": technique_results,
-                "positioning": positioning_results
+                "technique": results["technique"],
+                "positioning": results["positioning"]
             }
         except Exception as e:
-            print(f"Error analyzing performance: {e}")
+            logger.error("Error analyzing performance: %s", e)
             return {"error": str(e)}
 
 class CoachAgent:
     def __init__(self, api_key=None):
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         if self.api_key:
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = get_openai_client(self.api_key)
     
     def provide_feedback(self, analysis_results):
         """
@@ -224,14 +417,14 @@ class CoachAgent:
                 "recommendations": []
             }
         except Exception as e:
-            print(f"Error providing feedback: {e}")
+            logger.error("Error providing feedback: %s", e)
             return {"error": str(e)}
 
 class TeamAnalysisAgent:
     def __init__(self, api_key=None):
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         if self.api_key:
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = get_openai_client(self.api_key)
     
     def analyze_team_performance(self, video_frames):
         """
@@ -253,7 +446,7 @@ class TeamAnalysisAgent:
                 "areas_for_improvement": []
             }
         except Exception as e:
-            print(f"Error analyzing team performance: {e}")
+            logger.error("Error analyzing team performance: %s", e)
             return {"error": str(e)}
 
 # Example usage
@@ -1,8 +1,14 @@
 import cv2
 import numpy as np
 import json
+import logging
 from pathlib import Path
 from .google_ai_integration import analyze_technique, analyze_positioning, analyze_tactics
+from .player_detection import get_player_detector
+from .ball_tracking import BallTracker
+from .rally_segmentation import RallySegmenter, segment_rallies
+from .image_loading import decode_reduced
+from .structured_logging import sampled
 
 try:
     import tensorflow as tf
@@ -10,6 +16,12 @@ try:
 except ImportError:
     TENSORFLOW_AVAILABLE = False
 
+logger = logging.getLogger(__name__)
+frame_errors = sampled(logger, every=1, per_second=5)
+
+# Input size of the technique model
+MODEL_INPUT_SIZE = (224, 224)
+
 class VolleyballTechniqueClassifier:
     def __init__(self, model_path=None, labels_path=None):
         """
@@ -20,7 +32,7 @@ class VolleyballTechniqueClassifier:
             labels_path: Path to the JSON file containing technique labels
         """
         if not TENSORFLOW_AVAILABLE:
-            print("TensorFlow not available. Running without local model.")
+            logger.info("TensorFlow not available. Running without local model.")
             self.model = None
             self.labels = None
             return
@@ -37,9 +49,9 @@ class VolleyballTechniqueClassifier:
             else:
                 self.labels = None
                 
-            print("Volleyball Technique Classifier initialized successfully")
+            logger.info("Volleyball Technique Classifier initialized successfully")
         except Exception as e:
-            print(f"Error initializing classifier: {e}")
+            logger.error("Error initializing classifier: %s", e)
             self.model = None
             self.labels = None
     
@@ -62,7 +74,7 @@ class VolleyballTechniqueClassifier:
         
         try:
             # Preprocess frame
-            frame = cv2.resize(frame, (224, 224))  # Adjust size as needed
+            frame = cv2.resize(frame, MODEL_INPUT_SIZE)
             frame = frame / 255.0  # Normalize
             frame = np.expand_dims(frame, axis=0)  # Add batch dimension
             
@@ -81,13 +93,41 @@ class VolleyballTechniqueClassifier:
                 "confidence": confidence
             }
         except Exception as e:
-            print(f"Error predicting frame: {e}")
+            frame_errors.error("Error predicting frame: %s", e)
             return {
                 "technique": "unknown",
                 "confidence": 0.0,
                 "error": str(e)
             }
 
+    def predict_image(self, image):
+        """
+        Predict the volleyball technique in an encoded image.
+        
+        JPEGs are decoded at the smallest DCT scale that is still at least
+        the model's input size, instead of at full size.
+        
+        Args:
+            image: Image file path or encoded bytes
+            
+        Returns:
+            Dictionary containing prediction results
+        """
+        if isinstance(image, (bytes, bytearray)):
+            data = image
+        else:
+            with open(image, 'rb') as f:
+                data = f.read()
+        
+        frame = decode_reduced(data, MODEL_INPUT_SIZE)
+        if frame is None:
+            return {
+                "technique": "unknown",
+                "confidence": 0.0,
+                "error": "Could not decode image"
+            }
+        return self.predict_frame(frame)
+
     def process_video(self, video_path, sample_rate=15, output_path=None):
         """Process a video and extract frames.
         
@@ -125,48 +165,95 @@ class VolleyballTechniqueClassifier:
         
         return frames
 
-def detect_players(frame):
+def detect_players(frame, track=False, detect_interval=5):
     """
     Detect players in a video frame.
     
     Args:
-        frame: Video frame as numpy array
+        frame: Video frame as numpy array, or a list (or 4D array) of frames
+            to detect in as a batch
+        track: For a batch, only run the detector every detect_interval
+            frames and track the boxes through the frames in between
+        detect_interval: Detector interval used when track is True
         
     Returns:
-        List of player bounding boxes and positions
+        List of player bounding boxes ({"bbox": [x, y, w, h], "confidence": float,
+        "source": "detected" | "tracked"}), or one such list per frame for a batch
     """
-    # TODO: Implement player detection
-    return []
+    detector = get_player_detector()
+    
+    if isinstance(frame, np.ndarray) and frame.ndim == 3:
+        return detector.detect(frame)
+    
+    frames = list(frame)
+    if track:
+        return list(detector.track(frames, detect_interval=detect_interval))
+    return detector.detect_batch(frames)
 
-def track_ball_movement(frames):
+def track_ball_movement(frames, fps=30.0, tracker=None):
     """
     Track the ball's movement across video frames.
     
     Args:
-        frames: List of video frames as numpy arrays
+        frames: Video frames as numpy arrays, or (timestamp, frame) tuples.
+            May be a list or a generator; frames are processed one at a time.
+        fps: Frame rate used for timestamps when frames carry none
+        tracker: Optional BallTracker to use (e.g. with custom colour ranges)
         
     Returns:
-        List of ball positions and trajectories
+        Dictionary with per-frame "positions" and "trajectories" (segments
+        of continuous ball flight)
     """
-    # TODO: Implement ball tracking
-    return []
+    tracker = tracker or BallTracker()
+    positions = list(tracker.track(frames, fps=fps))
+    
+    return {
+        "positions": positions,
+        "trajectories": tracker.finish()
+    }
 
-def analyze_play_sequence(frames):
+def analyze_play_sequence(frames, fps=30.0, net_x=None):
     """
     Analyze a sequence of volleyball plays.
     
+    Splits the footage into rallies (serve to dead ball) from motion energy
+    and ball-track continuity, and marks serve, contact and net-crossing
+    events within each rally. For a video path the rally index is also
+    stored next to the video (see rally_segmentation.segment_rallies).
+    
     Args:
-        frames: List of video frames as numpy arrays
+        frames: Path to a video file, or video frames as numpy arrays (or
+            (timestamp, frame) tuples) in a list or generator
+        fps: Frame rate used for timestamps when frames carry none
+        net_x: Horizontal net position in pixels (defaults to the frame centre)
         
     Returns:
         Dictionary containing play analysis
     """
-    # TODO: Implement play sequence analysis
+    if isinstance(frames, (str, Path)):
+        index = segment_rallies(str(frames), net_x=net_x)
+    else:
+        segmenter = RallySegmenter(fps=fps, net_x=net_x)
+        for i, item in enumerate(frames):
+            if isinstance(item, tuple):
+                segmenter.update(item[1], item[0])
+            else:
+                segmenter.update(item, i / fps)
+        index = segmenter.finish()
+    
+    rallies = index["rallies"]
+    events = [event for rally in rallies for event in rally["events"]]
+    
     return {
-        "play_type": "unknown",
+        "play_type": "rally" if rallies else "no_play",
+        # Not estimated from video alone (needs the point outcome)
         "success_rate": 0.0,
         "player_positions": [],
-        "ball_trajectory": []
+        "ball_trajectory": index["ball_trajectories"],
+        "rallies": rallies,
+        "events": events,
+        "in_play_seconds": index["in_play_seconds"],
+        "duration": index["duration"]
     }
 
 def main():
@@ -188,7 +275,7 @@ def main():
         sample_rate=args.sample_rate
     )
     
-    print(f"Extracted {len(frames)} frames from video")
+    logger.info("Extracted %s frames from video", len(frames))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
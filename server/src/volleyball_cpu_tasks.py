@@ -0,0 +1,410 @@
+"""
+CPU Pool Worker Tasks
+
+The functions volleyball_ai.cpu_pool runs in its worker processes: image
+decoding (at a reduced JPEG DCT scale when the frame is resized right
+after), resizing, frame features, encoding and upload validation, and the
+shared-memory frame passing around them.
+
+This is a top-level module rather than part of the volleyball_ai package
+because every worker process imports it: importing a package submodule
+runs the package __init__, which loads the Gemini and OpenAI clients (and
+fails without their API keys). It only depends on OpenCV, NumPy and Pillow.
+"""
+
+import io
+import logging
+import os
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Size frames are resized to for frame_features
+FEATURE_SIZE = (128, 128)
+
+# Reduced-scale JPEG decoding (re-exported by volleyball_ai.image_loading)
+
+# DCT scale factors libjpeg can decode at (largest first)
+REDUCTIONS = (8, 4, 2)
+
+REDUCED_COLOR_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+REDUCED_GRAYSCALE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def reduction_for(size, min_size):
+    """
+    Pick the largest DCT scale factor that keeps an image at least min_size.
+
+    Args:
+        size: (width, height) of the encoded image
+        min_size: (width, height) the decoded image must not be smaller than
+
+    Returns:
+        int: 1, 2, 4 or 8
+    """
+    if not min_size:
+        return 1
+    width, height = size
+    min_width, min_height = min_size
+    for factor in REDUCTIONS:
+        # libjpeg rounds scaled dimensions up
+        if -(-width // factor) >= min_width and -(-height // factor) >= min_height:
+            return factor
+    return 1
+
+
+def image_header(data):
+    """
+    Read the format and size of an encoded image without decoding it.
+
+    Args:
+        data: Encoded image bytes
+
+    Returns:
+        Tuple of (format, (width, height)), or (None, None) if unreadable
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format, image.size
+    except Exception:
+        return None, None
+
+
+def decode_reduced(data, min_size=None, grayscale=False):
+    """
+    Decode an encoded image at the smallest scale that is at least min_size.
+
+    Args:
+        data: Encoded image bytes
+        min_size: (width, height) the frame will be resized to; None decodes
+            at full size
+        grayscale: Decode to a single channel
+
+    Returns:
+        BGR (or grayscale) numpy array, or None if the data is not an image
+    """
+    flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    if min_size:
+        image_format, size = image_header(data)
+        if image_format == 'JPEG':
+            factor = reduction_for(size, min_size)
+            if factor > 1:
+                flags = (REDUCED_GRAYSCALE_FLAGS if grayscale else REDUCED_COLOR_FLAGS)[factor]
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+
+# Shared memory
+
+class SharedFrame:
+    """Picklable reference to a NumPy array in a shared memory block."""
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+
+def share_array(array):
+    """Copy an array into a new shared memory block, returning (SharedFrame, block)."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return SharedFrame(block.name, array.shape, array.dtype.str), block
+
+
+def attach_shared(frame):
+    """Attach to a shared block, returning (array view, block)."""
+    block = shared_memory.SharedMemory(name=frame.name)
+    return np.ndarray(frame.shape, dtype=np.dtype(frame.dtype), buffer=block.buf), block
+
+
+def close_block(block, unlink=False):
+    """Close a shared block, removing it if unlink is set."""
+    try:
+        block.close()
+    except BufferError:
+        # A view is still referenced (e.g. by a traceback); the mapping goes with it
+        pass
+    if unlink:
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Tasks
+
+def decode_image(data, flags=cv2.IMREAD_COLOR, min_size=None):
+    """
+    Decode encoded image bytes (None if they are not an image).
+
+    With min_size, JPEGs are decoded at the smallest DCT scale that is at
+    least that large (see decode_reduced); flags then only
+    select colour or grayscale.
+    """
+    if min_size:
+        return decode_reduced(data, min_size, grayscale=flags == cv2.IMREAD_GRAYSCALE)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+
+def resize_frame(frame, size, interpolation=cv2.INTER_AREA):
+    """Resize a frame to (width, height)."""
+    return cv2.resize(frame, tuple(size), interpolation=interpolation)
+
+
+def frame_features(frame):
+    """
+    Compute the feature vector of a BGR frame.
+
+    The features the TF.js technique model is trained on (see
+    VolleyballFrameDataset.extract_features in models/volleyball_model_tfjs.py):
+    a 9-bin gradient orientation histogram, an 8x8 hue/saturation histogram,
+    5 motion features (zero for a single frame) and the edge mean and
+    standard deviation, on the frame resized to 128x128.
+
+    Args:
+        frame: BGR frame as numpy array
+
+    Returns:
+        80-value float numpy array
+    """
+    resized = cv2.resize(frame, FEATURE_SIZE)
+    gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 100, 200)
+
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1)
+    magnitude, angle = cv2.cartToPolar(gx, gy)
+
+    bins = 9
+    index = (angle * (bins / (2 * np.pi))).astype(np.int64).ravel()
+    inside = index < bins
+    hist = np.bincount(index[inside], weights=magnitude.ravel()[inside], minlength=bins)
+    if np.sum(hist) > 0:
+        hist = hist / np.sum(hist)
+
+    hsv = cv2.cvtColor(resized, cv2.COLOR_BGR2HSV)
+    color_hist = cv2.calcHist([hsv], [0, 1], None, [8, 8], [0, 180, 0, 256])
+    color_hist = cv2.normalize(color_hist, color_hist).flatten()
+
+    motion_features = np.zeros(5)
+
+    return np.concatenate([
+        hist,
+        color_hist,
+        motion_features,
+        [np.mean(edges) / 255.0, np.std(edges) / 255.0]
+    ])
+
+
+def encode_frame(frame, ext=".jpg", quality=90):
+    """Encode a frame, returning the encoded bytes."""
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if ext.lower() in (".jpg", ".jpeg") else []
+    success, buffer = cv2.imencode(ext, frame, params)
+    if not success:
+        raise ValueError(f"Could not encode frame as {ext}")
+    return buffer.tobytes()
+
+
+def is_intact_rgb_jpeg(image_path):
+    """
+    Check from its headers whether a file is a complete RGB JPEG.
+
+    Reads only the markers and the frame header, without decoding pixels:
+    SOI at the start, EOI at the end (trailing padding allowed), the format,
+    colour mode and non-zero dimensions as parsed by Image.open and verify().
+
+    Args:
+        image_path: Path to the image file
+
+    Returns:
+        bool: True if the file can be used as is
+    """
+    try:
+        with open(image_path, 'rb') as f:
+            if f.read(2) != b'\xff\xd8':
+                return False
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - 1024, 0))
+            tail = f.read()
+        if not tail.rstrip(b'\x00\r\n ').endswith(b'\xff\xd9'):
+            return False
+
+        with Image.open(image_path) as img:
+            if img.format != 'JPEG' or img.mode != 'RGB' or min(img.size) <= 0:
+                return False
+            img.verify()
+        return True
+    except Exception:
+        return False
+
+
+def validate_image_file(image_path):
+    """
+    Validates an image file and attempts to fix it if there are issues.
+
+    Intact RGB JPEGs (see is_intact_rgb_jpeg) are returned as they are;
+    only other formats and broken files are decoded and re-saved.
+
+    Args:
+        image_path: Path to the image file
+
+    Returns:
+        Tuple of (success, image path to use (the original or a fixed copy) or error_message)
+    """
+    if not os.path.exists(image_path):
+        return False, f"Image file not found: {image_path}"
+
+    if os.path.getsize(image_path) == 0:
+        return False, f"Image file is empty: {image_path}"
+
+    # Fast path: nothing to fix
+    if is_intact_rgb_jpeg(image_path):
+        logger.debug("Image is an intact RGB JPEG, using it as is: %s", image_path)
+        return True, image_path
+
+    # Try different methods to validate and fix the image
+    methods_tried = []
+
+    # Method 1: Try with PIL directly
+    try:
+        methods_tried.append("PIL direct open")
+        with Image.open(image_path) as img:
+            img_mode = img.mode
+
+            # Convert to RGB if needed
+            if img_mode != 'RGB':
+                img = img.convert('RGB')
+
+            # Save a fixed copy
+            fixed_path = f"{os.path.splitext(image_path)[0]}_fixed.jpg"
+            img.save(fixed_path, format="JPEG", quality=95)
+            logger.debug("Fixed image with PIL: %s", fixed_path)
+            return True, fixed_path
+    except UnidentifiedImageError:
+        logger.warning("PIL could not identify the image format: %s", image_path)
+    except Exception as e:
+        logger.warning("Error with PIL direct open: %s", e)
+
+    # Method 2: Try with OpenCV
+    try:
+        methods_tried.append("OpenCV")
+        img = cv2.imread(image_path)
+        if img is None:
+            logger.warning("OpenCV could not load the image: %s", image_path)
+        else:
+            # Save using OpenCV
+            fixed_path = f"{os.path.splitext(image_path)[0]}_cv_fixed.jpg"
+            cv2.imwrite(fixed_path, img)
+
+            # Verify the saved image
+            if os.path.exists(fixed_path) and os.path.getsize(fixed_path) > 0:
+                logger.info("Fixed image with OpenCV: %s", fixed_path)
+                return True, fixed_path
+    except Exception as e:
+        logger.warning("Error with OpenCV: %s", e)
+
+    # Method 3: Try reading as binary and converting with PIL
+    try:
+        methods_tried.append("Binary read + PIL")
+        with open(image_path, 'rb') as f:
+            image_data = f.read()
+
+        # Try to create an image from binary data
+        img = Image.open(io.BytesIO(image_data))
+
+        # Save a fixed copy
+        fixed_path = f"{os.path.splitext(image_path)[0]}_binary_fixed.jpg"
+        img.save(fixed_path, format="JPEG", quality=95)
+        logger.info("Fixed image with binary read + PIL: %s", fixed_path)
+        return True, fixed_path
+    except Exception as e:
+        logger.warning("Error with binary read + PIL: %s", e)
+
+    # Method 4: Create a blank image with error message
+    try:
+        methods_tried.append("Create blank image")
+        blank_img = Image.new('RGB', (800, 600), color='white')
+
+        # Add text explaining the error
+        from PIL import ImageDraw, ImageFont
+        draw = ImageDraw.Draw(blank_img)
+        try:
+            font = ImageFont.truetype("arial.ttf", 20)
+        except:
+            font = ImageFont.load_default()
+
+        error_text = f"Could not process the original image. Methods tried: {', '.join(methods_tried)}"
+        draw.text((50, 50), error_text, fill="black", font=font)
+        draw.text((50, 100), "This is a placeholder image created due to processing errors.", fill="black", font=font)
+
+        # Save the blank image
+        blank_path = f"{os.path.splitext(image_path)[0]}_blank.jpg"
+        blank_img.save(blank_path)
+        logger.warning("Created blank image with error message: %s", blank_path)
+        return True, blank_path
+    except Exception as e:
+        logger.error("Error creating blank image: %s", e)
+
+    return False, f"Failed to validate or fix image after trying multiple methods: {', '.join(methods_tried)}"
+
+
+TASKS = {
+    "decode": decode_image,
+    "resize": resize_frame,
+    "features": frame_features,
+    "encode": encode_frame,
+    "validate": validate_image_file,
+}
+
+
+def init_worker():
+    """Set up a worker process."""
+    # One OpenCV thread per worker; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    # Plain stderr logging: structured_logging lives in the volleyball_ai package
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format="%(asctime)s %(levelname)s [%(processName)s] %(name)s: %(message)s")
+
+
+def run_task(task, args, kwargs, shm_min_bytes):
+    """Run a task in a worker process, sharing large array results."""
+    blocks = []
+    try:
+        inputs = []
+        for arg in args:
+            if isinstance(arg, SharedFrame):
+                arg, block = attach_shared(arg)
+                blocks.append(block)
+            inputs.append(arg)
+        result = TASKS[task](*inputs, **kwargs)
+        inputs = arg = None
+
+        if isinstance(result, np.ndarray) and result.nbytes >= shm_min_bytes:
+            frame, block = share_array(result)
+            close_block(block)
+            return frame
+        return result
+    finally:
+        for block in blocks:
+            close_block(block)
@@ -1,24 +1,57 @@
 from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain_openai import ChatOpenAI
 from langchain import tools
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools.render import format_tool_to_openai_tool
 import cv2
-import google.generativeai as genai
 import PIL.Image
 import io
 import numpy as np
 import os
+import threading
+import uuid
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
+from ai.clients import get_chat_model, get_gemini_model
+from ai.structured_output import (
+    TECHNIQUE_JSON_PROMPT, AnalysisText, format_technique_analysis, json_generation_config, parse_technique_json
+)
+
 # Load environment variables
 load_dotenv()
 
-# Configure Google AI Gemini Pro Vision
+# Google AI Gemini Pro Vision and OpenAI clients are shared per process (see ai.clients)
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-genai.configure(api_key=GOOGLE_API_KEY)
-vision_model = genai.GenerativeModel('gemini-pro-vision')
+# Gemini model for JSON technique analysis (JSON mode needs a Gemini 1.5 model)
+STRUCTURED_ANALYSIS_MODEL = os.getenv("STRUCTURED_ANALYSIS_MODEL", "gemini-1.5-flash")
+
+# Model used for agent routing
+AGENT_MODEL = os.getenv("AGENT_MODEL", "gpt-4-turbo")
+
+# Frames handed to the agent by reference (the LLM cannot pass image bytes itself)
+_frame_store = {}
+_frame_store_lock = threading.Lock()
+
+def _open_frame(frame_bytes):
+    """Open frame bytes, or a frame id registered with shared_frame, as a PIL Image"""
+    if isinstance(frame_bytes, str):
+        with _frame_store_lock:
+            frame_bytes = _frame_store.get(frame_bytes, frame_bytes)
+    return PIL.Image.open(io.BytesIO(frame_bytes))
+
+@contextmanager
+def shared_frame(frame_bytes):
+    """Register frame bytes under an id the agent can pass to the tools"""
+    frame_id = f"frame-{uuid.uuid4().hex}"
+    with _frame_store_lock:
+        _frame_store[frame_id] = frame_bytes
+    try:
+        yield frame_id
+    finally:
+        with _frame_store_lock:
+            _frame_store.pop(frame_id, None)
 
 # Create a tool for volleyball analysis
 @tools.tool
@@ -34,8 +67,19 @@ def analyze_volleyball_frame(frame_bytes, analysis_type):
         Analysis results as text
     """
     # Convert bytes to PIL Image
-    image = PIL.Image.open(io.BytesIO(frame_bytes))
-    
+    image = _open_frame(frame_bytes)
+
+    # Technique analysis is requested as JSON so stats can read typed fields
+    if analysis_type == "technique":
+        generation_config = json_generation_config()
+        model = get_gemini_model(STRUCTURED_ANALYSIS_MODEL, **({"generation_config": generation_config} if generation_config else {}))
+        response = model.generate_content([TECHNIQUE_JSON_PROMPT, image])
+
+        structured = parse_technique_json(response.text)
+        if structured is None:
+            return response.text
+        return AnalysisText(format_technique_analysis(structured), structured)
+
     # Create appropriate prompt based on analysis type
     prompts = {
         "technique": "Analyze the volleyball techniques being performed in this frame. Identify specific skills like setting, spiking, blocking, or serving. Provide brief feedback on form.",
@@ -46,7 +90,7 @@ def analyze_volleyball_frame(frame_bytes, analysis_type):
     prompt = prompts.get(analysis_type, "Analyze this volleyball frame and provide key insights.")
     
     # Generate analysis using Google AI Studio
-    response = vision_model.generate_content([prompt, image])
+    response = get_gemini_model('gemini-pro-vision').generate_content([prompt, image])
     
     return response.text
 
@@ -64,14 +108,14 @@ def identify_players(frame_bytes, team_roster=None):
         Dictionary mapping identified jersey numbers to positions on court
     """
     # Convert bytes to PIL Image
-    image = PIL.Image.open(io.BytesIO(frame_bytes))
+    image = _open_frame(frame_bytes)
     
     prompt = "Identify volleyball players in this image. For each visible player, note their jersey number and current position on court."
     if team_roster:
         prompt += f" The team roster is: {team_roster}"
     
     # Generate analysis using Google AI Studio
-    response = vision_model.generate_content([prompt, image])
+    response = get_gemini_model('gemini-pro-vision').generate_content([prompt, image])
     
     # In a real implementation, we would parse the response to extract structured data
     # For now, we'll return the raw text
@@ -90,29 +134,114 @@ def detect_volleyball_events(frame_bytes):
         Detected events (serve, spike, block, dig, etc.)
     """
     # Convert bytes to PIL Image
-    image = PIL.Image.open(io.BytesIO(frame_bytes))
+    image = _open_frame(frame_bytes)
     
     prompt = "Analyze this volleyball frame and identify what specific volleyball action is happening (serve, spike, block, dig, set, pass). If multiple actions are visible, identify the main one."
     
     # Generate analysis using Google AI Studio
-    response = vision_model.generate_content([prompt, image])
+    response = get_gemini_model('gemini-pro-vision').generate_content([prompt, image])
     
     return response.text
 
+# Tools available to the agent
+agent_tools = [analyze_volleyball_frame, identify_players, detect_volleyball_events]
+
 # Convert tools to OpenAI format
-volleyball_tools = [
-    format_tool_to_openai_tool(analyze_volleyball_frame),
-    format_tool_to_openai_tool(identify_players),
-    format_tool_to_openai_tool(detect_volleyball_events)
-]
+volleyball_tools = [format_tool_to_openai_tool(tool) for tool in agent_tools]
+
+# Analysis types answered by exactly one tool, with the fixed tool arguments
+DIRECT_TOOL_ROUTES = {
+    "technique": (analyze_volleyball_frame, {"analysis_type": "technique"}),
+    "positioning": (analyze_volleyball_frame, {"analysis_type": "positioning"}),
+    "tactics": (analyze_volleyball_frame, {"analysis_type": "tactics"}),
+    "players": (identify_players, {}),
+    "events": (detect_volleyball_events, {}),
+}
+
+AGENT_SYSTEM_PROMPT = """You are a volleyball coach assistant that helps with real-time analysis of volleyball games.
+Use the tools available to analyze video frames and provide valuable insights.
+Keep your answers concise and actionable for coaches."""
 
 # Create an agent with the volleyball analysis tools
-def create_volleyball_agent():
+def create_volleyball_agent(model=None, tool_set=None):
+    """
+    Build a new agent executor. Prefer get_volleyball_agent, which reuses executors.
+    
+    Args:
+        model: OpenAI model used for routing (defaults to AGENT_MODEL)
+        tool_set: Tools the agent may call (defaults to agent_tools)
+        
+    Returns:
+        AgentExecutor
+    """
+    tool_set = list(tool_set or agent_tools)
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", AGENT_SYSTEM_PROMPT),
+        ("human", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad")
+    ])
     agent = create_openai_tools_agent(
-        llm=ChatOpenAI(model="gpt-4-turbo", api_key=OPENAI_API_KEY),
-        tools=volleyball_tools,
-        prompt="""You are a volleyball coach assistant that helps with real-time analysis of volleyball games.
-        Use the tools available to analyze video frames and provide valuable insights.
-        Keep your answers concise and actionable for coaches."""
+        llm=get_chat_model(model or AGENT_MODEL),
+        tools=tool_set,
+        prompt=prompt
     )
-    return AgentExecutor(agent=agent, tools=volleyball_tools, verbose=True) 
\ No newline at end of file
+    return AgentExecutor(agent=agent, tools=tool_set, verbose=True)
+
+class AgentPool:
+    """Thread-safe cache of agent executors, built once per (model, tool set)"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executors = {}
+    
+    def reset(self):
+        """Drop all executors (used after fork, since they hold HTTP connections)"""
+        self.lock = threading.Lock()
+        self.executors = {}
+    
+    def get(self, model=None, tool_set=None):
+        """Get the executor for a model and tool set, building it on first use"""
+        model = model or AGENT_MODEL
+        tool_set = tuple(tool_set or agent_tools)
+        key = (model, tuple(tool.name for tool in tool_set))
+        
+        executor = self.executors.get(key)
+        if executor is None:
+            with self.lock:
+                executor = self.executors.get(key)
+                if executor is None:
+                    executor = create_volleyball_agent(model, tool_set)
+                    self.executors[key] = executor
+        return executor
+    
+    def warm(self, configurations=None):
+        """
+        Build executors ahead of the first request.
+        
+        Args:
+            configurations: List of (model, tool_set) pairs (defaults to the default agent)
+            
+        Returns:
+            Number of executors built or already cached
+        """
+        warmed = 0
+        for model, tool_set in configurations or [(None, None)]:
+            try:
+                self.get(model, tool_set)
+                warmed += 1
+            except Exception as e:
+                print(f"Error warming agent for {model or AGENT_MODEL}: {e}")
+        return warmed
+
+agent_pool = AgentPool()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=agent_pool.reset)
+
+def get_volleyball_agent(model=None, tool_set=None):
+    """Get a shared agent executor from the pool"""
+    return agent_pool.get(model, tool_set)
+
+def warm_volleyball_agents(configurations=None):
+    """Build the pooled agent executors at startup"""
+    return agent_pool.warm(configurations)
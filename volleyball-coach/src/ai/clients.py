@@ -0,0 +1,221 @@
+"""
+Shared, connection-pooled API clients for the coach app.
+
+Keeps one Gemini model and one pooled OpenAI HTTP client per process, so
+keep-alive connections are reused across requests, threads and agents
+instead of being reopened each time. Clients are rebuilt after a fork
+(gunicorn workers), and each provider has request/latency/error counters.
+"""
+import os
+import threading
+import time
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+load_dotenv()
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Connection pool settings for OpenAI requests
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "30"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# Gemini transport: "grpc", "rest" or unset for the library default
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT")
+
+# Alternative Gemini API endpoint (e.g. a local stub server, used with GEMINI_TRANSPORT=rest)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+
+class ProviderStats:
+    """Thread-safe request counters for one API provider."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def start(self):
+        with self.lock:
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def finish(self, start_time, error=False):
+        latency = time.perf_counter() - start_time
+        with self.lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.errors += int(error)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "avg_latency_ms": round(self.total_latency / self.requests * 1000, 1) if self.requests else 0.0,
+                "max_latency_ms": round(self.max_latency * 1000, 1),
+            }
+
+
+class ClientRegistry:
+    """Process-wide client cache that is dropped when the process forks."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._stats = {}
+        self._pid = os.getpid()
+
+    def _reset_after_fork(self):
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._stats = {}
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+    def get(self, key, factory):
+        """Get the client for key, creating it with factory() on first use."""
+        self._check_pid()
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = factory()
+                    self._clients[key] = client
+        return client
+
+    def provider_stats(self, provider):
+        self._check_pid()
+        stats = self._stats.get(provider)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(provider, ProviderStats())
+        return stats
+
+    def snapshot(self):
+        self._check_pid()
+        return {provider: stats.snapshot() for provider, stats in list(self._stats.items())}
+
+
+client_registry = ClientRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=client_registry._reset_after_fork)
+
+
+class InstrumentedModel:
+    """Proxy for a Gemini GenerativeModel that counts generate_content calls."""
+
+    def __init__(self, model, stats):
+        self._model = model
+        self._stats = stats
+
+    def generate_content(self, *args, **kwargs):
+        start_time = self._stats.start()
+        error = True
+        try:
+            response = self._model.generate_content(*args, **kwargs)
+            error = False
+            return response
+        finally:
+            self._stats.finish(start_time, error)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+def get_gemini_model(model_name="gemini-pro-vision", **model_kwargs):
+    """Get the shared Gemini model for this process."""
+    def configure():
+        options = {"transport": GEMINI_TRANSPORT} if GEMINI_TRANSPORT else {}
+        if GEMINI_API_ENDPOINT:
+            options["client_options"] = {"api_endpoint": GEMINI_API_ENDPOINT}
+        genai.configure(api_key=GOOGLE_API_KEY, **options)
+        return True
+
+    client_registry.get(("gemini-config",), configure)
+
+    key = ("gemini", model_name, repr(sorted(model_kwargs.items())))
+    return client_registry.get(key, lambda: InstrumentedModel(
+        genai.GenerativeModel(model_name, **model_kwargs), client_registry.provider_stats("gemini")
+    ))
+
+
+if HTTPX_AVAILABLE:
+    class CountingTransport(httpx.HTTPTransport):
+        """HTTP transport that records every request in ProviderStats."""
+
+        def __init__(self, stats, **kwargs):
+            super().__init__(**kwargs)
+            self.stats = stats
+
+        def handle_request(self, request):
+            start_time = self.stats.start()
+            error = True
+            try:
+                response = super().handle_request(request)
+                error = response.status_code >= 400
+                return response
+            finally:
+                self.stats.finish(start_time, error)
+
+
+def get_openai_http_client():
+    """Get the shared, pooled HTTP client for OpenAI requests (None without httpx)."""
+    if not HTTPX_AVAILABLE:
+        return None
+
+    def create():
+        limits = httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+        )
+        transport = CountingTransport(client_registry.provider_stats("openai"), limits=limits)
+        return httpx.Client(transport=transport, timeout=OPENAI_TIMEOUT)
+
+    return client_registry.get(("openai-http",), create)
+
+
+def get_openai_client():
+    """Get the shared OpenAI client, which uses the pooled HTTP client."""
+    from openai import OpenAI
+
+    return client_registry.get(("openai",), lambda: OpenAI(
+        api_key=OPENAI_API_KEY, http_client=get_openai_http_client()
+    ))
+
+
+def get_chat_model(model="gpt-4-turbo"):
+    """Get the shared LangChain ChatOpenAI model using the pooled OpenAI client."""
+    from langchain_openai import ChatOpenAI
+
+    # Pass the sync client itself: langchain-openai would also hand an
+    # http_client to its AsyncOpenAI client, which only accepts async ones.
+    return client_registry.get(("openai-chat", model), lambda: ChatOpenAI(
+        model=model, api_key=OPENAI_API_KEY, client=get_openai_client().chat.completions
+    ))
+
+
+def client_stats():
+    """Request counters for every API provider used in this process."""
+    return client_registry.snapshot()
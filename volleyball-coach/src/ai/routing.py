@@ -0,0 +1,249 @@
+"""
+Request routing between direct tool calls and the LLM agent.
+
+Structured requests (a known analysis type plus a frame) map to exactly one
+tool, so they are dispatched to that tool directly. Only free-form coach
+questions go through the agent, where GPT-4-turbo decides which tools to
+call. Every route records its requests and latency, and direct routes also
+record the agent round-trips (latency and estimated cost) they avoided.
+"""
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from ai.analysis_tools import DIRECT_TOOL_ROUTES, get_volleyball_agent, shared_frame
+
+# Call the single matching tool directly instead of routing through the LLM
+DIRECT_TOOL_CALLS = os.getenv("DIRECT_TOOL_CALLS", "true").lower() == "true"
+
+# LLM calls an agent makes for a single-tool request (pick the tool, then answer)
+AGENT_LLM_CALLS_PER_REQUEST = 2
+
+# Estimates used until agent requests have been measured
+AGENT_LLM_CALL_SECONDS = float(os.getenv("AGENT_LLM_CALL_SECONDS", "1.5"))
+AGENT_PROMPT_TOKENS = int(os.getenv("AGENT_PROMPT_TOKENS", "700"))
+AGENT_COMPLETION_TOKENS = int(os.getenv("AGENT_COMPLETION_TOKENS", "80"))
+
+# Router model prices in USD per 1K tokens (gpt-4-turbo list prices)
+AGENT_PROMPT_COST_PER_1K = float(os.getenv("AGENT_PROMPT_COST_PER_1K", "0.01"))
+AGENT_COMPLETION_COST_PER_1K = float(os.getenv("AGENT_COMPLETION_COST_PER_1K", "0.03"))
+
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """Collects LLM call count, time and token usage during one agent run"""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start_time = self._started.pop(run_id, None)
+        if start_time is not None:
+            self.llm_seconds += time.perf_counter() - start_time
+        self.llm_calls += 1
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+
+
+class RouteStats:
+    """Counters for one route"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.llm_calls = 0
+        self.saved_seconds = 0.0
+        self.saved_cost = 0.0
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_latency_ms": round(self.total_seconds / self.requests * 1000, 1) if self.requests else 0.0,
+            "llm_calls": self.llm_calls,
+            "saved_seconds": round(self.saved_seconds, 2),
+            "saved_cost_usd": round(self.saved_cost, 4),
+        }
+
+
+class AnalysisRouter:
+    """Dispatch analysis requests to a tool directly or to the agent"""
+
+    def __init__(self, direct=None):
+        """
+        Initialize the router.
+
+        Args:
+            direct: Whether structured requests call tools directly (defaults to DIRECT_TOOL_CALLS)
+        """
+        self.direct = DIRECT_TOOL_CALLS if direct is None else direct
+        self.lock = threading.Lock()
+        self.routes = {}
+
+        # Measured agent LLM usage, used to price the calls direct routes avoid
+        self.agent_llm_calls = 0
+        self.agent_llm_seconds = 0.0
+        self.agent_prompt_tokens = 0
+        self.agent_completion_tokens = 0
+
+    def route_for(self, analysis_type=None, frame_bytes=None, direct=None):
+        """
+        Pick the route for a request.
+
+        Args:
+            analysis_type: Requested analysis type, if any
+            frame_bytes: Frame to analyze, if any
+            direct: Override for the router's direct dispatch setting
+
+        Returns:
+            "direct:<tool name>" for structured requests with a single matching tool, otherwise "agent"
+        """
+        direct = self.direct if direct is None else direct
+        if direct and frame_bytes is not None and analysis_type in DIRECT_TOOL_ROUTES:
+            tool, _ = DIRECT_TOOL_ROUTES[analysis_type]
+            return f"direct:{tool.name}"
+        return "agent"
+
+    def _agent_call_estimate(self):
+        """Average latency, prompt and completion tokens of one agent LLM call"""
+        with self.lock:
+            calls = self.agent_llm_calls
+            if not calls:
+                return AGENT_LLM_CALL_SECONDS, AGENT_PROMPT_TOKENS, AGENT_COMPLETION_TOKENS
+            seconds = self.agent_llm_seconds / calls
+            # Streaming responses carry no token usage, so keep the estimates then
+            prompt_tokens = self.agent_prompt_tokens / calls if self.agent_prompt_tokens else AGENT_PROMPT_TOKENS
+            completion_tokens = self.agent_completion_tokens / calls if self.agent_completion_tokens else AGENT_COMPLETION_TOKENS
+            return seconds, prompt_tokens, completion_tokens
+
+    def _record(self, route, seconds, error=False, llm_calls=0, saved_seconds=0.0, saved_cost=0.0):
+        with self.lock:
+            stats = self.routes.setdefault(route, RouteStats())
+            stats.requests += 1
+            stats.errors += int(error)
+            stats.total_seconds += seconds
+            stats.llm_calls += llm_calls
+            stats.saved_seconds += saved_seconds
+            stats.saved_cost += saved_cost
+
+    def _run_direct(self, route, frame_bytes, analysis_type):
+        tool, arguments = DIRECT_TOOL_ROUTES[analysis_type]
+        start_time = time.perf_counter()
+        try:
+            result = tool.func(frame_bytes=frame_bytes, **arguments)
+        except Exception:
+            self._record(route, time.perf_counter() - start_time, error=True)
+            raise
+
+        call_seconds, prompt_tokens, completion_tokens = self._agent_call_estimate()
+        saved_cost = AGENT_LLM_CALLS_PER_REQUEST * (
+            prompt_tokens / 1000 * AGENT_PROMPT_COST_PER_1K +
+            completion_tokens / 1000 * AGENT_COMPLETION_COST_PER_1K
+        )
+        self._record(
+            route, time.perf_counter() - start_time,
+            saved_seconds=AGENT_LLM_CALLS_PER_REQUEST * call_seconds, saved_cost=saved_cost
+        )
+        return result
+
+    def _run_agent(self, agent, instruction, frame_bytes=None):
+        agent = agent or get_volleyball_agent()
+        usage = LLMUsageCallback()
+        start_time = time.perf_counter()
+        error = True
+        try:
+            if frame_bytes is None:
+                result = agent.invoke({"input": instruction}, config={"callbacks": [usage]})
+            else:
+                with shared_frame(frame_bytes) as frame_id:
+                    result = agent.invoke({
+                        "input": f"{instruction}\nThe frame is '{frame_id}'. Pass '{frame_id}' as frame_bytes to the tools."
+                    }, config={"callbacks": [usage]})
+            error = False
+            return result["output"]
+        finally:
+            self._record("agent", time.perf_counter() - start_time, error=error, llm_calls=usage.llm_calls)
+            with self.lock:
+                self.agent_llm_calls += usage.llm_calls
+                self.agent_llm_seconds += usage.llm_seconds
+                self.agent_prompt_tokens += usage.prompt_tokens
+                self.agent_completion_tokens += usage.completion_tokens
+
+    def analyze(self, frame_bytes, analysis_type, agent=None, direct=None):
+        """
+        Analyze a frame with a specific analysis type.
+
+        Args:
+            frame_bytes: JPEG/PNG bytes of the frame
+            analysis_type: Type of analysis (technique, positioning, tactics, players, events)
+            agent: Agent executor for routed requests (None uses the pooled default agent)
+            direct: Override for the router's direct dispatch setting
+
+        Returns:
+            Analysis results as text
+        """
+        route = self.route_for(analysis_type, frame_bytes, direct)
+        if route != "agent":
+            return self._run_direct(route, frame_bytes, analysis_type)
+        return self._run_agent(agent, f"Analyze this volleyball frame for {analysis_type}.", frame_bytes)
+
+    def ask(self, question, frame_bytes=None, agent=None):
+        """
+        Answer a free-form coach question with the agent.
+
+        Args:
+            question: The coach's question
+            frame_bytes: Optional frame the question refers to
+            agent: Agent executor (None uses the pooled default agent)
+
+        Returns:
+            The agent's answer
+        """
+        return self._run_agent(agent, question, frame_bytes)
+
+    def stats(self):
+        """Counters per route, plus the totals saved by direct routes"""
+        with self.lock:
+            routes = {route: stats.to_dict() for route, stats in self.routes.items()}
+        return {
+            "routes": routes,
+            "saved_seconds": round(sum(r["saved_seconds"] for r in routes.values()), 2),
+            "saved_cost_usd": round(sum(r["saved_cost_usd"] for r in routes.values()), 4),
+        }
+
+
+# Shared router for the web app and the video pipeline
+analysis_router = AnalysisRouter()
+
+def analyze_with_agent(agent, frame_bytes, analysis_type, direct=None):
+    """
+    Analyze a frame, calling the matching tool directly when there is exactly one.
+
+    Args:
+        agent: Agent executor for routed requests (None uses the pooled default agent)
+        frame_bytes: JPEG/PNG bytes of the frame
+        analysis_type: Type of analysis (technique, positioning, tactics, players, events)
+        direct: Override for the router's direct dispatch setting (DIRECT_TOOL_CALLS)
+
+    Returns:
+        Analysis results as text
+    """
+    return analysis_router.analyze(frame_bytes, analysis_type, agent, direct)
+
+def routing_stats():
+    """Counters of the shared router"""
+    return analysis_router.stats()
@@ -0,0 +1,194 @@
+"""
+Structured technique analysis results.
+
+Technique analyses are requested from Gemini as JSON matching
+TECHNIQUE_SCHEMA, so stats updates read typed fields instead of scraping
+free text. Results stay usable as text: AnalysisText is a str carrying the
+parsed fields in its `structured` attribute. Free-text results (older
+models, agent answers) are classified with one compiled regex in a single
+pass.
+"""
+import json
+import re
+
+import google.generativeai as genai
+
+TECHNIQUES = ["serving", "setting", "spiking", "blocking", "digging", "passing"]
+
+# JSON schema of a technique analysis
+TECHNIQUE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "technique": {"type": "string", "enum": TECHNIQUES + ["none"]},
+        "quality_score": {"type": "number", "minimum": 0, "maximum": 1},
+        "summary": {"type": "string"},
+        "issues": {"type": "array", "items": {"type": "string"}},
+        "cues": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["technique", "quality_score", "summary", "issues", "cues"],
+}
+
+TECHNIQUE_JSON_PROMPT = (
+    "Analyze the volleyball technique being performed in this frame. "
+    "Respond only with a JSON object matching this schema, without markdown:\n"
+    + json.dumps(TECHNIQUE_SCHEMA) +
+    "\ntechnique is the main skill shown, quality_score rates its execution from 0 (poor) "
+    "to 1 (excellent), issues are form problems and cues are short coaching corrections."
+)
+
+# Keywords used to classify free-text results, in priority order
+TECHNIQUE_KEYWORDS = {
+    "serving": ["serve", "serving", "float serve", "jump serve", "underhand serve"],
+    "setting": ["set", "setting", "overhead pass"],
+    "spiking": ["spike", "spiking", "attack", "hitting"],
+    "blocking": ["block", "blocking", "net defense"],
+    "digging": ["dig", "digging", "defense", "defensive position"],
+    "passing": ["pass", "passing", "bump", "forearm pass"],
+}
+
+QUALITY_KEYWORDS = {
+    "high": ["excellent", "perfect", "great"],
+    "good": ["good"],
+    "low": ["poor", "incorrect", "improve"],
+}
+
+QUALITY_SCORES = {"high": 0.9, "good": 0.7, "low": 0.3}
+
+SUGGESTION_KEYWORDS = ["improve", "should", "try to", "adjust", "correct"]
+
+
+def _alternation(keywords):
+    # Longest first, so "float serve" wins over "serve" at the same position
+    return "|".join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True))
+
+# One regex with a named group per technique and quality level
+KEYWORD_PATTERN = re.compile(
+    r"\b(?:" + "|".join(
+        f"(?P<{name}>{_alternation(keywords)})"
+        for name, keywords in list(TECHNIQUE_KEYWORDS.items()) + [(f"quality_{level}", words) for level, words in QUALITY_KEYWORDS.items()]
+    ) + ")",
+    re.IGNORECASE,
+)
+
+# Sentences containing an improvement suggestion
+SUGGESTION_PATTERN = re.compile(
+    r"[^.]*\b(?:" + _alternation(SUGGESTION_KEYWORDS) + r")[^.]*",
+    re.IGNORECASE,
+)
+
+
+class AnalysisText(str):
+    """Analysis text that also carries the structured result it was made from"""
+
+    def __new__(cls, text, structured=None):
+        obj = super().__new__(cls, text)
+        obj.structured = structured
+        return obj
+
+
+def json_generation_config():
+    """Generation config requesting JSON output, if the installed library supports it"""
+    fields = getattr(genai.types.GenerationConfig, "__dataclass_fields__", {})
+    config = {}
+    if "response_mime_type" in fields:
+        config["response_mime_type"] = "application/json"
+    if "response_schema" in fields:
+        config["response_schema"] = TECHNIQUE_SCHEMA
+    return config
+
+
+def parse_technique_json(text):
+    """
+    Parse and normalize a JSON technique analysis.
+
+    Args:
+        text: Model response, optionally wrapped in a markdown code fence
+
+    Returns:
+        Dictionary with the TECHNIQUE_SCHEMA fields, or None if the text is not valid JSON
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    technique = str(data.get("technique", "none")).lower()
+    if technique not in TECHNIQUES:
+        # Accept "spike", "serve", ... as well as the enum values
+        match = KEYWORD_PATTERN.search(technique)
+        technique = match.lastgroup if match and match.lastgroup in TECHNIQUES else "none"
+
+    try:
+        quality_score = min(max(float(data.get("quality_score", 0.5)), 0.0), 1.0)
+    except (TypeError, ValueError):
+        quality_score = 0.5
+
+    return {
+        "technique": technique,
+        "quality_score": quality_score,
+        "summary": str(data.get("summary", "")),
+        "issues": [str(issue) for issue in data.get("issues") or []],
+        "cues": [str(cue) for cue in data.get("cues") or []],
+    }
+
+
+def format_technique_analysis(structured):
+    """Render a structured technique analysis as readable text"""
+    lines = []
+    if structured["technique"] != "none":
+        lines.append(f"Technique: {structured['technique'].capitalize()} (quality {structured['quality_score']:.1f}/1.0)")
+    if structured["summary"]:
+        lines.append(structured["summary"])
+    if structured["issues"]:
+        lines.append("Issues: " + "; ".join(structured["issues"]))
+    if structured["cues"]:
+        lines.append("To improve: " + "; ".join(structured["cues"]))
+    return "\n".join(lines)
+
+
+def classify_free_text(text):
+    """
+    Classify a free-text technique analysis in one pass over the text.
+
+    Args:
+        text: Analysis text
+
+    Returns:
+        Dictionary with technique (or None), quality_score and suggestions
+    """
+    found = {match.lastgroup for match in KEYWORD_PATTERN.finditer(text)}
+
+    technique = next((t for t in TECHNIQUE_KEYWORDS if t in found), None)
+    quality_score = next(
+        (QUALITY_SCORES[level] for level in QUALITY_KEYWORDS if f"quality_{level}" in found), 0.5
+    )
+    suggestions = [s.strip() for s in SUGGESTION_PATTERN.findall(text) if s.strip()]
+
+    return {"technique": technique, "quality_score": quality_score, "suggestions": suggestions}
+
+
+def technique_stats(result):
+    """
+    Get technique, quality score and suggestions from an analysis result.
+
+    Args:
+        result: AnalysisText with a structured result, or any free-text analysis
+
+    Returns:
+        Dictionary with technique (or None), quality_score and suggestions
+    """
+    structured = getattr(result, "structured", None)
+    if structured is None:
+        return classify_free_text(result)
+
+    technique = structured["technique"]
+    return {
+        "technique": technique if technique != "none" else None,
+        "quality_score": structured["quality_score"],
+        "suggestions": structured["cues"],
+    }
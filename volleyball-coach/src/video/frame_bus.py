@@ -0,0 +1,389 @@
+"""
+Shared-memory frame bus for the live pipeline.
+
+The capture loop writes each camera frame once into a ring of preallocated
+slots in a multiprocessing.shared_memory block. Consumers (the analysis
+worker, /video_feed, /get_frame, /capture_still, /analyze/<type>) take a
+reference to the latest slot and read the frame in place through a
+read-only NumPy view, without copying it.
+
+Every slot has a sequence number and a reference count in the shared
+header. The producer only reuses slots nobody holds, so a frame never
+changes under a reader; when every slot is held the new frame is dropped.
+Encoded JPEG variants are cached per slot and sequence number, so any
+number of consumers of the same frame share one encode.
+
+A frame larger than the slots (the camera switched resolution) moves the
+bus to a new, larger ring; references held on the old ring stay valid
+until they are released.
+
+Other processes can read the ring with FrameBus.attach(name, lock); the
+bus must then be created with a multiprocessing lock, which guards the
+header in both processes, and readers must attach again when name changes
+after a frame size increase. The JPEG cache is per process.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Frame slots in the ring
+FRAME_BUS_SLOTS = int(os.environ.get('FRAME_BUS_SLOTS', '8'))
+
+_CONTROL = np.dtype([('slots', '<i8'), ('slot_bytes', '<i8'), ('latest', '<i8'), ('seq', '<i8')])
+_SLOT = np.dtype([('seq', '<i8'), ('refs', '<i8'), ('timestamp', '<f8'),
+                  ('height', '<i4'), ('width', '<i4'), ('channels', '<i4'), ('pad', '<i4')])
+_DATA_ALIGN = 64
+
+
+def _data_offset(slots):
+    header = _CONTROL.itemsize + slots * _SLOT.itemsize
+    return (header + _DATA_ALIGN - 1) // _DATA_ALIGN * _DATA_ALIGN
+
+
+def _release_block(block, unlink, close=True):
+    if close:
+        try:
+            block.close()
+        except BufferError:
+            pass
+    if unlink:
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FrameRef:
+    """
+    A held frame slot; release it (or leave the with block) when done.
+
+    frame is a read-only view into shared memory that stays valid while the
+    reference is held.
+    """
+
+    def __init__(self, bus, meta, slot, seq, timestamp, frame):
+        self.bus = bus
+        # Slot headers of the ring the frame is in (the bus may have moved
+        # to a larger ring since)
+        self.meta = meta
+        self.slot = slot
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+        self.released = False
+
+    def jpeg(self, variant="raw", quality=None, render=None):
+        """
+        Get the frame as JPEG bytes, encoding it once per slot and variant.
+
+        Args:
+            variant: Cache key of the rendering (e.g. "raw" or "overlay")
+            quality: JPEG quality (OpenCV default if None)
+            render: Function drawing the variant onto a writable copy of
+                the frame and returning it (None encodes the frame as is)
+
+        Returns:
+            bytes: JPEG data
+        """
+        return self.bus.jpeg(self, variant, quality, render)
+
+    def copy(self):
+        """Writable copy of the frame that outlives the reference"""
+        return self.frame.copy()
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.frame = None
+            self.bus.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FrameBus:
+    """Ring of shared-memory frame slots with one producer and any number of readers"""
+
+    def __init__(self, slots=None, frame_shape=None, lock=None):
+        """
+        Create a frame bus.
+
+        Args:
+            slots: Number of frame slots (defaults to FRAME_BUS_SLOTS)
+            frame_shape: Expected frame shape (height, width, channels); if
+                None the ring is allocated for the first published frame
+                (either way it grows when a larger frame is published)
+            lock: Lock guarding the header; pass a multiprocessing lock to
+                read the ring from other processes
+        """
+        self.slots = max(slots or FRAME_BUS_SLOTS, 2)
+        self.lock = lock or threading.Lock()
+        self.owner = True
+        self.block = None
+        self.control = None
+        self.meta = None
+        self.data = None
+        self.slot_bytes = 0
+        self.retired = []
+        self._finalizer = None
+        self._init_local()
+        if frame_shape is not None:
+            self._allocate(int(np.prod(frame_shape)))
+
+    @classmethod
+    def attach(cls, name, lock):
+        """
+        Read the ring of a bus created in another process.
+
+        Args:
+            name: Shared memory name of the bus (FrameBus.name)
+            lock: The bus's lock (FrameBus.lock)
+
+        Returns:
+            FrameBus reading the shared ring
+        """
+        block = shared_memory.SharedMemory(name=name)
+        control = np.ndarray((), dtype=_CONTROL, buffer=block.buf)
+        bus = cls.__new__(cls)
+        bus.slots = int(control['slots'])
+        bus.lock = lock
+        bus.owner = False
+        bus.retired = []
+        bus._finalizer = None
+        bus._init_local()
+        bus._map(block, int(control['slot_bytes']))
+        del control
+        return bus
+
+    def _init_local(self):
+        self.new_frame = threading.Condition()
+        self.slot_locks = [threading.Lock() for _ in range(self.slots)]
+        self.jpeg_cache = [(0, {}) for _ in range(self.slots)]
+        self.published = 0
+        self.dropped = 0
+        self.reallocations = 0
+        self.encodes = 0
+        self.cache_hits = 0
+
+    def _allocate(self, slot_bytes):
+        block = shared_memory.SharedMemory(create=True, size=_data_offset(self.slots) + self.slots * slot_bytes)
+        with self.lock:
+            if self.block is not None:
+                self.retired.append((self.block, self.meta))
+            # Sequence numbers continue, so JPEG cache entries of the old
+            # ring never match frames of the new one
+            seq = self.seq
+            self._map(block, slot_bytes)
+            self.control[...] = (self.slots, slot_bytes, -1, seq)
+            self.meta[:] = 0
+        if self._finalizer is not None:
+            # The old ring is unlinked now and unmapped once its frames are released
+            self._finalizer.detach()
+            _release_block(self.retired[-1][0], unlink=True, close=False)
+            self._close_retired()
+        self._finalizer = weakref.finalize(self, _release_block, block, True)
+
+    def _close_retired(self):
+        # Unmapping invalidates frame views, so only rings nobody holds
+        with self.lock:
+            idle = [ring for ring in self.retired if not np.count_nonzero(ring[1]['refs'])]
+            self.retired = [ring for ring in self.retired if np.count_nonzero(ring[1]['refs'])]
+        for block, _ in idle:
+            _release_block(block, False)
+
+    def _map(self, block, slot_bytes):
+        self.block = block
+        self.slot_bytes = slot_bytes
+        self.control = np.ndarray((), dtype=_CONTROL, buffer=block.buf)
+        self.meta = np.ndarray((self.slots,), dtype=_SLOT, buffer=block.buf, offset=_CONTROL.itemsize)
+        self.data = np.ndarray((self.slots, slot_bytes), dtype=np.uint8, buffer=block.buf,
+                               offset=_data_offset(self.slots))
+
+    @property
+    def name(self):
+        """Shared memory name for FrameBus.attach (None until allocated)"""
+        return self.block.name if self.block is not None else None
+
+    @property
+    def seq(self):
+        """Sequence number of the latest frame (0 before the first)"""
+        return int(self.control['seq']) if self.control is not None else 0
+
+    def publish(self, frame):
+        """
+        Write a frame into a free slot and make it the latest.
+
+        Args:
+            frame: uint8 frame (height, width, channels)
+
+        Returns:
+            int: Sequence number of the frame, or None if every slot was held
+        """
+        if frame.dtype != np.uint8:
+            raise ValueError(f"Frame bus frames must be uint8, got {frame.dtype}")
+        if self.block is None:
+            self._allocate(frame.nbytes)
+        elif frame.nbytes > self.slot_bytes:
+            logger.warning("Frame of %s bytes does not fit the %s-byte slots, reallocating the frame bus",
+                           frame.nbytes, self.slot_bytes)
+            self._allocate(frame.nbytes)
+            self.reallocations += 1
+
+        with self.lock:
+            latest = int(self.control['latest'])
+            slot = None
+            for step in range(1, self.slots + 1):
+                candidate = (latest + step) % self.slots
+                if candidate != latest and self.meta['refs'][candidate] == 0:
+                    slot = candidate
+                    break
+            if slot is None:
+                self.dropped += 1
+                return None
+            # Invisible to readers while it is written
+            self.meta['seq'][slot] = 0
+
+        self.data[slot, :frame.nbytes].reshape(frame.shape)[...] = frame
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+
+        with self.lock:
+            seq = int(self.control['seq']) + 1
+            self.meta[slot] = (seq, 0, time.time(), height, width, channels, 0)
+            self.control['seq'] = seq
+            self.control['latest'] = slot
+        self.published += 1
+
+        with self.new_frame:
+            self.new_frame.notify_all()
+        return seq
+
+    def _acquire(self, slot):
+        # Called with the lock held
+        meta = self.meta[slot]
+        self.meta['refs'][slot] += 1
+        height, width, channels = int(meta['height']), int(meta['width']), int(meta['channels'])
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        frame = self.data[slot, :height * width * channels].reshape(shape)
+        frame.flags.writeable = False
+        return FrameRef(self, self.meta, slot, int(meta['seq']), float(meta['timestamp']), frame)
+
+    def latest(self):
+        """
+        Hold the latest frame.
+
+        Returns:
+            FrameRef, or None before the first frame
+        """
+        if self.control is None:
+            return None
+        with self.lock:
+            slot = int(self.control['latest'])
+            if slot < 0:
+                return None
+            return self._acquire(slot)
+
+    def next(self, after_seq, timeout=1.0):
+        """
+        Wait for a frame newer than after_seq and hold it.
+
+        Args:
+            after_seq: Sequence number already seen
+            timeout: Seconds to wait
+
+        Returns:
+            FrameRef, or None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.seq > after_seq:
+                ref = self.latest()
+                if ref is not None:
+                    return ref
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if self.owner:
+                with self.new_frame:
+                    if self.seq <= after_seq:
+                        self.new_frame.wait(min(remaining, 0.1))
+            else:
+                # Publishes from another process are not signalled here
+                time.sleep(min(remaining, 0.005))
+
+    def release(self, ref):
+        with self.lock:
+            meta, ref.meta = ref.meta, None
+            if meta is None or self.meta is None:
+                # Already released, or the bus is closed
+                return
+            meta['refs'][ref.slot] -= 1
+            retired = meta is not self.meta
+        if retired:
+            self._close_retired()
+
+    def jpeg(self, ref, variant="raw", quality=None, render=None):
+        """Encoded JPEG of a held frame, shared by every consumer of the slot (see FrameRef.jpeg)"""
+        if ref.released:
+            raise ValueError("Frame reference was released")
+        key = (variant, quality)
+        with self.slot_locks[ref.slot]:
+            cache_seq, cache = self.jpeg_cache[ref.slot]
+            if cache_seq != ref.seq:
+                cache = {}
+                self.jpeg_cache[ref.slot] = (ref.seq, cache)
+            if key in cache:
+                self.cache_hits += 1
+                return cache[key]
+
+            image = render(ref.frame.copy()) if render is not None else ref.frame
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if quality is not None else []
+            success, buffer = cv2.imencode('.jpg', image, params)
+            if not success:
+                raise ValueError("Could not encode frame as JPEG")
+            cache[key] = buffer.tobytes()
+            self.encodes += 1
+            return cache[key]
+
+    def stats(self):
+        """Ring size and publish, drop and encode counters"""
+        held = int(np.count_nonzero(self.meta['refs'])) if self.meta is not None else 0
+        return {
+            "name": self.name,
+            "slots": self.slots,
+            "slot_bytes": self.slot_bytes,
+            "seq": self.seq,
+            "held_slots": held,
+            "published": self.published,
+            "dropped": self.dropped,
+            "reallocations": self.reallocations,
+            "jpeg_encodes": self.encodes,
+            "jpeg_cache_hits": self.cache_hits,
+        }
+
+    def close(self):
+        """Unmap the ring (and remove it, in the creating process)"""
+        with self.new_frame:
+            self.new_frame.notify_all()
+        block, self.block = self.block, None
+        self.control = self.meta = self.data = None
+        retired, self.retired = self.retired, []
+        for old_block, _ in retired:
+            _release_block(old_block, False)
+        if block is None:
+            return
+        if self.owner:
+            self._finalizer()
+        else:
+            _release_block(block, False)
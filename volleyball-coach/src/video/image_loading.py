@@ -0,0 +1,42 @@
+"""
+Reduced-resolution image loading for previews.
+
+libjpeg can decode a JPEG straight to 1/2, 1/4 or 1/8 scale by skipping
+part of the inverse DCT (PIL's Image.draft), so a preview of a 4K phone
+capture never decodes the full frame. Counterpart of
+volleyball_ai.image_loading on the server.
+"""
+import io
+
+from PIL import Image
+
+
+def image_header(data):
+    """Format and (width, height) of encoded image bytes, or (None, None)"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format, image.size
+    except Exception:
+        return None, None
+
+
+def preview_jpeg(source, max_size, quality=85):
+    """
+    Encode a preview that fits in max_size x max_size.
+
+    Args:
+        source: Image file path or encoded bytes
+        max_size: Longest edge of the preview in pixels
+        quality: JPEG quality of the preview
+
+    Returns:
+        bytes: JPEG data
+    """
+    with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as image:
+        # JPEGs are decoded at the smallest DCT scale that still covers the preview
+        image.draft('RGB', (max_size, max_size))
+        image = image.convert('RGB')
+    image.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
@@ -5,10 +5,15 @@ import threading
 import queue
 import sys
 import os
+import logging
 
 # Add parent directory to path to import from ai module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from ai.analysis_tools import create_volleyball_agent
+from ai.routing import analysis_router
+from video.frame_bus import FrameBus
+from video.session_stats import SessionStats
+
+logger = logging.getLogger(__name__)
 
 class VolleyballAnalysisPipeline:
     def __init__(self, camera_index=0, analysis_interval=3, video_file=None):
@@ -32,33 +37,32 @@ class VolleyballAnalysisPipeline:
             "positioning": "No analysis yet",
             "tactics": "No analysis yet"
         }
-        self.agent = create_volleyball_agent()
+        self.router = analysis_router
         self.callback = None
-        self.frame_queue = queue.Queue(maxsize=10)
+        self.frames = FrameBus()
         self.analysis_queue = queue.Queue()
         self.running = False
+        self.stopped = threading.Event()
         
     def set_callback(self, callback):
         """Set a callback function to receive analysis results"""
         self.callback = callback
         
     def encode_frame(self, frame):
-        """Convert OpenCV frame to bytes"""
+        """Convert OpenCV frame (or held frame bus slot) to JPEG bytes; bytes pass through"""
+        if isinstance(frame, (bytes, bytearray)):
+            return bytes(frame)
+        if hasattr(frame, 'jpeg'):
+            return frame.jpeg()
         _, buffer = cv2.imencode('.jpg', frame)
         return buffer.tobytes()
     
     def analyze_frame(self, frame, analysis_type):
-        """Analyze a single frame"""
+        """Analyze a single frame (known analysis types call the tool directly, without the agent)"""
         frame_bytes = self.encode_frame(frame)
         
         try:
-            result = self.agent.invoke({
-                "input": f"Analyze this volleyball frame for {analysis_type}.",
-                "frame_bytes": frame_bytes,
-                "analysis_type": analysis_type
-            })
-            
-            analysis_result = result["output"]
+            analysis_result = self.router.analyze(frame_bytes, analysis_type)
             
             # Update latest analysis
             self.latest_analysis[analysis_type] = analysis_result
@@ -72,28 +76,61 @@ class VolleyballAnalysisPipeline:
             
             return analysis_result
         except Exception as e:
-            print(f"Error analyzing frame: {e}")
+            logger.error("Error analyzing frame: %s", e)
             return f"Analysis error: {str(e)}"
     
-    def get_frames(self):
-        """Generator to yield frames from the video source"""
+    def ask(self, question, frame=None):
+        """Answer a free-form coach question with the agent, optionally about a frame"""
+        frame_bytes = self.encode_frame(frame) if frame is not None else None
+        return self.router.ask(question, frame_bytes)
+    
+    def capture_frames(self):
+        """Generator reading frames from the video source into the frame bus"""
         if not self.cap.isOpened():
-            print("Error: Could not open video capture")
+            logger.error("Could not open video capture")
             return
             
         while self.running:
             ret, frame = self.cap.read()
             if not ret:
                 break
-                
-            # Add overlay of current analysis
-            frame_with_overlay = self.add_analysis_overlay(frame.copy())
             
-            yield frame_with_overlay
+            # Written once; every consumer reads this copy
+            self.frames.publish(frame)
             
-            # Add original frame to queue for analysis
-            if not self.frame_queue.full():
-                self.frame_queue.put(frame)
+            # The capture buffer itself is free for the caller to draw on
+            yield frame
+    
+    def get_frames(self):
+        """Generator to yield frames from the video source"""
+        for frame in self.capture_frames():
+            # Add overlay of current analysis
+            yield self.add_analysis_overlay(frame)
+    
+    def stream_jpegs(self, timeout=1.0):
+        """
+        Generator yielding every new frame with the analysis overlay as JPEG.
+        
+        Reads the frames published by the capture loop; all viewers of a
+        frame share one overlay encode.
+        """
+        seq = 0
+        while not self.stopped.is_set():
+            ref = self.frames.next(seq, timeout)
+            if ref is None:
+                continue
+            with ref:
+                seq = ref.seq
+                jpeg = ref.jpeg("overlay", render=self.add_analysis_overlay)
+            yield jpeg
+    
+    def get_current_frame(self):
+        """Copy of the latest frame, or None before the first frame"""
+        ref = self.frames.latest()
+        if ref is None:
+            return None
+        with ref:
+            return ref.copy()
     
     def add_analysis_overlay(self, frame):
         """Add analysis text overlay to frame"""
@@ -111,33 +148,33 @@ class VolleyballAnalysisPipeline:
         """Worker thread to analyze frames"""
         while self.running:
             try:
-                # Get a frame from the queue
-                if not self.frame_queue.empty():
-                    frame = self.frame_queue.get(timeout=1)
+                # Determine which analysis type to run based on time
+                current_time = time.time()
+                ref = None
+                if current_time - self.last_analysis_time >= self.analysis_interval:
+                    ref = self.frames.latest()
+                
+                if ref is not None:
+                    types = list(self.latest_analysis.keys())
+                    analysis_type = types[(int(current_time) // self.analysis_interval) % len(types)]
+                    
+                    # Release the slot before the remote call; the JPEG is all the analysis needs
+                    with ref:
+                        frame_bytes = ref.jpeg()
                     
-                    # Determine which analysis type to run based on time
-                    current_time = time.time()
-                    if current_time - self.last_analysis_time >= self.analysis_interval:
-                        types = list(self.latest_analysis.keys())
-                        analysis_type = types[(int(current_time) // self.analysis_interval) % len(types)]
-                        
-                        print(f"Analyzing {analysis_type}...")
-                        self.analyze_frame(frame, analysis_type)
-                        self.last_analysis_time = current_time
-                        
-                    self.frame_queue.task_done()
+                    logger.debug("Analyzing %s", analysis_type)
+                    self.analyze_frame(frame_bytes, analysis_type)
+                    self.last_analysis_time = current_time
                 else:
-                    # Sleep briefly if queue is empty
+                    # Sleep briefly until the next analysis is due
                     time.sleep(0.1)
-            except queue.Empty:
-                # Timeout on queue.get, just continue
-                pass
             except Exception as e:
-                print(f"Error in analysis worker: {e}")
+                logger.exception("Error in analysis worker: %s", e)
     
     def start(self):
         """Start the analysis pipeline"""
         self.running = True
+        self.stopped.clear()
         
         # Start analysis worker thread
         self.analysis_thread = threading.Thread(target=self.analysis_worker)
@@ -147,31 +184,31 @@ class VolleyballAnalysisPipeline:
     def stop(self):
         """Stop the analysis pipeline"""
         self.running = False
+        self.stopped.set()
         if hasattr(self, 'analysis_thread'):
             self.analysis_thread.join(timeout=1.0)
         self.cap.release()
     
-    def process_video_feed(self):
-        """Process the video feed in real-time"""
+    def close(self):
+        """Stop the pipeline and free the frame bus"""
+        self.stop()
+        self.frames.close()
+    
+    def process_video_feed(self, display=True):
+        """Process the video feed in real-time (display=False only feeds the frame bus, e.g. for the web app)"""
         if not self.cap.isOpened():
-            print("Error: Could not open video capture")
+            logger.error("Could not open video capture")
             return
         
         self.start()
         
         try:
-            while self.running:
-                ret, frame = self.cap.read()
-                if not ret:
-                    break
+            for frame in self.capture_frames():
+                if not display:
+                    continue
                 
                 # Display the frame with analysis overlay
-                display_frame = self.add_analysis_overlay(frame.copy())
-                cv2.imshow('Volleyball Analysis', display_frame)
-                
-                # Add original frame to queue for analysis
-                if not self.frame_queue.full():
-                    self.frame_queue.put(frame)
+                cv2.imshow('Volleyball Analysis', self.add_analysis_overlay(frame))
                 
                 # Exit on 'q' key
                 if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -179,63 +216,50 @@ class VolleyballAnalysisPipeline:
                     
         finally:
             self.stop()
-            cv2.destroyAllWindows()
+            if display:
+                cv2.destroyAllWindows()
 
-class VolleyballStatTracker:
-    def __init__(self):
-        self.stats = {
-            'team': {
-                'attack_attempts': 0,
-                'kills': 0,
-                'errors': 0,
-                'blocks': 0,
-                'digs': 0,
-                'aces': 0,
-            },
-            'players': {}
-        }
+class VolleyballStatTracker(SessionStats):
+    """Session statistics for the live pipeline, safe to update from any thread"""
+    
+    @property
+    def stats(self):
+        """Team and player event counters"""
+        snapshot = self.snapshot()
+        return {'team': snapshot['session']['events'], 'players': snapshot['players']}
     
     def update_stats(self, event_type, player_id=None):
         """Update statistics based on recognized events"""
-        # Update team stats
-        if event_type in self.stats['team']:
-            self.stats['team'][event_type] += 1
-        
-        # Update player stats if player_id is provided
-        if player_id:
-            if player_id not in self.stats['players']:
-                self.stats['players'][player_id] = {
-                    'attack_attempts': 0,
-                    'kills': 0,
-                    'errors': 0,
-                    'blocks': 0,
-                    'digs': 0,
-                    'aces': 0,
-                }
-            
-            if event_type in self.stats['players'][player_id]:
-                self.stats['players'][player_id][event_type] += 1
+        self.record_event(event_type, player_id)
     
-    def get_team_efficiency(self):
+    def update_technique_stat(self, technique, quality_score):
+        """Record an identified technique with its quality score (0-1)"""
+        self.record_technique(technique, quality_score)
+    
+    def add_improvement_suggestion(self, technique, suggestion):
+        """Record an improvement suggestion for a technique"""
+        self.record_suggestion(technique, suggestion)
+    
+    def get_team_efficiency(self, events=None):
         """Calculate team attack efficiency"""
-        attempts = self.stats['team']['attack_attempts']
+        events = events or self.snapshot()['session']['events']
+        attempts = events['attack_attempts']
         if attempts == 0:
             return 0
         
-        kills = self.stats['team']['kills']
-        errors = self.stats['team']['errors']
-        
-        return (kills - errors) / attempts
+        return (events['kills'] - events['errors']) / attempts
     
-    def get_stats_summary(self):
+    def get_stats_summary(self, max_age=0.0):
         """Get a summary of current stats"""
-        efficiency = self.get_team_efficiency()
+        snapshot = self.snapshot(max_age=max_age)
+        events = snapshot['session']['events']
+        efficiency = self.get_team_efficiency(events)
         
         return {
-            'team_stats': self.stats['team'],
+            'team_stats': events,
             'efficiency': f"{efficiency:.3f}",
-            'player_count': len(self.stats['players']),
-            'total_points': self.stats['team']['kills'] + self.stats['team']['aces'] + self.stats['team']['blocks']
+            'player_count': len(snapshot['players']),
+            'total_points': events['kills'] + events['aces'] + events['blocks']
         }
 
 # Simple test function
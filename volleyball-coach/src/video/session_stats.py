@@ -0,0 +1,294 @@
+"""
+Session statistics engine for live analysis.
+
+Counters are written from analysis threads and Flask request threads at the
+same time. Each thread writes only to its own shard (fixed-size NumPy
+arrays), so updates never take a lock; reads merge all shards. Shards of
+threads that have exited are folded into a base shard, so the number of
+shards stays bounded by the number of live threads.
+
+Besides session totals, every shard keeps a ring of time buckets for
+rolling-window aggregates (e.g. the last 5 minutes) and per-set totals.
+"""
+import threading
+import time
+import weakref
+from collections import deque
+
+import numpy as np
+
+EVENT_TYPES = ["attack_attempts", "kills", "errors", "blocks", "digs", "aces"]
+TECHNIQUES = ["serving", "setting", "spiking", "passing", "blocking", "digging"]
+
+# Layout of the session metric vector
+METRICS = (
+    EVENT_TYPES +
+    [f"technique_{t}" for t in TECHNIQUES] +
+    [f"quality_{t}" for t in TECHNIQUES] +
+    ["analyses", "technique_analyses", "positioning_analyses", "tactics_analyses"]
+)
+METRIC_INDEX = {name: i for i, name in enumerate(METRICS)}
+EVENT_INDEX = {name: i for i, name in enumerate(EVENT_TYPES)}
+
+
+class StatShard:
+    """Counters written by a single thread"""
+
+    def __init__(self, max_players, max_sets, window_buckets):
+        self.metrics = np.zeros(len(METRICS), dtype=np.float64)
+        self.players = np.zeros((max_players, len(EVENT_TYPES)), dtype=np.int64)
+        self.sets = np.zeros((max_sets, len(METRICS)), dtype=np.float64)
+        self.buckets = np.zeros((window_buckets, len(METRICS)), dtype=np.float64)
+        self.bucket_ids = np.full(window_buckets, -1, dtype=np.int64)
+        self.suggestions = deque(maxlen=50)
+
+    def add(self, other):
+        """Fold another shard into this one"""
+        self.metrics += other.metrics
+        self.players += other.players
+        self.sets += other.sets
+        for slot, bucket_id in enumerate(other.bucket_ids):
+            if bucket_id < 0:
+                continue
+            if self.bucket_ids[slot] != bucket_id:
+                if self.bucket_ids[slot] > bucket_id:
+                    continue
+                self.buckets[slot] = 0
+                self.bucket_ids[slot] = bucket_id
+            self.buckets[slot] += other.buckets[slot]
+        self.suggestions.extend(other.suggestions)
+
+
+class _ShardOwner:
+    """Lives in a thread's local storage; collected when the thread exits"""
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class SessionStats:
+    """
+    Sharded, lock-free-for-writers session statistics.
+
+    Writers update the calling thread's shard without locking. Readers merge
+    the shards under a lock that only readers, shard registration and shard
+    retirement take.
+    """
+
+    def __init__(self, max_players=64, max_sets=5, window_seconds=300, bucket_seconds=5):
+        """
+        Initialize the statistics engine.
+
+        Args:
+            max_players: Capacity of the per-player counter arrays
+            max_sets: Number of sets tracked separately
+            window_seconds: Longest rolling window available
+            bucket_seconds: Time resolution of rolling windows
+        """
+        self.max_players = max_players
+        self.max_sets = max_sets
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = int(np.ceil(window_seconds / bucket_seconds)) + 1
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = []
+        self.base = self._new_shard()
+
+        self.player_slots = {}
+        self.current_set = 0
+        self.started_at = time.time()
+        self.last_update = None
+
+        self._snapshot = None
+        self._snapshot_time = 0.0
+
+    def _new_shard(self):
+        return StatShard(self.max_players, self.max_sets, self.window_buckets)
+
+    def _shard(self):
+        """Get the calling thread's shard, registering it on first use"""
+        owner = getattr(self.local, "owner", None)
+        if owner is None:
+            shard = self._new_shard()
+            owner = _ShardOwner(shard)
+            with self.lock:
+                self.shards.append(shard)
+            weakref.finalize(owner, self._retire, shard)
+            self.local.owner = owner
+        return owner.shard
+
+    def _retire(self, shard):
+        """Fold the shard of an exited thread into the base shard"""
+        with self.lock:
+            if shard in self.shards:
+                self.base.add(shard)
+                self.shards.remove(shard)
+
+    def _player_slot(self, player_id):
+        slot = self.player_slots.get(player_id)
+        if slot is None:
+            with self.lock:
+                slot = self.player_slots.get(player_id)
+                if slot is None:
+                    if len(self.player_slots) >= self.max_players:
+                        return None
+                    slot = len(self.player_slots)
+                    self.player_slots[player_id] = slot
+        return slot
+
+    def _add(self, metric, value=1.0, now=None):
+        """Add to a metric in the session, current set and current time bucket"""
+        now = now or time.time()
+        shard = self._shard()
+        index = METRIC_INDEX[metric]
+
+        shard.metrics[index] += value
+        shard.sets[min(self.current_set, self.max_sets - 1), index] += value
+
+        bucket_id = int(now // self.bucket_seconds)
+        slot = bucket_id % self.window_buckets
+        if shard.bucket_ids[slot] != bucket_id:
+            shard.buckets[slot] = 0
+            shard.bucket_ids[slot] = bucket_id
+        shard.buckets[slot, index] += value
+
+        self.last_update = now
+        return shard
+
+    def record_event(self, event_type, player_id=None):
+        """Count a game event (kills, blocks, ...) for the team and optionally a player"""
+        if event_type not in EVENT_INDEX:
+            return
+        shard = self._add(event_type)
+
+        if player_id is not None:
+            slot = self._player_slot(player_id)
+            if slot is not None:
+                shard.players[slot, EVENT_INDEX[event_type]] += 1
+
+    def record_technique(self, technique, quality_score):
+        """Count an identified technique and its quality score (0-1)"""
+        if technique not in TECHNIQUES:
+            return
+        now = time.time()
+        self._add(f"technique_{technique}", now=now)
+        self._add(f"quality_{technique}", float(quality_score), now=now)
+
+    def record_analysis(self, analysis_type):
+        """Count a completed frame analysis"""
+        now = time.time()
+        self._add("analyses", now=now)
+        if f"{analysis_type}_analyses" in METRIC_INDEX:
+            self._add(f"{analysis_type}_analyses", now=now)
+
+    def record_suggestion(self, technique, suggestion):
+        """Keep an improvement suggestion (the most recent ones per thread are kept)"""
+        self._shard().suggestions.append((time.time(), technique, suggestion))
+
+    def start_set(self):
+        """Start counting a new set"""
+        self.current_set = min(self.current_set + 1, self.max_sets - 1)
+        return self.current_set + 1
+
+    def _merged(self):
+        """Sum all shards (caller holds the lock)"""
+        merged = self._new_shard()
+        for shard in [self.base] + self.shards:
+            merged.add(shard)
+        return merged
+
+    def _window_totals(self, merged, seconds, now):
+        first_bucket = int((now - seconds) // self.bucket_seconds) + 1
+        mask = merged.bucket_ids >= first_bucket
+        return merged.buckets[mask].sum(axis=0)
+
+    def window(self, seconds=300):
+        """
+        Aggregate the most recent seconds of the session.
+
+        Args:
+            seconds: Window length (at most the window_seconds given at creation)
+
+        Returns:
+            Dictionary of metric totals
+        """
+        now = time.time()
+        with self.lock:
+            merged = self._merged()
+        return self._summarize(self._window_totals(merged, seconds, now))
+
+    @staticmethod
+    def _summarize(totals):
+        """Turn a metric vector into events, techniques and analysis counts"""
+        techniques = {}
+        for technique in TECHNIQUES:
+            count = int(totals[METRIC_INDEX[f"technique_{technique}"]])
+            quality = totals[METRIC_INDEX[f"quality_{technique}"]]
+            techniques[technique] = {
+                "count": count,
+                "avg_quality": round(quality / count, 3) if count else None,
+            }
+
+        return {
+            "events": {event: int(totals[METRIC_INDEX[event]]) for event in EVENT_TYPES},
+            "techniques": techniques,
+            "analyses": {
+                "total": int(totals[METRIC_INDEX["analyses"]]),
+                "technique": int(totals[METRIC_INDEX["technique_analyses"]]),
+                "positioning": int(totals[METRIC_INDEX["positioning_analyses"]]),
+                "tactics": int(totals[METRIC_INDEX["tactics_analyses"]]),
+            },
+        }
+
+    def snapshot(self, max_age=0.0, window_seconds=300, suggestions=10):
+        """
+        Consistent view of the session statistics.
+
+        Args:
+            max_age: Return a cached snapshot if it is at most this many seconds old
+            window_seconds: Length of the rolling window included in the snapshot
+            suggestions: Number of most recent improvement suggestions to include
+
+        Returns:
+            Dictionary with session, rolling window, per-set and per-player statistics
+        """
+        now = time.time()
+        cached = self._snapshot
+        if cached is not None and now - self._snapshot_time <= max_age:
+            return cached
+
+        with self.lock:
+            merged = self._merged()
+            player_slots = dict(self.player_slots)
+            current_set = self.current_set
+
+        session = self._summarize(merged.metrics)
+        players = {}
+        for player_id, slot in player_slots.items():
+            players[player_id] = {event: int(merged.players[slot, i]) for i, event in enumerate(EVENT_TYPES)}
+
+        recent = sorted(merged.suggestions, key=lambda item: item[0])[-suggestions:] if suggestions else []
+
+        snapshot = {
+            "timestamp": now,
+            "session_seconds": round(now - self.started_at, 1),
+            "last_update": self.last_update,
+            "session": session,
+            "window": {
+                "seconds": window_seconds,
+                **self._summarize(self._window_totals(merged, window_seconds, now)),
+            },
+            "sets": [self._summarize(merged.sets[i]) for i in range(current_set + 1)],
+            "current_set": current_set + 1,
+            "players": players,
+            "suggestions": [
+                {"timestamp": timestamp, "technique": technique, "suggestion": text}
+                for timestamp, technique, text in recent
+            ],
+        }
+
+        self._snapshot = snapshot
+        self._snapshot_time = now
+        return snapshot
@@ -11,13 +11,12 @@ import cv2
 import numpy as np
 import io
 import base64
-from flask import Flask, Response, render_template, jsonify, request, send_file, send_from_directory
+from flask import Flask, Response, render_template, jsonify, request, send_file, send_from_directory, g
 from dotenv import load_dotenv
 import tempfile
 import re
 import argparse
 import secrets
-import uuid
 from werkzeug.utils import secure_filename
 import ssl
 import shutil
@@ -29,23 +28,40 @@ from flask_cors import CORS
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from video.pipeline import VolleyballAnalysisPipeline, VolleyballStatTracker
+from video.image_loading import image_header, preview_jpeg
+from ai.clients import client_stats
+from ai.structured_output import technique_stats
+from web.structured_logging import configure_logging, bind_context, clear_context, logging_stats
+from web.profiling import start_profile, get_profile, list_profiles, start_sampler, sampler, collapsed_stacks, valid_profile_id
 
 # Fix the import to use the correct path
 try:
-    from ai.agent_tools import create_volleyball_agent, analyze_with_agent
+    from ai.analysis_tools import warm_volleyball_agents
+    from ai.routing import analysis_router, analyze_with_agent, routing_stats
 except ImportError:
-    print("Warning: ai.agent_tools module not found, some features will be disabled")
+    print("Warning: ai.analysis_tools module not found, some features will be disabled")
+    analysis_router = None
     
     # Create stub functions for missing imports
-    def create_volleyball_agent(*args, **kwargs):
-        return None
-        
     def analyze_with_agent(*args, **kwargs):
         return "AI analysis is not available in this deployment"
+    
+    def warm_volleyball_agents(*args, **kwargs):
+        return 0
+    
+    def routing_stats():
+        return {"routes": {}, "saved_seconds": 0.0, "saved_cost_usd": 0.0}
 
 # Load environment variables
 load_dotenv()
 
+# JSON log lines, written by a background thread (see LOG_LEVEL/LOG_FORMAT)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Low-frequency stack sampling of the whole process (see CONTINUOUS_PROFILING)
+start_sampler()
+
 # Set up application paths
 app_root = os.environ.get('FLASK_APP_ROOT', os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 template_path = os.environ.get('FLASK_TEMPLATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
@@ -60,6 +76,37 @@ app = Flask(__name__,
 app.config['CORS_HEADERS'] = 'Content-Type'
 cors = CORS(app)
 
+# Log lines written while a request is handled carry its ID and route, and
+# requests with an X-Profile header (or ?profile=) of "sample" or "cprofile"
+# are profiled under that ID
+@app.before_request
+def bind_request_log_context():
+    g.request_id = valid_profile_id(request.headers.get('X-Request-Id'))
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.log_context = bind_context(request_id=g.request_id, method=request.method, route=route)
+    
+    profile_mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if profile_mode:
+        g.profile = start_profile(g.request_id, f"{request.method} {route}", profile_mode.lower())
+
+@app.after_request
+def add_request_headers(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+        response.headers['X-Profile-Url'] = f"/api/profiles/{profile.id}"
+    if 'request_id' in g:
+        response.headers['X-Request-Id'] = g.request_id
+    return response
+
+@app.teardown_request
+def clear_request_log_context(error=None):
+    # Only still running when the request failed before after_request ran
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+    clear_context(g.pop('log_context', None))
+
 # Set port from environment variable
 port = int(os.environ.get('PORT', 10000))
 
@@ -70,7 +117,7 @@ key_path = os.path.join(os.path.dirname(__file__), 'key.pem')
 
 # Generate self-signed certificates if they don't exist
 if not os.path.exists(cert_path) or not os.path.exists(key_path):
-    print("SSL certificates not found. Generating self-signed certificates...")
+    logger.info("SSL certificates not found. Generating self-signed certificates...")
     try:
         from OpenSSL import crypto
         
@@ -99,10 +146,9 @@ if not os.path.exists(cert_path) or not os.path.exists(key_path):
         with open(key_path, "wb") as f:
             f.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, k))
         
-        print("Self-signed certificates generated successfully")
+        logger.info("Self-signed certificates generated successfully")
     except Exception as e:
-        print(f"Error generating SSL certificates: {str(e)}")
-        print("Will continue without SSL...")
+        logger.warning("Error generating SSL certificates, continuing without SSL: %s", e)
 
 # Use certificates if they exist
 if os.path.exists(cert_path) and os.path.exists(key_path):
@@ -110,11 +156,10 @@ if os.path.exists(cert_path) and os.path.exists(key_path):
         ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
         ssl_context.load_cert_chain(certfile=cert_path, keyfile=key_path)
         ssl_context.options |= ssl.OP_NO_TLSv1 | ssl.OP_NO_TLSv1_1  # Only use TLS 1.2 or higher
-        print("SSL certificates found, HTTPS will be enabled")
+        logger.info("SSL certificates found, HTTPS will be enabled")
     except Exception as e:
-        print(f"Error setting up SSL: {str(e)}")
+        logger.warning("Error setting up SSL, continuing without SSL: %s", e)
         ssl_context = None
-        print("Continuing without SSL...")
 
 # Create temp directory if not exists
 temp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'temp')
@@ -127,6 +172,10 @@ os.makedirs(static_dir, exist_ok=True)
 # Global pipeline instance
 pipeline = None
 
+# Build the pooled agent executors in the background so the first request doesn't pay for it
+if os.environ.get('WARM_AGENTS', 'true').lower() == 'true':
+    threading.Thread(target=warm_volleyball_agents, daemon=True).start()
+
 # Global stats tracker
 stats_tracker = VolleyballStatTracker()
 
@@ -170,62 +219,30 @@ def initialize_pipeline():
     pipeline_thread.daemon = True
     pipeline_thread.start()
     
-    print(f"Pipeline initialized with camera {app_settings['camera_index']} of type {app_settings['camera_type']}")
+    logger.info("Pipeline initialized with camera %s of type %s", app_settings['camera_index'], app_settings['camera_type'])
     return pipeline
 
 def analysis_callback(analysis_type, result):
     """Callback function for new analysis results"""
     # Update timestamps
     analysis_timestamps[analysis_type] = time.time()
+    stats_tracker.record_analysis(analysis_type)
     
     # Extract technique and quality information for stats
     if analysis_type == "technique":
         try:
-            # Try to identify the technique from the result
-            technique_keywords = {
-                "serving": ["serve", "serving", "float serve", "jump serve", "underhand serve"],
-                "setting": ["set", "setting", "overhead pass"],
-                "spiking": ["spike", "spiking", "attack", "hitting"],
-                "blocking": ["block", "blocking", "net defense"],
-                "digging": ["dig", "digging", "defense", "defensive position"],
-                "passing": ["pass", "passing", "bump", "forearm pass"]
-            }
-            
-            # Default technique and quality
-            detected_technique = None
-            quality_score = 0.5  # Default middle score
-            
-            # Search for technique keywords in the result
-            for technique, keywords in technique_keywords.items():
-                if any(keyword.lower() in result.lower() for keyword in keywords):
-                    detected_technique = technique
-                    
-                    # Try to estimate quality from the text
-                    if "excellent" in result.lower() or "perfect" in result.lower() or "great" in result.lower():
-                        quality_score = 0.9
-                    elif "good" in result.lower():
-                        quality_score = 0.7
-                    elif "poor" in result.lower() or "incorrect" in result.lower() or "improve" in result.lower():
-                        quality_score = 0.3
-                    
-                    break
+            # Typed fields for JSON analyses, one regex pass over legacy free text
+            stats = technique_stats(result)
             
             # Update stats if technique detected
-            if detected_technique:
-                stats_tracker.update_technique_stat(detected_technique, quality_score)
+            if stats["technique"]:
+                stats_tracker.update_technique_stat(stats["technique"], stats["quality_score"])
                 
-                # Extract improvement suggestions
-                if "improve" in result.lower() or "should" in result.lower() or "try to" in result.lower():
-                    # Look for sentences with improvement suggestions
-                    sentences = result.split('.')
-                    for sentence in sentences:
-                        if any(word in sentence.lower() for word in ["improve", "should", "try to", "adjust", "correct"]):
-                            suggestion = sentence.strip()
-                            if suggestion:
-                                stats_tracker.add_improvement_suggestion(detected_technique, suggestion)
+                for suggestion in stats["suggestions"]:
+                    stats_tracker.add_improvement_suggestion(stats["technique"], suggestion)
             
         except Exception as e:
-            print(f"Error processing technique stats: {e}")
+            logger.warning("Error processing technique stats: %s", e)
 
 def analyze_volleyball_technique(frame_bytes):
     """
@@ -299,16 +316,12 @@ def video_feed():
             initialize_pipeline()
             
         try:
-            for frame in pipeline.get_frames():
-                # Save current frame to disk
-                pipeline.save_current_frame()
-                
-                # Convert to JPEG for streaming
-                _, jpeg = cv2.imencode('.jpg', frame)
+            # Frames from the capture loop, encoded once for every viewer
+            for jpeg in pipeline.stream_jpegs():
                 yield (b'--frame\r\n'
-                      b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
+                      b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
         except Exception as e:
-            print(f"Error in video feed: {str(e)}")
+            logger.error("Error in video feed: %s", e)
             # Generate a fallback frame with error message
             fallback = np.zeros((480, 640, 3), dtype=np.uint8)
             cv2.putText(fallback, "Camera not available", (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
@@ -343,26 +356,39 @@ def get_analysis():
 @app.route('/stats')
 def get_stats():
     """API endpoint to get current statistics"""
-    # Return a simplified response structure matching what the tablet UI expects
+    # Snapshots are reused for up to a second, so frequent polling stays cheap
+    snapshot = stats_tracker.snapshot(max_age=1.0)
+    session = snapshot['session']
+    technique_counts = {technique: values['count'] for technique, values in session['techniques'].items()}
+    most_practiced = max(technique_counts, key=technique_counts.get)
+    minutes, seconds = divmod(int(snapshot['session_seconds']), 60)
+    
+    # Keep the structure the tablet UI expects, with real numbers
     stats_summary = {
         "success": True,
         "stats": {
-            "session_duration": "Active",
-            "frames_analyzed": 0,
-            "most_practiced_technique": "3D Reference Models",
-            "techniques_identified": {
-                "serving": 0,
-                "setting": 0,
-                "spiking": 0,
-                "passing": 0,
-                "blocking": 0,
-                "digging": 0
-            }
+            "session_duration": f"{minutes}:{seconds:02d}",
+            "frames_analyzed": session['analyses']['total'],
+            "most_practiced_technique": most_practiced if technique_counts[most_practiced] else "None yet",
+            "techniques_identified": technique_counts,
+            "technique_quality": {technique: values['avg_quality'] for technique, values in session['techniques'].items()},
+            "team_stats": session['events'],
+            "efficiency": f"{stats_tracker.get_team_efficiency(session['events']):.3f}",
+            "last_5_minutes": snapshot['window'],
+            "current_set": snapshot['current_set'],
+            "sets": snapshot['sets'],
+            "players": snapshot['players'],
+            "suggestions": snapshot['suggestions']
         }
     }
     
     return jsonify(stats_summary)
 
+@app.route('/stats/set', methods=['POST'])
+def start_new_set():
+    """API endpoint to start counting a new set"""
+    return jsonify({"success": True, "current_set": stats_tracker.start_set()})
+
 @app.route('/analyze/<analysis_type>', methods=['POST'])
 def analyze_frame(analysis_type):
     """API endpoint to analyze the current frame with a specific analysis type"""
@@ -373,15 +399,16 @@ def analyze_frame(analysis_type):
         return jsonify({"success": False, "error": "Invalid analysis type"})
     
     try:
-        # Get the current frame
-        with pipeline.frame_lock:
-            if pipeline.current_frame is None:
-                return jsonify({"success": False, "error": "No frame available"})
-            
-            frame = pipeline.current_frame.copy()
+        # Get the current frame (shared JPEG encode, slot released before the analysis)
+        ref = pipeline.frames.latest()
+        if ref is None:
+            return jsonify({"success": False, "error": "No frame available"})
+        
+        with ref:
+            frame_bytes = ref.jpeg()
         
         # Analyze the frame
-        result = pipeline.analyze_frame(frame, analysis_type)
+        result = pipeline.analyze_frame(frame_bytes, analysis_type)
         
         # Update latest analysis
         pipeline.latest_analysis[analysis_type] = result
@@ -406,12 +433,16 @@ def capture_frame():
         filename = f"capture_{timestamp}.jpg"
         
         # Save the current frame
-        with pipeline.frame_lock:
-            if pipeline.current_frame is None:
-                return jsonify({"success": False, "error": "No frame available"})
-            
-            filepath = os.path.join(temp_dir, filename)
-            cv2.imwrite(filepath, pipeline.current_frame)
+        ref = pipeline.frames.latest()
+        if ref is None:
+            return jsonify({"success": False, "error": "No frame available"})
+        
+        with ref:
+            frame_bytes = ref.jpeg()
+        
+        filepath = os.path.join(temp_dir, filename)
+        with open(filepath, 'wb') as f:
+            f.write(frame_bytes)
         
         return jsonify({"success": True, "filename": filename})
     
@@ -489,13 +520,20 @@ def static_files(filename):
 
 @app.route('/last_captured')
 def last_captured():
-    """Serve the last captured frame"""
+    """Serve the last captured frame (?max_size=N for a preview at most N pixels wide and high)"""
     last_capture_path = os.path.join(temp_dir, 'last_captured.jpg')
     if os.path.exists(last_capture_path):
-        return send_file(last_capture_path, mimetype='image/jpeg')
+        return send_image(last_capture_path, mimetype='image/jpeg')
     else:
         return "No capture available", 404
 
+def send_image(path, mimetype=None):
+    """Send an image file, or a reduced-resolution preview of it if max_size is requested"""
+    max_size = request.args.get('max_size', type=int)
+    if max_size and max_size > 0:
+        return Response(preview_jpeg(path, max_size), mimetype='image/jpeg')
+    return send_file(path, mimetype=mimetype)
+
 @app.route('/clips')
 def clips():
     """Render clips page"""
@@ -506,6 +544,83 @@ def tablet():
     """Render tablet mode interface for sideline viewing"""
     return render_template('tablet.html')
 
+@app.route('/api/clients')
+def get_client_stats():
+    """API endpoint with request, error and latency counters per AI provider"""
+    return jsonify({"success": True, "pid": os.getpid(), "providers": client_stats()})
+
+@app.route('/api/logging')
+def get_logging_stats():
+    """API endpoint with the queue usage of the log writer"""
+    return jsonify({"success": True, **logging_stats()})
+
+@app.route('/api/profiles')
+def get_profiles():
+    """API endpoint listing stored request profiles, newest first"""
+    return jsonify({"success": True, "profiles": list_profiles()})
+
+@app.route('/api/profiles/hot')
+def get_hot_stacks():
+    """API endpoint with the hottest stacks of the continuous sampler (?stage=, ?limit=, ?format=speedscope|collapsed)"""
+    stage = request.args.get('stage')
+    output_format = request.args.get('format', 'json')
+    if output_format == 'speedscope':
+        return _profile_download(json.dumps(sampler.to_speedscope(stage)), "continuous.speedscope.json", "application/json")
+    if output_format == 'collapsed':
+        return _profile_download(collapsed_stacks(sampler.snapshot(stage)), "continuous.collapsed.txt", "text/plain")
+    return jsonify({"success": True, "sampler": sampler.stats(),
+                    "stacks": sampler.hot_stacks(stage, int(request.args.get('limit', 20)))})
+
+@app.route('/api/profiles/<profile_id>')
+def download_profile(profile_id):
+    """API endpoint to download a request profile (?format=speedscope|collapsed)"""
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({"success": False, "error": f"Profile not found: {profile_id}"}), 404
+    if request.args.get('format') == 'collapsed':
+        return _profile_download(profile.to_collapsed(), f"{profile.id}.collapsed.txt", "text/plain")
+    return _profile_download(json.dumps(profile.to_speedscope()), f"{profile.id}.speedscope.json", "application/json")
+
+def _profile_download(data, filename, mimetype):
+    return Response(data, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.route('/api/routing')
+def get_routing_stats():
+    """API endpoint with requests, latency and savings per analysis route"""
+    return jsonify({"success": True, **routing_stats()})
+
+@app.route('/api/frames')
+def get_frame_bus_stats():
+    """API endpoint with the frame bus ring, drop and JPEG cache counters"""
+    if not pipeline:
+        return jsonify({"success": False, "error": "Pipeline not initialized"})
+    return jsonify({"success": True, **pipeline.frames.stats()})
+
+@app.route('/ask', methods=['POST'])
+def ask_coach():
+    """API endpoint for free-form coach questions, answered by the agent"""
+    if analysis_router is None:
+        return jsonify({"success": False, "error": "AI analysis is not available in this deployment"})
+    
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '').strip()
+    if not question:
+        return jsonify({"success": False, "error": "No question provided"}), 400
+    
+    try:
+        # Optionally include the current frame
+        frame_bytes = None
+        if data.get('include_frame') and pipeline:
+            ref = pipeline.frames.latest()
+            if ref is not None:
+                with ref:
+                    frame_bytes = ref.jpeg()
+        
+        answer = analysis_router.ask(question, frame_bytes)
+        return jsonify({"success": True, "answer": answer})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
 @app.route('/api/clips')
 def get_clips():
     """API endpoint to get saved clips"""
@@ -587,7 +702,7 @@ technique_references = {
 
 @app.route('/api/reference/<technique>')
 def get_reference_image(technique):
-    """API endpoint to get reference images for technique comparison"""
+    """API endpoint to get reference images for technique comparison (?max_size=N for a preview)"""
     if technique in technique_references:
         reference_file = technique_references[technique]
         reference_path = os.path.join(static_dir, 'references', reference_file)
@@ -596,7 +711,7 @@ def get_reference_image(technique):
         if not os.path.exists(reference_path):
             return send_from_directory(static_dir, 'placeholder.jpg')
         
-        return send_file(reference_path)
+        return send_image(reference_path)
     else:
         return "Technique reference not found", 404
 
@@ -605,7 +720,7 @@ def get_reference_image(technique):
 def get_reference_model(model_id):
     """API endpoint to get a specific 3D reference model"""
     try:
-        print(f"Requested model ID: {model_id}")
+        logger.debug("Requested model ID: %s", model_id)
         
         # Handle both formats: with or without _reference suffix
         base_model_id = model_id.replace('_reference', '')
@@ -622,11 +737,11 @@ def get_reference_model(model_id):
         for path in possible_paths:
             if os.path.exists(path):
                 model_path = path
-                print(f"Found model file at: {model_path}")
+                logger.debug("Found model file at: %s", model_path)
                 break
         
         if not model_path:
-            print(f"Model file not found for {model_id}. Tried: {possible_paths}")
+            logger.warning("Model file not found for %s. Tried: %s", model_id, possible_paths)
             return jsonify({
                 'success': False,
                 'message': f'Model {model_id} not found'
@@ -635,7 +750,6 @@ def get_reference_model(model_id):
         # Read the model file
         with open(model_path, 'r') as f:
             model_data = json.load(f)
-            print(f"Loaded model data with keys: {list(model_data.keys())}")
             
         # Return wrapped in the expected format
         return jsonify({
@@ -643,9 +757,7 @@ def get_reference_model(model_id):
             'technique': model_data
         })
     except Exception as e:
-        print(f"Error getting reference model: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error getting reference model: %s", e)
         return jsonify({
             'success': False,
             'message': str(e)
@@ -655,13 +767,12 @@ def get_reference_model(model_id):
 def list_reference_models():
     """List all available 3D reference models"""
     try:
-        print("Listing available 3D reference models")
         models_dir = os.path.join(app.static_folder, 'references', '3d_models')
         
         # Create directory if it doesn't exist
         if not os.path.exists(models_dir):
             os.makedirs(models_dir, exist_ok=True)
-            print(f"Created models directory: {models_dir}")
+            logger.info("Created models directory: %s", models_dir)
             
         models = []
         
@@ -672,8 +783,6 @@ def list_reference_models():
                 model_name = model_id.replace('_', ' ').title()
                 model_path = f'/api/reference3d/{model_id}'
                 
-                print(f"Found model file: {filename}, ID: {model_id}, URL: {model_path}")
-                
                 # Try to load the model to get description
                 description = "Volleyball technique reference model"
                 try:
@@ -684,7 +793,7 @@ def list_reference_models():
                         elif 'name' in model_data:
                             model_name = model_data['name']
                 except Exception as e:
-                    print(f"Error loading model data from {filename}: {str(e)}")
+                    logger.warning("Error loading model data from %s: %s", filename, e)
                 
                 models.append({
                     'name': model_name,
@@ -694,7 +803,7 @@ def list_reference_models():
         
         # If no models are found, add a sample
         if not models:
-            print("No models found, creating a sample model")
+            logger.info("No models found, creating a sample model")
             # Create a sample model if not exists
             sample_path = os.path.join(models_dir, 'sample.json')
             if not os.path.exists(sample_path):
@@ -756,15 +865,13 @@ def list_reference_models():
                     'description': 'Sample volleyball technique reference model'
                 })
         
-        print(f"Returning {len(models)} models: {[model['url'] for model in models]}")
+        logger.debug("Returning %d reference models", len(models))
         return jsonify({
             'success': True,
             'models': models
         })
     except Exception as e:
-        print(f"Error listing reference models: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error listing reference models: %s", e)
         return jsonify({
             'success': False,
             'message': str(e)
@@ -779,50 +886,35 @@ def technique_viewer():
 def analyze_mobile(analysis_type):
     """API endpoint for mobile device analysis with uploaded frames"""
     try:
-        print("\n===== MOBILE ANALYSIS REQUEST =====")
-        print(f"Analysis type: {analysis_type}")
-        print(f"Request content type: {request.content_type}")
-        print(f"Request files keys: {list(request.files.keys())}")
-        print(f"Request form keys: {list(request.form.keys())}")
-        
         if analysis_type not in ["technique", "positioning", "tactics"]:
-            print(f"ERROR: Invalid analysis type: {analysis_type}")
+            logger.warning("Invalid analysis type: %s", analysis_type)
             return jsonify({"error": "Invalid analysis type"}), 400
         
         # Check if we have a file in the request
         if 'image' not in request.files:
-            print("ERROR: No image file found in request")
-            for key in request.files:
-                print(f"Found file with key: {key}")
+            # The form layout only matters when the upload is malformed
+            logger.warning("No image file found in request", extra={"file_keys": list(request.files.keys())})
             return jsonify({"error": "No image provided"}), 400
         
         file = request.files['image']
         if file.filename == '':
-            print("ERROR: Empty filename in request")
+            logger.warning("Empty filename in request")
             return jsonify({"error": "No image provided"}), 400
         
-        print(f"Image filename: {file.filename}")
-        print(f"Image content type: {file.content_type}")
-        
         # Read the file directly as bytes
         img_bytes = file.read()
-        print(f"Read {len(img_bytes)} bytes from uploaded image")
+        logger.debug("Read %d bytes from uploaded image %s", len(img_bytes), file.filename)
         
-        # Use the AI agent for analysis with the raw bytes
-        print("Creating volleyball agent...")
-        agent = create_volleyball_agent()
-        print(f"Calling analyze_with_agent for {analysis_type} analysis...")
-        result = analyze_with_agent(agent, img_bytes, analysis_type)
-        print(f"Analysis result: {result[:100]}...")
+        # Use the AI agent for analysis with the raw bytes (single-tool types call the tool directly)
+        result = analyze_with_agent(None, img_bytes, analysis_type)
+        logger.info("Mobile %s analysis complete", analysis_type, extra={"image_bytes": len(img_bytes)})
         
         # Update stats via callback
         analysis_callback(analysis_type, result)
         
         return jsonify(result)
     except Exception as e:
-        print(f"Error in analyze_mobile: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error in analyze_mobile: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/capture/mobile', methods=['POST'])
@@ -839,13 +931,15 @@ def capture_mobile_frame():
             return jsonify({"success": False, "error": "Empty file"})
         
         # Read the image
-        in_memory_file = io.BytesIO()
-        file.save(in_memory_file)
-        data = np.frombuffer(in_memory_file.getvalue(), dtype=np.uint8)
-        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        data = file.read()
+        image_format, _ = image_header(data)
         
-        if image is None:
-            return jsonify({"success": False, "error": "Could not decode image"})
+        # JPEGs are saved as uploaded; anything else is decoded and converted once
+        if image_format != 'JPEG':
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                return jsonify({"success": False, "error": "Could not decode image"})
+            data = cv2.imencode('.jpg', image)[1].tobytes()
         
         # Generate a timestamp
         timestamp = time.strftime("%Y%m%d_%H%M%S")
@@ -853,18 +947,18 @@ def capture_mobile_frame():
         
         # Save the image
         filepath = os.path.join(temp_dir, filename)
-        cv2.imwrite(filepath, image)
+        with open(filepath, 'wb') as f:
+            f.write(data)
         
         # Also save as last_captured
         last_capture_path = os.path.join(temp_dir, 'last_captured.jpg')
-        cv2.imwrite(last_capture_path, image)
+        with open(last_capture_path, 'wb') as f:
+            f.write(data)
         
         return jsonify({"success": True, "filename": filename})
     
     except Exception as e:
-        print(f"Error capturing mobile frame: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error capturing mobile frame: %s", e)
         return jsonify({"success": False, "error": str(e)})
 
 @app.route('/capture_still')
@@ -875,29 +969,31 @@ def capture_still():
             initialize_pipeline()
             
         # Get the current frame from the pipeline
-        frame = pipeline.get_current_frame()
+        ref = pipeline.frames.latest()
         
-        if frame is None:
+        if ref is None:
             # Return a default error image
             fallback = np.zeros((480, 640, 3), dtype=np.uint8)
             cv2.putText(fallback, "No camera frame available", (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
             _, jpeg = cv2.imencode('.jpg', fallback)
             return Response(jpeg.tobytes(), mimetype='image/jpeg')
         
-        # Convert to JPEG for sending
-        _, jpeg = cv2.imencode('.jpg', frame)
+        # JPEG shared with the other consumers of this frame
+        with ref:
+            jpeg = ref.jpeg()
         
         # Also save to a file for potential later use
         timestamp = int(time.time())
         still_filename = f"still_{timestamp}.jpg"
         still_path = os.path.join(temp_dir, still_filename)
-        cv2.imwrite(still_path, frame)
+        with open(still_path, 'wb') as f:
+            f.write(jpeg)
         
         # Return as an image response
-        return Response(jpeg.tobytes(), mimetype='image/jpeg')
+        return Response(jpeg, mimetype='image/jpeg')
     
     except Exception as e:
-        print(f"Error capturing still frame: {str(e)}")
+        logger.error("Error capturing still frame: %s", e)
         # Return a default error image
         fallback = np.zeros((480, 640, 3), dtype=np.uint8)
         cv2.putText(fallback, f"Error: {str(e)}", (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
@@ -910,35 +1006,28 @@ def get_frame():
     try:
         global pipeline
         
-        if pipeline is None or not hasattr(pipeline, 'get_current_frame'):
-            app.logger.error("Pipeline not initialized or doesn't support get_current_frame")
+        if pipeline is None:
+            logger.error("Pipeline not initialized")
             return Response(status=500)
         
-        frame = pipeline.get_current_frame()
-        if frame is None:
-            app.logger.error("No frame available from pipeline")
+        ref = pipeline.frames.latest()
+        if ref is None:
+            logger.warning("No frame available from pipeline")
             return Response(status=404)
         
-        # Convert the frame to JPEG
-        success, buffer = cv2.imencode('.jpg', frame)
-        if not success:
-            app.logger.error("Failed to encode frame as JPEG")
-            return Response(status=500)
+        # JPEG shared with the other consumers of this frame
+        with ref:
+            jpeg = ref.jpeg()
         
-        app.logger.info("Successfully retrieved and encoded frame")
-        return Response(buffer.tobytes(), mimetype='image/jpeg')
+        return Response(jpeg, mimetype='image/jpeg')
     except Exception as e:
-        app.logger.error(f"Error in get_frame: {str(e)}")
+        logger.error("Error in get_frame: %s", e)
         return Response(status=500)
 
 @app.route('/test_mobile_image', methods=['POST'])
 def test_mobile_image():
     """Simple test endpoint to verify mobile image upload is working correctly"""
     try:
-        # Log all the form data and files for debugging
-        app.logger.info(f"Request form data keys: {list(request.form.keys())}")
-        app.logger.info(f"Request files keys: {list(request.files.keys())}")
-        
         # Check for image in all possible field names
         image_file = None
         image_field_name = None
@@ -950,7 +1039,10 @@ def test_mobile_image():
                 break
         
         if not image_file:
-            app.logger.error("No image found in any standard field")
+            logger.warning("No image found in any standard field", extra={
+                "form_keys": list(request.form.keys()),
+                "file_keys": list(request.files.keys()),
+            })
             return jsonify({
                 "success": False, 
                 "error": "No image found", 
@@ -973,7 +1065,7 @@ def test_mobile_image():
             "size_bytes": len(img_bytes)
         }
         
-        app.logger.info(f"Successfully received image: {image_info}")
+        logger.info("Received test image", extra={"image": image_info})
         
         # Save the image for verification
         timestamp = int(time.time())
@@ -991,9 +1083,7 @@ def test_mobile_image():
             "saved_as": temp_filename
         })
     except Exception as e:
-        app.logger.error(f"Error in test_mobile_image: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in test_mobile_image: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/mobile_test')
@@ -1016,16 +1106,15 @@ def analyze_video():
         JSON with analysis results
     """
     try:
-        print("\n===== VIDEO ANALYSIS REQUEST =====")
         # Check if video file is present
         if 'video' not in request.files:
-            print("ERROR: No video file found in request")
+            logger.warning("No video file found in request")
             return jsonify({"error": "No video file provided"}), 400
             
         video_file = request.files['video']
         
         if video_file.filename == '':
-            print("ERROR: Empty video filename")
+            logger.warning("Empty video filename")
             return jsonify({"error": "Empty video file name"}), 400
         
         # Get analysis parameters
@@ -1033,7 +1122,11 @@ def analyze_video():
         interval_seconds = float(request.form.get('interval_seconds', 1.0))
         max_frames = int(request.form.get('max_frames', 5))
         
-        print(f"Analysis requested - Type: {analysis_type}, Interval: {interval_seconds}s, Max frames: {max_frames}")
+        logger.info("Video analysis requested", extra={
+            "analysis_type": analysis_type,
+            "interval_seconds": interval_seconds,
+            "max_frames": max_frames,
+        })
         
         # Save the video file temporarily
         temp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'temp')
@@ -1041,14 +1134,13 @@ def analyze_video():
         
         video_path = os.path.join(temp_dir, f"{int(time.time())}_uploaded_{secure_filename(video_file.filename)}")
         video_file.save(video_path)
-        print(f"Video saved to: {video_path}")
+        logger.debug("Video saved to: %s", video_path)
         
         # Analyze the video
-        print("Opening video for analysis...")
         cap = cv2.VideoCapture(video_path)
         
         if not cap.isOpened():
-            print(f"ERROR: Could not open video file at {video_path}")
+            logger.error("Could not open video file at %s", video_path)
             return jsonify({"error": "Could not process video file"}), 500
         
         # Get video properties
@@ -1056,7 +1148,7 @@ def analyze_video():
         frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         duration = frame_count / fps if fps > 0 else 0
         
-        print(f"Video properties - FPS: {fps}, Frames: {frame_count}, Duration: {duration:.2f}s")
+        logger.debug("Video properties - FPS: %s, Frames: %d, Duration: %.2fs", fps, frame_count, duration)
         
         # Calculate frame indices to analyze
         frame_indices = []
@@ -1071,7 +1163,7 @@ def analyze_video():
             if not frame_indices and frame_count > 0:
                 frame_indices = [int(frame_count / 2)]  # Middle frame
                 
-        print(f"Will analyze frames at indices: {frame_indices}")
+        logger.debug("Will analyze frames at indices: %s", frame_indices)
         
         # Extract and analyze frames
         results = []
@@ -1083,7 +1175,7 @@ def analyze_video():
             ret, frame = cap.read()
             
             if not ret:
-                print(f"WARNING: Could not read frame at index {frame_idx}")
+                logger.warning("Could not read frame at index %d", frame_idx)
                 continue
                 
             # Save frame as image for reference
@@ -1091,12 +1183,12 @@ def analyze_video():
             cv2.imwrite(frame_path, frame)
             frame_images.append(frame_path)
             
-            print(f"Processing frame {idx+1}/{len(frame_indices)} (index {frame_idx})...")
+            logger.debug("Processing frame %d/%d (index %d)", idx + 1, len(frame_indices), frame_idx)
             
             # Convert frame to bytes for analysis
             success, buffer = cv2.imencode('.jpg', frame)
             if not success:
-                print(f"WARNING: Could not encode frame {idx} to JPEG")
+                logger.warning("Could not encode frame %d to JPEG", idx)
                 continue
                 
             frame_bytes = buffer.tobytes()
@@ -1112,7 +1204,7 @@ def analyze_video():
                 else:
                     analysis_result = "Unknown analysis type requested"
                     
-                print(f"Analysis for frame {idx+1} complete: {len(analysis_result) if analysis_result else 0} chars")
+                logger.debug("Analysis for frame %d complete: %d chars", idx + 1, len(analysis_result) if analysis_result else 0)
                     
                 results.append({
                     "frame_index": frame_idx,
@@ -1121,9 +1213,7 @@ def analyze_video():
                     "frame_path": os.path.basename(frame_path)
                 })
             except Exception as e:
-                import traceback
-                print(f"Error analyzing frame {idx}: {str(e)}")
-                traceback.print_exc()
+                logger.exception("Error analyzing frame %d: %s", idx, e)
                 results.append({
                     "frame_index": frame_idx,
                     "timestamp": frame_idx / fps if fps > 0 else 0,
@@ -1148,13 +1238,11 @@ def analyze_video():
             "results": results
         }
         
-        print(f"Analysis complete - {len(results)} frames analyzed")
+        logger.info("Video analysis complete - %d frames analyzed", len(results))
         return jsonify(response)
         
     except Exception as e:
-        app.logger.error(f"Error in analyze_video: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in analyze_video: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/temp/<path:filename>')
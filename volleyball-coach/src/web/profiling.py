@@ -0,0 +1,321 @@
+"""
+Profiling for the coach web app.
+
+A request sent with an X-Profile header (or ?profile=) of "sample" or
+"cprofile" is profiled on its own: "sample" snapshots the request thread's
+stack every PROFILE_SAMPLE_INTERVAL_MS, "cprofile" runs cProfile on it. The
+last PROFILE_BUFFER_SIZE profiles are kept under the request ID (see
+valid_profile_id) and export as speedscope JSON or collapsed stacks for
+flamegraph.pl. PROFILING=1 enables per-request profiles; they are off by
+default, since any client could otherwise profile its requests.
+
+A background thread also samples every busy thread PROFILE_SAMPLE_HZ times
+per second (CONTINUOUS_PROFILING=0 turns it off) and aggregates the stacks
+by stage: frame capture/extraction, JPEG encoding and remote AI calls.
+"""
+
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+PROFILING_ENABLED = os.environ.get('PROFILING', '0').lower() not in ('0', 'false', 'no')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_BUFFER_SIZE = int(os.environ.get('PROFILE_BUFFER_SIZE', '20'))
+CONTINUOUS_PROFILING = os.environ.get('CONTINUOUS_PROFILING', '1').lower() not in ('0', 'false', 'no')
+PROFILE_SAMPLE_HZ = float(os.environ.get('PROFILE_SAMPLE_HZ', '5'))
+PROFILE_MAX_STACKS = int(os.environ.get('PROFILE_MAX_STACKS', '5000'))
+
+MAX_STACK_DEPTH = 128
+
+# Profile IDs are also used in download file names
+PROFILE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Stage of a stack: the first rule matching a frame from the innermost frame
+# outwards, by path fragment or function name
+STAGE_RULES = (
+    ("remote_call", ("/google/generativeai/", "/google/api_core/", "/openai/", "/langchain", "/httpx/",
+                     "/httpcore/", "/urllib3/", "/requests/", "/http/client.py", "/ssl.py", "/ai/clients.py"), ()),
+    ("encoding", (), ("encode_frame", "generate", "capture_still", "get_frame")),
+    ("extraction", (), ("get_frames", "process_video_feed", "capture_mobile_frame", "analyze_video")),
+)
+STAGES = tuple(rule[0] for rule in STAGE_RULES) + ("other",)
+
+# A thread outside the stages whose innermost frame is here is waiting
+IDLE_FILES = ("/threading.py", "/queue.py", "/selectors.py", "/socketserver.py", "/socket.py",
+              "/concurrent/futures/thread.py", "/logging/handlers.py")
+
+
+def _stack(frame):
+    """Root-first (function, file, line) tuples of a frame's stack"""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append((getattr(code, "co_qualname", code.co_name), code.co_filename.replace(os.sep, "/"),
+                      code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def stack_stage(stack):
+    for function, filename, _ in reversed(stack):
+        for stage, files, functions in STAGE_RULES:
+            if function.rsplit(".", 1)[-1] in functions or any(part in filename for part in files):
+                return stage
+    return "other"
+
+
+def _frame_label(key):
+    return f"{key[0]} ({os.path.basename(key[1])}:{key[2]})"
+
+
+def speedscope_document(name, profiles):
+    """Speedscope file for a list of (profile name, Counter of stacks to milliseconds)"""
+    frames, index, entries = [], {}, []
+    for profile_name, stacks in profiles:
+        samples, weights = [], []
+        for stack, weight in stacks.most_common():
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+            samples.append([index[key] for key in stack])
+            weights.append(round(weight, 3))
+        entries.append({"type": "sampled", "name": profile_name, "unit": "milliseconds", "startValue": 0,
+                        "endValue": round(sum(weights), 3), "samples": samples, "weights": weights})
+    return {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": name,
+            "exporter": "volleyball-coach", "activeProfileIndex": 0, "shared": {"frames": frames},
+            "profiles": entries}
+
+
+def collapsed_stacks(stacks):
+    """flamegraph.pl input: one "a;b;c weight" line per stack"""
+    lines = []
+    for stack, weight in stacks.most_common():
+        labels = (_frame_label(key).replace(";", ":").replace(" ", "_") for key in stack)
+        lines.append(f"{';'.join(labels)} {max(int(round(weight)), 1)}")
+    return "\n".join(lines) + "\n"
+
+
+def _cprofile_stacks(stats):
+    """Stacks approximated from cProfile's caller graph (time split by caller, as gprof does)"""
+    callees = {}
+    for function, entry in stats.items():
+        for caller, edge in entry[4].items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+    stacks = Counter()
+
+    def walk(function, share, path, on_path):
+        total = stats[function][3]
+        if total <= 0 or share < 1e-5:
+            return
+        fraction = min(share / total, 1.0)
+        filename, line, name = function
+        stack = path + ((name, filename.replace(os.sep, "/"), line),)
+        stacks[stack] += stats[function][2] * fraction * 1000
+        if len(stack) < MAX_STACK_DEPTH:
+            for callee, edge_time in callees.get(function, ()):
+                if callee not in on_path:
+                    walk(callee, edge_time * fraction, stack, on_path | {callee})
+
+    for function, entry in stats.items():
+        if not entry[4]:
+            walk(function, entry[3], (), {function})
+    return stacks
+
+
+def valid_profile_id(profile_id):
+    """The client-supplied ID (e.g. X-Request-Id) if it is safe to use, otherwise a new random ID"""
+    if profile_id and PROFILE_ID_PATTERN.fullmatch(profile_id):
+        return profile_id
+    return uuid.uuid4().hex[:16]
+
+
+class RequestProfile:
+    """Profile of one request; stop() stores it under its ID"""
+
+    def __init__(self, profile_id, name, mode):
+        self.id = valid_profile_id(profile_id)
+        self.name = name
+        self.mode = mode
+        self.started = time.time()
+        self.start_time = time.perf_counter()
+        self.duration_ms = None
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.profiler = None
+        self.thread = None
+
+        if mode == "cprofile":
+            try:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            except ValueError:
+                # Another profiler is active (one cProfile per process on 3.12+)
+                self.profiler = None
+                self.mode = "sample"
+        if self.profiler is None:
+            self.thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+            self.thread.start()
+
+    def _sample(self):
+        interval = PROFILE_SAMPLE_INTERVAL_MS / 1000.0
+        last = time.perf_counter()
+        while not self.stopped.wait(interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_stack(frame)] += (now - last) * 1000
+            last = now
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.create_stats()
+            self.stacks = _cprofile_stacks(self.profiler.stats)
+        else:
+            self.stopped.set()
+            self.thread.join()
+        self.duration_ms = (time.perf_counter() - self.start_time) * 1000
+        _store(self)
+        return self
+
+    def summary(self):
+        stages = Counter()
+        for stack, weight in self.stacks.items():
+            stages[stack_stage(stack)] += weight
+        return {"id": self.id, "name": self.name, "mode": self.mode, "started": self.started,
+                "duration_ms": round(self.duration_ms or 0, 3), "stacks": len(self.stacks),
+                "stage_ms": {stage: round(value, 3) for stage, value in stages.most_common()}}
+
+    def to_speedscope(self):
+        return speedscope_document(f"{self.name} [{self.id}]", [(f"{self.name} ({self.mode})", self.stacks)])
+
+    def to_collapsed(self):
+        return collapsed_stacks(self.stacks)
+
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def _store(profile):
+    with _profiles_lock:
+        _profiles.pop(profile.id, None)
+        _profiles[profile.id] = profile
+        while len(_profiles) > PROFILE_BUFFER_SIZE:
+            _profiles.popitem(last=False)
+
+
+def start_profile(profile_id, name, mode="sample"):
+    """Start profiling the current request (None when disabled or the mode is unknown)"""
+    if not PROFILING_ENABLED or mode not in ("sample", "cprofile"):
+        return None
+    if profile_id and get_profile(profile_id) is not None:
+        # Never replace another request's profile
+        profile_id = None
+    return RequestProfile(profile_id, name, mode)
+
+
+def get_profile(profile_id):
+    if not PROFILE_ID_PATTERN.fullmatch(profile_id or ""):
+        return None
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def list_profiles():
+    with _profiles_lock:
+        profiles = list(reversed(_profiles.values()))
+    return [profile.summary() for profile in profiles]
+
+
+class StackSampler:
+    """Background thread aggregating the stacks of busy threads by stage"""
+
+    def __init__(self, hz=PROFILE_SAMPLE_HZ, max_stacks=PROFILE_MAX_STACKS):
+        self.interval = 1.0 / hz if hz > 0 else 0
+        self.max_stacks = max_stacks
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.stages = {}
+        self.samples = 0
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        if self.interval <= 0 or (self.thread is not None and self.thread.is_alive()):
+            return
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            stacks = [_stack(frame) for thread_id, frame in sys._current_frames().items() if thread_id != own_id]
+            with self.lock:
+                self.samples += 1
+                for stack in stacks:
+                    stage = self.stages.get(stack) or stack_stage(stack)
+                    if not stack or (stage == "other" and stack[-1][1].endswith(IDLE_FILES)):
+                        continue
+                    if stack not in self.stacks:
+                        if len(self.stacks) >= self.max_stacks:
+                            self.dropped += 1
+                            continue
+                        self.stages[stack] = stage
+                    self.stacks[stack] += self.interval * 1000
+
+    def snapshot(self, stage=None):
+        with self.lock:
+            return Counter({stack: weight for stack, weight in self.stacks.items()
+                            if not stage or self.stages[stack] == stage})
+
+    def hot_stacks(self, stage=None, limit=20):
+        """The most sampled stacks, innermost frame first"""
+        return [{"stage": self.stages.get(stack, "other"), "ms": round(weight, 3),
+                 "stack": [_frame_label(key) for key in reversed(stack)]}
+                for stack, weight in self.snapshot(stage).most_common(limit)]
+
+    def to_speedscope(self, stage=None):
+        stages = [stage] if stage else STAGES
+        return speedscope_document("continuous profile", [(name, self.snapshot(name)) for name in stages])
+
+    def stats(self):
+        totals = Counter()
+        with self.lock:
+            for stack, weight in self.stacks.items():
+                totals[self.stages[stack]] += weight
+        return {"running": self.thread is not None and self.thread.is_alive(),
+                "hz": round(1.0 / self.interval, 3) if self.interval else 0, "samples": self.samples,
+                "stacks": len(self.stacks), "dropped_stacks": self.dropped,
+                "stage_ms": {stage: round(totals.get(stage, 0.0), 3) for stage in STAGES}}
+
+
+sampler = StackSampler()
+
+
+def _restart_after_fork():
+    # The sampling thread does not survive a fork
+    sampler.lock = threading.Lock()
+    if sampler.thread is not None:
+        sampler.thread = None
+        sampler.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def start_sampler():
+    """Start the continuous sampler (no-op with CONTINUOUS_PROFILING=0)"""
+    if CONTINUOUS_PROFILING:
+        sampler.start()
+    return sampler
@@ -0,0 +1,123 @@
+"""
+Structured logging for the coach web app.
+
+Log records are written as JSON lines (or plain text with LOG_FORMAT=text)
+by a background thread, so request threads only put records on a queue.
+Records written while a request is handled carry its request ID and route
+(see bind_context), and LOG_LEVELS sets levels per module, e.g.
+"video.pipeline=DEBUG,werkzeug=WARNING". Per-frame messages are logged at
+DEBUG, so at the default INFO level they cost a level check.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+# Attributes of every LogRecord; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context"}
+
+_log_context = contextvars.ContextVar('coach_log_context', default=None)
+
+_handler = None
+_listener = None
+
+
+def bind_context(**fields):
+    """Add fields to the log context of the current request; returns a token for clear_context()"""
+    context = dict(_log_context.get() or {})
+    context.update(fields)
+    return _log_context.set(context)
+
+
+def clear_context(token=None):
+    """Restore the log context from before bind_context()"""
+    if token is not None:
+        try:
+            _log_context.reset(token)
+            return
+        except ValueError:
+            pass
+    _log_context.set(None)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the log context and extra fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Queues records unformatted with the caller's log context; drops them when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.context = _log_context.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=None, log_format=None):
+    """Install the queue handler and writer thread on the root logger (once per process)"""
+    global _handler, _listener
+    root = logging.getLogger()
+    if _handler is not None:
+        return root
+
+    output = logging.StreamHandler(sys.stdout)
+    if (log_format or LOG_FORMAT) == "text":
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    _handler = ContextQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    root.addHandler(_handler)
+    root.setLevel(level or LOG_LEVEL)
+    for item in LOG_LEVELS.split(","):
+        if "=" in item:
+            name, module_level = item.split("=", 1)
+            logging.getLogger(name.strip()).setLevel(module_level.strip().upper())
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    # Write what is still queued when the process exits
+    atexit.register(_listener.stop)
+    return root
+
+
+def logging_stats():
+    """Queue usage of the logging handler"""
+    if _handler is None:
+        return {"configured": False}
+    return {"configured": True, "queued": _handler.queue.qsize(), "dropped": _handler.dropped}